@@ -0,0 +1,266 @@
+"""
+Admission control for Gemini calls and API requests
+Caps upstream calls in flight per worker behind a bounded priority queue, and rate-limits each client with a token bucket
+"""
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from deadline import Deadline
+from rate_limit import TokenBucket
+
+# Priority lanes, highest priority first
+LANES = ('interactive', 'batch')
+
+# Lane of the request being served; set by the API routes, inherited by engine threads and tasks
+current_lane: ContextVar[str] = ContextVar('current_lane', default='interactive')
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call cannot be admitted within its queue-time limit"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server busy ({reason}), retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority_lane(lane: str):
+    """Run the enclosed calls in the given lane (e.g. 'batch' for background jobs)"""
+    if lane not in LANES:
+        raise ValueError(f"Lane must be one of: {', '.join(LANES)}")
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class _Waiter:
+    """A queued caller; wake() hands it a slot"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.granted = False
+        self.cancelled = False
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self) -> None:
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class AdmissionController:
+    """
+    Concurrency cap with a bounded priority queue
+
+    Up to max_concurrent calls run at once. Further callers wait in a queue
+    ordered by lane, then arrival. A freed slot goes straight to the next
+    waiter. A caller is rejected at once when the queue is full, and after
+    max_queue_seconds (or its deadline, if sooner) when still waiting. Works
+    for threads (slot) and coroutines (async_slot).
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_queue: int = 32,
+        max_queue_seconds: float = 10.0,
+        retry_after_seconds: float = 2.0
+    ):
+        """
+        Initialize the controller
+
+        Args:
+            max_concurrent: Upstream calls allowed in flight
+            max_queue: Callers allowed to wait for a slot (all lanes together)
+            max_queue_seconds: Longest wait for a slot
+            retry_after_seconds: Retry-After hint given to rejected callers
+        """
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_seconds = max_queue_seconds
+        self.retry_after_seconds = retry_after_seconds
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queue = []
+        self._order = itertools.count()
+
+        self.admitted = {lane: 0 for lane in LANES}
+        self.queued = {lane: 0 for lane in LANES}
+        self.rejected = {'queue_full': 0, 'queue_timeout': 0}
+        self.total_queue_seconds = 0.0
+
+    @contextmanager
+    def slot(self, deadline: Optional[Deadline] = None):
+        """Hold an upstream slot for the enclosed blocking call"""
+        waiter, started = self._enter(None)
+        if waiter is not None:
+            waiter.event.wait(self._wait_limit(deadline))
+            self._finish_wait(waiter, started)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def async_slot(self, deadline: Optional[Deadline] = None):
+        """Hold an upstream slot for the enclosed awaited call"""
+        waiter, started = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self._wait_limit(deadline))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                self._finish_wait(waiter, started, cancelled=True)
+                raise
+            self._finish_wait(waiter, started)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _enter(self, loop) -> tuple:
+        """Take a free slot or join the queue; returns (waiter or None, start time)"""
+        lane = current_lane.get()
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._queue:
+                self._in_flight += 1
+                self.admitted[lane] += 1
+                return None, None
+            if len(self._queue) >= self.max_queue:
+                self.rejected['queue_full'] += 1
+                raise AdmissionRejected('queue full', self.retry_after_seconds)
+            waiter = _Waiter(loop)
+            waiter.lane = lane
+            heapq.heappush(self._queue, (LANES.index(lane), next(self._order), waiter))
+            self.queued[lane] += 1
+            return waiter, time.monotonic()
+
+    def _finish_wait(self, waiter: _Waiter, started: float, cancelled: bool = False) -> None:
+        """Leave the queue after a wait; raise if no slot was handed over in time"""
+        with self._lock:
+            self.total_queue_seconds += time.monotonic() - started
+            if waiter.granted:
+                if not cancelled:
+                    self.admitted[waiter.lane] += 1
+                    return
+                granted_but_cancelled = True
+            else:
+                waiter.cancelled = True
+                self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+                heapq.heapify(self._queue)
+                granted_but_cancelled = False
+                if not cancelled:
+                    self.rejected['queue_timeout'] += 1
+        if granted_but_cancelled:
+            self._release()
+        if not cancelled:
+            raise AdmissionRejected('queue timeout', self.retry_after_seconds)
+
+    def _release(self) -> None:
+        """Free a slot, handing it to the highest-priority waiter if there is one"""
+        with self._lock:
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if not waiter.cancelled:
+                    waiter.wake()
+                    return
+            self._in_flight -= 1
+
+    def _wait_limit(self, deadline: Optional[Deadline]) -> float:
+        """Queue-time limit for one caller"""
+        if deadline is None:
+            return self.max_queue_seconds
+        return min(self.max_queue_seconds, deadline.remaining())
+
+    def stats(self) -> Dict:
+        """Return in-flight count, queue depth per lane and rejection counters"""
+        with self._lock:
+            depth = {lane: 0 for lane in LANES}
+            for _, _, waiter in self._queue:
+                depth[waiter.lane] += 1
+            waits = sum(self.queued.values())
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self._in_flight,
+                'queue_depth': depth,
+                'admitted': dict(self.admitted),
+                'queued': dict(self.queued),
+                'rejected': dict(self.rejected),
+                'mean_queue_seconds': round(self.total_queue_seconds / waits, 3) if waits else 0.0
+            }
+
+
+class ClientRateLimiter:
+    """
+    Token bucket per client
+
+    Buckets are created on first use and the least recently seen clients are
+    dropped beyond max_clients.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: float = 10.0, max_clients: int = 10000):
+        """
+        Initialize the limiter
+
+        Args:
+            rate: Requests per second allowed per client
+            burst: Requests a client may make at once
+            max_clients: Clients tracked before the least recent are forgotten
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def check(self, client: str) -> float:
+        """
+        Take a token for a client
+
+        Returns:
+            0.0 when the request may proceed, otherwise seconds until it may
+        """
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, capacity=self.burst)
+                self._buckets[client] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+        wait = bucket.try_acquire()
+        if wait:
+            with self._lock:
+                self.limited += 1
+        return wait
+
+    def stats(self) -> Dict:
+        """Return limiter settings and counters"""
+        return {
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'clients': len(self._buckets),
+            'limited': self.limited
+        }
@@ -3,11 +3,23 @@ Flask API Server for Flusso RAG Demo
 Provides REST API endpoints for querying the knowledge base
 """
 import os
+import math
 import logging
-from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, abort, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from query_engine import FlussoQueryEngine
+import metrics
+from admission import current_lane
+from query_engine import COMPARE_MODES
+from responses import compress, dumps, lean_result, wants_lean
+from static_assets import StaticAssets
+from config import (
+    BATCH_TIMEOUT_SECONDS, COMPARE_MODE, ERROR_STATUS, FRONTEND_PATH, RESPONSE_COMPRESSION_ENABLED,
+    RESPONSE_COMPRESSION_MIN_BYTES, STORE_ID,
+    client_address, create_client_limiter, create_query_engine, create_query_log, parse_batch_args,
+    parse_budget_args, parse_deadline, parse_lookup_args, parse_query_args, rate_limited_path, request_lane,
+    start_upstream_warmup, too_many_requests
+)
 
 # Configure logging
 logging.basicConfig(
@@ -16,54 +28,165 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through responses.dumps (orjson when installed), without the str round trip"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        """Serialize to a JSON string (the sort_keys/indent options of the default provider do not apply)"""
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs) -> Response:
+        """Build a JSON response from the encoded bytes"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)  # Enable CORS for frontend communication
 
-# Configuration - USE ENVIRONMENT VARIABLES ONLY
-API_KEY = os.getenv('GEMINI_API_KEY')
-STORE_ID = os.getenv('STORE_ID')
-FRONTEND_PATH = Path(__file__).parent.parent / 'frontend'
-
-if not API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable is required")
-if not STORE_ID:
-    raise ValueError("STORE_ID environment variable is required")
-
 # Initialize query engine
 try:
-    query_engine = FlussoQueryEngine(api_key=API_KEY, store_id=STORE_ID)
+    query_engine = create_query_engine()
+    client_limiter = create_client_limiter()
+    query_log = create_query_log()
+    metrics.set_query_log(query_log)
+    static_assets = StaticAssets(FRONTEND_PATH)
+    # Called by gunicorn.conf.py in each worker, after the fork when the app is preloaded
+    app.extensions['flusso_warmup'] = lambda: start_upstream_warmup(query_engine)
     logger.info("✓ Flask app initialized with query engine")
 except Exception as e:
     logger.error(f"Failed to initialize query engine: {e}")
     raise RuntimeError(f"Cannot start application: Query engine initialization failed - {e}")
 
 
+def _lean_requested():
+    """Whether the caller asked for lean results (Prefer: return=minimal, or "lean" in the body or query string)"""
+    data = request.get_json(silent=True) if request.is_json else None
+    flag = data.get('lean') if isinstance(data, dict) else None
+    return wants_lean(request.headers.get('Prefer'), request.args.get('lean', flag))
+
+
+def _result_response(result):
+    """Return an engine result as JSON, with 504/503/429 on timeouts, an open circuit or overload"""
+    status = ERROR_STATUS.get(result.get('error_type'), 200)
+    lean = _lean_requested()
+    response = jsonify(lean_result(result) if lean else result)
+    if lean:
+        response.headers['Preference-Applied'] = 'return=minimal'
+    if result.get('retry_after') is not None:
+        response.headers['Retry-After'] = str(math.ceil(result['retry_after']))
+    return response, status
+
+
+@app.before_request
+def start_request_metrics():
+    """Start timing the request (registered first so rejected requests are counted too)"""
+    g.metrics_timer = metrics.start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    """Record the request once its body, including any stream, has been sent"""
+    timer = g.pop('metrics_timer', None)
+    if timer is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method, status = request.method, response.status_code
+        response.call_on_close(lambda: timer.finish(route, method, status))
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON bodies above the size threshold with the best encoding the client accepts"""
+    if (not RESPONSE_COMPRESSION_ENABLED or response.is_streamed or response.direct_passthrough
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body, coding = compress(response.get_data(), request.headers.get('Accept-Encoding'), RESPONSE_COMPRESSION_MIN_BYTES)
+    if coding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = coding
+    return response
+
+
+@app.before_request
+def admit_request():
+    """Apply the per-client rate limit and pick the priority lane for API requests"""
+    if request.method == 'OPTIONS' or not rate_limited_path(request.path):
+        return None
+    current_lane.set(request_lane(request.path, request.headers.get('X-Priority')))
+    if client_limiter is not None:
+        wait = client_limiter.check(client_address(request.remote_addr, request.headers.get('X-Forwarded-For')))
+        if wait:
+            return _result_response(too_many_requests(wait))
+    return None
+
+
 # ============================================================================
 # API Endpoints
 # ============================================================================
 
+def _asset_response(path):
+    """Serve a frontend file from memory, compressed and with cache validators"""
+    found = static_assets.respond(path, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    if found is None:
+        abort(404)
+    status, headers, body = found
+    return Response(body, status=status, headers=headers)
+
+
 @app.route('/')
 def index():
     """Serve the frontend"""
-    return send_from_directory(FRONTEND_PATH, 'index.html')
+    return _asset_response('')
 
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve static files from frontend directory"""
-    return send_from_directory(FRONTEND_PATH, filename)
+    return _asset_response(filename)
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (503 until the worker's upstream warm-up has finished)"""
+    ready = query_engine.ready
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if ready else 'warming_up',
         'query_engine_ready': query_engine is not None,
+        'ready': ready,
+        'pid': os.getpid(),
+        'warmup': query_engine.warmup,
         'store_id': STORE_ID,
-        'model': query_engine.model_name if query_engine else None
-    })
+        'model': query_engine.model_name if query_engine else None,
+        'cache': query_engine.cache.stats() if query_engine.cache else None,
+        'semantic_cache': query_engine.semantic_cache.stats() if query_engine.semantic_cache else None,
+        'single_flight': query_engine.single_flight.stats() if query_engine.single_flight else None,
+        'context_cache': query_engine.context_cache.stats() if query_engine.context_cache else None,
+        'sessions': query_engine.sessions.stats() if query_engine.sessions else None,
+        'session_prefix_cache': query_engine.session_prefix_cache.stats() if query_engine.session_prefix_cache else None,
+        'local_index': query_engine.local_index.stats() if query_engine.local_index else None,
+        'catalog': query_engine.catalog.stats() if query_engine.catalog else None,
+        'query_log': query_log.stats() if query_log else None,
+        'router': query_engine.router.stats() if query_engine.router else None,
+        'hedging': query_engine.hedger.stats() if query_engine.hedger else None,
+        'retries': query_engine.retry_policy.stats() if query_engine.retry_policy else None,
+        'circuit_breaker': query_engine.breaker.stats() if query_engine.breaker else None,
+        'admission': query_engine.admission.stats() if query_engine.admission else None,
+        'upstream': query_engine.client.stats() if hasattr(query_engine.client, 'stats') else None,
+        'client_rate_limit': client_limiter.stats() if client_limiter else None,
+        'static_assets': static_assets.stats()
+    }), 200 if ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics, aggregated over all workers"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 
 @app.route('/api/query', methods=['POST'])
@@ -75,10 +198,14 @@ def api_query():
     {
         "query": "user question",
         "temperature": 0.3 (optional),
-        "top_p": 0.9 (optional)
+        "top_p": 0.9 (optional),
+        "max_tokens": 1024 (optional, answer-token limit),
+        "thinking_budget": 0 (optional, 0 off, -1 dynamic),
+        "timeout": 30 (optional, seconds)
     }
     
-    Response:
+    Response (504 when the deadline runs out; metadata.truncated is true when
+    the answer was cut off at max_tokens):
     {
         "success": true/false,
         "query": "original query",
@@ -103,60 +230,20 @@ def api_query():
                 'error': 'No JSON data provided'
             }), 400
         
-        # Extract query
-        user_query = data.get('query', '').strip()
-        if not user_query:
+        try:
+            deadline = parse_deadline(data)
+            query_args = parse_query_args(data)
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'error': 'Query cannot be empty'
-            }), 400
-        
-        # Extract optional parameters
-        temperature = data.get('temperature')
-        top_p = data.get('top_p')
-        model = data.get('model')
-        
-        # Validate parameters if provided
-        if temperature is not None:
-            try:
-                temperature = float(temperature)
-                if not 0.0 <= temperature <= 1.0:
-                    raise ValueError()
-            except (ValueError, TypeError):
-                return jsonify({
-                    'success': False,
-                    'error': 'Temperature must be a number between 0.0 and 1.0'
-                }), 400
-        
-        if top_p is not None:
-            try:
-                top_p = float(top_p)
-                if not 0.0 <= top_p <= 1.0:
-                    raise ValueError()
-            except (ValueError, TypeError):
-                return jsonify({
-                    'success': False,
-                    'error': 'Top_p must be a number between 0.0 and 1.0'
-                }), 400
-        
-        # Validate model if provided
-        allowed_models = ['gemini-2.5-flash', 'gemini-2.5-pro']
-        if model is not None and model not in allowed_models:
-            return jsonify({
-                'success': False,
-                'error': f'Model must be one of: {", ".join(allowed_models)}'
+                'error': str(e)
             }), 400
         
         # Process query
-        logger.info(f"API Query received: {user_query[:100]}...")
-        result = query_engine.query(
-            user_query=user_query,
-            temperature=temperature,
-            model=model,
-            top_p=top_p
-        )
+        logger.info(f"API Query received: {query_args['user_query'][:100]}...")
+        result = query_engine.query(**query_args, deadline=deadline)
         
-        return jsonify(result)
+        return _result_response(result)
         
     except Exception as e:
         logger.error(f"Error processing API query: {e}", exc_info=True)
@@ -166,6 +253,230 @@ def api_query():
         }), 500
 
 
+@app.route('/api/query/stream', methods=['POST'])
+def api_query_stream():
+    """
+    Process a user query and stream the answer as Server-Sent Events
+    
+    Request body: Same as /api/query
+    
+    Response (text/event-stream):
+        event: delta   data: {"text": "answer fragment"}   (repeated)
+        event: done    data: {"success": true, "sources": [...], "metadata": {...}, ...}
+        event: error   data: {"success": false, "error": "..."}
+    """
+    if not query_engine:
+        return jsonify({
+            'success': False,
+            'error': 'Query engine not initialized. Check server logs.'
+        }), 500
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': 'No JSON data provided'
+        }), 400
+    
+    try:
+        deadline = parse_deadline(data)
+        query_args = parse_query_args(data)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    logger.info(f"API Stream query received: {query_args['user_query'][:100]}...")
+    lean = _lean_requested()
+    
+    def generate():
+        try:
+            for event in query_engine.query_stream(**query_args, deadline=deadline):
+                name = event.pop('event')
+                if name == 'error':
+                    event['success'] = False
+                if lean and name == 'done':
+                    event = lean_result(event)
+                yield f"event: {name}\ndata: {dumps(event).decode('utf-8')}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}", exc_info=True)
+            payload = dumps({'success': False, 'error': f'Internal server error: {str(e)}'}).decode('utf-8')
+            yield f"event: error\ndata: {payload}\n\n"
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if lean:
+        headers['Preference-Applied'] = 'return=minimal'
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/api/session', methods=['POST'])
+def api_start_session():
+    """
+    Start a conversation session
+    
+    Response (201):
+        {"success": true, "session_id": "...", "idle_timeout": seconds}
+    
+    Pass the id as "session_id" to /api/query or /api/query/stream to ask
+    follow-up questions; clients may also choose their own ids.
+    """
+    if query_engine.sessions is None:
+        return jsonify({
+            'success': False,
+            'error': 'Sessions are not enabled on this server'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'session_id': query_engine.start_session(),
+        'idle_timeout': query_engine.sessions.idle_ttl_seconds
+    }), 201
+
+
+@app.route('/api/session/<session_id>', methods=['GET', 'DELETE'])
+def api_session(session_id):
+    """
+    Show (GET) or end (DELETE) a conversation session
+    
+    Response:
+        GET: {"success": true, "session": {"summary": ..., "turns": [{"question", "answer"}, ...], ...}}
+        DELETE: {"success": true, "deleted": true/false}
+    """
+    if query_engine.sessions is None:
+        return jsonify({
+            'success': False,
+            'error': 'Sessions are not enabled on this server'
+        }), 404
+    
+    if request.method == 'DELETE':
+        return jsonify({
+            'success': True,
+            'deleted': query_engine.end_session(session_id)
+        })
+    
+    session = query_engine.sessions.get(session_id)
+    if session is None:
+        return jsonify({
+            'success': False,
+            'error': 'Session not found or expired'
+        }), 404
+    return jsonify({
+        'success': True,
+        'session': session
+    })
+
+
+@app.route('/api/lookup', methods=['GET'])
+def api_lookup():
+    """
+    Search the local index of the knowledge base (no Gemini call)
+    
+    Query parameters:
+        q: Question or product code (e.g. "flow rate of 100.1000")
+        k: Number of passages to return (default 5)
+    
+    Response:
+        {
+            "success": true,
+            "query": "...",
+            "spec": {"code", "attribute", "label", "value", "path", "score"} or null,
+            "hits": [{"path", "text", "score", "codes"}, ...],
+            "took_ms": 0.4
+        }
+    """
+    if query_engine.local_index is None:
+        return jsonify({
+            'success': False,
+            'error': 'Local index is not enabled on this server'
+        }), 404
+    
+    try:
+        lookup_args = parse_lookup_args(request.args)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    return jsonify(query_engine.lookup(**lookup_args))
+
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Run many queries and helper lookups concurrently
+    
+    Request body:
+    {
+        "items": [
+            {"query": "user question", "model": "gemini-2.5-flash"},
+            {"type": "product", "product_code": "100.1000"},
+            {"type": "parts", "product_code": "100.1000"},
+            {"type": "installation", "product_code": "100.1000"},
+            {"type": "compare", "products": ["100.1000", "160.1000"]},
+            {"type": "search", "category": "kitchen faucet", "features": ["pull-down"]}
+        ],
+        "concurrency": 4 (optional),
+        "stream": false (optional)
+    }
+    
+    Response:
+        {"success": true, "count": N, "results": [...]} with results in input order,
+        each shaped like /api/query (failed items have success=false and error).
+        With "stream": true or "Accept: application/x-ndjson", one JSON line per
+        item is sent as it finishes, each with its "index".
+    """
+    if not query_engine:
+        return jsonify({
+            'success': False,
+            'error': 'Query engine not initialized'
+        }), 500
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': 'No JSON data provided'
+        }), 400
+    
+    try:
+        deadline = parse_deadline(data, BATCH_TIMEOUT_SECONDS)
+        batch = parse_batch_args(data)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    logger.info(f"API Batch request: {len(batch['items'])} items (concurrency {batch['concurrency']})")
+    metrics.note_batch(len(batch['items']))
+    lean = _lean_requested()
+    shape = lean_result if lean else dict
+    headers = {'Preference-Applied': 'return=minimal'} if lean else {}
+    
+    if batch['stream'] or request.accept_mimetypes.best == 'application/x-ndjson':
+        def generate():
+            for index, result in query_engine.iter_query_many(batch['items'], batch['concurrency'], deadline):
+                yield dumps(dict(shape(result), index=index)) + b"\n"
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
+    
+    try:
+        results = query_engine.query_many(batch['items'], batch['concurrency'], deadline)
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'results': [shape(result) for result in results]
+        }), headers
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+
 @app.route('/api/product/<product_code>', methods=['GET'])
 def api_product_info(product_code):
     """
@@ -173,6 +484,7 @@ def api_product_info(product_code):
     
     Parameters:
         product_code: Product code (e.g., "100.1000")
+        max_tokens, thinking_budget: Optional query parameters overriding the budgets
     
     Response: Same as /api/query
     """
@@ -183,9 +495,17 @@ def api_product_info(product_code):
         }), 500
     
     try:
+        try:
+            budget_args = parse_budget_args(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         logger.info(f"API Product info request: {product_code}")
-        result = query_engine.get_product_info(product_code)
-        return jsonify(result)
+        result = query_engine.get_product_info(product_code, deadline=parse_deadline(None), **budget_args)
+        return _result_response(result)
         
     except Exception as e:
         logger.error(f"Error getting product info: {e}", exc_info=True)
@@ -202,7 +522,9 @@ def api_compare_products():
     
     Request body:
     {
-        "products": ["100.1000", "160.1000", ...]
+        "products": ["100.1000", "160.1000", ...],
+        "mode": "single" | "decomposed" (optional, default COMPARE_MODE),
+        "max_tokens": 4096, "thinking_budget": 1024 (optional)
     }
     
     Response: Same as /api/query
@@ -235,9 +557,25 @@ def api_compare_products():
                 'error': 'At least 2 products required for comparison'
             }), 400
         
-        logger.info(f"API Compare request: {', '.join(product_codes)}")
-        result = query_engine.compare_products(product_codes)
-        return jsonify(result)
+        mode = data.get('mode', COMPARE_MODE)
+        if mode not in COMPARE_MODES:
+            return jsonify({
+                'success': False,
+                'error': f'Mode must be one of: {", ".join(COMPARE_MODES)}'
+            }), 400
+        
+        try:
+            deadline = parse_deadline(data)
+            budget_args = parse_budget_args(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        logger.info(f"API Compare request ({mode}): {', '.join(product_codes)}")
+        result = query_engine.compare_products(product_codes, mode=mode, deadline=deadline, **budget_args)
+        return _result_response(result)
         
     except Exception as e:
         logger.error(f"Error comparing products: {e}", exc_info=True)
@@ -255,7 +593,8 @@ def api_search_by_features():
     Request body:
     {
         "category": "kitchen faucet",
-        "features": ["pull-down", "matte black", ...]
+        "features": ["pull-down", "matte black", ...],
+        "max_tokens": 1024, "thinking_budget": 0 (optional)
     }
     
     Response: Same as /api/query
@@ -289,9 +628,18 @@ def api_search_by_features():
                 'error': 'Features must be a non-empty list'
             }), 400
         
+        try:
+            deadline = parse_deadline(data)
+            budget_args = parse_budget_args(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         logger.info(f"API Search request: {category} - {', '.join(features)}")
-        result = query_engine.search_by_features(category, features)
-        return jsonify(result)
+        result = query_engine.search_by_features(category, features, deadline=deadline, **budget_args)
+        return _result_response(result)
         
     except Exception as e:
         logger.error(f"Error searching by features: {e}", exc_info=True)
@@ -308,6 +656,7 @@ def api_installation_guide(product_code):
     
     Parameters:
         product_code: Product code
+        max_tokens, thinking_budget: Optional query parameters overriding the budgets
     
     Response: Same as /api/query
     """
@@ -318,9 +667,17 @@ def api_installation_guide(product_code):
         }), 500
     
     try:
+        try:
+            budget_args = parse_budget_args(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         logger.info(f"API Installation guide request: {product_code}")
-        result = query_engine.get_installation_guide(product_code)
-        return jsonify(result)
+        result = query_engine.get_installation_guide(product_code, deadline=parse_deadline(None), **budget_args)
+        return _result_response(result)
         
     except Exception as e:
         logger.error(f"Error getting installation guide: {e}", exc_info=True)
@@ -337,6 +694,7 @@ def api_parts_info(product_code):
     
     Parameters:
         product_code: Product code
+        max_tokens, thinking_budget: Optional query parameters overriding the budgets
     
     Response: Same as /api/query
     """
@@ -347,9 +705,17 @@ def api_parts_info(product_code):
         }), 500
     
     try:
+        try:
+            budget_args = parse_budget_args(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         logger.info(f"API Parts info request: {product_code}")
-        result = query_engine.get_parts_info(product_code)
-        return jsonify(result)
+        result = query_engine.get_parts_info(product_code, deadline=parse_deadline(None), **budget_args)
+        return _result_response(result)
         
     except Exception as e:
         logger.error(f"Error getting parts info: {e}", exc_info=True)
@@ -405,6 +771,7 @@ def main():
     if os.getenv('RENDER'):
         logger.info("Running in production mode with gunicorn")
     else:
+        start_upstream_warmup(query_engine)
         app.run(host='0.0.0.0', port=port, debug=debug)
 
 
@@ -0,0 +1,511 @@
+"""
+ASGI API Server for Flusso RAG Demo
+Serves the same REST API as app.py on an event loop, backed by AsyncFlussoQueryEngine,
+so a single process can hold hundreds of concurrent Gemini calls
+
+Run with:
+    gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --workers 2 --timeout 300
+"""
+import os
+import asyncio
+import math
+import logging
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from admission import ClientRateLimiter, current_lane
+from async_query_engine import AsyncFlussoQueryEngine
+from query_engine import COMPARE_MODES
+from query_log import QueryLog
+from responses import compress, dumps, lean_result, wants_lean
+from static_assets import StaticAssets
+from config import (
+    BATCH_TIMEOUT_SECONDS, COMPARE_MODE, ERROR_STATUS, FRONTEND_PATH, RESPONSE_COMPRESSION_ENABLED,
+    RESPONSE_COMPRESSION_MIN_BYTES, STORE_ID,
+    client_address, create_client_limiter, create_query_engine, create_query_log, parse_batch_args,
+    parse_budget_args, parse_deadline, parse_lookup_args, parse_query_args, rate_limited_path, request_lane,
+    start_upstream_warmup, too_many_requests
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded through responses.dumps (orjson when installed)"""
+
+    def render(self, content) -> bytes:
+        """Encode the content as compact UTF-8 JSON"""
+        return dumps(content)
+
+
+def _error(message: str, status_code: int) -> FastJSONResponse:
+    """Build an error response in the API's standard shape"""
+    return FastJSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+
+def _lean_requested(request: Request, data=None) -> bool:
+    """Whether the caller asked for lean results (Prefer: return=minimal, or "lean" in the body or query string)"""
+    flag = data.get('lean') if isinstance(data, dict) else None
+    return wants_lean(request.headers.get('prefer'), request.query_params.get('lean', flag))
+
+
+def _lean_headers(lean: bool) -> dict:
+    """Headers acknowledging lean mode"""
+    return {'Preference-Applied': 'return=minimal'} if lean else {}
+
+
+def _result_response(result: dict, lean: bool = False) -> FastJSONResponse:
+    """Return an engine result as JSON, with 504/503/429 on timeouts, an open circuit or overload"""
+    headers = _lean_headers(lean)
+    if result.get('retry_after') is not None:
+        headers['Retry-After'] = str(math.ceil(result['retry_after']))
+    return FastJSONResponse(
+        lean_result(result) if lean else result,
+        status_code=ERROR_STATUS.get(result.get('error_type'), 200),
+        headers=headers
+    )
+
+
+async def _json_body(request: Request):
+    """Decode the JSON request body, returning None when it is missing or invalid"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+class MetricsMiddleware:
+    """Record the latency, status and in-flight count of every HTTP request"""
+
+    def __init__(self, app, routes: list):
+        self.app = app
+        self.paths = {route.endpoint: route.path for route in routes}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        timer = metrics.start_request()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched endpoint in the scope
+            timer.finish(self.paths.get(scope.get('endpoint'), 'unmatched'), scope['method'], status)
+
+
+class CompressionMiddleware:
+    """Compress JSON responses above the size threshold with the best encoding the client accepts"""
+
+    def __init__(self, app, min_bytes: int = 1024):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        accept_encoding = Headers(scope=scope).get('accept-encoding')
+        held = None
+
+        async def send_compressed(message):
+            nonlocal held
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                if headers.get('content-type', '').startswith('application/json') and 'content-encoding' not in headers:
+                    held = message  # Wait for the body to decide
+                    return
+            elif message['type'] == 'http.response.body' and held is not None:
+                start, held = held, None
+                if not message.get('more_body', False):
+                    body, coding = compress(message.get('body', b''), accept_encoding, self.min_bytes)
+                    headers = MutableHeaders(raw=start['headers'])
+                    headers.add_vary_header('Accept-Encoding')
+                    if coding is not None:
+                        headers['Content-Encoding'] = coding
+                        headers['Content-Length'] = str(len(body))
+                        message = {'type': 'http.response.body', 'body': body}
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+class AdmissionMiddleware:
+    """Apply the per-client rate limit and pick the priority lane for API requests"""
+
+    def __init__(self, app, client_limiter: Optional[ClientRateLimiter] = None):
+        self.app = app
+        self.client_limiter = client_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not rate_limited_path(scope['path']):
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        current_lane.set(request_lane(scope['path'], request.headers.get('x-priority')))
+        if self.client_limiter is not None:
+            peer = request.client.host if request.client else None
+            wait = self.client_limiter.check(client_address(peer, request.headers.get('x-forwarded-for')))
+            if wait:
+                return await _result_response(too_many_requests(wait))(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+def create_app(
+    query_engine: AsyncFlussoQueryEngine,
+    client_limiter: Optional[ClientRateLimiter] = None,
+    query_log: Optional[QueryLog] = None
+) -> Starlette:
+    """
+    Build the ASGI application around an async query engine
+
+    Args:
+        query_engine: Engine whose query methods are coroutines
+        client_limiter: Optional per-client rate limiter for the /api routes
+        query_log: Optional query log receiving a record of every API request
+
+    Returns:
+        Starlette application exposing the /api routes and the frontend
+    """
+    metrics.set_query_log(query_log)
+
+    static_assets = StaticAssets(FRONTEND_PATH)
+
+    def _asset_response(request: Request, path: str) -> Response:
+        """Serve a frontend file from memory, compressed and with cache validators"""
+        found = static_assets.respond(
+            path, request.headers.get('accept-encoding'), request.headers.get('if-none-match')
+        )
+        if found is None:
+            return _error('Endpoint not found', 404)
+        status, headers, body = found
+        return Response(body, status_code=status, headers=headers)
+
+    async def index(request: Request):
+        """Serve the frontend"""
+        return _asset_response(request, '')
+
+    async def serve_static(request: Request):
+        """Serve static files from frontend directory"""
+        return _asset_response(request, request.path_params['filename'])
+
+    async def health_check(request: Request):
+        """Health check endpoint (503 until the worker's upstream warm-up has finished)"""
+        ready = query_engine.ready
+        return FastJSONResponse({
+            'status': 'healthy' if ready else 'warming_up',
+            'query_engine_ready': query_engine is not None,
+            'ready': ready,
+            'pid': os.getpid(),
+            'warmup': query_engine.warmup,
+            'store_id': STORE_ID,
+            'model': query_engine.model_name,
+            'cache': query_engine.cache.stats() if query_engine.cache else None,
+            'semantic_cache': query_engine.semantic_cache.stats() if query_engine.semantic_cache else None,
+            'single_flight': query_engine.single_flight.stats() if query_engine.single_flight else None,
+            'context_cache': query_engine.context_cache.stats() if query_engine.context_cache else None,
+            'sessions': query_engine.sessions.stats() if query_engine.sessions else None,
+            'session_prefix_cache': (
+                query_engine.session_prefix_cache.stats() if query_engine.session_prefix_cache else None
+            ),
+            'local_index': query_engine.local_index.stats() if query_engine.local_index else None,
+            'catalog': query_engine.catalog.stats() if query_engine.catalog else None,
+            'query_log': query_log.stats() if query_log else None,
+            'router': query_engine.router.stats() if query_engine.router else None,
+            'hedging': query_engine.hedger.stats() if query_engine.hedger else None,
+            'retries': query_engine.retry_policy.stats() if query_engine.retry_policy else None,
+            'circuit_breaker': query_engine.breaker.stats() if query_engine.breaker else None,
+            'admission': query_engine.admission.stats() if query_engine.admission else None,
+            'upstream': query_engine.client.stats() if hasattr(query_engine.client, 'stats') else None,
+            'client_rate_limit': client_limiter.stats() if client_limiter else None,
+            'static_assets': static_assets.stats()
+        }, status_code=200 if ready else 503)
+
+    async def api_query(request: Request):
+        """Process a user query (same contract as the Flask /api/query)"""
+        data = await _json_body(request)
+        if not data:
+            return _error('No JSON data provided', 400)
+        try:
+            deadline = parse_deadline(data)
+            query_args = parse_query_args(data)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        try:
+            logger.info(f"API Query received: {query_args['user_query'][:100]}...")
+            result = await query_engine.query(**query_args, deadline=deadline)
+            return _result_response(result, _lean_requested(request, data))
+        except Exception as e:
+            logger.error(f"Error processing API query: {e}", exc_info=True)
+            return _error(f'Internal server error: {str(e)}', 500)
+
+    async def api_query_stream(request: Request):
+        """Process a user query and stream the answer as Server-Sent Events"""
+        data = await _json_body(request)
+        if not data:
+            return _error('No JSON data provided', 400)
+        try:
+            deadline = parse_deadline(data)
+            query_args = parse_query_args(data)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        logger.info(f"API Stream query received: {query_args['user_query'][:100]}...")
+        lean = _lean_requested(request, data)
+
+        async def generate():
+            try:
+                async for event in query_engine.query_stream(**query_args, deadline=deadline):
+                    name = event.pop('event')
+                    if name == 'error':
+                        event['success'] = False
+                    if lean and name == 'done':
+                        event = lean_result(event)
+                    yield f"event: {name}\ndata: {dumps(event).decode('utf-8')}\n\n"
+            except Exception as e:
+                logger.error(f"Error streaming query: {e}", exc_info=True)
+                payload = dumps({'success': False, 'error': f'Internal server error: {str(e)}'}).decode('utf-8')
+                yield f"event: error\ndata: {payload}\n\n"
+
+        return StreamingResponse(
+            generate(),
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **_lean_headers(lean)}
+        )
+
+    async def api_start_session(request: Request):
+        """Start a conversation session (same contract as the Flask /api/session)"""
+        if query_engine.sessions is None:
+            return _error('Sessions are not enabled on this server', 404)
+        return FastJSONResponse({
+            'success': True,
+            'session_id': await asyncio.to_thread(query_engine.start_session),
+            'idle_timeout': query_engine.sessions.idle_ttl_seconds
+        }, status_code=201)
+
+    async def api_session(request: Request):
+        """Show (GET) or end (DELETE) a conversation session"""
+        if query_engine.sessions is None:
+            return _error('Sessions are not enabled on this server', 404)
+        session_id = request.path_params['session_id']
+        if request.method == 'DELETE':
+            return FastJSONResponse({'success': True, 'deleted': await asyncio.to_thread(query_engine.end_session, session_id)})
+        session = await asyncio.to_thread(query_engine.sessions.get, session_id)
+        if session is None:
+            return _error('Session not found or expired', 404)
+        return FastJSONResponse({'success': True, 'session': session})
+
+    async def api_lookup(request: Request):
+        """Search the local index of the knowledge base (same contract as the Flask /api/lookup)"""
+        if query_engine.local_index is None:
+            return _error('Local index is not enabled on this server', 404)
+        try:
+            lookup_args = parse_lookup_args(request.query_params)
+        except ValueError as e:
+            return _error(str(e), 400)
+        return FastJSONResponse(await asyncio.to_thread(query_engine.lookup, **lookup_args))
+
+    async def api_batch(request: Request):
+        """Run many queries and helper lookups concurrently (same contract as the Flask /api/batch)"""
+        data = await _json_body(request)
+        if not data:
+            return _error('No JSON data provided', 400)
+        try:
+            deadline = parse_deadline(data, BATCH_TIMEOUT_SECONDS)
+            batch = parse_batch_args(data)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        logger.info(f"API Batch request: {len(batch['items'])} items (concurrency {batch['concurrency']})")
+        metrics.note_batch(len(batch['items']))
+        lean = _lean_requested(request, data)
+        shape = lean_result if lean else dict
+
+        if batch['stream'] or 'application/x-ndjson' in request.headers.get('accept', ''):
+            async def generate():
+                async for index, result in query_engine.iter_query_many(batch['items'], batch['concurrency'], deadline):
+                    yield dumps(dict(shape(result), index=index)) + b"\n"
+
+            return StreamingResponse(generate(), media_type='application/x-ndjson', headers=_lean_headers(lean))
+
+        try:
+            results = await query_engine.query_many(batch['items'], batch['concurrency'], deadline)
+            return FastJSONResponse(
+                {'success': True, 'count': len(results), 'results': [shape(result) for result in results]},
+                headers=_lean_headers(lean)
+            )
+        except Exception as e:
+            logger.error(f"Error processing batch: {e}", exc_info=True)
+            return _error(f'Internal server error: {str(e)}', 500)
+
+    async def api_product_info(request: Request):
+        """Get information for a specific product"""
+        product_code = request.path_params['product_code']
+        try:
+            budget_args = parse_budget_args(request.query_params)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        try:
+            logger.info(f"API Product info request: {product_code}")
+            result = await query_engine.get_product_info(product_code, deadline=parse_deadline(None), **budget_args)
+            return _result_response(result, _lean_requested(request))
+        except Exception as e:
+            logger.error(f"Error getting product info: {e}", exc_info=True)
+            return _error(f'Internal server error: {str(e)}', 500)
+
+    async def api_compare_products(request: Request):
+        """Compare multiple products"""
+        data = await _json_body(request)
+        if not data:
+            return _error('No JSON data provided', 400)
+
+        product_codes = data.get('products', [])
+        if not isinstance(product_codes, list):
+            return _error('Products must be a list', 400)
+        if len(product_codes) < 2:
+            return _error('At least 2 products required for comparison', 400)
+        mode = data.get('mode', COMPARE_MODE)
+        if mode not in COMPARE_MODES:
+            return _error(f'Mode must be one of: {", ".join(COMPARE_MODES)}', 400)
+        try:
+            deadline = parse_deadline(data)
+            budget_args = parse_budget_args(data)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        try:
+            logger.info(f"API Compare request ({mode}): {', '.join(product_codes)}")
+            result = await query_engine.compare_products(product_codes, mode=mode, deadline=deadline, **budget_args)
+            return _result_response(result, _lean_requested(request, data))
+        except Exception as e:
+            logger.error(f"Error comparing products: {e}", exc_info=True)
+            return _error(f'Internal server error: {str(e)}', 500)
+
+    async def api_search_by_features(request: Request):
+        """Search for products by features"""
+        data = await _json_body(request)
+        if not data:
+            return _error('No JSON data provided', 400)
+
+        category = (data.get('category') or '').strip()
+        features = data.get('features', [])
+        if not category:
+            return _error('Category is required', 400)
+        if not features or not isinstance(features, list):
+            return _error('Features must be a non-empty list', 400)
+        try:
+            deadline = parse_deadline(data)
+            budget_args = parse_budget_args(data)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        try:
+            logger.info(f"API Search request: {category} - {', '.join(features)}")
+            result = await query_engine.search_by_features(category, features, deadline=deadline, **budget_args)
+            return _result_response(result, _lean_requested(request, data))
+        except Exception as e:
+            logger.error(f"Error searching by features: {e}", exc_info=True)
+            return _error(f'Internal server error: {str(e)}', 500)
+
+    async def api_installation_guide(request: Request):
+        """Get installation guide for a product"""
+        product_code = request.path_params['product_code']
+        try:
+            budget_args = parse_budget_args(request.query_params)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        try:
+            logger.info(f"API Installation guide request: {product_code}")
+            result = await query_engine.get_installation_guide(product_code, deadline=parse_deadline(None), **budget_args)
+            return _result_response(result, _lean_requested(request))
+        except Exception as e:
+            logger.error(f"Error getting installation guide: {e}", exc_info=True)
+            return _error(f'Internal server error: {str(e)}', 500)
+
+    async def api_parts_info(request: Request):
+        """Get parts information for a product"""
+        product_code = request.path_params['product_code']
+        try:
+            budget_args = parse_budget_args(request.query_params)
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        try:
+            logger.info(f"API Parts info request: {product_code}")
+            result = await query_engine.get_parts_info(product_code, deadline=parse_deadline(None), **budget_args)
+            return _result_response(result, _lean_requested(request))
+        except Exception as e:
+            logger.error(f"Error getting parts info: {e}", exc_info=True)
+            return _error(f'Internal server error: {str(e)}', 500)
+
+    async def not_found(request: Request, exc):
+        """Handle 404 errors"""
+        return _error('Endpoint not found', 404)
+
+    async def metrics_endpoint(request: Request):
+        """Prometheus metrics, aggregated over all workers"""
+        body, content_type = metrics.render()
+        return Response(body, headers={'Content-Type': content_type})
+
+    routes = [
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+        Route('/api/health', health_check, methods=['GET']),
+        Route('/api/query', api_query, methods=['POST']),
+        Route('/api/query/stream', api_query_stream, methods=['POST']),
+        Route('/api/session', api_start_session, methods=['POST']),
+        Route('/api/session/{session_id}', api_session, methods=['GET', 'DELETE']),
+        Route('/api/lookup', api_lookup, methods=['GET']),
+        Route('/api/batch', api_batch, methods=['POST']),
+        Route('/api/product/{product_code}', api_product_info, methods=['GET']),
+        Route('/api/compare', api_compare_products, methods=['POST']),
+        Route('/api/search', api_search_by_features, methods=['POST']),
+        Route('/api/installation/{product_code}', api_installation_guide, methods=['GET']),
+        Route('/api/parts/{product_code}', api_parts_info, methods=['GET']),
+        Route('/', index, methods=['GET']),
+        Route('/{filename:path}', serve_static, methods=['GET']),
+    ]
+
+    middleware = [
+        Middleware(MetricsMiddleware, routes=routes),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(AdmissionMiddleware, client_limiter=client_limiter)
+    ]
+    if RESPONSE_COMPRESSION_ENABLED:
+        middleware.insert(1, Middleware(CompressionMiddleware, min_bytes=RESPONSE_COMPRESSION_MIN_BYTES))
+
+    return Starlette(
+        routes=routes,
+        middleware=middleware,
+        exception_handlers={404: not_found},
+        on_startup=[lambda: start_upstream_warmup(query_engine)]
+    )
+
+
+# Initialize query engine
+try:
+    app = create_app(create_query_engine(AsyncFlussoQueryEngine), create_client_limiter(), create_query_log())
+    logger.info("✓ ASGI app initialized with async query engine")
+except Exception as e:
+    logger.error(f"Failed to initialize query engine: {e}")
+    raise RuntimeError(f"Cannot start application: Query engine initialization failed - {e}")
@@ -0,0 +1,441 @@
+"""
+Async variant of the Flusso query engine
+Uses the Gemini SDK's async client (client.aio) so one process can hold many
+upstream requests in flight at once
+"""
+import time
+import asyncio
+import logging
+from contextlib import nullcontext
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from deadline import Deadline, DeadlineExceeded
+from metrics import note_query, upstream_call
+from query_engine import BUDGET_KEYS, COMPARE_MODES, GEMINI_BASE_URL, AnswerStream, FlussoQueryEngine, QueryPlan
+from response_cache import ResponseCache
+from single_flight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFlussoQueryEngine(FlussoQueryEngine):
+    """
+    Query engine whose query() and query_stream() are coroutines
+
+    Planning, caching, prompt building and result shaping are inherited
+    unchanged; the steps that read or write SQLite (caches, sessions, the
+    catalog) run in worker threads so they never block the event loop. The
+    helper methods (get_product_info, compare_products, ...) return
+    self.query(...), so on this class they return awaitables.
+    """
+
+    single_flight_class = AsyncSingleFlight
+
+    def start_warm_up(self, connections: int = 2, probe: bool = False) -> None:
+        """
+        Warm up the upstream connections in a task on the running event loop
+
+        Call this from the app's startup in each worker; the engine reports
+        ready=False until awarm_up() has finished.
+        """
+        self.ready = False
+        self._warmup_task = asyncio.get_running_loop().create_task(self.awarm_up(connections, probe))
+
+    async def awarm_up(self, connections: int = 2, probe: bool = False, timeout: float = 10.0) -> Dict:
+        """
+        Open pooled keep-alive connections on the async client's pool
+
+        Args:
+            Same as FlussoQueryEngine.warm_up()
+
+        Returns:
+            Warm-up summary
+        """
+        self.ready = False
+        started = time.time()
+        summary = {'connections': 0, 'probe': None, 'error': None, 'skipped': not self._owns_client}
+        try:
+            client = self.client
+            if self._owns_client:
+                await asyncio.gather(*(
+                    self._async_http_client.head(GEMINI_BASE_URL, timeout=timeout) for _ in range(connections)
+                ))
+                summary['connections'] = connections
+                if probe:
+                    await client.aio.models.get(model=self.model_name, config=types.GetModelConfig(
+                        http_options=types.HttpOptions(timeout=int(timeout * 1000))
+                    ))
+                    summary['probe'] = 'ok'
+        except Exception as e:
+            logger.warning(f"Upstream warm-up failed: {e}")
+            summary['error'] = str(e)
+            if probe and summary['connections']:
+                summary['probe'] = 'failed'
+        return self._finish_warm_up(summary, started)
+
+    async def query(
+        self,
+        user_query: str,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        model: Optional[str] = None,
+        refresh: bool = False,
+        file_search: bool = True,
+        deadline: Optional[Deadline] = None,
+        session_id: Optional[str] = None,
+        thinking_budget: Optional[int] = None,
+        route: bool = True
+    ) -> Dict:
+        """
+        Process a user query without blocking the event loop
+
+        Args:
+            Same as FlussoQueryEngine.query()
+
+        Returns:
+            Dictionary with answer, sources, and metadata
+        """
+        plan = await asyncio.to_thread(
+            self._plan_query,
+            user_query, temperature, top_p, max_tokens, model, file_search, deadline, session_id, thinking_budget, route
+        )
+        if plan.result is not None:
+            return plan.result
+        if plan.history:
+            return await self._query_session(plan)
+
+        result = await self._query_model(plan.prompt, plan.params, refresh, plan.deadline)
+        escalation = self._escalation(plan, result)
+        if escalation is not None:
+            decision, params = escalation
+            escalated = await self._query_model(plan.prompt, params, refresh, plan.deadline)
+            if escalated.get('success'):
+                result, plan.decision = escalated, decision
+
+        return await self._finish_query_async(plan, result)
+
+    async def _finish_query_async(self, plan: QueryPlan, result: Dict) -> Dict:
+        """_finish_query(), in a thread when it writes the first turn of a session"""
+        if plan.session_id is None:
+            return self._finish_query(plan, result)
+        return await asyncio.to_thread(self._finish_query, plan, result)
+
+    async def _query_model(
+        self,
+        user_query: str,
+        params: Dict,
+        refresh: bool,
+        deadline: Optional[Deadline]
+    ) -> Dict:
+        """Answer a query with fixed parameters from the caches, a shared call or Gemini"""
+        cached, cache_key = await asyncio.to_thread(self._lookup_cache, user_query, params, refresh)
+        if cached is not None:
+            return cached
+
+        if self.single_flight is None:
+            return await self._generate(user_query, params, cache_key, deadline)
+
+        result, shared = await self.single_flight.do(
+            cache_key or ResponseCache.make_key(user_query, **params),
+            lambda: self._generate(user_query, params, cache_key, deadline),
+            recheck=None if refresh else lambda: self._recheck_cache(user_query, cache_key),
+            deadline=deadline
+        )
+        return self._from_shared(result, user_query) if shared else result
+
+    async def _generate(
+        self,
+        user_query: str,
+        params: Dict,
+        cache_key: Optional[str],
+        deadline: Optional[Deadline] = None
+    ) -> Dict:
+        """Call Gemini for a query that missed the caches and store the result"""
+        try:
+            start_time = time.time()
+
+            logger.info(f"Using model: {params['model']}")
+            if deadline is not None:
+                deadline.check('the upstream call')
+
+            contents = self._build_prompt(user_query)
+            response = await self._call_upstream(
+                lambda: self.client.aio.models.generate_content(
+                    model=params['model'],
+                    contents=contents,
+                    config=self._build_config(params, deadline)
+                ),
+                params['model'],
+                deadline
+            )
+            return await asyncio.to_thread(self._generated, user_query, params, cache_key, response, start_time)
+
+        except Exception as e:
+            return await asyncio.to_thread(self._generation_failed, user_query, cache_key, e, deadline)
+
+    async def _query_session(self, plan: QueryPlan) -> Dict:
+        """Answer the next question of a session with its history (answers depend on it, so nothing is cached)"""
+        params, deadline = plan.params, plan.deadline
+        turn = await asyncio.to_thread(self._session_turn, plan.session_id, plan.user_query, params)
+        try:
+            start_time = time.time()
+            if deadline is not None:
+                deadline.check('the upstream call')
+            response = await self._call_upstream(
+                lambda: self.client.aio.models.generate_content(
+                    model=params['model'],
+                    contents=turn.contents,
+                    config=self._build_config(params, deadline, turn.cached_content)
+                ),
+                params['model'],
+                deadline
+            )
+            return await asyncio.to_thread(self._session_answered, plan, turn, response, start_time)
+        except Exception as e:
+            return self._error_result(plan.user_query, self._deadline_error(e, deadline))
+
+    async def _call_upstream(self, call, model: str, deadline: Optional[Deadline]):
+        """Await a generate_content call through admission, hedging, retries and the circuit breaker"""
+        async def timed():
+            with upstream_call(model):
+                return await call()
+
+        async def admitted():
+            # A hedge is one more upstream call, so it takes a slot of its own
+            async with self._upstream_slot(deadline):
+                return await timed()
+
+        async def hedged():
+            if self.hedger is not None:
+                return await self.hedger.acall(timed, deadline, key=model, hedge_fn=admitted)
+            if deadline is None:
+                return await timed()
+            try:
+                return await asyncio.wait_for(timed(), deadline.remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"Deadline of {deadline.budget:g}s exceeded during upstream call")
+
+        async def attempt():
+            async with self._upstream_slot(deadline):
+                return await hedged()
+
+        if self.retry_policy is not None:
+            return await self.retry_policy.acall(attempt, deadline)
+        return await attempt()
+
+    def _upstream_slot(self, deadline: Optional[Deadline]):
+        """Async admission slot for one upstream call (a no-op without admission control)"""
+        if self.admission is None:
+            return nullcontext()
+        return self.admission.async_slot(deadline)
+
+    async def query_stream(
+        self,
+        user_query: str,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        model: Optional[str] = None,
+        refresh: bool = False,
+        file_search: bool = True,
+        deadline: Optional[Deadline] = None,
+        session_id: Optional[str] = None,
+        thinking_budget: Optional[int] = None,
+        route: bool = True
+    ) -> AsyncIterator[Dict]:
+        """
+        Process a user query and stream the answer as it is generated
+
+        Args:
+            Same as FlussoQueryEngine.query()
+
+        Yields:
+            Same events as FlussoQueryEngine.query_stream()
+        """
+        plan = await asyncio.to_thread(
+            self._plan_query,
+            user_query, temperature, top_p, max_tokens, model, file_search, deadline, session_id, thinking_budget, route,
+            True
+        )
+        if plan.result is not None:
+            for event in self._result_events(plan.result):
+                yield event
+            return
+        turn, cached, cache_key = await asyncio.to_thread(self._stream_start, plan, refresh)
+        if cached is not None:
+            for event in self._result_events(cached):
+                yield event
+            return
+
+        answer = AnswerStream(plan.params['model'], plan.deadline)
+        try:
+            contents, config = self._stream_request(plan, turn)
+            async with self._upstream_slot(plan.deadline):
+                with upstream_call(plan.params['model']):
+                    stream = await self.client.aio.models.generate_content_stream(
+                        model=plan.params['model'],
+                        contents=contents,
+                        config=config
+                    )
+                    async for chunk in stream:
+                        text = answer.add(chunk)
+                        if text:
+                            yield {'event': 'delta', 'text': text}
+            yield await asyncio.to_thread(self._stream_done, plan, answer, turn, cache_key)
+
+        except Exception as e:
+            for event in await asyncio.to_thread(self._stream_failed, plan, answer, cache_key, e):
+                yield event
+        except BaseException:
+            # The client closed the stream (GeneratorExit) or the task was cancelled
+            if self.breaker is not None:
+                self.breaker.record_abandoned()
+            raise
+
+    async def compare_products(self, product_codes: List[str], mode: str = 'single', **query_kwargs) -> Dict:
+        """
+        Compare multiple products
+
+        Args:
+            Same as FlussoQueryEngine.compare_products()
+
+        Returns:
+            Query result dictionary
+        """
+        if len(product_codes) < 2:
+            raise ValueError("At least 2 products required for comparison")
+        if mode not in COMPARE_MODES:
+            raise ValueError(f"Compare mode must be one of: {', '.join(COMPARE_MODES)}")
+        note_query(self._comparison_prompt(product_codes))
+
+        if mode == 'single' and not await asyncio.to_thread(self._catalog_covers, product_codes):
+            return await self.query(self._comparison_prompt(product_codes), **self._budget('compare', query_kwargs))
+
+        # Per-product lookups and the synthesis share one deadline
+        query_kwargs['deadline'] = self._request_deadline(query_kwargs.get('deadline'))
+        details_kwargs = self._step_kwargs(
+            {key: value for key, value in query_kwargs.items() if key not in BUDGET_KEYS}
+        )
+        details = await asyncio.gather(*(
+            self.get_product_details(code, **details_kwargs) for code in product_codes
+        ))
+
+        local = self._local_comparison(product_codes, details)
+        if local is not None:
+            return local
+
+        synthesis = await self.query(
+            self._synthesis_prompt(product_codes, details),
+            file_search=False,
+            **self._step_kwargs(self._budget('compare', query_kwargs))
+        )
+        return self._decomposed_result(product_codes, details, synthesis)
+
+    async def get_product_details(self, product_code: str, **query_kwargs) -> Dict:
+        """
+        Get structured specifications for one product
+
+        Args:
+            Same as FlussoQueryEngine.get_product_details()
+
+        Returns:
+            Query result dictionary with a 'details' field
+        """
+        product = await asyncio.to_thread(self.catalog.get, product_code) if self.catalog is not None else None
+        if product is not None:
+            return self._catalog_details(product)
+        return self._attach_details(
+            await self.query(self._details_prompt(product_code), **self._budget('details', query_kwargs))
+        )
+
+    async def search_by_features(self, category: str, features: List[str], **query_kwargs) -> Dict:
+        """
+        Search for products by category and features
+
+        Args:
+            Same as FlussoQueryEngine.search_by_features()
+
+        Returns:
+            Query result dictionary
+        """
+        note_query(self._features_prompt(category, features))
+        local = await asyncio.to_thread(self._catalog_search, category, features)
+        if local is None:
+            return await self.query(self._features_prompt(category, features), **self._budget('search', query_kwargs))
+        if self.catalog_phrasing and local['metadata']['catalog']['matches']:
+            phrased = await self.query(
+                self._phrasing_prompt(category, features, local),
+                file_search=False,
+                **self._step_kwargs(self._budget('search', query_kwargs))
+            )
+            return self._phrased_search(phrased, local)
+        return local
+
+    async def query_many(
+        self,
+        items: List[Dict],
+        concurrency: int = 16,
+        deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        """
+        Run a batch of queries and helper lookups concurrently
+
+        Args:
+            Same as FlussoQueryEngine.query_many()
+
+        Returns:
+            One result per item, in input order
+        """
+        results = [None] * len(items)
+        async for index, result in self.iter_query_many(items, concurrency, deadline):
+            results[index] = result
+        return results
+
+    async def iter_query_many(
+        self,
+        items: List[Dict],
+        concurrency: int = 16,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Run a batch concurrently and yield results as each item finishes
+
+        Args:
+            Same as FlussoQueryEngine.iter_query_many()
+
+        Yields:
+            (index, result) tuples in completion order
+        """
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+
+        logger.info(f"Processing batch of {len(items)} items (concurrency {concurrency})")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(index: int, item: Dict) -> Tuple[int, Dict]:
+            async with semaphore:
+                return index, await self._run_batch_item(item, deadline)
+
+        tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _run_batch_item(self, item: Dict, deadline: Optional[Deadline] = None) -> Dict:
+        """Run one batch item, turning any failure into a per-item error result"""
+        try:
+            return await self._batch_call(item, deadline)()
+        except Exception as e:
+            logger.error(f"Batch item failed: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'item': item
+            }
@@ -0,0 +1,470 @@
+"""
+Record/replay transport for the Gemini client
+Records upstream calls to a compact on-disk cassette and serves them back offline, with optional latency simulation
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from google.genai import errors, types
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent recorders must not share a cassette
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ('record', 'replay')
+
+# File magic, then records of [sha256 request digest][payload length][zlib-compressed JSON]
+MAGIC = b'FLUSSOCASSETTE1\n'
+_HEADER = struct.Struct('>32sI')
+
+# Config fields that do not change the answer (or differ between runs) and stay out of the key
+_UNKEYED_CONFIG = {'http_options', 'cached_content', 'system_instruction', 'tools'}
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request the cassette has no recording of"""
+
+
+def _contents_json(contents):
+    """JSON-compatible form of request contents (a string or a list of contents)"""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, list):
+        return [_contents_json(item) for item in contents]
+    if hasattr(contents, 'model_dump'):
+        return contents.model_dump(mode='json', exclude_none=True)
+    return contents
+
+
+def describe_request(model: str, contents, config=None, stream: bool = False) -> Dict:
+    """
+    Canonical description of a generate_content call
+
+    The system instruction, tools and context-cache handle are left out (they
+    are fixed per deployment and the cache name changes between runs); whether
+    File Search was on is kept as a flag.
+    """
+    settings = {}
+    if config is not None:
+        settings = config.model_dump(mode='json', exclude_none=True, exclude=_UNKEYED_CONFIG)
+        settings['file_search'] = bool(config.tools or config.cached_content)
+    return {'model': model, 'contents': _contents_json(contents), 'config': settings, 'stream': stream}
+
+
+def request_digest(request: Dict) -> bytes:
+    """SHA-256 of a request description; the cassette index key"""
+    canonical = json.dumps(request, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).digest()
+
+
+def _timeout_seconds(config) -> Optional[float]:
+    """HTTP timeout requested through config.http_options, in seconds"""
+    http_options = getattr(config, 'http_options', None)
+    if http_options is None or http_options.timeout is None:
+        return None
+    return http_options.timeout / 1000
+
+
+def _dump(response: types.GenerateContentResponse) -> Dict:
+    """JSON form of a response, grounding metadata and usage included"""
+    return response.model_dump(mode='json', exclude_none=True)
+
+
+def _recorded_error(error: Dict) -> errors.APIError:
+    """Rebuild the SDK error of a recorded failed call"""
+    code = error['code']
+    return errors.ClientError(code, error['body']) if code < 500 else errors.ServerError(code, error['body'])
+
+
+class Cassette:
+    """
+    Append-only file of recorded upstream calls with an in-memory hash index
+
+    Recording appends one record per call in a single write, under an flock so
+    several gunicorn workers can record into the same file. Replay scans the
+    record headers once (payloads stay compressed in an mmap), so opening a
+    large production capture is fast and each lookup is one dict access plus
+    one decompression. A request recorded several times is replayed round-robin.
+    """
+
+    def __init__(self, path: str, mode: str = 'replay'):
+        """
+        Open a cassette
+
+        Args:
+            path: Cassette file path
+            mode: 'record' (append calls) or 'replay' (serve them)
+        """
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Cassette mode must be one of: {', '.join(CASSETTE_MODES)}")
+
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, List[Tuple[int, int]]] = {}
+        self._cursor: Dict[bytes, int] = {}
+        self._file = None
+        self._mmap = None
+        self.records = 0
+        self.hits = 0
+        self.misses = 0
+
+        if mode == 'record':
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(path, 'ab')
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        """Index every record of the file by request digest"""
+        started = time.perf_counter()
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            raise ValueError(f"Cassette {self.path} is empty")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a Flusso cassette")
+
+        position = len(MAGIC)
+        while position + _HEADER.size <= size:
+            digest, length = _HEADER.unpack_from(self._mmap, position)
+            start = position + _HEADER.size
+            if start + length > size:
+                break
+            self._index.setdefault(digest, []).append((start, length))
+            self.records += 1
+            position = start + length
+        if position != size:
+            logger.warning(f"Cassette {self.path} ends with a truncated record; ignoring it")
+
+        logger.info(
+            f"✓ Cassette loaded: {self.records} recordings of {len(self._index)} requests "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+
+    def append(self, request: Dict, entry: Dict) -> None:
+        """
+        Record one call
+
+        Args:
+            request: describe_request() output
+            entry: Recorded outcome ('response', 'stream' or 'error', plus 'latency')
+        """
+        payload = zlib.compress(
+            json.dumps(dict(entry, request=request), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        )
+        record = _HEADER.pack(request_digest(request), len(payload)) + payload
+        with self._lock:
+            fd = self._file.fileno()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    record = MAGIC + record
+                self._file.write(record)
+                self._file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            self.records += 1
+
+    def lookup(self, request: Dict) -> Optional[Dict]:
+        """Return the next recording of a request, or None if it was never recorded"""
+        digest = request_digest(request)
+        with self._lock:
+            locations = self._index.get(digest)
+            if not locations:
+                self.misses += 1
+                return None
+            cursor = self._cursor.get(digest, 0)
+            self._cursor[digest] = cursor + 1
+            self.hits += 1
+        start, length = locations[cursor % len(locations)]
+        return json.loads(zlib.decompress(self._mmap[start:start + length]))
+
+    def entries(self) -> Iterator[Dict]:
+        """Iterate over every recording in file order (replay mode)"""
+        locations = sorted(location for group in self._index.values() for location in group)
+        for start, length in locations:
+            yield json.loads(zlib.decompress(self._mmap[start:start + length]))
+
+    def close(self) -> None:
+        """Release the file handles"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict:
+        """Return cassette counters"""
+        return {
+            'mode': self.mode,
+            'path': self.path,
+            'records': self.records,
+            'requests': len(self._index) if self.mode == 'replay' else None,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class _Recording:
+    """Collects the outcome of one upstream call while it is being recorded"""
+
+    def __init__(self, cassette: Cassette, request: Dict):
+        self.cassette = cassette
+        self.request = request
+        self.started = time.perf_counter()
+        self.chunks = []
+
+    def elapsed(self) -> float:
+        return round(time.perf_counter() - self.started, 4)
+
+    def chunk(self, chunk: types.GenerateContentResponse) -> None:
+        self.chunks.append([self.elapsed(), _dump(chunk)])
+
+    def response(self, response: types.GenerateContentResponse) -> None:
+        self.cassette.append(self.request, {'latency': self.elapsed(), 'response': _dump(response)})
+
+    def stream_done(self) -> None:
+        self.cassette.append(self.request, {'latency': self.elapsed(), 'stream': self.chunks})
+
+    def error(self, error: Exception) -> None:
+        # Only API errors before any output are replayable; network errors and broken streams are not recorded
+        if isinstance(error, errors.APIError) and not self.chunks:
+            self.cassette.append(self.request, {
+                'latency': self.elapsed(),
+                'error': {'code': error.code, 'body': error.details}
+            })
+
+
+class _CassetteModels:
+    """Synchronous client.models stand-in"""
+
+    def __init__(self, client: 'CassetteClient'):
+        self._client = client
+
+    def generate_content(self, model: str, contents, config=None) -> types.GenerateContentResponse:
+        request = describe_request(model, contents, config)
+        if self._client.cassette.mode == 'record':
+            recording = _Recording(self._client.cassette, request)
+            try:
+                response = self._client.inner.models.generate_content(model=model, contents=contents, config=config)
+            except Exception as e:
+                recording.error(e)
+                raise
+            recording.response(response)
+            return response
+
+        entry = self._client._replay(request)
+        delay = self._client._delay(entry['latency'])
+        timeout = _timeout_seconds(config)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise httpx.ReadTimeout('Recorded upstream call exceeded the timeout')
+        if delay:
+            time.sleep(delay)
+        return self._client._response(entry)
+
+    def generate_content_stream(self, model: str, contents, config=None):
+        request = describe_request(model, contents, config, stream=True)
+        if self._client.cassette.mode == 'record':
+            recording = _Recording(self._client.cassette, request)
+            try:
+                for chunk in self._client.inner.models.generate_content_stream(
+                    model=model, contents=contents, config=config
+                ):
+                    recording.chunk(chunk)
+                    yield chunk
+            except Exception as e:
+                recording.error(e)
+                raise
+            recording.stream_done()
+            return
+
+        entry = self._client._replay(request)
+        timeout = _timeout_seconds(config)
+        started = time.perf_counter()
+        for offset, chunk in self._client._chunks(entry):
+            delay = self._client._delay(offset) - (time.perf_counter() - started)
+            if timeout is not None and self._client._delay(offset) > timeout:
+                time.sleep(max(0.0, timeout - (time.perf_counter() - started)))
+                raise httpx.ReadTimeout('Recorded upstream call exceeded the timeout')
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk if chunk is not None else self._client._response(entry)
+
+
+class _CassetteAsyncModels:
+    """Asynchronous client.aio.models stand-in"""
+
+    def __init__(self, client: 'CassetteClient'):
+        self._client = client
+
+    async def generate_content(self, model: str, contents, config=None) -> types.GenerateContentResponse:
+        request = describe_request(model, contents, config)
+        if self._client.cassette.mode == 'record':
+            recording = _Recording(self._client.cassette, request)
+            try:
+                response = await self._client.inner.aio.models.generate_content(
+                    model=model, contents=contents, config=config
+                )
+            except Exception as e:
+                recording.error(e)
+                raise
+            recording.response(response)
+            return response
+
+        entry = self._client._replay(request)
+        delay = self._client._delay(entry['latency'])
+        timeout = _timeout_seconds(config)
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise httpx.ReadTimeout('Recorded upstream call exceeded the timeout')
+        if delay:
+            await asyncio.sleep(delay)
+        return self._client._response(entry)
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        client = self._client
+        request = describe_request(model, contents, config, stream=True)
+
+        if client.cassette.mode == 'record':
+            recording = _Recording(client.cassette, request)
+            try:
+                inner = await client.inner.aio.models.generate_content_stream(
+                    model=model, contents=contents, config=config
+                )
+            except Exception as e:
+                recording.error(e)
+                raise
+
+            async def record():
+                try:
+                    async for chunk in inner:
+                        recording.chunk(chunk)
+                        yield chunk
+                except Exception as e:
+                    recording.error(e)
+                    raise
+                recording.stream_done()
+
+            return record()
+
+        entry = client._replay(request)
+
+        async def replay():
+            timeout = _timeout_seconds(config)
+            started = time.perf_counter()
+            for offset, chunk in client._chunks(entry):
+                delay = client._delay(offset) - (time.perf_counter() - started)
+                if timeout is not None and client._delay(offset) > timeout:
+                    await asyncio.sleep(max(0.0, timeout - (time.perf_counter() - started)))
+                    raise httpx.ReadTimeout('Recorded upstream call exceeded the timeout')
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chunk if chunk is not None else client._response(entry)
+
+        return replay()
+
+
+class CassetteClient:
+    """
+    Drop-in replacement for genai.Client that records or replays calls
+
+    In record mode every generate_content / generate_content_stream call goes
+    to the wrapped client and its outcome (answer, grounding metadata, usage,
+    chunk timings or API error) is appended to the cassette; other attributes
+    (e.g. client.caches) are passed through. In replay mode calls are answered
+    from the cassette only, optionally taking as long as they took when
+    recorded (scaled by latency_scale); a request that was never recorded
+    raises CassetteMiss.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        inner=None,
+        simulate_latency: bool = True,
+        latency_scale: float = 1.0
+    ):
+        """
+        Initialize the client
+
+        Args:
+            cassette: Cassette to record to or replay from
+            inner: Client that answers recorded calls (required in record mode)
+            simulate_latency: Replay calls with their recorded latency
+            latency_scale: Multiplier for recorded latencies (e.g. 0.1 replays 10x faster)
+        """
+        if cassette.mode == 'record' and inner is None:
+            raise ValueError("Record mode needs the client to record")
+        if latency_scale < 0:
+            raise ValueError("latency_scale cannot be negative")
+
+        self.cassette = cassette
+        self.inner = inner
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+
+        self.models = _CassetteModels(self)
+        self.aio = type('CassetteAio', (), {})()
+        self.aio.models = _CassetteAsyncModels(self)
+
+    def __getattr__(self, name):
+        inner = self.__dict__.get('inner')
+        if inner is None:
+            raise AttributeError(f"Replayed client has no '{name}'")
+        return getattr(inner, name)
+
+    def _replay(self, request: Dict) -> Dict:
+        """Recording for a request"""
+        entry = self.cassette.lookup(request)
+        if entry is None:
+            raise CassetteMiss(f"No recording of this {request['model']} request in {self.cassette.path}")
+        return entry
+
+    def _delay(self, seconds: float) -> float:
+        """Replay delay for a recorded duration"""
+        return seconds * self.latency_scale if self.simulate_latency else 0.0
+
+    @staticmethod
+    def _response(entry: Dict) -> types.GenerateContentResponse:
+        """Rebuild a recorded non-streamed response, or raise its recorded API error"""
+        if 'error' in entry:
+            raise _recorded_error(entry['error'])
+        return types.GenerateContentResponse.model_validate(entry['response'])
+
+    @staticmethod
+    def _chunks(entry: Dict) -> Iterator[Tuple[float, Optional[types.GenerateContentResponse]]]:
+        """
+        Rebuild recorded stream chunks with their offsets from the call start
+
+        A recorded API error comes out as one (latency, None) item; the caller
+        waits for it and then raises through _response().
+        """
+        if 'error' in entry:
+            yield entry['latency'], None
+            return
+        for offset, chunk in entry['stream']:
+            yield offset, types.GenerateContentResponse.model_validate(chunk)
+
+    def stats(self) -> Dict:
+        """Return cassette counters"""
+        return self.cassette.stats()
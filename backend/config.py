@@ -0,0 +1,632 @@
+"""
+Shared configuration for the Flusso API servers
+Reads environment variables and builds the query engine used by app.py and asgi_app.py
+"""
+import os
+import math
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, Type
+
+from admission import LANES, AdmissionController, ClientRateLimiter
+from deadline import Deadline
+from hedging import Hedger
+from local_index import LocalIndex
+from model_router import ModelRouter
+from product_catalog import ProductCatalog
+from query_log import QueryLog
+from resilience import CircuitBreaker, RetryPolicy
+from query_engine import TOKEN_BUDGETS, FlussoQueryEngine
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from sessions import SESSION_ID_PATTERN, SessionStore
+
+logger = logging.getLogger(__name__)
+
+
+def _env_budget(name: str, default: Optional[int]) -> Optional[int]:
+    """Integer token budget from the environment ('none' or empty keeps the model default)"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return None if value.strip().lower() in ('', 'none') else int(value)
+
+
+# Configuration - USE ENVIRONMENT VARIABLES ONLY
+API_KEY = os.getenv('GEMINI_API_KEY')
+STORE_ID = os.getenv('STORE_ID')
+FRONTEND_PATH = Path(__file__).parent.parent / 'frontend'
+
+# Response cache shared by all gunicorn workers on this host
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'True').lower() == 'true'
+CACHE_PATH = os.getenv('CACHE_PATH', os.path.join(tempfile.gettempdir(), 'flusso_response_cache.sqlite3'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1000))
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', 3600))
+
+# Near-duplicate cache (per worker, in memory)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'True').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 10000))
+
+# Request coalescing (single-flight); the lock directory enables cross-worker leases
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'True').lower() == 'true'
+SINGLE_FLIGHT_CROSS_WORKER = os.getenv('SINGLE_FLIGHT_CROSS_WORKER', 'True').lower() == 'true'
+SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'flusso_single_flight'))
+SINGLE_FLIGHT_LEASE_SECONDS = float(os.getenv('SINGLE_FLIGHT_LEASE_SECONDS', 60))
+
+# Explicit Gemini context cache for the system instruction and File Search tool
+CONTEXT_CACHE_ENABLED = os.getenv('CONTEXT_CACHE_ENABLED', 'False').lower() == 'true'
+CONTEXT_CACHE_TTL_SECONDS = float(os.getenv('CONTEXT_CACHE_TTL_SECONDS', 3600))
+
+# Multi-turn sessions shared by all gunicorn workers on this host; history beyond the token
+# budget is folded into a summary, and idle sessions are evicted
+SESSIONS_ENABLED = os.getenv('SESSIONS_ENABLED', 'True').lower() == 'true'
+SESSION_PATH = os.getenv('SESSION_PATH', os.path.join(tempfile.gettempdir(), 'flusso_sessions.sqlite3'))
+SESSION_HISTORY_TOKENS = int(os.getenv('SESSION_HISTORY_TOKENS', 4000))
+SESSION_MAX_ANSWER_TOKENS = int(os.getenv('SESSION_MAX_ANSWER_TOKENS', 1500))
+SESSION_IDLE_SECONDS = float(os.getenv('SESSION_IDLE_SECONDS', 1800))
+SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', 10000))
+# Keep each session's history in an explicit Gemini context cache (recreated per this many new tokens)
+SESSION_PREFIX_CACHE_ENABLED = os.getenv('SESSION_PREFIX_CACHE_ENABLED', 'False').lower() == 'true'
+SESSION_PREFIX_CACHE_TOKENS = int(os.getenv('SESSION_PREFIX_CACHE_TOKENS', 1024))
+
+# Local BM25 index of the knowledge base (built with local_index.py or ingest.py --local-index):
+# /api/lookup, spec answers without a Gemini call and optionally pre-selected grounding passages
+LOCAL_INDEX_ENABLED = os.getenv('LOCAL_INDEX_ENABLED', 'True').lower() == 'true'
+LOCAL_INDEX_PATH = os.getenv('LOCAL_INDEX_PATH', os.path.join(tempfile.gettempdir(), 'flusso_index'))
+LOCAL_INDEX_ANSWERS = os.getenv('LOCAL_INDEX_ANSWERS', 'True').lower() == 'true'
+LOCAL_INDEX_CONTEXT = os.getenv('LOCAL_INDEX_CONTEXT', 'False').lower() == 'true'
+LOCAL_INDEX_MAX_RESULTS = int(os.getenv('LOCAL_INDEX_MAX_RESULTS', 20))
+
+# Structured product catalog (built with product_catalog.py or ingest.py --catalog): /api/search and
+# /api/compare run as indexed queries; the model phrases the answer only if asked, or searches on no match
+CATALOG_ENABLED = os.getenv('CATALOG_ENABLED', 'True').lower() == 'true'
+CATALOG_PATH = os.getenv('CATALOG_PATH', os.path.join(tempfile.gettempdir(), 'flusso_catalog.sqlite3'))
+CATALOG_PHRASE_ANSWERS = os.getenv('CATALOG_PHRASE_ANSWERS', 'False').lower() == 'true'
+CATALOG_FALLBACK = os.getenv('CATALOG_FALLBACK', 'True').lower() == 'true'
+
+# Query log: one compact JSON line per API request (normalized query, route, model, latency, tokens,
+# cache outcome), written off the request path and rotated by size; analyze it with query_log.py
+QUERY_LOG_ENABLED = os.getenv('QUERY_LOG_ENABLED', 'True').lower() == 'true'
+QUERY_LOG_DIR = os.getenv('QUERY_LOG_DIR', os.path.join(tempfile.gettempdir(), 'flusso_query_log'))
+QUERY_LOG_MAX_BYTES = int(os.getenv('QUERY_LOG_MAX_BYTES', 16 * 1024 * 1024))
+QUERY_LOG_MAX_FILES = int(os.getenv('QUERY_LOG_MAX_FILES', 20))
+
+# Answer-token limit and thinking budget per endpoint (MAX_TOKENS_<KIND> / THINKING_BUDGET_<KIND> for
+# query, product, details, compare, search, installation and parts); requests may override both.
+# Thinking: 0 turns it off (flash only), -1 lets the model decide, 'none' keeps the model default
+# (with either of the last two, the answer-token limit is not applied)
+ENDPOINT_BUDGETS = {
+    kind: {
+        'max_tokens': _env_budget(f'MAX_TOKENS_{kind.upper()}', budget['max_tokens']),
+        'thinking_budget': _env_budget(f'THINKING_BUDGET_{kind.upper()}', budget['thinking_budget'])
+    }
+    for kind, budget in TOKEN_BUDGETS.items()
+}
+MAX_TOKENS_LIMIT = int(os.getenv('MAX_TOKENS_LIMIT', 8192))
+THINKING_BUDGET_LIMIT = 24576
+
+# Model routing: 'off', 'auto' (route when the client sends no model or "auto") or 'override'
+ROUTER_MODE = os.getenv('ROUTER_MODE', 'auto')
+ROUTER_STRONG_SHARE = float(os.getenv('ROUTER_STRONG_SHARE', 0.25))
+ROUTER_LATENCY_BUDGET_SECONDS = float(os.getenv('ROUTER_LATENCY_BUDGET_SECONDS', 20))
+ROUTER_ESCALATE = os.getenv('ROUTER_ESCALATE', 'True').lower() == 'true'
+ROUTER_LATENCY_PROBE_SECONDS = float(os.getenv('ROUTER_LATENCY_PROBE_SECONDS', 60))
+
+# Request deadlines (keep below gunicorn's --timeout so workers are never killed mid-request)
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', 60))
+REQUEST_TIMEOUT_MAX_SECONDS = float(os.getenv('REQUEST_TIMEOUT_MAX_SECONDS', 120))
+BATCH_TIMEOUT_SECONDS = float(os.getenv('BATCH_TIMEOUT_SECONDS', 240))
+
+# Hedged upstream requests: send a backup call when the first is slower than the percentile
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'False').lower() == 'true'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 90))
+HEDGE_MAX_RATIO = float(os.getenv('HEDGE_MAX_RATIO', 0.1))
+HEDGE_MAX_IN_FLIGHT = int(os.getenv('HEDGE_MAX_IN_FLIGHT', 4))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))
+
+# Retries for transient upstream errors (429/5xx/network) and the circuit breaker
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 8))
+BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', 'True').lower() == 'true'
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', 30))
+
+# Admission control: upstream calls in flight per worker, the priority wait queue and per-client limits
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True').lower() == 'true'
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 8))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 32))
+ADMISSION_QUEUE_SECONDS = float(os.getenv('ADMISSION_QUEUE_SECONDS', 10))
+CLIENT_RATE_LIMIT_ENABLED = os.getenv('CLIENT_RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+CLIENT_RATE_PER_SECOND = float(os.getenv('CLIENT_RATE_PER_SECOND', 2))
+CLIENT_BURST = float(os.getenv('CLIENT_BURST', 10))
+# Identify clients by the address the proxy appends to X-Forwarded-For; must be on behind a proxy
+# (start_server.sh sets it for Render), or every client shares the proxy's rate limit bucket
+TRUST_PROXY_HEADERS = os.getenv('TRUST_PROXY_HEADERS', 'False').lower() == 'true'
+_proxy_warning_logged = False
+
+# Worker start-up: open keep-alive connections to the Gemini API (and optionally probe it)
+# before /api/health reports the worker ready; idle pooled connections are kept this long
+UPSTREAM_WARMUP_ENABLED = os.getenv('UPSTREAM_WARMUP_ENABLED', 'True').lower() == 'true'
+UPSTREAM_WARMUP_CONNECTIONS = int(os.getenv('UPSTREAM_WARMUP_CONNECTIONS', 2))
+UPSTREAM_WARMUP_PROBE = os.getenv('UPSTREAM_WARMUP_PROBE', 'False').lower() == 'true'
+UPSTREAM_KEEPALIVE_SECONDS = float(os.getenv('UPSTREAM_KEEPALIVE_SECONDS', 120))
+
+# API response compression (gzip/brotli, negotiated per request) for JSON bodies of at least this size
+RESPONSE_COMPRESSION_ENABLED = os.getenv('RESPONSE_COMPRESSION_ENABLED', 'True').lower() == 'true'
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+
+# Default strategy for /api/compare: 'single' prompt or 'decomposed' per-product lookups
+COMPARE_MODE = os.getenv('COMPARE_MODE', 'single')
+
+# Batch endpoint limits
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv('BATCH_DEFAULT_CONCURRENCY', 4))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 16))
+
+# Upstream: 'live' (Gemini API), 'fake' (local stand-in for load tests; no API key or quota used),
+# 'record' (live calls appended to CASSETTE_PATH) or 'replay' (answers served from CASSETTE_PATH offline)
+UPSTREAM_MODES = ('live', 'fake', 'record', 'replay')
+UPSTREAM_MODE = os.getenv('UPSTREAM_MODE', 'live')
+FAKE_LATENCY_MEDIAN = float(os.getenv('FAKE_LATENCY_MEDIAN', 1.5))
+FAKE_LATENCY_SIGMA = float(os.getenv('FAKE_LATENCY_SIGMA', 0.5))
+FAKE_ERROR_RATE = float(os.getenv('FAKE_ERROR_RATE', 0.0))
+FAKE_ANSWER_WORDS = int(os.getenv('FAKE_ANSWER_WORDS', 250))
+FAKE_TOKEN_SECONDS = float(os.getenv('FAKE_TOKEN_SECONDS', 0))
+FAKE_THINKING_TOKENS = int(os.getenv('FAKE_THINKING_TOKENS', 0))
+CASSETTE_PATH = os.getenv('CASSETTE_PATH', os.path.join(tempfile.gettempdir(), 'flusso.cassette'))
+CASSETTE_SIMULATE_LATENCY = os.getenv('CASSETTE_SIMULATE_LATENCY', 'True').lower() == 'true'
+CASSETTE_LATENCY_SCALE = float(os.getenv('CASSETTE_LATENCY_SCALE', 1.0))
+
+ALLOWED_MODELS = ['gemini-2.5-flash', 'gemini-2.5-pro']
+
+# HTTP status for failed results by error_type (other failures keep 200 with success=false)
+ERROR_STATUS = {'deadline_exceeded': 504, 'circuit_open': 503, 'overloaded': 429, 'too_many_requests': 429}
+AUTO_MODEL = 'auto'
+
+
+def create_query_engine(engine_class: Type[FlussoQueryEngine] = FlussoQueryEngine) -> FlussoQueryEngine:
+    """
+    Build a query engine from environment configuration
+    
+    Args:
+        engine_class: FlussoQueryEngine or a subclass (e.g. AsyncFlussoQueryEngine)
+        
+    Returns:
+        Configured query engine
+    """
+    live = UPSTREAM_MODE in ('live', 'record')
+    if live and not API_KEY:
+        raise ValueError("GEMINI_API_KEY environment variable is required")
+    if live and not STORE_ID:
+        raise ValueError("STORE_ID environment variable is required")
+    client = create_upstream_client()
+    
+    response_cache = None
+    if CACHE_ENABLED:
+        response_cache = ResponseCache(
+            CACHE_PATH,
+            max_entries=CACHE_MAX_ENTRIES,
+            ttl_seconds=CACHE_TTL_SECONDS
+        )
+    
+    semantic_cache = None
+    if SEMANTIC_CACHE_ENABLED:
+        semantic_cache = SemanticCache(
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+            ttl_seconds=CACHE_TTL_SECONDS
+        )
+    
+    single_flight = None
+    if SINGLE_FLIGHT_ENABLED:
+        single_flight = engine_class.single_flight_class(
+            lock_dir=SINGLE_FLIGHT_LOCK_DIR if SINGLE_FLIGHT_CROSS_WORKER else None,
+            lease_seconds=SINGLE_FLIGHT_LEASE_SECONDS
+        )
+    
+    router = None
+    if ROUTER_MODE != 'off':
+        router = ModelRouter(
+            fast_model=ALLOWED_MODELS[0],
+            strong_model=ALLOWED_MODELS[1],
+            mode=ROUTER_MODE,
+            strong_share_budget=ROUTER_STRONG_SHARE,
+            latency_budget_seconds=ROUTER_LATENCY_BUDGET_SECONDS,
+            escalate_ungrounded=ROUTER_ESCALATE,
+            latency_probe_seconds=ROUTER_LATENCY_PROBE_SECONDS
+        )
+    
+    hedger = None
+    if HEDGE_ENABLED:
+        hedger = Hedger(
+            percentile=HEDGE_PERCENTILE,
+            min_samples=HEDGE_MIN_SAMPLES,
+            max_hedge_ratio=HEDGE_MAX_RATIO,
+            max_in_flight=HEDGE_MAX_IN_FLIGHT
+        )
+    
+    breaker = None
+    if BREAKER_ENABLED:
+        breaker = CircuitBreaker(
+            failure_threshold=BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=BREAKER_RESET_SECONDS
+        )
+    retry_policy = RetryPolicy(
+        max_attempts=RETRY_MAX_ATTEMPTS,
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        breaker=breaker
+    )
+    
+    sessions = None
+    if SESSIONS_ENABLED:
+        sessions = SessionStore(
+            SESSION_PATH,
+            history_token_budget=SESSION_HISTORY_TOKENS,
+            max_answer_tokens=SESSION_MAX_ANSWER_TOKENS,
+            idle_ttl_seconds=SESSION_IDLE_SECONDS,
+            max_sessions=SESSION_MAX_SESSIONS
+        )
+    
+    local_index = LocalIndex(LOCAL_INDEX_PATH) if LOCAL_INDEX_ENABLED else None
+    catalog = ProductCatalog(CATALOG_PATH) if CATALOG_ENABLED else None
+    
+    admission = None
+    if ADMISSION_ENABLED:
+        admission = AdmissionController(
+            max_concurrent=ADMISSION_MAX_CONCURRENT,
+            max_queue=ADMISSION_MAX_QUEUE,
+            max_queue_seconds=ADMISSION_QUEUE_SECONDS
+        )
+    
+    return engine_class(
+        api_key=API_KEY or 'fake-key',
+        store_id=STORE_ID or 'fileSearchStores/fake',
+        client=client,
+        cache=response_cache,
+        semantic_cache=semantic_cache,
+        single_flight=single_flight,
+        context_cache_ttl=CONTEXT_CACHE_TTL_SECONDS if CONTEXT_CACHE_ENABLED else None,
+        router=router,
+        request_timeout=REQUEST_TIMEOUT_SECONDS,
+        hedger=hedger,
+        retry_policy=retry_policy,
+        admission=admission,
+        keepalive_seconds=UPSTREAM_KEEPALIVE_SECONDS,
+        sessions=sessions,
+        session_prefix_cache_tokens=SESSION_PREFIX_CACHE_TOKENS if SESSION_PREFIX_CACHE_ENABLED else None,
+        local_index=local_index,
+        local_answers=LOCAL_INDEX_ANSWERS,
+        local_context=LOCAL_INDEX_CONTEXT,
+        catalog=catalog,
+        catalog_phrasing=CATALOG_PHRASE_ANSWERS,
+        catalog_fallback=CATALOG_FALLBACK,
+        token_budgets=ENDPOINT_BUDGETS
+    )
+
+
+def start_upstream_warmup(query_engine: FlussoQueryEngine) -> None:
+    """Start the engine's upstream warm-up in this worker, if enabled"""
+    if UPSTREAM_WARMUP_ENABLED:
+        query_engine.start_warm_up(UPSTREAM_WARMUP_CONNECTIONS, UPSTREAM_WARMUP_PROBE)
+
+
+def create_upstream_client():
+    """
+    Build the Gemini client stand-in selected by UPSTREAM_MODE
+    
+    Returns:
+        None for the live API (the engine creates a genai.Client), otherwise the stand-in
+    """
+    if UPSTREAM_MODE not in UPSTREAM_MODES:
+        raise ValueError(f"UPSTREAM_MODE must be one of: {', '.join(UPSTREAM_MODES)}")
+    if UPSTREAM_MODE == 'live':
+        return None
+    
+    if UPSTREAM_MODE in ('record', 'replay'):
+        from cassette import Cassette, CassetteClient
+        cassette = Cassette(CASSETTE_PATH, UPSTREAM_MODE)
+        if UPSTREAM_MODE == 'record':
+            from google import genai
+            logger.info(f"UPSTREAM_MODE=record: Gemini calls are recorded to {CASSETTE_PATH}")
+            return CassetteClient(cassette, inner=genai.Client(api_key=API_KEY))
+        logger.warning(
+            f"UPSTREAM_MODE=replay: answers come from {CASSETTE_PATH} "
+            f"(recorded latency {'x' + format(CASSETTE_LATENCY_SCALE, 'g') if CASSETTE_SIMULATE_LATENCY else 'off'})"
+        )
+        return CassetteClient(
+            cassette,
+            simulate_latency=CASSETTE_SIMULATE_LATENCY,
+            latency_scale=CASSETTE_LATENCY_SCALE
+        )
+    
+    from fake_gemini import FakeGeminiClient, fixed_latency, lognormal_latency, lognormal_words
+    logger.warning(
+        f"UPSTREAM_MODE=fake: answers come from a local fake Gemini client "
+        f"(median {FAKE_LATENCY_MEDIAN}s, error rate {FAKE_ERROR_RATE})"
+    )
+    latency = (
+        lognormal_latency(FAKE_LATENCY_MEDIAN, FAKE_LATENCY_SIGMA) if FAKE_LATENCY_SIGMA > 0
+        else fixed_latency(FAKE_LATENCY_MEDIAN)
+    )
+    return FakeGeminiClient(
+        latency=latency,
+        answer_words=lognormal_words(FAKE_ANSWER_WORDS, 0.4),
+        error_rate=FAKE_ERROR_RATE,
+        code_sources=True,
+        seed=os.getpid(),
+        token_seconds=FAKE_TOKEN_SECONDS,
+        thinking_tokens=FAKE_THINKING_TOKENS
+    )
+
+
+def create_query_log() -> Optional[QueryLog]:
+    """Build the query log the API routes append to (None when disabled)"""
+    if not QUERY_LOG_ENABLED:
+        return None
+    return QueryLog(QUERY_LOG_DIR, max_bytes=QUERY_LOG_MAX_BYTES, max_files=QUERY_LOG_MAX_FILES)
+
+
+def create_client_limiter() -> Optional[ClientRateLimiter]:
+    """Build the per-client rate limiter used by the API routes (None when disabled)"""
+    if not CLIENT_RATE_LIMIT_ENABLED:
+        return None
+    return ClientRateLimiter(rate=CLIENT_RATE_PER_SECOND, burst=CLIENT_BURST)
+
+
+def rate_limited_path(path: str) -> bool:
+    """Whether a request path counts against the per-client limit (API routes except health)"""
+    return path.startswith('/api/') and path != '/api/health'
+
+
+def request_lane(path: str, priority: Optional[str]) -> str:
+    """
+    Pick the priority lane for a request
+    
+    Args:
+        path: Request path; /api/batch always runs in the batch lane
+        priority: Value of the X-Priority header, which integrations may set to "batch"
+        
+    Returns:
+        'interactive' or 'batch'
+    """
+    if path == '/api/batch' or (priority or '').strip().lower() == 'batch':
+        return 'batch'
+    return LANES[0]
+
+
+def client_address(remote_addr: Optional[str], forwarded_for: Optional[str]) -> str:
+    """Client identity for rate limiting: the peer address, or the proxy-appended one when trusted"""
+    global _proxy_warning_logged
+    if TRUST_PROXY_HEADERS and forwarded_for:
+        return forwarded_for.split(',')[-1].strip()
+    if forwarded_for and not _proxy_warning_logged:
+        _proxy_warning_logged = True
+        logger.warning(
+            "Requests arrive through a proxy (X-Forwarded-For) but TRUST_PROXY_HEADERS is off: "
+            "all clients behind it share one per-client rate limit"
+        )
+    return remote_addr or 'unknown'
+
+
+def too_many_requests(retry_after: float) -> dict:
+    """Error body for a client over its rate limit"""
+    return {
+        'success': False,
+        'error': f'Too many requests, retry in {math.ceil(retry_after)}s',
+        'error_type': 'too_many_requests',
+        'retry_after': round(retry_after, 1)
+    }
+
+
+def parse_query_args(data: dict) -> dict:
+    """
+    Validate the body of a query request
+    
+    Args:
+        data: Decoded JSON request body
+        
+    Returns:
+        Keyword arguments for FlussoQueryEngine.query / query_stream
+        
+    Raises:
+        ValueError: With a client-facing message when the body is invalid
+    """
+    # Extract query
+    user_query = (data.get('query') or '').strip()
+    if not user_query:
+        raise ValueError('Query cannot be empty')
+    
+    # Extract optional parameters
+    temperature = data.get('temperature')
+    top_p = data.get('top_p')
+    model = data.get('model')
+    session_id = data.get('session_id')
+    
+    # Validate parameters if provided
+    if temperature is not None:
+        try:
+            temperature = float(temperature)
+            if not 0.0 <= temperature <= 1.0:
+                raise ValueError()
+        except (ValueError, TypeError):
+            raise ValueError('Temperature must be a number between 0.0 and 1.0')
+    
+    if top_p is not None:
+        try:
+            top_p = float(top_p)
+            if not 0.0 <= top_p <= 1.0:
+                raise ValueError()
+        except (ValueError, TypeError):
+            raise ValueError('Top_p must be a number between 0.0 and 1.0')
+    
+    # Validate model if provided ("auto" leaves the choice to the router)
+    if model == AUTO_MODEL:
+        model = None
+    elif model is not None and model not in ALLOWED_MODELS:
+        raise ValueError(f'Model must be one of: {", ".join(ALLOWED_MODELS + [AUTO_MODEL])}')
+    
+    if session_id is not None:
+        if not SESSIONS_ENABLED:
+            raise ValueError('Sessions are not enabled on this server')
+        if not isinstance(session_id, str) or not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError('Session_id must be 1-128 letters, digits, "-" or "_"')
+    
+    return {
+        'user_query': user_query,
+        'temperature': temperature,
+        'top_p': top_p,
+        'model': model,
+        'session_id': session_id,
+        **parse_budget_args(data)
+    }
+
+
+def parse_budget_args(data) -> dict:
+    """
+    Validate the per-request answer-token limit and thinking budget
+    
+    Args:
+        data: Decoded JSON request body or query parameters, which may carry
+            "max_tokens" and "thinking_budget" (None keeps the endpoint's default)
+        
+    Returns:
+        Keyword arguments for the engine's query and helper methods
+        
+    Raises:
+        ValueError: With a client-facing message when a value is invalid
+    """
+    max_tokens = data.get('max_tokens')
+    thinking_budget = data.get('thinking_budget')
+    
+    if max_tokens is not None:
+        try:
+            max_tokens = int(max_tokens)
+            if not 1 <= max_tokens <= MAX_TOKENS_LIMIT:
+                raise ValueError()
+        except (ValueError, TypeError):
+            raise ValueError(f'Max_tokens must be an integer between 1 and {MAX_TOKENS_LIMIT}')
+    
+    if thinking_budget is not None:
+        try:
+            thinking_budget = int(thinking_budget)
+            if not -1 <= thinking_budget <= THINKING_BUDGET_LIMIT:
+                raise ValueError()
+        except (ValueError, TypeError):
+            raise ValueError(f'Thinking_budget must be an integer between -1 (dynamic) and {THINKING_BUDGET_LIMIT}')
+    
+    return {'max_tokens': max_tokens, 'thinking_budget': thinking_budget}
+
+
+def parse_lookup_args(args) -> dict:
+    """
+    Validate the query string of a lookup request
+    
+    Args:
+        args: Query parameters ("q" and optional "k")
+        
+    Returns:
+        Keyword arguments for FlussoQueryEngine.lookup
+        
+    Raises:
+        ValueError: With a client-facing message when the parameters are invalid
+    """
+    query = (args.get('q') or '').strip()
+    if not query:
+        raise ValueError('Parameter q cannot be empty')
+    
+    k = args.get('k', 5)
+    try:
+        k = int(k)
+        if not 1 <= k <= LOCAL_INDEX_MAX_RESULTS:
+            raise ValueError()
+    except (ValueError, TypeError):
+        raise ValueError(f'Parameter k must be an integer between 1 and {LOCAL_INDEX_MAX_RESULTS}')
+    
+    return {'query': query, 'k': k}
+
+
+def parse_deadline(data: Optional[dict], default: float = REQUEST_TIMEOUT_SECONDS) -> Deadline:
+    """
+    Start the deadline for a request
+    
+    Args:
+        data: Decoded JSON request body, which may carry "timeout" in seconds
+        default: Budget used when the body has no timeout (also raises the
+            upper limit for longer requests such as batches)
+        
+    Returns:
+        Deadline starting now
+        
+    Raises:
+        ValueError: With a client-facing message when the timeout is invalid
+    """
+    timeout = (data or {}).get('timeout')
+    if timeout is None:
+        return Deadline(default)
+    limit = max(default, REQUEST_TIMEOUT_MAX_SECONDS)
+    try:
+        timeout = float(timeout)
+        if not 0.0 < timeout <= limit:
+            raise ValueError()
+    except (ValueError, TypeError):
+        raise ValueError(f'Timeout must be a number of seconds between 0 and {limit:g}')
+    return Deadline(timeout)
+
+
+def parse_batch_args(data: dict) -> dict:
+    """
+    Validate the body of a batch request
+    
+    Args:
+        data: Decoded JSON request body
+        
+    Returns:
+        Dictionary with 'items' (query-style items normalized through
+        parse_query_args, the budgets of the others through parse_budget_args),
+        'concurrency' and 'stream'
+        
+    Raises:
+        ValueError: With a client-facing message when the body is invalid
+    """
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('Items must be a non-empty list')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'At most {BATCH_MAX_ITEMS} items allowed per batch')
+    
+    concurrency = data.get('concurrency', BATCH_DEFAULT_CONCURRENCY)
+    try:
+        concurrency = int(concurrency)
+        if not 1 <= concurrency <= BATCH_MAX_CONCURRENCY:
+            raise ValueError()
+    except (ValueError, TypeError):
+        raise ValueError(f'Concurrency must be an integer between 1 and {BATCH_MAX_CONCURRENCY}')
+    
+    normalized = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f'Item {index} must be an object')
+        if item.get('type', 'query') == 'query':
+            try:
+                query_args = parse_query_args(item)
+            except ValueError as e:
+                raise ValueError(f'Item {index}: {e}')
+            if query_args.pop('session_id') is not None:
+                raise ValueError(f'Item {index}: session_id is not supported in batches')
+            item = dict(item, query=query_args.pop('user_query'), **query_args)
+        else:
+            try:
+                item = dict(item, **parse_budget_args(item))
+            except ValueError as e:
+                raise ValueError(f'Item {index}: {e}')
+        normalized.append(item)
+    
+    return {
+        'items': normalized,
+        'concurrency': concurrency,
+        'stream': bool(data.get('stream', False))
+    }
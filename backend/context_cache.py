@@ -0,0 +1,134 @@
+"""
+Explicit Gemini context caching for the system instruction and File Search tool
+Keeps one cached-content handle per model per process and refreshes it before it expires
+"""
+import time
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+
+class ContextCacheManager:
+    """
+    Create and refresh cached-content handles without blocking requests
+
+    get() only returns a handle that is already valid. Missing or nearly
+    expired handles are (re)created in a background thread, and until then
+    callers fall back to sending the system instruction inline. When creation
+    fails (for example because the prefix is below the model's minimum
+    cacheable size), the manager waits retry_seconds before trying again.
+    """
+
+    def __init__(
+        self,
+        client_provider: Callable,
+        store_id: str,
+        system_instruction: str,
+        ttl_seconds: float = 3600,
+        refresh_margin_seconds: float = 300,
+        retry_seconds: float = 600
+    ):
+        """
+        Initialize the manager
+
+        Args:
+            client_provider: Returns the Gemini client (genai.Client) of the calling process
+            store_id: File Search store included in grounded caches
+            system_instruction: Instruction stored in every cache
+            ttl_seconds: Lifetime requested for each cached content
+            refresh_margin_seconds: Recreate a handle this long before it expires
+            retry_seconds: Wait after a failed creation before trying again
+        """
+        if refresh_margin_seconds >= ttl_seconds:
+            raise ValueError("refresh_margin_seconds must be smaller than ttl_seconds")
+
+        self.client_provider = client_provider
+        self.store_id = store_id
+        self.system_instruction = system_instruction
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+
+        self._handles: Dict[Tuple[str, bool], Tuple[str, float]] = {}
+        self._creating = set()
+        self._failed_until: Dict[Tuple[str, bool], float] = {}
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, file_search: bool = True) -> Optional[str]:
+        """
+        Return a valid cached-content name for a model, scheduling refreshes as needed
+
+        Args:
+            model: Model the cache must belong to
+            file_search: Whether the cache should include the File Search tool
+
+        Returns:
+            Cached content name, or None when the caller should send the instruction inline
+        """
+        key = (model, file_search)
+        now = time.time()
+        with self._lock:
+            handle = self._handles.get(key)
+            usable = handle is not None and handle[1] > now + 30
+            needs_refresh = handle is None or handle[1] - now <= self.refresh_margin_seconds
+            if needs_refresh and key not in self._creating and self._failed_until.get(key, 0) <= now:
+                self._creating.add(key)
+                threading.Thread(target=self._create, args=(key,), daemon=True).start()
+            if usable:
+                self.hits += 1
+                return handle[0]
+            self.misses += 1
+            return None
+
+    def _create(self, key: Tuple[str, bool]) -> None:
+        """Create a cached content for a (model, file_search) pair"""
+        model, file_search = key
+        tools = None
+        if file_search:
+            tools = [types.Tool(file_search=types.FileSearch(file_search_store_names=[self.store_id]))]
+        try:
+            cached = self.client_provider().caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"flusso-system-{model}{'-grounded' if file_search else ''}",
+                    system_instruction=self.system_instruction,
+                    tools=tools,
+                    ttl=f"{int(self.ttl_seconds)}s"
+                )
+            )
+            expires_at = cached.expire_time.timestamp() if cached.expire_time else time.time() + self.ttl_seconds
+            with self._lock:
+                self._handles[key] = (cached.name, expires_at)
+                self.created += 1
+            logger.info(f"✓ Context cache ready for {model}: {cached.name}")
+        except Exception as e:
+            with self._lock:
+                self._failed_until[key] = time.time() + self.retry_seconds
+                self.failures += 1
+            logger.warning(f"Context cache creation failed for {model}, sending instruction inline: {e}")
+        finally:
+            with self._lock:
+                self._creating.discard(key)
+
+    def stats(self) -> Dict:
+        """Return handle and usage counters"""
+        now = time.time()
+        return {
+            'handles': {
+                f"{model}{' (grounded)' if grounded else ''}": round(expires_at - now)
+                for (model, grounded), (_, expires_at) in self._handles.items()
+            },
+            'created': self.created,
+            'failures': self.failures,
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,51 @@
+"""
+End-to-end request deadlines
+A Deadline is created when a request arrives and passed down to every upstream call it makes
+"""
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time before or during an upstream call"""
+
+
+class Deadline:
+    """
+    Point in time by which a request must be answered
+
+    Uses the monotonic clock, so it is unaffected by wall-clock changes.
+    """
+
+    def __init__(self, seconds: float):
+        """
+        Initialize the deadline
+
+        Args:
+            seconds: Time budget from now
+        """
+        if seconds <= 0:
+            raise ValueError("Deadline budget must be positive")
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the deadline has passed"""
+        return time.monotonic() >= self.expires_at
+
+    def check(self, what: str = 'request') -> None:
+        """
+        Raise if the deadline has passed
+
+        Raises:
+            DeadlineExceeded: When no time is left
+        """
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.budget:g}s exceeded before {what}")
+
+    def timeout_ms(self) -> int:
+        """Remaining budget in milliseconds, for HttpOptions(timeout=...)"""
+        return max(1, int(self.remaining() * 1000))
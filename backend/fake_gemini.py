@@ -0,0 +1,545 @@
+"""
+Local stand-in for the Gemini client used by load tests and benchmarks
+Mimics client.models / client.aio.models (and client.caches, File Search store uploads) with configurable latency, error rate and answer size and no network access
+"""
+import os
+import time
+import random
+import asyncio
+import datetime
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+from google.genai import errors, types
+
+from product_codes import extract_product_codes
+
+
+def fixed_latency(seconds: float) -> Callable[[random.Random], float]:
+    """Latency sampler that always returns the same delay"""
+    return lambda rng: seconds
+
+
+def lognormal_latency(median: float, sigma: float = 0.5) -> Callable[[random.Random], float]:
+    """Latency sampler with a long right tail, like real model calls"""
+    import math
+    mu = math.log(median)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+def lognormal_words(median: int, sigma: float = 0.5) -> Callable[[random.Random], int]:
+    """Answer length sampler (in words) with a long right tail"""
+    import math
+    mu = math.log(median)
+    return lambda rng: max(1, int(rng.lognormvariate(mu, sigma)))
+
+
+# Status names the Gemini API returns with each error code
+_ERROR_STATUS = {404: 'NOT_FOUND', 429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 503: 'UNAVAILABLE', 504: 'DEADLINE_EXCEEDED'}
+
+
+def _api_error(code: int) -> errors.APIError:
+    """Build the SDK error the real client raises for an HTTP error code"""
+    body = {'error': {'code': code, 'message': f'Fake upstream error {code}', 'status': _ERROR_STATUS.get(code, 'UNKNOWN')}}
+    return errors.ClientError(code, body) if code < 500 else errors.ServerError(code, body)
+
+
+def _prompt_text(contents) -> str:
+    """Flatten request contents (a string or a list of contents) to text"""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, list):
+        return '\n'.join(_prompt_text(item) for item in contents)
+    parts = getattr(contents, 'parts', None) or []
+    return '\n'.join(getattr(part, 'text', None) or '' for part in parts)
+
+
+def _timeout_seconds(config) -> Optional[float]:
+    """HTTP timeout requested through config.http_options, in seconds"""
+    http_options = getattr(config, 'http_options', None)
+    if http_options is None or http_options.timeout is None:
+        return None
+    return http_options.timeout / 1000
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def build_response(
+    text: str,
+    sources: List[str],
+    usage: Optional[types.GenerateContentResponseUsageMetadata] = None,
+    finish_reason: types.FinishReason = types.FinishReason.STOP
+) -> types.GenerateContentResponse:
+    """
+    Build a real GenerateContentResponse with File Search grounding
+
+    Each source becomes a retrieved-context chunk with a text excerpt, and the
+    answer is split into equal segments, each supported by one chunk, the way
+    File Search attributes answers.
+    """
+    chunks = [
+        types.GroundingChunk(
+            retrieved_context=types.GroundingChunkRetrievedContext(
+                title=title,
+                uri=f"fake://{title}",
+                text=f"Excerpt from {title}: specifications, finishes and installation notes."
+            )
+        )
+        for title in sources
+    ]
+    supports = []
+    if sources and text:
+        step = max(1, len(text) // len(sources))
+        for index in range(len(sources)):
+            start = index * step
+            end = len(text) if index == len(sources) - 1 else min(len(text), start + step)
+            if start >= end:
+                break
+            supports.append(types.GroundingSupport(
+                segment=types.Segment(start_index=start, end_index=end, text=text[start:end]),
+                grounding_chunk_indices=[index],
+                confidence_scores=[0.9]
+            ))
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(
+            content=types.Content(role='model', parts=[types.Part(text=text)]),
+            grounding_metadata=types.GroundingMetadata(
+                grounding_chunks=chunks,
+                grounding_supports=supports or None
+            ),
+            finish_reason=finish_reason
+        )],
+        usage_metadata=usage
+    )
+
+
+class _FakeModels:
+    """Synchronous client.models stand-in"""
+
+    def __init__(self, upstream: 'FakeGeminiClient'):
+        self._upstream = upstream
+
+    def generate_content(self, model: str, contents, config=None) -> types.GenerateContentResponse:
+        delay = self._upstream._begin(contents)
+        timeout = _timeout_seconds(config)
+        try:
+            response, error = self._upstream._outcome(model, contents, config)
+            delay += sum(self._upstream._generation_seconds(response))
+            if timeout is not None and delay > timeout:
+                time.sleep(timeout)
+                raise httpx.ReadTimeout('Fake upstream timed out')
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            return response
+        finally:
+            self._upstream._end()
+
+    def generate_content_stream(self, model: str, contents, config=None):
+        delay = self._upstream._begin(contents)
+        try:
+            response = self._upstream._response(model, contents, config)
+            words = (response.text or '').split(' ')
+            thinking, answering = self._upstream._generation_seconds(response)
+            first_token = delay * self._upstream.first_token_fraction + thinking
+            timeout = _timeout_seconds(config)
+            if timeout is not None and first_token > timeout:
+                time.sleep(timeout)
+                raise httpx.ReadTimeout('Fake upstream timed out')
+            time.sleep(first_token)
+            step = (delay * (1 - self._upstream.first_token_fraction) + answering) / max(len(words), 1)
+            for i, word in enumerate(words):
+                yield build_response(word + (' ' if i < len(words) - 1 else ''), [])
+                time.sleep(step)
+            yield response.model_copy(update={'candidates': [response.candidates[0].model_copy(
+                update={'content': types.Content(role='model', parts=[types.Part(text='')])}
+            )]})
+        finally:
+            self._upstream._end()
+
+
+class _FakeAsyncModels:
+    """Asynchronous client.aio.models stand-in"""
+
+    def __init__(self, upstream: 'FakeGeminiClient'):
+        self._upstream = upstream
+
+    async def generate_content(self, model: str, contents, config=None) -> types.GenerateContentResponse:
+        delay = self._upstream._begin(contents)
+        timeout = _timeout_seconds(config)
+        try:
+            response, error = self._upstream._outcome(model, contents, config)
+            delay += sum(self._upstream._generation_seconds(response))
+            if timeout is not None and delay > timeout:
+                await asyncio.sleep(timeout)
+                raise httpx.ReadTimeout('Fake upstream timed out')
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return response
+        finally:
+            self._upstream._end()
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        upstream = self._upstream
+
+        async def stream():
+            delay = upstream._begin(contents)
+            try:
+                response = upstream._response(model, contents, config)
+                words = (response.text or '').split(' ')
+                thinking, answering = upstream._generation_seconds(response)
+                first_token = delay * upstream.first_token_fraction + thinking
+                timeout = _timeout_seconds(config)
+                if timeout is not None and first_token > timeout:
+                    await asyncio.sleep(timeout)
+                    raise httpx.ReadTimeout('Fake upstream timed out')
+                await asyncio.sleep(first_token)
+                step = (delay * (1 - upstream.first_token_fraction) + answering) / max(len(words), 1)
+                for i, word in enumerate(words):
+                    yield build_response(word + (' ' if i < len(words) - 1 else ''), [])
+                    await asyncio.sleep(step)
+                yield response.model_copy(update={'candidates': [response.candidates[0].model_copy(
+                    update={'content': types.Content(role='model', parts=[types.Part(text='')])}
+                )]})
+            finally:
+                upstream._end()
+
+        return stream()
+
+
+class _FakeCaches:
+    """client.caches stand-in: remembers each cached prefix's token count until it expires"""
+
+    def __init__(self, upstream: 'FakeGeminiClient'):
+        self._upstream = upstream
+
+    def create(self, model: str, config: types.CreateCachedContentConfig) -> types.CachedContent:
+        text = (config.system_instruction or '') + '\n' + _prompt_text(config.contents or [])
+        ttl = float((config.ttl or '3600s').rstrip('s'))
+        with self._upstream._lock:
+            self._upstream.caches_created += 1
+            name = f"cachedContents/fake-{self._upstream.caches_created}"
+            self._upstream._cached_tokens[name] = (estimate_tokens(text), time.time() + ttl)
+        return types.CachedContent(
+            name=name,
+            model=model,
+            display_name=config.display_name,
+            expire_time=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl)
+        )
+
+    def delete(self, name: str, config=None) -> None:
+        with self._upstream._lock:
+            if self._upstream._cached_tokens.pop(name, None) is None:
+                raise _api_error(404)
+
+
+class _FakeDocuments:
+    """client.file_search_stores.documents stand-in"""
+
+    def __init__(self, upstream: 'FakeGeminiClient'):
+        self._upstream = upstream
+
+    def list(self, parent: str, config=None) -> List[types.Document]:
+        with self._upstream._lock:
+            return [document for name, document in self._upstream._documents.items()
+                    if name.startswith(parent + '/documents/')]
+
+    def get(self, name: str, config=None) -> types.Document:
+        with self._upstream._lock:
+            document = self._upstream._documents.get(name)
+        if document is None:
+            raise _api_error(404)
+        return document
+
+    def delete(self, name: str, config=None) -> None:
+        time.sleep(self._upstream.upload_latency(self._upstream._rng) / 4)
+        with self._upstream._lock:
+            if self._upstream._documents.pop(name, None) is None:
+                raise _api_error(404)
+            self._upstream.documents_deleted += 1
+
+
+class _FakeFileSearchStores:
+    """client.file_search_stores stand-in: uploads become documents once their operation is done"""
+
+    def __init__(self, upstream: 'FakeGeminiClient'):
+        self._upstream = upstream
+        self.documents = _FakeDocuments(upstream)
+
+    def upload_to_file_search_store(
+        self,
+        file_search_store_name: str,
+        file,
+        config: Optional[types.UploadToFileSearchStoreConfig] = None
+    ) -> types.UploadToFileSearchStoreOperation:
+        upstream = self._upstream
+        if isinstance(config, dict):
+            config = types.UploadToFileSearchStoreConfig(**config)
+        size = os.path.getsize(file) if isinstance(file, (str, os.PathLike)) else len(file.read())
+        with upstream._lock:
+            upstream.uploads_in_flight += 1
+            upstream.peak_uploads_in_flight = max(upstream.peak_uploads_in_flight, upstream.uploads_in_flight)
+            delay = upstream.upload_latency(upstream._rng)
+            failed = upstream.error_rate and upstream._rng.random() < upstream.error_rate
+            code = upstream._rng.choice(upstream.error_codes) if failed else None
+        try:
+            time.sleep(delay)
+            if code is not None:
+                with upstream._lock:
+                    upstream.errors += 1
+                raise _api_error(code)
+            with upstream._lock:
+                upstream.uploads += 1
+                upstream.uploaded_bytes += size
+                number = upstream.uploads
+                document = types.Document(
+                    name=f"{file_search_store_name}/documents/fake-{number}",
+                    display_name=config.display_name if config else None,
+                    size_bytes=size,
+                    mime_type=config.mime_type if config else None,
+                    custom_metadata=config.custom_metadata if config else None,
+                    state=types.DocumentState.STATE_ACTIVE
+                )
+                name = f"{file_search_store_name}/upload/operations/fake-{number}"
+                upstream._operations[name] = (time.monotonic() + upstream.index_seconds, document)
+        finally:
+            with upstream._lock:
+                upstream.uploads_in_flight -= 1
+        return types.UploadToFileSearchStoreOperation(name=name, done=False)
+
+
+class _FakeOperations:
+    """client.operations stand-in for upload operations"""
+
+    def __init__(self, upstream: 'FakeGeminiClient'):
+        self._upstream = upstream
+
+    def get(self, operation, config=None):
+        with self._upstream._lock:
+            done_at, document = self._upstream._operations.get(operation.name, (None, None))
+            if document is None:
+                raise _api_error(404)
+            if time.monotonic() < done_at:
+                return operation.model_copy(update={'done': False})
+            # Indexing finished: the document becomes visible to list() and File Search
+            self._upstream._documents.setdefault(document.name, document)
+        return operation.model_copy(update={
+            'done': True,
+            'response': types.UploadToFileSearchStoreResponse(
+                parent=document.name.split('/documents/')[0],
+                document_name=document.name
+            )
+        })
+
+
+class FakeGeminiClient:
+    """
+    Drop-in replacement for genai.Client in load tests
+
+    Tracks the number of calls and the peak number of concurrent upstream
+    requests, which is what the concurrency benchmarks report. Context caches
+    can be created and referenced through cached_content, whose tokens are
+    then reported as cached prompt tokens. Files uploaded to a File Search
+    store take upload_latency, and their operation reports done (and the
+    document appears) index_seconds later. With token_seconds, each generated
+    token (thinking included) adds to the latency, and max_output_tokens and
+    the thinking budget in the config are honored: an answer cut off at the
+    limit reports finish_reason MAX_TOKENS. A timeout set
+    through config.http_options is honored the way httpx does it: the call
+    raises httpx.ReadTimeout once the timeout elapses. With an error_rate,
+    that share of calls fails with the SDK's ClientError/ServerError, after
+    the sampled latency (or before the first token when streaming).
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Callable[[random.Random], float]] = None,
+        answer_words: Union[int, Callable[[random.Random], int]] = 120,
+        sources: Optional[List[str]] = None,
+        first_token_fraction: float = 0.2,
+        per_code_latency: float = 0.0,
+        responder: Optional[Callable[[str, str], Optional[str]]] = None,
+        seed: int = 0,
+        error_rate: float = 0.0,
+        error_codes: Sequence[int] = (503, 429),
+        code_sources: bool = False,
+        upload_latency: Optional[Callable[[random.Random], float]] = None,
+        index_seconds: float = 0.0,
+        token_seconds: float = 0.0,
+        thinking_tokens: Union[int, Callable[[random.Random], int]] = 0
+    ):
+        """
+        Initialize the fake client
+
+        Args:
+            latency: Sampler returning the seconds each call takes (default 0.5s fixed)
+            answer_words: Length of generated answers in words, or a sampler
+                returning it (e.g. lognormal_words(120))
+            sources: Document titles returned as grounding chunks
+            first_token_fraction: Share of the latency spent before the first streamed token
+            per_code_latency: Extra seconds per product code in the prompt (longer
+                answers for multi-product prompts)
+            responder: Optional function (model, prompt) -> answer text overriding the
+                default filler answer (return None to fall back to it)
+            seed: Random seed for reproducible latency samples
+            error_rate: Share of calls that fail (0.0-1.0)
+            error_codes: HTTP codes the failures are drawn from
+            code_sources: Also ground on a spec sheet per product code in the prompt
+            upload_latency: Sampler returning the seconds each File Search upload takes
+                (default 0.1s fixed; deletes take a quarter of it)
+            index_seconds: Seconds from an upload until its operation is done
+            token_seconds: Extra seconds per generated token, thinking included
+                (0 keeps the latency independent of the answer length)
+            thinking_tokens: Thinking tokens spent per call when the budget allows
+                them (dynamic or unset), or a sampler returning them
+        """
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate must be between 0.0 and 1.0")
+
+        self.latency = latency or fixed_latency(0.5)
+        self.answer_words = answer_words
+        self.sources = sources if sources is not None else ['Flusso Catalog.pdf', 'Spec Sheet 100.1000.pdf']
+        self.first_token_fraction = first_token_fraction
+        self.per_code_latency = per_code_latency
+        self.responder = responder
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.code_sources = code_sources
+        self.upload_latency = upload_latency or fixed_latency(0.1)
+        self.index_seconds = index_seconds
+        self.token_seconds = token_seconds
+        self.thinking_tokens = thinking_tokens
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.caches_created = 0
+        self.cached_calls = 0
+        self._cached_tokens: Dict[str, tuple] = {}
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.uploads_in_flight = 0
+        self.peak_uploads_in_flight = 0
+        self.documents_deleted = 0
+        self._documents: Dict[str, types.Document] = {}
+        self._operations: Dict[str, tuple] = {}
+
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
+        self.file_search_stores = _FakeFileSearchStores(self)
+        self.operations = _FakeOperations(self)
+        self.aio = type('FakeAio', (), {})()
+        self.aio.models = _FakeAsyncModels(self)
+
+    def _begin(self, contents) -> float:
+        """Record a call starting and sample its latency"""
+        extra = 0.0
+        if self.per_code_latency:
+            extra = self.per_code_latency * len(extract_product_codes(_prompt_text(contents)))
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return self.latency(self._rng) + extra
+
+    def _end(self) -> None:
+        """Record a call finishing"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def _response(self, model: str, contents, config=None) -> types.GenerateContentResponse:
+        """Build the answer for a request, or raise the sampled upstream error"""
+        cached_content = getattr(config, 'cached_content', None)
+        with self._lock:
+            cached_tokens, expires_at = self._cached_tokens.get(cached_content, (None, 0.0))
+            if cached_content and expires_at <= time.time():
+                raise _api_error(404)
+            if cached_tokens is not None:
+                self.cached_calls += 1
+            failed = self.error_rate and self._rng.random() < self.error_rate
+            code = self._rng.choice(self.error_codes) if failed else None
+            words = self.answer_words(self._rng) if callable(self.answer_words) else self.answer_words
+            thinking = self.thinking_tokens(self._rng) if callable(self.thinking_tokens) else self.thinking_tokens
+            if failed:
+                self.errors += 1
+        if code is not None:
+            raise _api_error(code)
+
+        prompt = _prompt_text(contents)
+        text = self.responder(model, prompt) if self.responder else None
+        if text is None:
+            text = ' '.join(['**Flusso**'] + ['lorem'] * (words - 1))
+        sources = list(self.sources)
+        if self.code_sources:
+            sources += [f"Spec Sheet {code}.pdf" for code in extract_product_codes(prompt)]
+
+        # Thinking stays within its budget, and counts against max_output_tokens like the answer does
+        thinking_config = getattr(config, 'thinking_config', None)
+        budget = thinking_config.thinking_budget if thinking_config is not None else None
+        if budget is not None and budget >= 0:
+            thinking = min(thinking, budget)
+        finish_reason = types.FinishReason.STOP
+        max_output = getattr(config, 'max_output_tokens', None)
+        if max_output is not None:
+            thinking = min(thinking, max_output)
+            allowed = max_output - thinking
+            if estimate_tokens(text) > allowed:
+                text = text[:allowed * 4].rsplit(' ', 1)[0] if allowed else ''
+                finish_reason = types.FinishReason.MAX_TOKENS
+
+        prompt_tokens = estimate_tokens(prompt) + (cached_tokens or 0)
+        response_tokens = estimate_tokens(text) if text else 0
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens,
+            candidates_token_count=response_tokens,
+            thoughts_token_count=thinking or None,
+            total_token_count=prompt_tokens + response_tokens + thinking
+        )
+        return build_response(text, sources, usage, finish_reason)
+
+    def _outcome(
+        self,
+        model: str,
+        contents,
+        config=None
+    ) -> Tuple[Optional[types.GenerateContentResponse], Optional[Exception]]:
+        """Build the answer, holding back a sampled error until the call's latency has passed"""
+        try:
+            return self._response(model, contents, config), None
+        except errors.APIError as e:
+            return None, e
+
+    def _generation_seconds(self, response: Optional[types.GenerateContentResponse]) -> Tuple[float, float]:
+        """Seconds spent generating the thinking and the answer tokens of a response"""
+        usage = response.usage_metadata if response is not None else None
+        if not self.token_seconds or usage is None:
+            return 0.0, 0.0
+        return (
+            self.token_seconds * (usage.thoughts_token_count or 0),
+            self.token_seconds * (usage.candidates_token_count or 0)
+        )
+
+    def stats(self) -> Dict:
+        """Return call counters"""
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'caches_created': self.caches_created,
+            'cached_calls': self.cached_calls,
+            'uploads': self.uploads,
+            'uploaded_bytes': self.uploaded_bytes,
+            'peak_uploads_in_flight': self.peak_uploads_in_flight,
+            'documents': len(self._documents),
+            'documents_deleted': self.documents_deleted
+        }
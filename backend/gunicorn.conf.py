@@ -0,0 +1,40 @@
+"""
+Gunicorn settings shared by the Flask and ASGI servers (loaded automatically from backend/)
+Preloads the app in the master, warms up each worker and enables Prometheus multi-process mode so /metrics reports every worker
+"""
+import os
+import shutil
+import tempfile
+
+# Workers inherit this and write their samples to files in it
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'flusso_metrics'))
+# It must exist before the app (and its metrics) is preloaded; on_starting then empties it
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Import the app (google.genai included) once in the master; workers are forked with it loaded.
+# The engine creates its Gemini client lazily in each worker, so no connection pool crosses the fork
+preload_app = os.getenv('PRELOAD_APP', 'True').lower() == 'true'
+
+# Threads per Flask worker (gunicorn switches to gthread when above 1), so static files and health
+# checks are answered while other requests wait on Gemini; the uvicorn worker class ignores it
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+
+def on_starting(server):
+    """Start every server run with an empty metrics directory"""
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def post_worker_init(worker):
+    """Start the Flask worker's upstream warm-up (the ASGI app starts its own on lifespan startup)"""
+    start_warmup = getattr(worker.wsgi, 'extensions', {}).get('flusso_warmup')
+    if start_warmup is not None:
+        start_warmup()
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
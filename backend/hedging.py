@@ -0,0 +1,252 @@
+"""
+Hedged upstream requests
+If a call has not answered by the observed latency percentile, a duplicate is sent and the first answer wins
+"""
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class Hedger:
+    """
+    Send a backup request when the first one is slower than usual
+
+    The hedge delay is the given percentile of recent successful latencies,
+    tracked per key (model). Hedging is limited two ways so it cannot
+    multiply load: each call earns max_hedge_ratio of a hedge credit and a
+    hedge spends one, and at most max_in_flight hedges run at once. No hedge
+    is sent when the request deadline would expire before the delay.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 90,
+        min_samples: int = 20,
+        max_hedge_ratio: float = 0.1,
+        max_in_flight: int = 4,
+        window: int = 500,
+        max_workers: int = 64
+    ):
+        """
+        Initialize the hedger
+
+        Args:
+            percentile: Latency percentile after which the hedge is sent
+            min_samples: Latency samples needed per key before hedging starts
+            max_hedge_ratio: Largest long-run share of calls that may be hedged
+            max_in_flight: Most hedges outstanding at once
+            window: Recent latency samples kept per key
+            max_workers: Threads available for racing synchronous calls
+        """
+        if not 0 < percentile < 100:
+            raise ValueError("percentile must be between 0 and 100")
+        if not 0.0 <= max_hedge_ratio <= 1.0:
+            raise ValueError("max_hedge_ratio must be between 0.0 and 1.0")
+
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_in_flight = max_in_flight
+        self.window = window
+
+        self._samples: Dict[str, deque] = {}
+        self._credits = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+
+        self.calls = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.hedges_denied = 0
+
+    def delay(self, key: str) -> Optional[float]:
+        """Current hedge delay for a key, or None while there are too few samples"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def observe(self, key: str, seconds: float) -> None:
+        """Record the latency of a successful call"""
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        deadline: Optional[Deadline] = None,
+        key: str = 'default',
+        hedge_fn: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """
+        Run a blocking call, hedging it if it is slow
+
+        Attempts run in the hedger's threads with a copy of the caller's
+        context, so per-request state (metrics, priority lane) follows them.
+
+        Args:
+            fn: The upstream call (safe to run twice)
+            deadline: Request deadline; the wait is cut off when it expires
+            key: Latency bucket, e.g. the model name
+            hedge_fn: The backup attempt, when it differs from fn (e.g. fn
+                taking its own admission slot); defaults to fn
+
+        Returns:
+            The first successful result
+
+        Raises:
+            DeadlineExceeded: When no attempt finished before the deadline
+            Exception: The last attempt's error when every attempt failed
+        """
+        delay = self._begin(key)
+        if delay is None or (deadline is not None and deadline.remaining() <= delay):
+            return self._timed(fn, key)
+
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='hedge')
+
+        primary = self._pool.submit(contextvars.copy_context().run, self._timed, fn, key)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        if not self._acquire_hedge():
+            return self._first_success({primary: False}, deadline)
+
+        logger.info(f"No response from {key} after {delay:.2f}s, sending hedged request")
+        hedge = self._pool.submit(contextvars.copy_context().run, self._timed, hedge_fn or fn, key)
+        hedge.add_done_callback(lambda _: self._release_hedge())
+        return self._first_success({primary: False, hedge: True}, deadline)
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        deadline: Optional[Deadline] = None,
+        key: str = 'default',
+        hedge_fn: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Await a call, hedging it if it is slow
+
+        Args:
+            Same as call(), with fn returning an awaitable
+
+        Returns:
+            The first successful result; the losing attempt is cancelled
+        """
+        delay = self._begin(key)
+        primary = asyncio.ensure_future(self._atimed(fn, key))
+        attempts = {primary: False}
+        try:
+            if delay is not None and (deadline is None or deadline.remaining() > delay):
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self._acquire_hedge():
+                    logger.info(f"No response from {key} after {delay:.2f}s, sending hedged request")
+                    hedge = asyncio.ensure_future(self._atimed(hedge_fn or fn, key))
+                    hedge.add_done_callback(lambda _: self._release_hedge())
+                    attempts[hedge] = True
+
+            pending = set(attempts)
+            error = None
+            while pending:
+                timeout = deadline.remaining() if deadline is not None else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded(f"Deadline of {deadline.budget:g}s exceeded during upstream call")
+                for task in done:
+                    if task.exception() is None:
+                        self._record_win(attempts[task])
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    def _first_success(self, attempts: Dict, deadline: Optional[Deadline]) -> Any:
+        """Wait for the first attempt that succeeds (attempts map future -> is_hedge)"""
+        pending = set(attempts)
+        error = None
+        while pending:
+            timeout = deadline.remaining() if deadline is not None else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"Deadline of {deadline.budget:g}s exceeded during upstream call")
+            for future in done:
+                if future.exception() is None:
+                    self._record_win(attempts[future])
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _begin(self, key: str) -> Optional[float]:
+        """Count a call, earn hedge credit and return the hedge delay"""
+        with self._lock:
+            self.calls += 1
+            self._credits = min(self.max_in_flight, self._credits + self.max_hedge_ratio)
+        return self.delay(key)
+
+    def _acquire_hedge(self) -> bool:
+        """Spend a hedge credit if the budget and in-flight limit allow"""
+        with self._lock:
+            if self._credits >= 1.0 and self._in_flight < self.max_in_flight:
+                self._credits -= 1.0
+                self._in_flight += 1
+                self.hedges_sent += 1
+                return True
+            self.hedges_denied += 1
+            return False
+
+    def _release_hedge(self) -> None:
+        """Mark a hedge as finished"""
+        with self._lock:
+            self._in_flight -= 1
+
+    def _record_win(self, is_hedge: bool) -> None:
+        """Count hedges that answered first"""
+        if is_hedge:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def _timed(self, fn: Callable[[], Any], key: str) -> Any:
+        """Run a blocking attempt and record its latency when it succeeds"""
+        started = time.monotonic()
+        result = fn()
+        self.observe(key, time.monotonic() - started)
+        return result
+
+    async def _atimed(self, fn: Callable[[], Awaitable[Any]], key: str) -> Any:
+        """Await an attempt and record its latency when it succeeds"""
+        started = time.monotonic()
+        result = await fn()
+        self.observe(key, time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict:
+        """Return hedging counters and current delays"""
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            'calls': self.calls,
+            'hedges_sent': self.hedges_sent,
+            'hedge_wins': self.hedge_wins,
+            'hedges_denied': self.hedges_denied,
+            'hedges_in_flight': self._in_flight,
+            'delays': {key: round(value, 3) for key in keys if (value := self.delay(key)) is not None}
+        }
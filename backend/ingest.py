@@ -0,0 +1,727 @@
+"""
+Incremental ingestion of a document directory into the File Search store
+
+Walks a directory, content-hashes every document against a local SQLite
+manifest and uploads only new or changed files to the File Search store, with
+bounded parallelism, retries and resumable progress. Files removed from disk
+are removed from the store, and a replaced document is deleted only after its
+new version has been indexed, so answers never lose a source mid-run.
+
+Usage:
+    python ingest.py ../docs
+    python ingest.py ../docs --concurrency 8 --dry-run
+    python ingest.py ../docs --reconcile
+    python ingest.py ../docs --local-index --catalog
+"""
+import os
+import sys
+import time
+import heapq
+import fnmatch
+import hashlib
+import logging
+import sqlite3
+import argparse
+import mimetypes
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional
+
+from google.genai import errors, types
+
+from rate_limit import TokenBucket
+from resilience import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# Document types File Search indexes
+DEFAULT_PATTERNS = ('*.pdf', '*.txt', '*.md', '*.html', '*.htm', '*.csv', '*.json', '*.doc', '*.docx', '*.xlsx', '*.pptx')
+
+MANIFEST_NAME = '.flusso_manifest.sqlite3'
+HASH_CHUNK_BYTES = 1 << 20
+
+# Custom metadata written on every document, so reconcile() can match store documents to files
+PATH_KEY = 'source_path'
+HASH_KEY = 'sha256'
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's contents, read in 1 MB chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        while chunk := handle.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalFile:
+    """A document on disk, identified by its path relative to the ingested directory"""
+
+    __slots__ = ('path', 'abs_path', 'size', 'mtime_ns', 'sha256')
+
+    def __init__(self, path: str, abs_path: str, size: int, mtime_ns: int, sha256: Optional[str] = None):
+        self.path = path
+        self.abs_path = abs_path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+
+
+def find_files(root: str, patterns: Iterable[str] = DEFAULT_PATTERNS) -> List[LocalFile]:
+    """
+    List the documents under a directory (without hashing them)
+
+    Hidden files and directories (including the manifest) are skipped.
+
+    Args:
+        root: Directory to walk
+        patterns: Filename globs to include (case-insensitive)
+
+    Returns:
+        Files sorted by relative path
+    """
+    patterns = [pattern.lower() for pattern in patterns]
+    files = []
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories[:] = sorted(name for name in subdirectories if not name.startswith('.'))
+        for name in sorted(names):
+            if name.startswith('.') or not any(fnmatch.fnmatch(name.lower(), pattern) for pattern in patterns):
+                continue
+            abs_path = os.path.join(directory, name)
+            stat = os.stat(abs_path)
+            path = os.path.relpath(abs_path, root).replace(os.sep, '/')
+            files.append(LocalFile(path, abs_path, stat.st_size, stat.st_mtime_ns))
+    return files
+
+
+def hash_files(files: List[LocalFile], known: Dict[str, Dict]) -> List[LocalFile]:
+    """
+    Fill in the content hashes of scanned files
+
+    A file keeps the hash recorded in `known` (path -> {'sha256', 'size',
+    'mtime_ns'}) while its size and mtime are unchanged; the others are
+    hashed in parallel.
+
+    Returns:
+        The files that were hashed
+    """
+    for local in files:
+        row = known.get(local.path)
+        if row is not None and row['size'] == local.size and row['mtime_ns'] == local.mtime_ns:
+            local.sha256 = row['sha256']
+    to_hash = [local for local in files if local.sha256 is None]
+    if to_hash:
+        # hashlib releases the GIL on large buffers, so hashing scales with threads
+        with ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) * 2)) as pool:
+            for local, digest in zip(to_hash, pool.map(lambda item: file_sha256(item.abs_path), to_hash)):
+                local.sha256 = digest
+    return to_hash
+
+
+class IngestPlan:
+    """What a run has to do: files to upload (new, changed, resumed) and documents to delete"""
+
+    def __init__(self):
+        self.new: List[LocalFile] = []
+        self.changed: List[LocalFile] = []
+        self.unchanged = 0
+        self.resumed: Dict[str, str] = {}
+        self.removed: List[str] = []
+
+    @property
+    def uploads(self) -> List[LocalFile]:
+        return self.new + self.changed
+
+    def summary(self) -> Dict:
+        """Counts for logging and dry runs"""
+        return {
+            'new': len(self.new),
+            'changed': len(self.changed),
+            'unchanged': self.unchanged,
+            'resumed': len(self.resumed),
+            'removed': len(self.removed),
+            'upload_bytes': sum(local.size for local in self.uploads)
+        }
+
+
+class Manifest:
+    """
+    Local record of what has been ingested into each File Search store
+
+    documents maps every ingested file to its content hash, size, mtime and
+    store document. pending holds uploads whose bytes were sent but whose
+    indexing was not confirmed yet, with their operation, so an interrupted
+    run polls them instead of sending the file again. deletions queues store
+    documents to remove (old versions and removed files) until the delete
+    has gone through. Every row is written as soon as its step finishes,
+    which is what makes runs resumable.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the manifest
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                store TEXT NOT NULL,
+                path TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                document_name TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (store, path)
+            )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS pending (
+                store TEXT NOT NULL,
+                path TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                PRIMARY KEY (store, path)
+            )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS deletions (
+                store TEXT NOT NULL,
+                document_name TEXT NOT NULL,
+                queued_at REAL NOT NULL,
+                PRIMARY KEY (store, document_name)
+            )"""
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return a connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def documents(self, store: str) -> Dict[str, Dict]:
+        """Ingested files of a store by path"""
+        rows = self._connection().execute(
+            "SELECT path, sha256, size, mtime_ns, document_name FROM documents WHERE store = ?", (store,)
+        )
+        return {
+            path: {'sha256': sha256, 'size': size, 'mtime_ns': mtime_ns, 'document_name': document_name}
+            for path, sha256, size, mtime_ns, document_name in rows
+        }
+
+    def pending(self, store: str) -> Dict[str, Dict]:
+        """Uploads waiting for indexing by path"""
+        rows = self._connection().execute("SELECT path, sha256, operation FROM pending WHERE store = ?", (store,))
+        return {path: {'sha256': sha256, 'operation': operation} for path, sha256, operation in rows}
+
+    def deletions(self, store: str) -> List[str]:
+        """Store documents queued for deletion"""
+        rows = self._connection().execute(
+            "SELECT document_name FROM deletions WHERE store = ? ORDER BY queued_at", (store,)
+        )
+        return [row[0] for row in rows]
+
+    def mark_pending(self, store: str, local: LocalFile, operation: str) -> None:
+        """Remember an upload whose bytes were accepted"""
+        self._connection().execute(
+            "INSERT OR REPLACE INTO pending (store, path, sha256, operation, started_at) VALUES (?, ?, ?, ?, ?)",
+            (store, local.path, local.sha256, operation, time.time())
+        )
+
+    def commit_upload(self, store: str, local: LocalFile, document_name: str) -> None:
+        """Record an indexed document and queue the version it replaces for deletion"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT document_name FROM documents WHERE store = ? AND path = ?", (store, local.path)
+            ).fetchone()
+            if row is not None and row[0] != document_name:
+                conn.execute(
+                    "INSERT OR IGNORE INTO deletions (store, document_name, queued_at) VALUES (?, ?, ?)",
+                    (store, row[0], time.time())
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (store, path, sha256, size, mtime_ns, document_name, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (store, local.path, local.sha256, local.size, local.mtime_ns, document_name, time.time())
+            )
+            conn.execute("DELETE FROM pending WHERE store = ? AND path = ?", (store, local.path))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def drop_pending(self, store: str, path: str) -> None:
+        """Forget an upload that cannot be resumed"""
+        self._connection().execute("DELETE FROM pending WHERE store = ? AND path = ?", (store, path))
+
+    def queue_removal(self, store: str, path: str) -> None:
+        """Forget a file that is gone from disk and queue its document for deletion"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT document_name FROM documents WHERE store = ? AND path = ?", (store, path)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "INSERT OR IGNORE INTO deletions (store, document_name, queued_at) VALUES (?, ?, ?)",
+                    (store, row[0], time.time())
+                )
+            conn.execute("DELETE FROM documents WHERE store = ? AND path = ?", (store, path))
+            conn.execute("DELETE FROM pending WHERE store = ? AND path = ?", (store, path))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def queue_deletion(self, store: str, document_name: str) -> None:
+        """Queue a store document that no file refers to for deletion"""
+        self._connection().execute(
+            "INSERT OR IGNORE INTO deletions (store, document_name, queued_at) VALUES (?, ?, ?)",
+            (store, document_name, time.time())
+        )
+
+    def deleted(self, store: str, document_name: str) -> None:
+        """Record a finished deletion"""
+        self._connection().execute(
+            "DELETE FROM deletions WHERE store = ? AND document_name = ?", (store, document_name)
+        )
+
+
+class Ingester:
+    """
+    Sync a document directory into a File Search store
+
+    At most `concurrency` API requests are in flight at once. Uploads return
+    a long-running operation; instead of holding a worker while the document
+    is indexed, the operation is polled every poll_interval from the same
+    pool, so slow indexing does not cap upload throughput. Transient errors
+    (429, 5xx, network) are retried with the engine's RetryPolicy. Content
+    hashes are only computed for files whose size or mtime differ from the
+    manifest, so a run over an unchanged tree costs one stat() per file.
+    """
+
+    def __init__(
+        self,
+        client,
+        store_name: str,
+        manifest: Manifest,
+        concurrency: int = 4,
+        rate_per_second: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+        poll_interval: float = 2.0,
+        index_timeout: float = 600.0,
+        progress_callback: Optional[Callable[[Dict], None]] = None
+    ):
+        """
+        Initialize the ingester
+
+        Args:
+            client: genai.Client (or FakeGeminiClient) with file_search_stores and operations
+            store_name: File Search store (fileSearchStores/...)
+            manifest: Manifest recording what has been ingested
+            concurrency: Maximum API requests (uploads, polls, deletes) in flight
+            rate_per_second: Optional cap on uploads started per second
+            retry: Retry policy for transient errors (default 5 attempts, up to 30s apart)
+            poll_interval: Seconds between checks of an upload's operation
+            index_timeout: An upload not indexed this long after it was sent counts as failed
+                (it stays pending and is polled again by the next run)
+            progress_callback: Called with status() after each upload or deletion
+        """
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+        if not store_name.startswith('fileSearchStores/'):
+            raise ValueError("store_name must look like fileSearchStores/...")
+
+        self.client = client
+        self.store_name = store_name
+        self.manifest = manifest
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate_per_second) if rate_per_second else None
+        self.retry = retry or RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0)
+        self.poll_interval = poll_interval
+        self.index_timeout = index_timeout
+        self.progress_callback = progress_callback
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """Reset counters for a new run"""
+        self.files = 0
+        self.hashed = 0
+        self.hashed_bytes = 0
+        self.uploaded = 0
+        self.uploaded_bytes = 0
+        self.deleted = 0
+        self.failed = 0
+        self.adopted = 0
+        self.orphans = 0
+        self.total_uploads = 0
+        self.total_deletions = 0
+        self.started_at = time.time()
+
+    def scan(self, root: str, patterns: Iterable[str] = DEFAULT_PATTERNS, rehash: bool = False) -> List[LocalFile]:
+        """
+        Find the documents under a directory and hash them
+
+        Hidden files and directories (including the manifest) are skipped.
+        A file keeps the hash recorded in the manifest while its size and
+        mtime are unchanged; other files are hashed in parallel.
+
+        Args:
+            root: Directory to ingest
+            patterns: Filename globs to include (case-insensitive)
+            rehash: Hash every file, ignoring recorded sizes and mtimes
+
+        Returns:
+            Files sorted by relative path
+        """
+        known = {} if rehash else self.manifest.documents(self.store_name)
+        pending = self.manifest.pending(self.store_name)
+        files = find_files(root, patterns)
+        to_hash = hash_files(files, known)
+        self.files = len(files)
+        self.hashed = len(to_hash)
+        self.hashed_bytes = sum(local.size for local in to_hash)
+        logger.info(f"Scanned {root}: {len(files)} files, {len(to_hash)} hashed, {len(pending)} uploads pending")
+        return files
+
+    def plan(self, files: List[LocalFile]) -> IngestPlan:
+        """Compare scanned files with the manifest"""
+        known = self.manifest.documents(self.store_name)
+        pending = self.manifest.pending(self.store_name)
+        plan = IngestPlan()
+        for local in files:
+            row = known.get(local.path)
+            if row is not None and row['sha256'] == local.sha256:
+                plan.unchanged += 1
+                continue
+            (plan.new if row is None else plan.changed).append(local)
+            resume = pending.get(local.path)
+            if resume is not None and resume['sha256'] == local.sha256:
+                plan.resumed[local.path] = resume['operation']
+        on_disk = {local.path for local in files}
+        plan.removed = sorted(path for path in known if path not in on_disk)
+        return plan
+
+    def reconcile(self, files: List[LocalFile]) -> Dict:
+        """
+        Match the store's documents with the manifest
+
+        A document carrying this tool's metadata but missing from the
+        manifest (an upload indexed after its run was interrupted) is adopted
+        when its file still has the same hash, and queued for deletion
+        otherwise. Documents uploaded by other means are left alone.
+
+        Returns:
+            Counts of adopted, orphaned and unmanaged documents
+        """
+        known = self.manifest.documents(self.store_name)
+        referenced = {row['document_name'] for row in known.values()}
+        referenced.update(self.manifest.deletions(self.store_name))
+        by_path = {local.path: local for local in files}
+        unmanaged = 0
+
+        for document in self.retry.call(
+            lambda: self.client.file_search_stores.documents.list(parent=self.store_name)
+        ):
+            if document.name in referenced:
+                continue
+            metadata = {item.key: item.string_value for item in document.custom_metadata or []}
+            path = metadata.get(PATH_KEY)
+            if path is None:
+                unmanaged += 1
+                continue
+            local = by_path.get(path)
+            row = known.get(path)
+            if local is not None and local.sha256 == metadata.get(HASH_KEY) and (row is None or row['sha256'] != local.sha256):
+                self.manifest.commit_upload(self.store_name, local, document.name)
+                known[path] = {'sha256': local.sha256, 'document_name': document.name}
+                self.adopted += 1
+            else:
+                self.manifest.queue_deletion(self.store_name, document.name)
+                self.orphans += 1
+
+        result = {'adopted': self.adopted, 'orphans': self.orphans, 'unmanaged': unmanaged}
+        logger.info(f"Reconciled {self.store_name}: {result}")
+        return result
+
+    def run(
+        self,
+        root: str,
+        patterns: Iterable[str] = DEFAULT_PATTERNS,
+        delete_removed: bool = True,
+        dry_run: bool = False,
+        rehash: bool = False,
+        reconcile: bool = False
+    ) -> Dict:
+        """
+        Sync a directory into the store
+
+        Args:
+            root: Directory to ingest
+            patterns: Filename globs to include
+            delete_removed: Delete the documents of files that are gone from disk
+            dry_run: Only report what would be done
+            rehash: Hash every file instead of trusting unchanged sizes and mtimes
+            reconcile: List the store first and adopt or delete documents missing from the manifest
+
+        Returns:
+            Final status dictionary (with the plan under 'plan')
+        """
+        self._reset()
+        files = self.scan(root, patterns, rehash=rehash)
+        if reconcile and not dry_run:
+            self.reconcile(files)
+        plan = self.plan(files)
+        summary = plan.summary()
+        logger.info(f"Ingestion plan for {self.store_name}: {summary}")
+        if dry_run:
+            return dict(self.status(), plan=summary)
+
+        if delete_removed:
+            for path in plan.removed:
+                self.manifest.queue_removal(self.store_name, path)
+        self.total_uploads = len(plan.uploads)
+        self._sync(plan)
+
+        status = dict(self.status(), plan=summary)
+        logger.info(f"✓ Ingestion finished: {status}")
+        return status
+
+    def _sync(self, plan: IngestPlan) -> None:
+        """Upload, wait for indexing, then delete replaced and removed documents"""
+        uploads = iter(plan.uploads)
+        polls = []  # heap of (due, sequence, local, operation, sent_at)
+        sequence = 0
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            # Uploads left pending by an interrupted run are polled before anything is sent again
+            for local in plan.uploads:
+                if local.path in plan.resumed:
+                    operation = types.UploadToFileSearchStoreOperation(name=plan.resumed[local.path])
+                    heapq.heappush(polls, (0.0, sequence, local, operation, time.monotonic()))
+                    sequence += 1
+            resumed = {local.path for _, _, local, _, _ in polls}
+
+            while True:
+                now = time.monotonic()
+                while polls and polls[0][0] <= now and len(futures) < self.concurrency:
+                    _, _, local, operation, sent_at = heapq.heappop(polls)
+                    futures[pool.submit(self._poll, operation)] = ('poll', local, sent_at)
+                while len(futures) < self.concurrency:
+                    local = next(uploads, None)
+                    if local is None:
+                        break
+                    if local.path not in resumed:
+                        futures[pool.submit(self._upload, local)] = ('upload', local, now)
+                if not futures and not polls:
+                    break
+
+                # With every slot busy a due poll waits for a request to finish, not for its timer
+                timeout = max(0.0, polls[0][0] - now) if polls and len(futures) < self.concurrency else None
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, local, sent_at = futures.pop(future)
+                    try:
+                        operation = future.result()
+                    except Exception as e:
+                        if kind == 'poll' and isinstance(e, errors.APIError) and e.code == 404 and local.path in resumed:
+                            # The resumed operation is gone: send the file again
+                            self.manifest.drop_pending(self.store_name, local.path)
+                            resumed.discard(local.path)
+                            futures[pool.submit(self._upload, local)] = ('upload', local, time.monotonic())
+                            continue
+                        self._failed(f"{kind} {local.path}", e)
+                        continue
+                    if kind == 'upload':
+                        sent_at = time.monotonic()
+                        self.manifest.mark_pending(self.store_name, local, operation.name)
+                    self._after_poll(local, operation, sent_at, polls, sequence)
+                    sequence += 1
+
+            deletions = self.manifest.deletions(self.store_name)
+            self.total_deletions = len(deletions)
+            for _ in pool.map(self._delete, deletions):
+                pass
+
+    def _after_poll(self, local: LocalFile, operation, sent_at: float, polls: List, sequence: int) -> None:
+        """Commit an indexed upload, or schedule the next poll of its operation"""
+        if not operation.done:
+            if time.monotonic() - sent_at > self.index_timeout:
+                self._failed(f"indexing {local.path}", TimeoutError(f"not indexed after {self.index_timeout:g}s"))
+                return
+            heapq.heappush(polls, (time.monotonic() + self.poll_interval, sequence, local, operation, sent_at))
+            return
+        if operation.error:
+            self.manifest.drop_pending(self.store_name, local.path)
+            self._failed(f"indexing {local.path}", RuntimeError(operation.error.get('message', operation.error)))
+            return
+
+        self.manifest.commit_upload(self.store_name, local, operation.response.document_name)
+        with self._lock:
+            self.uploaded += 1
+            self.uploaded_bytes += local.size
+            status = self.status()
+        self._progress(status)
+
+    def _upload(self, local: LocalFile):
+        """Send one file and return its upload operation"""
+        if self.bucket is not None:
+            self.bucket.acquire()
+        config = types.UploadToFileSearchStoreConfig(
+            display_name=local.path,
+            mime_type=mimetypes.guess_type(local.path)[0],
+            custom_metadata=[
+                types.CustomMetadata(key=PATH_KEY, string_value=local.path),
+                types.CustomMetadata(key=HASH_KEY, string_value=local.sha256)
+            ]
+        )
+        return self.retry.call(lambda: self.client.file_search_stores.upload_to_file_search_store(
+            file_search_store_name=self.store_name,
+            file=local.abs_path,
+            config=config
+        ))
+
+    def _poll(self, operation):
+        """Fetch the current state of an upload operation"""
+        return self.retry.call(lambda: self.client.operations.get(operation))
+
+    def _delete(self, document_name: str) -> None:
+        """Delete one store document (already deleted counts as done)"""
+        try:
+            self.retry.call(lambda: self.client.file_search_stores.documents.delete(
+                name=document_name,
+                config=types.DeleteDocumentConfig(force=True)
+            ))
+        except errors.APIError as e:
+            if e.code != 404:
+                self._failed(f"delete {document_name}", e)
+                return
+        except Exception as e:
+            self._failed(f"delete {document_name}", e)
+            return
+        self.manifest.deleted(self.store_name, document_name)
+        with self._lock:
+            self.deleted += 1
+            status = self.status()
+        self._progress(status)
+
+    def _failed(self, what: str, error: BaseException) -> None:
+        """Count and log a failed step (it is retried by the next run)"""
+        with self._lock:
+            self.failed += 1
+        logger.warning(f"Ingestion {what} failed: {str(error)[:200]}")
+
+    def _progress(self, status: Dict) -> None:
+        """Log every 25 finished steps and notify the callback"""
+        done = status['uploaded'] + status['deleted']
+        if done % 25 == 0 or done == self.total_uploads + self.total_deletions:
+            logger.info(f"Ingestion progress: {status['uploaded']}/{self.total_uploads} uploaded, "
+                        f"{status['deleted']}/{self.total_deletions} deleted, {status['failed']} failed")
+        if self.progress_callback:
+            self.progress_callback(status)
+
+    def status(self) -> Dict:
+        """Return progress for the current (or last) run"""
+        elapsed = time.time() - self.started_at
+        return {
+            'store': self.store_name,
+            'files': self.files,
+            'hashed': self.hashed,
+            'uploaded': self.uploaded,
+            'uploaded_bytes': self.uploaded_bytes,
+            'deleted': self.deleted,
+            'adopted': self.adopted,
+            'orphans': self.orphans,
+            'failed': self.failed,
+            'elapsed_seconds': round(elapsed, 2),
+            'files_per_second': round(self.uploaded / elapsed, 1) if elapsed else 0.0,
+            'retries': self.retry.retries
+        }
+
+
+def main():
+    """Ingest a document directory from the command line"""
+    parser = argparse.ArgumentParser(description='Upload new and changed documents to the File Search store')
+    parser.add_argument('root', help='Directory with the knowledge-base documents')
+    parser.add_argument('--store', help='File Search store (default STORE_ID)')
+    parser.add_argument('--manifest', help=f'Manifest database (default <root>/{MANIFEST_NAME})')
+    parser.add_argument('--include', nargs='+', default=list(DEFAULT_PATTERNS), metavar='GLOB')
+    parser.add_argument('--concurrency', type=int, default=4, help='API requests in flight')
+    parser.add_argument('--rate', type=float, help='Uploads started per second')
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--keep-removed', action='store_true', help='Do not delete documents of removed files')
+    parser.add_argument('--rehash', action='store_true', help='Hash every file, even with unchanged size and mtime')
+    parser.add_argument('--reconcile', action='store_true', help='Match store documents missing from the manifest')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the plan')
+    parser.add_argument('--local-index', action='store_true', help='Also update the local BM25 index (LOCAL_INDEX_PATH)')
+    parser.add_argument('--catalog', action='store_true', help='Also update the product catalog (CATALOG_PATH)')
+    args = parser.parse_args()
+
+    from config import API_KEY, STORE_ID, UPSTREAM_MODE, create_upstream_client
+
+    store = args.store or STORE_ID
+    if not store:
+        print("Error: pass --store or set STORE_ID")
+        sys.exit(1)
+    if not os.path.isdir(args.root):
+        print(f"Error: {args.root} is not a directory")
+        sys.exit(1)
+    if UPSTREAM_MODE == 'fake':
+        client = create_upstream_client()
+    elif UPSTREAM_MODE == 'replay':
+        print("Error: UPSTREAM_MODE=replay cannot upload documents")
+        sys.exit(1)
+    else:
+        if not API_KEY:
+            print("Error: GEMINI_API_KEY environment variable is required")
+            sys.exit(1)
+        from google import genai
+        client = genai.Client(api_key=API_KEY)
+
+    ingester = Ingester(
+        client,
+        store,
+        Manifest(args.manifest or os.path.join(args.root, MANIFEST_NAME)),
+        concurrency=args.concurrency,
+        rate_per_second=args.rate,
+        poll_interval=args.poll_interval
+    )
+    status = ingester.run(
+        args.root,
+        patterns=args.include,
+        delete_removed=not args.keep_removed,
+        dry_run=args.dry_run,
+        rehash=args.rehash,
+        reconcile=args.reconcile
+    )
+    print(status)
+    if args.local_index and not args.dry_run:
+        from config import LOCAL_INDEX_PATH
+        from local_index import LocalIndex
+        print(LocalIndex(LOCAL_INDEX_PATH).update(args.root, rehash=args.rehash))
+    if args.catalog and not args.dry_run:
+        from config import CATALOG_PATH
+        from product_catalog import ProductCatalog
+        print(ProductCatalog(CATALOG_PATH).update(args.root, rehash=args.rehash))
+    sys.exit(1 if status['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,712 @@
+"""
+Local BM25 index over the knowledge-base documents
+
+Answers exact spec lookups ("what is the flow rate of 100.1000") and
+pre-selects grounding passages without a Gemini call. Documents are split
+into passages and tokenized with product codes kept whole. The index is a set
+of immutable, memory-mapped segment files plus a small JSON manifest. An
+update writes one segment for the new and changed documents, and a segment
+whose documents were all replaced simply stops being referenced. Segments are
+merged once there are too many of them or too much of their text is dead.
+Servers notice a new manifest within reload_interval and switch to it.
+
+Usage:
+    python local_index.py build ../docs
+    python local_index.py search "flow rate of 100.1000"
+"""
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import time
+import heapq
+import struct
+import logging
+import argparse
+import threading
+from array import array
+from collections import Counter
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDFs are skipped without pypdf
+    PdfReader = None
+
+from ingest import find_files, hash_files
+from product_codes import PRODUCT_CODE_PATTERN, extract_product_codes
+from semantic_cache import STOPWORDS, stem
+
+logger = logging.getLogger(__name__)
+
+# Documents with extractable text
+TEXT_PATTERNS = ('*.txt', '*.md', '*.csv', '*.json', '*.html', '*.htm', '*.pdf')
+
+MANIFEST_NAME = 'index.json'
+PASSAGE_WORDS = 120
+
+# BM25 parameters; product codes weigh more than words, since a code names exactly one product
+K1 = 1.2
+B = 0.75
+CODE_BOOST = 2.0
+
+# Merge all segments when there are more than this many, or this share of passages is dead
+MAX_SEGMENTS = 8
+MAX_DEAD_SHARE = 0.3
+
+# Segment layout: header, then the sections below in order, each 8-byte aligned.
+# Term table entries are (first posting, document frequency); passage entries are
+# (document, text offset, text bytes, token count). Arrays are little-endian.
+MAGIC = b'FLBM25\x00\x01'
+_HEADER = struct.Struct('<8sIIII7Q')
+_SECTIONS = ('terms', 'table', 'ids', 'tfs', 'passages', 'documents', 'text')
+
+# Spec attributes a lookup can answer from a "Label: value" line, with the words that name them
+SPEC_ATTRIBUTES = {
+    'flow_rate': ('flow rate', 'gpm'),
+    'spout_reach': ('spout reach', 'reach'),
+    'spout_height': ('spout height',),
+    'finishes': ('finish', 'finishes'),
+    'dimensions': ('dimension', 'dimensions', 'overall size'),
+    'valve_type': ('valve', 'rough-in', 'rough in'),
+    'cartridge': ('cartridge',),
+    'mounting': ('mounting', 'mount'),
+    'collection': ('collection',),
+    'connections': ('connection', 'connections'),
+    'material': ('material', 'construction'),
+    'warranty': ('warranty',),
+    'certifications': ('certification', 'certifications', 'certified', 'compliance'),
+    'weight': ('weight',),
+}
+
+_WORD = re.compile(r'[a-z0-9]+')
+_SPEC_LINE = re.compile(r'^[\s\-*•|]*(?:\*\*)?([A-Za-z][A-Za-z /&()\-]{1,40}?)(?:\*\*)?\s*[:|]\s*(.+?)\s*\|?\s*$')
+_ATTRIBUTE_PATTERNS = {
+    name: re.compile(r'\b(?:' + '|'.join(re.escape(word) for word in words) + r')\b', re.IGNORECASE)
+    for name, words in SPEC_ATTRIBUTES.items()
+}
+# Second column headings of spec tables ("| Feature | Value |")
+_TABLE_HEADINGS = {'value', 'values', 'details', 'description', 'specification'}
+_SPEC_QUERY_MAX_WORDS = 16
+# Yes/no, how-to and comparison questions need more than one spec line
+_NOT_A_LOOKUP = re.compile(
+    r'^\s*(is|are|does|do|can|will|should|would|could|why|how (?:do|to|can|should))\b'
+    r'|\b(compatib\w*|compar\w*|differ\w*|install\w*|replac\w*|recommend\w*|better|instead)\b',
+    re.IGNORECASE
+)
+
+
+def parse_spec_line(line: str) -> Optional[Tuple[str, str]]:
+    """Split a "Label: value" line or a two-column table row into (label, value); None for other lines"""
+    match = _SPEC_LINE.match(line)
+    if match is None:
+        return None
+    value = match.group(2).strip('|* ')
+    if not value or value.lower() in _TABLE_HEADINGS:
+        return None
+    return match.group(1).strip(), value
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into index terms
+
+    Product codes stay whole and upper-cased (100.1000, TVH.2691); other words
+    are lower-cased and lightly stemmed, and stopwords are dropped.
+    """
+    tokens = [match.upper() for match in PRODUCT_CODE_PATTERN.findall(text)]
+    words = _WORD.findall(PRODUCT_CODE_PATTERN.sub(' ', text).lower())
+    tokens.extend(stem(word) for word in words if word not in STOPWORDS)
+    return tokens
+
+
+class _TextExtractor(HTMLParser):
+    """Visible text of an HTML document, with line breaks at block elements"""
+
+    BLOCKS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'section', 'ul', 'ol'}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag in self.BLOCKS:
+            self.parts.append('\n')
+        elif tag in ('td', 'th'):
+            self.parts.append(' | ')
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def extract_text(path: str) -> Optional[str]:
+    """
+    Read the text of a document
+
+    Returns:
+        The text, or None for PDFs when pypdf is not installed
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.pdf':
+        if PdfReader is None:
+            return None
+        return '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+    with open(path, encoding='utf-8', errors='replace') as handle:
+        text = handle.read()
+    if extension in ('.html', '.htm'):
+        parser = _TextExtractor()
+        parser.feed(text)
+        text = ''.join(parser.parts)
+    return text
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> List[str]:
+    """Split text into passages of whole lines, breaking at blank lines or after max_words words"""
+    passages, lines, words = [], [], 0
+    for line in text.splitlines():
+        line = ' '.join(line.split())
+        if not line:
+            if words >= max_words // 2:
+                passages.append('\n'.join(lines))
+                lines, words = [], 0
+            continue
+        count = len(line.split())
+        if lines and words + count > max_words:
+            passages.append('\n'.join(lines))
+            lines, words = [], 0
+        lines.append(line)
+        words += count
+    if lines:
+        passages.append('\n'.join(lines))
+    return passages
+
+
+def _aligned(data: bytes) -> bytes:
+    """Pad a section to a multiple of 8 bytes"""
+    return data + b' ' * (-len(data) % 8)
+
+
+def write_segment(path: str, documents: List[Dict], passages: List[Tuple[int, str]]) -> None:
+    """
+    Write an immutable segment file
+
+    Args:
+        path: Segment file to create (written to a temporary name, then renamed)
+        documents: Document records ({'path', 'sha256', 'first', 'count'}), in passage order
+        passages: (document index, text) pairs
+    """
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    lengths = []
+    for passage_id, (_, text) in enumerate(passages):
+        counts = Counter(tokenize(text))
+        lengths.append(sum(counts.values()))
+        for term, frequency in counts.items():
+            postings.setdefault(term, []).append((passage_id, min(frequency, 0xFFFF)))
+
+    terms = sorted(postings)
+    table, ids, tfs = array('I'), array('I'), array('H')
+    for term in terms:
+        table.extend((len(ids), len(postings[term])))
+        for passage_id, frequency in postings[term]:
+            ids.append(passage_id)
+            tfs.append(frequency)
+
+    passage_table, text_blob = array('I'), bytearray()
+    for passage_id, (document, text) in enumerate(passages):
+        data = text.encode('utf-8')
+        passage_table.extend((document, len(text_blob), len(data), lengths[passage_id]))
+        text_blob += data
+
+    arrays = (table, ids, tfs, passage_table)
+    if sys.byteorder != 'little':
+        for values in arrays:
+            values.byteswap()
+    sections = [
+        _aligned('\n'.join(terms).encode('utf-8')),
+        _aligned(table.tobytes()),
+        _aligned(ids.tobytes()),
+        _aligned(tfs.tobytes()),
+        _aligned(passage_table.tobytes()),
+        _aligned(json.dumps(documents, separators=(',', ':')).encode('utf-8')),
+        bytes(text_blob)
+    ]
+    offsets, position = [], _HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, 'wb') as handle:
+        handle.write(_HEADER.pack(MAGIC, len(passages), len(terms), len(documents), len(ids), *offsets))
+        for section in sections:
+            handle.write(section)
+    os.replace(temporary, path)
+
+
+class Segment:
+    """A memory-mapped segment: postings and passage text are read in place, only the vocabulary is loaded"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as handle:
+            self._mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.passage_count, term_count, document_count, posting_count, *offsets = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an index segment")
+        if sys.byteorder != 'little':
+            raise RuntimeError("Index segments are little-endian")
+
+        self.name = os.path.basename(path)
+        self.size = len(self._mm)
+        view = memoryview(self._mm)
+        section = dict(zip(_SECTIONS, offsets))
+        terms = bytes(view[section['terms']:section['table']]).decode('utf-8').rstrip(' ')
+        self._terms = {term: index for index, term in enumerate(terms.split('\n'))} if term_count else {}
+        self._table = view[section['table']:section['table'] + 8 * term_count].cast('I')
+        self._ids = view[section['ids']:section['ids'] + 4 * posting_count].cast('I')
+        self._tfs = view[section['tfs']:section['tfs'] + 2 * posting_count].cast('H')
+        self._passages = view[section['passages']:section['passages'] + 16 * self.passage_count].cast('I')
+        self.lengths = self._passages[3::4]
+        self.documents: List[Dict] = json.loads(bytes(view[section['documents']:section['text']]))
+        self._text = section['text']
+
+    def postings(self, term: str) -> Optional[Tuple[memoryview, memoryview]]:
+        """Passage ids and term frequencies of a term (None when the segment does not contain it)"""
+        index = self._terms.get(term)
+        if index is None:
+            return None
+        start, count = self._table[2 * index], self._table[2 * index + 1]
+        return self._ids[start:start + count], self._tfs[start:start + count]
+
+    def df(self, term: str) -> int:
+        """Number of passages containing a term"""
+        index = self._terms.get(term)
+        return 0 if index is None else self._table[2 * index + 1]
+
+    def passage(self, passage_id: int) -> Tuple[int, str]:
+        """(document index, text) of a passage"""
+        document, offset, size, _ = self._passages[4 * passage_id:4 * passage_id + 4]
+        start = self._text + offset
+        return document, self._mm[start:start + size].decode('utf-8')
+
+
+class _IndexState:
+    """
+    An immutable view of the index: its open segments and collection statistics
+
+    The BM25 length normalization of every passage is computed once here, so
+    scoring a posting is a multiply and a divide. Dead passages (of documents
+    replaced or removed since their segment was written) get no norm.
+    """
+
+    def __init__(self, segments: List[Segment], live: Dict[str, set], manifest: Dict):
+        self.segments = segments
+        self.manifest = manifest
+        dead = []
+        for segment in segments:
+            passages = set()
+            for index, document in enumerate(segment.documents):
+                if index not in live.get(segment.name, ()):
+                    passages.update(range(document['first'], document['first'] + document['count']))
+            dead.append(passages)
+
+        self.passages = sum(segment.passage_count - len(passages) for segment, passages in zip(segments, dead))
+        tokens = sum(
+            length for segment, passages in zip(segments, dead)
+            for passage_id, length in enumerate(segment.lengths) if passage_id not in passages
+        )
+        self.avgdl = max(1.0, tokens / self.passages) if self.passages else 1.0
+        self.dead_passages = sum(len(passages) for passages in dead)
+        self.norms: List[List[Optional[float]]] = [
+            [None if passage_id in passages else K1 * (1 - B + B * length / self.avgdl)
+             for passage_id, length in enumerate(segment.lengths)]
+            for segment, passages in zip(segments, dead)
+        ]
+
+
+class LocalIndex:
+    """
+    BM25 search over passages of the knowledge-base documents
+
+    The directory holds segment files and index.json, which lists the live
+    segments and, for every indexed document, its content hash and the
+    segment that holds its current version. update() indexes only new and
+    changed documents. Readers keep using the segments they mapped until
+    they see a newer manifest, so an update never blocks a search.
+    """
+
+    def __init__(self, directory: str, reload_interval: float = 2.0):
+        """
+        Open the index (an empty index when nothing has been built yet)
+
+        Args:
+            directory: Index directory
+            reload_interval: Seconds between checks for a newer manifest
+        """
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._segments: Dict[str, Segment] = {}
+        self._manifest_mtime = None
+        self._checked_at = 0.0
+        self._state = _IndexState([], {}, {'segments': [], 'documents': {}})
+
+        self.searches = 0
+        self.spec_answers = 0
+        self.reloads = 0
+        self._load()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _read_manifest(self) -> Dict:
+        """Read index.json (an empty manifest when there is none)"""
+        try:
+            with open(self.manifest_path, encoding='utf-8') as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return {'segments': [], 'documents': {}, 'next_segment': 1}
+
+    def _load(self) -> None:
+        """Map the segments listed in the manifest and swap in the new state"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._manifest_mtime and self._manifest_mtime is not None:
+                return
+            manifest = self._read_manifest()
+            try:
+                segments = [
+                    self._segments.get(name) or Segment(os.path.join(self.directory, name))
+                    for name in manifest['segments']
+                ]
+            except FileNotFoundError:
+                return  # Replaced by a merge while we read the manifest: the next check loads the new one
+            live: Dict[str, set] = {}
+            for record in manifest['documents'].values():
+                live.setdefault(record['segment'], set()).add(record['doc'])
+            self._segments = {segment.name: segment for segment in segments}
+            self._state = _IndexState(segments, live, manifest)
+            if self._manifest_mtime is not None:
+                self.reloads += 1
+            self._manifest_mtime = mtime
+        if mtime is not None:
+            logger.info(f"✓ Local index loaded: {len(manifest['documents'])} documents, "
+                        f"{self._state.passages} passages in {len(segments)} segments")
+
+    def _maybe_reload(self) -> None:
+        """Pick up a newer manifest written by another process"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            self._load()
+
+    def update(self, root: str, patterns: Iterable[str] = TEXT_PATTERNS, rehash: bool = False) -> Dict:
+        """
+        Index new and changed documents and drop removed ones
+
+        Args:
+            root: Knowledge-base document directory
+            patterns: Filename globs to index
+            rehash: Hash every file instead of trusting unchanged sizes and mtimes
+
+        Returns:
+            Counts of indexed, unchanged, removed and skipped documents
+        """
+        started = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self._read_manifest()
+        known = manifest['documents']
+        files = find_files(root, patterns)
+        hash_files(files, {} if rehash else known)
+
+        documents, passages, skipped = [], [], 0
+        changed = {}
+        for local in files:
+            record = known.get(local.path)
+            if record is not None and record['sha256'] == local.sha256:
+                if record['size'] != local.size or record['mtime_ns'] != local.mtime_ns:
+                    changed[local.path] = dict(record, size=local.size, mtime_ns=local.mtime_ns)
+                continue
+            try:
+                text = extract_text(local.abs_path)
+            except Exception as e:
+                logger.warning(f"Could not read {local.path}: {e}")
+                text = None
+            if text is None:
+                skipped += 1
+                continue
+            chunks = split_passages(text)
+            changed[local.path] = {
+                'doc': len(documents), 'sha256': local.sha256, 'size': local.size, 'mtime_ns': local.mtime_ns
+            }
+            documents.append({'path': local.path, 'sha256': local.sha256, 'first': len(passages), 'count': len(chunks)})
+            passages.extend((changed[local.path]['doc'], chunk) for chunk in chunks)
+
+        on_disk = {local.path for local in files}
+        removed = [path for path in known if path not in on_disk]
+        if documents:
+            name = f"seg-{manifest.get('next_segment', 1):06d}.bm25"
+            write_segment(os.path.join(self.directory, name), documents, passages)
+            manifest['next_segment'] = manifest.get('next_segment', 1) + 1
+            manifest['segments'].append(name)
+            for record in changed.values():
+                if 'segment' not in record:
+                    record['segment'] = name
+        known.update(changed)
+        for path in removed:
+            del known[path]
+
+        referenced = {record['segment'] for record in known.values()}
+        dropped = [name for name in manifest['segments'] if name not in referenced]
+        manifest['segments'] = [name for name in manifest['segments'] if name in referenced]
+        merged = self._needs_merge(manifest)
+        if merged:
+            dropped += self._merge(manifest)
+        if documents or removed or changed or dropped:
+            self._write_manifest(manifest)
+            for name in dropped:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+        self._load()
+
+        result = {
+            'documents': len(known),
+            'indexed': len(documents),
+            'passages': len(passages),
+            'unchanged': len(files) - len(documents) - skipped,
+            'removed': len(removed),
+            'skipped': skipped,
+            'merged': merged,
+            'segments': len(manifest['segments']),
+            'elapsed_seconds': round(time.time() - started, 3)
+        }
+        logger.info(f"✓ Local index updated: {result}")
+        return result
+
+    def _open(self, name: str) -> Segment:
+        """A segment of the manifest being written (mapped once per update)"""
+        if name not in self._segments:
+            self._segments[name] = Segment(os.path.join(self.directory, name))
+        return self._segments[name]
+
+    def _needs_merge(self, manifest: Dict) -> bool:
+        """Whether the segments should be merged after an update"""
+        if len(manifest['segments']) > MAX_SEGMENTS:
+            return True
+        if len(manifest['segments']) < 2:
+            return False
+        live: Dict[str, set] = {}
+        for record in manifest['documents'].values():
+            live.setdefault(record['segment'], set()).add(record['doc'])
+        total = dead = 0
+        for name in manifest['segments']:
+            segment = self._open(name)
+            for index, document in enumerate(segment.documents):
+                total += document['count']
+                if index not in live.get(name, ()):
+                    dead += document['count']
+        return total > 0 and dead / total > MAX_DEAD_SHARE
+
+    def _merge(self, manifest: Dict) -> List[str]:
+        """Rewrite the live passages of all segments into one (text is copied, documents are not re-read)"""
+        documents, passages = [], []
+        for path, record in sorted(manifest['documents'].items()):
+            segment = self._open(record['segment'])
+            source = segment.documents[record['doc']]
+            record['doc'] = len(documents)
+            documents.append(dict(source, first=len(passages)))
+            passages.extend(
+                (record['doc'], segment.passage(passage_id)[1])
+                for passage_id in range(source['first'], source['first'] + source['count'])
+            )
+        name = f"seg-{manifest.get('next_segment', 1):06d}.bm25"
+        write_segment(os.path.join(self.directory, name), documents, passages)
+        manifest['next_segment'] = manifest.get('next_segment', 1) + 1
+        dropped = manifest['segments']
+        manifest['segments'] = [name]
+        for record in manifest['documents'].values():
+            record['segment'] = name
+        return dropped
+
+    def _write_manifest(self, manifest: Dict) -> None:
+        """Replace index.json atomically"""
+        manifest['updated_at'] = time.time()
+        temporary = f"{self.manifest_path}.tmp{os.getpid()}"
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, separators=(',', ':'))
+        os.replace(temporary, self.manifest_path)
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """
+        Rank passages by BM25
+
+        Args:
+            query: Free text; product codes in it count CODE_BOOST times
+            k: Number of passages to return
+
+        Returns:
+            Hits ({'path', 'text', 'score', 'codes'}), best first
+        """
+        self._maybe_reload()
+        state = self._state
+        self.searches += 1
+        if not state.passages:
+            return []
+
+        scores: Dict[Tuple[int, int], float] = {}
+        for term, query_frequency in Counter(tokenize(query)).items():
+            df = sum(segment.df(term) for segment in state.segments)
+            if not df:
+                continue
+            idf = math.log(1 + (state.passages - df + 0.5) / (df + 0.5))
+            weight = idf * query_frequency * (CODE_BOOST if '.' in term else 1.0)
+            for position, segment in enumerate(state.segments):
+                postings = segment.postings(term)
+                if postings is None:
+                    continue
+                norms = state.norms[position]
+                for passage_id, frequency in zip(*postings):
+                    norm = norms[passage_id]
+                    if norm is not None:
+                        key = (position, passage_id)
+                        scores[key] = scores.get(key, 0.0) + weight * frequency * (K1 + 1) / (frequency + norm)
+
+        hits = []
+        for (position, passage_id), score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            segment = state.segments[position]
+            document, text = segment.passage(passage_id)
+            hits.append({
+                'path': segment.documents[document]['path'],
+                'text': text,
+                'score': round(score, 3),
+                'codes': extract_product_codes(text)
+            })
+        return hits
+
+    @staticmethod
+    def _about(hit: Dict, code: str) -> bool:
+        """Whether a passage is about one product: it names only that code, or no code in that product's document"""
+        if hit['codes']:
+            return hit['codes'] == [code]
+        return code in hit['path'].upper()
+
+    def spec_lookup(self, query: str) -> Optional[Dict]:
+        """
+        Answer a single-attribute question about one product from a spec line
+
+        The query must be a short question naming exactly one product code and
+        one attribute from SPEC_ATTRIBUTES (not a yes/no, how-to or comparison
+        question). The best passages about that product are searched for
+        a "Label: value" line (or table row) whose label names the attribute.
+
+        Returns:
+            {'code', 'attribute', 'label', 'value', 'path', 'score'}, or None
+        """
+        codes = extract_product_codes(query)
+        if len(codes) != 1 or len(query.split()) > _SPEC_QUERY_MAX_WORDS or _NOT_A_LOOKUP.search(query):
+            return None
+        attributes = [name for name, pattern in _ATTRIBUTE_PATTERNS.items() if pattern.search(query)]
+        if len(attributes) != 1:
+            return None
+        code, attribute = codes[0], attributes[0]
+        pattern = _ATTRIBUTE_PATTERNS[attribute]
+
+        for hit in self.search(query, k=10):
+            if not self._about(hit, code):
+                continue
+            for line in hit['text'].split('\n'):
+                spec = parse_spec_line(line)
+                if spec is not None and pattern.search(spec[0]):
+                    self.spec_answers += 1
+                    return {
+                        'code': code,
+                        'attribute': attribute,
+                        'label': spec[0],
+                        'value': spec[1],
+                        'path': hit['path'],
+                        'score': hit['score']
+                    }
+        return None
+
+    def grounding(self, query: str, k: int = 4) -> List[Dict]:
+        """
+        Passages to send with a product question instead of running File Search
+
+        Returns:
+            The top passages when the query names product codes and every one of
+            them is covered by a passage about it; otherwise an empty list
+        """
+        codes = extract_product_codes(query)
+        if not codes:
+            return []
+        hits = self.search(query, k=k)
+        if all(any(self._about(hit, code) for hit in hits) for code in codes):
+            return hits
+        return []
+
+    def stats(self) -> Dict:
+        """Return index size and counters"""
+        state = self._state
+        return {
+            'documents': len(state.manifest['documents']),
+            'passages': state.passages,
+            'dead_passages': state.dead_passages,
+            'segments': len(state.segments),
+            'bytes': sum(segment.size for segment in state.segments),
+            'searches': self.searches,
+            'spec_answers': self.spec_answers,
+            'reloads': self.reloads
+        }
+
+
+def main():
+    """Build or query the local index from the command line"""
+    parser = argparse.ArgumentParser(description='Build or query the local BM25 index of the knowledge base')
+    parser.add_argument('--index', help='Index directory (default LOCAL_INDEX_PATH)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Index new and changed documents')
+    build.add_argument('root', help='Directory with the knowledge-base documents')
+    build.add_argument('--rehash', action='store_true', help='Hash every file, even with unchanged size and mtime')
+    search = commands.add_parser('search', help='Run a lookup')
+    search.add_argument('query')
+    search.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    from config import LOCAL_INDEX_PATH
+
+    index = LocalIndex(args.index or LOCAL_INDEX_PATH)
+    if args.command == 'build':
+        if not os.path.isdir(args.root):
+            print(f"Error: {args.root} is not a directory")
+            sys.exit(1)
+        if PdfReader is None:
+            logger.warning("pypdf is not installed; PDF documents are skipped")
+        print(json.dumps(index.update(args.root, rehash=args.rehash), indent=2))
+        return
+
+    started = time.perf_counter()
+    result = {'spec': index.spec_lookup(args.query), 'hits': index.search(args.query, k=args.k)}
+    result['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Prometheus metrics for the API servers
+Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) makes each worker write its samples to shared files that /metrics aggregates
+The same per-request tracking feeds the optional query log (query_log.py) with one record per API request
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Seconds; Gemini calls range from sub-second cache-warm lookups to minute-long pro answers
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+REQUESTS = Counter('flusso_http_requests_total', 'HTTP requests served', ['route', 'method', 'status'])
+REQUEST_LATENCY = Histogram(
+    'flusso_http_request_duration_seconds', 'HTTP request latency until the response body is sent',
+    ['route', 'model'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge('flusso_http_requests_in_flight', 'HTTP requests being served', multiprocess_mode='livesum')
+UPSTREAM_LATENCY = Histogram(
+    'flusso_upstream_duration_seconds', 'Latency of single Gemini calls (each retry and hedge counts)',
+    ['model', 'outcome'], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    'flusso_upstream_calls_in_flight', 'Gemini calls in flight', ['model'], multiprocess_mode='livesum'
+)
+STREAM_FIRST_TOKEN = Histogram(
+    'flusso_stream_first_token_seconds', 'Time from the streaming call to its first answer token',
+    ['model'], buckets=LATENCY_BUCKETS
+)
+CACHE_LOOKUPS = Counter('flusso_cache_lookups_total', 'Cache lookups by outcome', ['cache', 'result'])
+ERRORS = Counter('flusso_errors_total', 'Failed queries by error class', ['error_type'])
+TOKENS = Counter('flusso_tokens_total', 'Gemini tokens reported in usage_metadata', ['model', 'kind'])
+
+# Timer of the HTTP request being served; engine threads and tasks inherit it
+_current_request: ContextVar[Optional['RequestTimer']] = ContextVar('metrics_request', default=None)
+
+# Query log receiving a record for every finished request that asked something (set_query_log)
+_query_log = None
+
+# Cache outcome reported in the query log for a hit in each cache
+_CACHE_OUTCOMES = {'response': 'hit', 'semantic': 'semantic', 'local_index': 'local'}
+
+
+class RequestTimer:
+    """Latency and in-flight tracking for one HTTP request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.model = None
+        self.query = None
+        self.cache = None
+        self.upstream_calls = 0
+        self.tokens: Dict[str, int] = {}
+        self.batch_items = None
+        self._finished = False
+        REQUESTS_IN_FLIGHT.inc()
+
+    def finish(self, route: str, method: str, status: int) -> None:
+        """Record the request once its response has been sent"""
+        if self._finished:
+            return
+        self._finished = True
+        elapsed = time.perf_counter() - self.started
+        REQUESTS_IN_FLIGHT.dec()
+        REQUESTS.labels(route, method, str(status)).inc()
+        REQUEST_LATENCY.labels(route, self.model or 'none').observe(elapsed)
+        if _query_log is not None and (self.query is not None or self.batch_items is not None):
+            _query_log.append(self._record(route, status, elapsed))
+
+    def _record(self, route: str, status: int, elapsed: float) -> Dict:
+        """Query log record of the finished request (the query is normalized by the log's writer)"""
+        # A request that needed the upstream is a miss, even if some of its lookups hit a cache
+        if self.cache == 'stale' or not self.upstream_calls:
+            cache = self.cache or 'none'
+        else:
+            cache = 'miss'
+        record = {
+            'ts': round(time.time(), 3),
+            'route': route,
+            'status': status,
+            'q': self.query if self.batch_items is None else None,
+            'model': self.model,
+            'ms': round(elapsed * 1000, 1),
+            'cache': cache,
+            'calls': self.upstream_calls
+        }
+        if self.tokens:
+            record['tokens'] = self.tokens
+        if self.batch_items is not None:
+            record['items'] = self.batch_items
+        return record
+
+
+def set_query_log(query_log) -> None:
+    """Send a record of every finished API request that asked something to query_log.append()"""
+    global _query_log
+    _query_log = query_log
+
+
+def start_request() -> RequestTimer:
+    """Start timing the current HTTP request"""
+    timer = RequestTimer()
+    _current_request.set(timer)
+    return timer
+
+
+def note_model(model: str) -> None:
+    """Label the current request's latency with the model answering it (the last one for escalated requests)"""
+    timer = _current_request.get()
+    if timer is not None:
+        timer.model = model
+
+
+def note_query(text: str) -> None:
+    """Remember what the current request asked (the first question wins, so helper prompts don't replace it)"""
+    timer = _current_request.get()
+    if timer is not None and timer.query is None:
+        timer.query = text
+
+
+def note_batch(items: int) -> None:
+    """Log the current request as a batch of this many items instead of by its first question"""
+    timer = _current_request.get()
+    if timer is not None:
+        timer.batch_items = items
+
+
+def note_cache(outcome: str) -> None:
+    """Report how the current request was answered without the upstream ('hit', 'coalesced', ...)"""
+    timer = _current_request.get()
+    if timer is not None:
+        timer.cache = outcome
+
+
+@contextmanager
+def upstream_call(model: str):
+    """Time one Gemini call and count it as in flight"""
+    gauge = UPSTREAM_IN_FLIGHT.labels(model)
+    gauge.inc()
+    timer = _current_request.get()
+    if timer is not None:
+        timer.upstream_calls += 1
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        gauge.dec()
+        UPSTREAM_LATENCY.labels(model, outcome).observe(time.perf_counter() - started)
+
+
+def record_first_token(model: str, seconds: float) -> None:
+    """Record the time to first token of a streamed answer"""
+    STREAM_FIRST_TOKEN.labels(model).observe(seconds)
+
+
+def record_cache_lookup(cache: str, result: str) -> None:
+    """Count a cache lookup ('hit', 'miss' or 'stale')"""
+    CACHE_LOOKUPS.labels(cache, result).inc()
+    if result == 'hit':
+        note_cache(_CACHE_OUTCOMES.get(cache, cache))
+    elif result == 'stale':
+        note_cache('stale')
+
+
+def record_error(error_type: str) -> None:
+    """Count a failed query"""
+    ERRORS.labels(error_type).inc()
+
+
+def record_usage(model: str, usage) -> None:
+    """Add the token counts of a response's usage_metadata"""
+    if usage is None:
+        return
+    counts = (
+        ('prompt', usage.prompt_token_count),
+        ('response', usage.candidates_token_count),
+        ('thinking', usage.thoughts_token_count),
+        ('cached', usage.cached_content_token_count),
+        ('tool_use', usage.tool_use_prompt_token_count)
+    )
+    timer = _current_request.get()
+    for kind, count in counts:
+        if count:
+            TOKENS.labels(model, kind).inc(count)
+            if timer is not None:
+                timer.tokens[kind] = timer.tokens.get(kind, 0) + count
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    Render all metrics in the Prometheus text format
+
+    Returns:
+        (body, content type); under gunicorn the samples of every worker are aggregated
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
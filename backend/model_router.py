@@ -0,0 +1,222 @@
+"""
+Local model routing between a fast and a strong Gemini model
+Classifies queries with cheap text rules and picks a model under a share and latency budget
+"""
+import re
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from product_codes import extract_product_codes
+
+# Query categories recognized by classify_query
+CATEGORIES = ('lookup', 'comparison', 'open')
+
+# When the router may replace the model sent by the client
+ROUTER_MODES = ('off', 'auto', 'override')
+
+_COMPARISON_WORDS = re.compile(
+    r'\b(compare|comparison|comparing|versus|vs|difference|differences|differ|better|which is best)\b',
+    re.IGNORECASE
+)
+
+
+def classify_query(text: str) -> str:
+    """
+    Classify a query without calling a model
+
+    Args:
+        text: User query
+
+    Returns:
+        'comparison' for multi-product or compare-style questions, 'lookup' for
+        questions about a single product code, 'open' for everything else
+    """
+    codes = extract_product_codes(text)
+    if len(codes) >= 2 or _COMPARISON_WORDS.search(text):
+        return 'comparison'
+    if codes:
+        return 'lookup'
+    return 'open'
+
+
+class ModelRouter:
+    """
+    Pick a model per query from its category, within a budget
+
+    The strong model is used for categories routed to it only while its share
+    of recent decisions stays under strong_share_budget and its observed
+    latency (moving average) stays under latency_budget_seconds. Only strong
+    calls update that average, so while it is over budget one request is let
+    through to the strong model every latency_probe_seconds to re-measure it.
+    Answers from
+    the fast model without grounding can be escalated to the strong model,
+    which also counts against the share budget.
+    """
+
+    def __init__(
+        self,
+        fast_model: str = 'gemini-2.5-flash',
+        strong_model: str = 'gemini-2.5-pro',
+        mode: str = 'auto',
+        routes: Optional[Dict[str, str]] = None,
+        strong_share_budget: float = 0.25,
+        latency_budget_seconds: float = 20.0,
+        escalate_ungrounded: bool = True,
+        latency_probe_seconds: float = 60.0,
+        window: int = 200,
+        expected_latency: Optional[Dict[str, float]] = None
+    ):
+        """
+        Initialize the router
+
+        Args:
+            fast_model: Model for cheap lookups
+            strong_model: Model for harder questions and escalations
+            mode: 'auto' routes only when the client did not choose a model;
+                'override' also replaces explicit choices; 'off' disables routing
+            routes: Category -> 'fast' | 'strong' (defaults: comparisons strong, the rest fast)
+            strong_share_budget: Largest share of recent decisions that may use the strong model
+            latency_budget_seconds: Use the strong model only while its average latency is below this
+            escalate_ungrounded: Retry with the strong model when a fast answer has no grounding
+            latency_probe_seconds: While over the latency budget, how often one request still
+                goes to the strong model so its latency estimate can recover
+            window: Number of recent decisions the share budget is measured over
+            expected_latency: Starting latency estimates per model, in seconds
+        """
+        if mode not in ROUTER_MODES:
+            raise ValueError(f"Router mode must be one of: {', '.join(ROUTER_MODES)}")
+        if not 0.0 <= strong_share_budget <= 1.0:
+            raise ValueError("strong_share_budget must be between 0.0 and 1.0")
+
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.mode = mode
+        self.routes = dict({'lookup': 'fast', 'comparison': 'strong', 'open': 'fast'}, **(routes or {}))
+        self.strong_share_budget = strong_share_budget
+        self.latency_budget_seconds = latency_budget_seconds
+        self.escalate_ungrounded = escalate_ungrounded
+        self.latency_probe_seconds = latency_probe_seconds
+
+        self._latency = dict(expected_latency or {fast_model: 4.0, strong_model: 12.0})
+        self._recent = deque(maxlen=window)
+        # Last time the strong model was sampled or sent a latency probe
+        self._strong_checked_at = 0.0
+        self._lock = threading.Lock()
+
+        self.decisions = {category: 0 for category in CATEGORIES}
+        self.strong_decisions = 0
+        self.budget_downgrades = 0
+        self.escalations = 0
+        self.latency_probes = 0
+
+    def route(self, user_query: str, requested_model: Optional[str] = None) -> Optional[Dict]:
+        """
+        Decide which model should answer a query
+
+        Args:
+            user_query: User query
+            requested_model: Model sent by the client, if any
+
+        Returns:
+            Routing decision (model, category, reason, requested_model), or None
+            when the requested model should be used unchanged
+        """
+        if self.mode == 'off' or (self.mode == 'auto' and requested_model is not None):
+            return None
+
+        category = classify_query(user_query)
+        reason = f"{category} -> {self.routes[category]}"
+        with self._lock:
+            model = self.fast_model
+            if self.routes[category] == 'strong':
+                blocked = self._strong_blocked()
+                if blocked:
+                    reason = blocked
+                    self.budget_downgrades += 1
+                else:
+                    model = self.strong_model
+            self._record(model)
+            self.decisions[category] += 1
+
+        return {
+            'model': model,
+            'category': category,
+            'reason': reason,
+            'requested_model': requested_model,
+            'escalated': False
+        }
+
+    def escalation(self, decision: Optional[Dict], result: Dict, file_search: bool = True) -> Optional[Dict]:
+        """
+        Decide whether a routed answer should be regenerated with the strong model
+
+        Args:
+            decision: Decision returned by route()
+            result: Result produced with decision['model']
+            file_search: Whether the query was grounded with File Search
+
+        Returns:
+            Updated decision for the escalated call, or None to keep the result
+        """
+        if (
+            decision is None
+            or not self.escalate_ungrounded
+            or not file_search
+            or decision['model'] != self.fast_model
+            or not result.get('success')
+            or result.get('source_count')
+        ):
+            return None
+
+        with self._lock:
+            if self._strong_blocked():
+                return None
+            self._record(self.strong_model)
+            self.escalations += 1
+
+        return dict(decision, model=self.strong_model, escalated=True, first_model=decision['model'],
+                    reason=f"{decision['reason']}, escalated: no grounding")
+
+    def observe(self, model: str, seconds: float) -> None:
+        """Feed an upstream latency sample into the model's moving average"""
+        with self._lock:
+            previous = self._latency.get(model, seconds)
+            self._latency[model] = 0.9 * previous + 0.1 * seconds
+            if model == self.strong_model:
+                self._strong_checked_at = time.monotonic()
+
+    def _strong_blocked(self) -> Optional[str]:
+        """Return why the strong model is over budget, or None (caller holds the lock)"""
+        now = time.monotonic()
+        slow = self._latency.get(self.strong_model, 0.0) > self.latency_budget_seconds
+        if slow and now - self._strong_checked_at < self.latency_probe_seconds:
+            return 'latency budget exceeded'
+        if self._recent and (sum(self._recent) + 1) / (len(self._recent) + 1) > self.strong_share_budget:
+            return 'strong model share budget exceeded'
+        if slow:
+            # Past the probe interval: this request re-measures the strong model
+            self._strong_checked_at = now
+            self.latency_probes += 1
+        return None
+
+    def _record(self, model: str) -> None:
+        """Remember a decision for the share budget (caller holds the lock)"""
+        strong = model == self.strong_model
+        self._recent.append(1 if strong else 0)
+        self.strong_decisions += strong
+
+    def stats(self) -> Dict:
+        """Return routing counters and latency estimates"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'decisions': dict(self.decisions),
+                'strong_decisions': self.strong_decisions,
+                'strong_share': round(sum(self._recent) / len(self._recent), 3) if self._recent else 0.0,
+                'budget_downgrades': self.budget_downgrades,
+                'escalations': self.escalations,
+                'latency_probes': self.latency_probes,
+                'latency_estimates': {model: round(value, 2) for model, value in self._latency.items()}
+            }
@@ -0,0 +1,565 @@
+"""
+Structured product attributes extracted from the knowledge base
+
+Spec sheets are parsed into one record per product (the fields of
+PRODUCT_DETAIL_FIELDS) and kept in SQLite. Every category, finish and feature
+tag is also stored word by word in an indexed table, so feature searches and
+comparisons run as indexed queries instead of model calls. A document is
+attributed to a product when its file name or first heading names exactly one
+product code. Products the knowledge base mentions without a spec sheet can be
+filled in by asking the model for their details (build --llm).
+
+Usage:
+    python product_catalog.py build ../docs
+    python product_catalog.py build ../docs --llm
+    python product_catalog.py search "kitchen faucet" pull-down "matte black"
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ingest import find_files, hash_files
+from local_index import TEXT_PATTERNS, extract_text, parse_spec_line, tokenize
+from product_codes import extract_product_codes
+
+logger = logging.getLogger(__name__)
+
+# Fields of a product record (also the keys the model is asked for by get_product_details)
+PRODUCT_DETAIL_FIELDS = [
+    'name', 'category', 'collection', 'finishes', 'dimensions',
+    'flow_rate', 'valve_type', 'mounting', 'features'
+]
+LIST_FIELDS = ('finishes', 'features')
+
+# Spec line labels for each field, checked in this order (so "Valve type" is not a category)
+FIELD_LABELS = {
+    'name': ('name', 'product name', 'model name'),
+    'collection': ('collection', 'series'),
+    'finishes': ('finish', 'finishes'),
+    'dimensions': ('dimension', 'dimensions', 'overall size'),
+    'flow_rate': ('flow rate', 'gpm'),
+    'valve_type': ('valve', 'valve type', 'rough-in', 'rough in', 'cartridge'),
+    'mounting': ('mounting', 'mount'),
+    'features': ('feature', 'features', 'highlights'),
+    'category': ('category', 'product type', 'type'),
+}
+_FIELD_PATTERNS = [
+    (field, re.compile(r'\b(?:' + '|'.join(re.escape(label) for label in labels) + r')\b', re.IGNORECASE))
+    for field, labels in FIELD_LABELS.items()
+]
+
+# Field values that also become feature tags (searching "thermostatic" finds the valve type)
+TAGGED_FIELDS = ('collection', 'valve_type', 'mounting')
+
+# Pseudo document path of records answered by the model (build --llm)
+MODEL_SOURCE = '@model'
+
+_BULLET = re.compile(r'^\s*[-*•]\s+(.+?)\s*$')
+_HEADING = re.compile(r'^\s*#+\s*(.+?)\s*$')
+_LIST_SEPARATOR = re.compile(r'\s*[;,]\s*')
+
+
+def _field_of(label: str) -> Optional[str]:
+    """Record field a spec line label names, if any"""
+    for field, pattern in _FIELD_PATTERNS:
+        if pattern.search(label):
+            return field
+    return None
+
+
+def _split_list(value) -> List[str]:
+    """Items of a comma- or semicolon-separated value (or of a list)"""
+    if isinstance(value, list):
+        items = [str(item) for item in value]
+    else:
+        items = _LIST_SEPARATOR.split(str(value))
+    return [item.strip(' .') for item in items if item and item.strip(' .')]
+
+
+def extract_products(path: str, text: str) -> Dict[str, Dict]:
+    """
+    Extract the product record of a spec sheet
+
+    Args:
+        path: Document path relative to the knowledge-base root
+        text: Document text
+
+    Returns:
+        {code: fields} for the product the document is about (empty when its
+        file name and first heading do not name exactly one product code)
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return {}
+    codes = extract_product_codes(os.path.basename(path))
+    if len(codes) != 1:
+        codes = extract_product_codes(lines[0])
+    if len(codes) != 1:
+        return {}
+    code = codes[0]
+
+    fields: Dict = {'finishes': [], 'features': []}
+    title = _HEADING.match(lines[0])
+    heading = ''
+    for line in lines:
+        match = _HEADING.match(line)
+        if match:
+            heading = match.group(1).lower()
+            continue
+        spec = parse_spec_line(line)
+        field = _field_of(spec[0]) if spec is not None else None
+        if field in LIST_FIELDS:
+            fields[field].extend(_split_list(spec[1]))
+        elif field is not None:
+            fields.setdefault(field, spec[1])
+        elif spec is None and 'feature' in heading:
+            bullet = _BULLET.match(line)
+            if bullet:
+                fields['features'].append(bullet.group(1).strip(' .'))
+
+    if 'name' not in fields and title:
+        name = re.sub(re.escape(code), '', title.group(1), flags=re.IGNORECASE).strip(' -–:|')
+        if name:
+            fields['name'] = name
+    if 'category' not in fields and fields.get('name'):
+        fields['category'] = fields['name']
+    return {code: fields}
+
+
+def _merge(extractions: List[Dict]) -> Dict:
+    """Combine the extractions of one product (earlier ones win; lists are unioned)"""
+    record = {field: ([] if field in LIST_FIELDS else None) for field in PRODUCT_DETAIL_FIELDS}
+    for fields in extractions:
+        for field in PRODUCT_DETAIL_FIELDS:
+            value = fields.get(field)
+            if field in LIST_FIELDS:
+                for item in _split_list(value) if value else []:
+                    if item.lower() not in (existing.lower() for existing in record[field]):
+                        record[field].append(item)
+            elif record[field] is None and value not in (None, '', []):
+                record[field] = ', '.join(value) if isinstance(value, list) else str(value)
+    return record
+
+
+def _tags(record: Dict) -> List[Tuple[str, str]]:
+    """(kind, tag) pairs indexed for a record: its category, finishes and feature tags"""
+    tags = []
+    if record.get('category'):
+        tags.append(('category', record['category']))
+    tags.extend(('finish', finish) for finish in record['finishes'])
+    tags.extend(('feature', feature) for feature in record['features'])
+    tags.extend(('feature', record[field]) for field in TAGGED_FIELDS if record.get(field))
+    return tags
+
+
+class ProductCatalog:
+    """
+    Product records with indexed category, finish and feature tags, in SQLite
+
+    documents remembers each indexed file (hash, size, mtime and the product
+    codes it mentions) so updates only re-read changed files; extractions
+    holds what each document said about a product, and products the merged
+    record per code. Tags are stored once each (tags, with their words in
+    tag_words) and linked to products through product_tags, so a search first
+    resolves its words to a handful of tag ids and then reads their products
+    off the primary key.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open the catalog
+
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        self.path = path
+        self._local = threading.local()
+        self.searches = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                codes TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS extractions (
+                path TEXT NOT NULL,
+                code TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                PRIMARY KEY (path, code)
+            );
+            CREATE INDEX IF NOT EXISTS idx_extractions_code ON extractions(code);
+            CREATE TABLE IF NOT EXISTS products (
+                code TEXT PRIMARY KEY,
+                category TEXT,
+                record TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                extracted_by TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                UNIQUE (kind, tag)
+            );
+            CREATE TABLE IF NOT EXISTS tag_words (
+                word TEXT NOT NULL,
+                tag_id INTEGER NOT NULL,
+                PRIMARY KEY (word, tag_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS product_tags (
+                tag_id INTEGER NOT NULL,
+                code TEXT NOT NULL,
+                PRIMARY KEY (tag_id, code)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_product_tags_code ON product_tags(code);
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return a connection for the current thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def update(self, root: str, patterns: Iterable[str] = TEXT_PATTERNS, rehash: bool = False) -> Dict:
+        """
+        Extract new and changed documents and drop removed ones
+
+        Args:
+            root: Knowledge-base document directory
+            patterns: Filename globs to read
+            rehash: Hash every file instead of trusting unchanged sizes and mtimes
+
+        Returns:
+            Counts of read, unchanged, removed and skipped documents and of products
+        """
+        started = time.time()
+        conn = self._connection()
+        known = {
+            row[0]: {'sha256': row[1], 'size': row[2], 'mtime_ns': row[3]}
+            for row in conn.execute("SELECT path, sha256, size, mtime_ns FROM documents")
+        }
+        files = find_files(root, patterns)
+        hash_files(files, {} if rehash else known)
+
+        read, skipped, affected = [], 0, set()
+        for local in files:
+            record = known.get(local.path)
+            if record is not None and record['sha256'] == local.sha256:
+                continue
+            try:
+                text = extract_text(local.abs_path)
+            except Exception as e:
+                logger.warning(f"Could not read {local.path}: {e}")
+                text = None
+            if text is None:
+                skipped += 1
+                continue
+            read.append((local, extract_product_codes(text), extract_products(local.path, text)))
+
+        on_disk = {local.path for local in files}
+        removed = [path for path in known if path not in on_disk]
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for path in removed + [local.path for local, _, _ in read]:
+                affected.update(row[0] for row in conn.execute("SELECT code FROM extractions WHERE path = ?", (path,)))
+                conn.execute("DELETE FROM extractions WHERE path = ?", (path,))
+                conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+            for local, codes, products in read:
+                conn.execute(
+                    "INSERT INTO documents (path, sha256, size, mtime_ns, codes) VALUES (?, ?, ?, ?, ?)",
+                    (local.path, local.sha256, local.size, local.mtime_ns, json.dumps(codes))
+                )
+                for code, fields in products.items():
+                    conn.execute(
+                        "INSERT INTO extractions (path, code, fields) VALUES (?, ?, ?)",
+                        (local.path, code, json.dumps(fields))
+                    )
+                    affected.add(code)
+            # Files touched but unchanged keep their hash; only the stat shortcut moves
+            conn.executemany(
+                "UPDATE documents SET size = ?, mtime_ns = ? WHERE path = ? AND sha256 = ?",
+                [(local.size, local.mtime_ns, local.path, local.sha256) for local in files]
+            )
+            for code in affected:
+                self._rebuild(conn, code)
+            if affected:
+                self._drop_unused_tags(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        result = {
+            'documents': len(files) - skipped,
+            'read': len(read),
+            'unchanged': len(files) - len(read) - skipped,
+            'removed': len(removed),
+            'skipped': skipped,
+            'products_updated': len(affected),
+            'products': self.count(),
+            'elapsed_seconds': round(time.time() - started, 3)
+        }
+        logger.info(f"✓ Product catalog updated: {result}")
+        return result
+
+    def _rebuild(self, conn: sqlite3.Connection, code: str) -> None:
+        """Recompute a product's merged record and tags from its extractions (inside a transaction)"""
+        rows = conn.execute(
+            "SELECT path, fields FROM extractions WHERE code = ? ORDER BY path = ?, path",
+            (code, MODEL_SOURCE)
+        ).fetchall()
+        conn.execute("DELETE FROM product_tags WHERE code = ?", (code,))
+        if not rows:
+            conn.execute("DELETE FROM products WHERE code = ?", (code,))
+            return
+
+        record = _merge([json.loads(fields) for _, fields in rows])
+        documents = [path for path, _ in rows if path != MODEL_SOURCE]
+        conn.execute(
+            "INSERT OR REPLACE INTO products (code, category, record, sources, extracted_by, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                code,
+                (record['category'] or '').lower() or None,
+                json.dumps(record),
+                json.dumps(documents),
+                'spec_sheet' if documents else 'model',
+                time.time()
+            )
+        )
+        for kind, tag in _tags(record):
+            row = conn.execute("SELECT id FROM tags WHERE kind = ? AND tag = ?", (kind, tag)).fetchone()
+            if row is None:
+                tag_id = conn.execute("INSERT INTO tags (kind, tag) VALUES (?, ?)", (kind, tag)).lastrowid
+                conn.executemany(
+                    "INSERT INTO tag_words (word, tag_id) VALUES (?, ?)",
+                    [(word, tag_id) for word in set(tokenize(tag))]
+                )
+            else:
+                tag_id = row[0]
+            conn.execute("INSERT OR IGNORE INTO product_tags (tag_id, code) VALUES (?, ?)", (tag_id, code))
+
+    @staticmethod
+    def _drop_unused_tags(conn: sqlite3.Connection) -> None:
+        """Delete tags no product has any more (inside a transaction)"""
+        conn.execute("DELETE FROM tags WHERE id NOT IN (SELECT tag_id FROM product_tags)")
+        conn.execute("DELETE FROM tag_words WHERE tag_id NOT IN (SELECT id FROM tags)")
+
+    def add_model_record(self, code: str, details: Dict) -> None:
+        """Store the details the model returned for a product without a spec sheet"""
+        fields = {field: details.get(field) for field in PRODUCT_DETAIL_FIELDS if details.get(field) is not None}
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (path, code, fields) VALUES (?, ?, ?)",
+                (MODEL_SOURCE, code.upper(), json.dumps(fields))
+            )
+            self._rebuild(conn, code.upper())
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def missing_codes(self) -> List[str]:
+        """Product codes the documents mention that have no record yet"""
+        mentioned = set()
+        for (codes,) in self._connection().execute("SELECT codes FROM documents"):
+            mentioned.update(json.loads(codes))
+        have = {row[0] for row in self._connection().execute("SELECT code FROM products")}
+        return sorted(mentioned - have)
+
+    def count(self) -> int:
+        """Number of products in the catalog"""
+        return self._connection().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def get(self, code: str) -> Optional[Dict]:
+        """
+        Read one product
+
+        Returns:
+            {'code', 'record', 'sources', 'extracted_by'}, or None when the
+            catalog does not have the product
+        """
+        row = self._connection().execute(
+            "SELECT code, record, sources, extracted_by FROM products WHERE code = ?",
+            (code.strip().upper(),)
+        ).fetchone()
+        return self._product(row) if row is not None else None
+
+    @staticmethod
+    def _product(row) -> Dict:
+        return {'code': row[0], 'record': json.loads(row[1]), 'sources': json.loads(row[2]), 'extracted_by': row[3]}
+
+    def _tag_ids(self, conn: sqlite3.Connection, text: str, kinds: Tuple[str, ...]) -> Optional[Dict[int, str]]:
+        """
+        Tags of the given kinds that contain every word of the text
+
+        Returns:
+            {tag id: tag}, finishes and features first, or None when the text
+            has no indexable words
+        """
+        words = sorted(set(tokenize(text)))
+        if not words:
+            return None
+        rows = conn.execute(
+            f"SELECT tags.id, tags.tag FROM tags JOIN ("
+            f"SELECT tag_id FROM tag_words WHERE word IN ({','.join('?' * len(words))}) "
+            f"GROUP BY tag_id HAVING COUNT(*) = ?"
+            f") matched ON matched.tag_id = tags.id "
+            f"WHERE tags.kind IN ({','.join('?' * len(kinds))}) ORDER BY tags.kind = 'category', tags.tag",
+            (*words, len(words), *kinds)
+        )
+        return dict(rows.fetchall())
+
+    def search(self, category: str, features: List[str]) -> Dict:
+        """
+        Find the products of a category that have all the features
+
+        A category matches when every word of it is in the product's category
+        ("faucet" matches kitchen and lavatory faucets); a feature matches when
+        every word of it is in one finish or feature tag (or the category).
+        Words are stemmed like the local index, so "pull-down sprayers" finds
+        "Pull-down sprayer".
+
+        Returns:
+            {'products': [...] ordered by code, each with 'matched' mapping
+            every feature to the tag that satisfied it}
+        """
+        self.searches += 1
+        conn = self._connection()
+        terms = [(None, self._tag_ids(conn, category, ('category',)))]
+        terms += [(feature, self._tag_ids(conn, feature, ('finish', 'feature', 'category'))) for feature in features]
+        terms = [(feature, tag_ids) for feature, tag_ids in terms if tag_ids is not None]
+        if any(not tag_ids for _, tag_ids in terms):
+            return {'products': []}
+
+        # Intersect the products of each term in SQLite; only the final codes come back
+        if terms:
+            selects, params = [], []
+            for _, tag_ids in terms:
+                selects.append(f"SELECT code FROM product_tags WHERE tag_id IN ({','.join('?' * len(tag_ids))})")
+                params.extend(tag_ids)
+            codes = [row[0] for row in conn.execute(' INTERSECT '.join(selects) + ' ORDER BY code', params)]
+        else:
+            codes = [row[0] for row in conn.execute("SELECT code FROM products ORDER BY code")]
+
+        # Each feature reports its best matching tag (finishes and features before the category)
+        ranks = {
+            feature: {tag_id: position for position, tag_id in enumerate(tag_ids)}
+            for feature, tag_ids in terms if feature is not None
+        }
+        names = {tag_id: tag for _, tag_ids in terms for tag_id, tag in tag_ids.items()}
+        wanted = sorted({tag_id for rank in ranks.values() for tag_id in rank})
+        products = []
+        for start in range(0, len(codes), 500):
+            chunk = codes[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            matched: Dict[str, Dict[str, Tuple[int, str]]] = {}
+            if wanted:
+                rows = conn.execute(
+                    f"SELECT code, tag_id FROM product_tags WHERE code IN ({placeholders}) "
+                    f"AND tag_id IN ({','.join('?' * len(wanted))})",
+                    (*chunk, *wanted)
+                )
+                for code, tag_id in rows:
+                    for feature, rank in ranks.items():
+                        position = rank.get(tag_id)
+                        best = matched.setdefault(code, {}).get(feature)
+                        if position is not None and (best is None or position < best[0]):
+                            matched[code][feature] = (position, names[tag_id])
+            rows = conn.execute(
+                f"SELECT code, record, sources, extracted_by FROM products WHERE code IN ({placeholders}) ORDER BY code",
+                chunk
+            )
+            for row in rows:
+                product = self._product(row)
+                product['matched'] = {
+                    feature: tag for feature, (_, tag) in matched.get(product['code'], {}).items()
+                }
+                products.append(product)
+        return {'products': products}
+
+    def stats(self) -> Dict:
+        """Return catalog size and counters"""
+        conn = self._connection()
+        by_source = dict(conn.execute("SELECT extracted_by, COUNT(*) FROM products GROUP BY extracted_by").fetchall())
+        return {
+            'products': sum(by_source.values()),
+            'from_spec_sheets': by_source.get('spec_sheet', 0),
+            'from_model': by_source.get('model', 0),
+            'documents': conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            'searches': self.searches
+        }
+
+
+def main():
+    """Build or search the product catalog from the command line"""
+    parser = argparse.ArgumentParser(description='Build or search the structured product catalog')
+    parser.add_argument('--catalog', help='Catalog database (default CATALOG_PATH)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Extract new and changed documents')
+    build.add_argument('root', help='Directory with the knowledge-base documents')
+    build.add_argument('--rehash', action='store_true', help='Hash every file, even with unchanged size and mtime')
+    build.add_argument('--llm', action='store_true',
+                       help='Ask the model for the details of products mentioned without a spec sheet')
+    search = commands.add_parser('search', help='Find products by category and features')
+    search.add_argument('category')
+    search.add_argument('features', nargs='*')
+    args = parser.parse_args()
+
+    from config import CATALOG_PATH
+
+    catalog = ProductCatalog(args.catalog or CATALOG_PATH)
+    if args.command == 'search':
+        started = time.perf_counter()
+        result = catalog.search(args.category, args.features)
+        result['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        print(json.dumps(result, indent=2))
+        return
+
+    if not os.path.isdir(args.root):
+        print(f"Error: {args.root} is not a directory")
+        sys.exit(1)
+    print(json.dumps(catalog.update(args.root, rehash=args.rehash), indent=2))
+    if args.llm:
+        from config import create_query_engine
+
+        engine = create_query_engine()
+        missing = catalog.missing_codes()
+        logger.info(f"Asking the model for {len(missing)} products without a spec sheet")
+        filled = 0
+        for code in missing:
+            result = engine.get_product_details(code)
+            if result.get('details'):
+                catalog.add_model_record(code, result['details'])
+                filled += 1
+            else:
+                logger.warning(f"No details for {code}: {result.get('error') or 'answer was not JSON'}")
+        print(json.dumps({'missing': len(missing), 'filled_by_model': filled, 'products': catalog.count()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
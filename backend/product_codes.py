@@ -0,0 +1,21 @@
+"""
+Product code helpers shared by the caching and routing layers
+"""
+import re
+from typing import List
+
+# Flusso product codes look like 100.1000, 240.4420 or TVH.2691
+PRODUCT_CODE_PATTERN = re.compile(r'\b[A-Za-z0-9]{2,6}\.(?=[A-Za-z]*\d)[A-Za-z0-9]{3,8}\b')
+
+
+def extract_product_codes(text: str) -> List[str]:
+    """
+    Extract product codes from free text
+
+    Args:
+        text: Query or document text
+
+    Returns:
+        Sorted, de-duplicated, upper-cased product codes
+    """
+    return sorted({match.upper() for match in PRODUCT_CODE_PATTERN.findall(text)})
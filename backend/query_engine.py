@@ -1,8 +1,62 @@
 import os
+import copy
+import json
+import time
 import logging
-from typing import Dict, List, Optional
+import threading
+import traceback
+import httpx
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from google import genai
 from google.genai import types
+from admission import AdmissionController, AdmissionRejected
+from context_cache import ContextCacheManager
+from deadline import Deadline, DeadlineExceeded
+from hedging import Hedger
+from local_index import LocalIndex
+from metrics import (
+    note_cache, note_model, note_query, record_cache_lookup, record_error, record_first_token, record_usage,
+    upstream_call
+)
+from resilience import CircuitOpenError, RetryPolicy, TRANSIENT_ERRORS, classify_error
+from model_router import ModelRouter
+from product_catalog import PRODUCT_DETAIL_FIELDS, ProductCatalog
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from sessions import SessionPrefixCache, SessionStore, SessionTurn
+from single_flight import SingleFlight
+
+# Comparison strategies for compare_products
+COMPARE_MODES = ('single', 'decomposed')
+
+# Host the warm-up opens connections to (the Gemini Developer API endpoint)
+GEMINI_BASE_URL = 'https://generativelanguage.googleapis.com/'
+
+# Most products listed in a search answer built from the catalog
+CATALOG_MAX_ROWS = 50
+
+# Default answer-token limit and thinking budget per kind of request: short for
+# lookups, longer for comparisons. A thinking budget of 0 turns thinking off,
+# -1 lets the model decide and None keeps the model default; 'query' also
+# applies to anything the caller leaves unset. Thinking tokens count against
+# the output limit, so the answer-token limit is only applied with a fixed
+# thinking budget (which is added to it)
+TOKEN_BUDGETS = {
+    'query': {'max_tokens': 2048, 'thinking_budget': 1024},
+    'product': {'max_tokens': 1024, 'thinking_budget': 512},
+    'details': {'max_tokens': 512, 'thinking_budget': 0},
+    'compare': {'max_tokens': 3072, 'thinking_budget': 1024},
+    'search': {'max_tokens': 1536, 'thinking_budget': 512},
+    'installation': {'max_tokens': 2048, 'thinking_budget': 512},
+    'parts': {'max_tokens': 2048, 'thinking_budget': 0},
+}
+BUDGET_KEYS = ('max_tokens', 'thinking_budget')
+
+# Smallest thinking budget per model (thinking cannot be turned off on pro)
+MIN_THINKING_BUDGET = {'gemini-2.5-pro': 128}
 
 # Configure logging
 logging.basicConfig(
@@ -12,18 +66,133 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class QueryPlan:
+    """How one question will be answered, decided before any model call (see FlussoQueryEngine._plan_query)"""
+    
+    def __init__(self, user_query: str, session_id: Optional[str], deadline: Optional[Deadline], options: Dict):
+        self.user_query = user_query
+        self.session_id = session_id
+        self.deadline = deadline
+        # Generation arguments of the request, re-resolved for an escalated model
+        self.options = options
+        # Whether the question is asked with its session's history (no caches, no local answers)
+        self.history = False
+        # A finished answer that needs no model call (local spec answer), or None
+        self.result = None
+        self.passages: List[Dict] = []
+        self.decision: Optional[Dict] = None
+        # The prompt sent to the model and its parameters; with pre-selected passages the
+        # prompt carries them and File Search is off
+        self.prompt = user_query
+        self.params: Dict = {}
+        # Parameters of the question itself, which its session's follow-ups are asked with
+        self.session_params: Dict = {}
+
+
+class AnswerStream:
+    """Collects a streamed answer chunk by chunk (the same for sync and async streams)"""
+    
+    def __init__(self, model: str, deadline: Optional[Deadline]):
+        self.model = model
+        self.deadline = deadline
+        self.started = time.time()
+        self.first_token_time = None
+        self.parts: List[str] = []
+        self.grounding_metadata = None
+        self.finish_reason = None
+        self.usage = None
+    
+    def add(self, chunk: types.GenerateContentResponse) -> Optional[str]:
+        """Take in one chunk and return its text (None when it carries none)"""
+        if self.deadline is not None:
+            self.deadline.check('the stream finished')
+        self.usage = chunk.usage_metadata or self.usage
+        candidate = chunk.candidates[0] if chunk.candidates else None
+        if candidate is not None and candidate.grounding_metadata:
+            self.grounding_metadata = candidate.grounding_metadata
+        if candidate is not None and candidate.finish_reason:
+            self.finish_reason = candidate.finish_reason
+        text = chunk.text
+        if text:
+            if self.first_token_time is None:
+                self.first_token_time = time.time() - self.started
+                logger.info(f"First token received in {self.first_token_time:.2f}s")
+                record_first_token(self.model, self.first_token_time)
+            self.parts.append(text)
+        return text
+
+
 class FlussoQueryEngine:
     """
     Query engine for Flusso product knowledge base using Gemini API with File Search
     """
     
-    def __init__(self, api_key: str, store_id: str):
+    # Coalescer type matching this engine's call style (see AsyncFlussoQueryEngine)
+    single_flight_class = SingleFlight
+    
+    def __init__(
+        self,
+        api_key: str,
+        store_id: str,
+        cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        client: Optional[genai.Client] = None,
+        context_cache_ttl: Optional[float] = None,
+        router: Optional[ModelRouter] = None,
+        request_timeout: Optional[float] = None,
+        hedger: Optional[Hedger] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        admission: Optional[AdmissionController] = None,
+        keepalive_seconds: float = 120,
+        sessions: Optional[SessionStore] = None,
+        session_prefix_cache_tokens: Optional[int] = None,
+        local_index: Optional[LocalIndex] = None,
+        local_answers: bool = True,
+        local_context: bool = False,
+        catalog: Optional[ProductCatalog] = None,
+        catalog_phrasing: bool = False,
+        catalog_fallback: bool = True,
+        token_budgets: Optional[Dict[str, Dict[str, Optional[int]]]] = None
+    ):
         """
         Initialize the query engine
         
         Args:
             api_key: Google Gemini API key
             store_id: File Search store ID (e.g., fileSearchStores/...)
+            cache: Optional shared response cache; identical requests are served from it
+            semantic_cache: Optional near-duplicate cache consulted after an exact miss
+            single_flight: Optional coalescer so identical concurrent queries share one upstream call
+            client: Optional pre-built Gemini client (e.g. a local fake for load tests);
+                otherwise each process creates its own on first use
+            context_cache_ttl: Keep the system instruction and File Search tool in an
+                explicit Gemini context cache with this TTL in seconds (None disables it)
+            router: Optional model router choosing flash or pro per query
+            request_timeout: Default time budget in seconds for calls made without a deadline
+            hedger: Optional hedger sending a backup request when a call is unusually slow
+            retry_policy: Optional retries (and circuit breaker) for transient upstream errors;
+                when a call still fails, an expired cached answer is served if there is one
+            admission: Optional cap on upstream calls in flight, with a priority wait queue
+            keepalive_seconds: How long idle upstream connections stay in the pool
+            sessions: Optional store for multi-turn conversations (query(session_id=...))
+            session_prefix_cache_tokens: Keep each session's history in an explicit Gemini
+                context cache, recreated once this many tokens of it are not covered yet
+                (None disables it)
+            local_index: Optional BM25 index of the knowledge base, served by lookup()
+            local_answers: Answer single-attribute spec questions ("flow rate of
+                100.1000") from the local index without calling Gemini
+            local_context: Send product questions with passages pre-selected by the
+                local index instead of running File Search, when it covers every
+                product code they name
+            catalog: Optional structured product catalog; feature searches and
+                comparisons of catalogued products are answered from it
+            catalog_phrasing: Have the model phrase search answers from the catalog
+                matches (without File Search) instead of returning the table
+            catalog_fallback: Ask the model (with File Search) when the catalog has
+                no product matching a search
+            token_budgets: Answer-token limit and thinking budget per kind of
+                request, merged over TOKEN_BUDGETS; requests can override both
         """
         if not api_key:
             raise ValueError("API key is required")
@@ -32,23 +201,177 @@ class FlussoQueryEngine:
         
         self.api_key = api_key
         self.store_id = store_id
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self.single_flight = single_flight
+        self.router = router
+        self.request_timeout = request_timeout
+        self.hedger = hedger
+        self.retry_policy = retry_policy
+        self.breaker = retry_policy.breaker if retry_policy is not None else None
+        self.admission = admission
+        self.keepalive_seconds = keepalive_seconds
+        self.local_index = local_index
+        self.local_answers = local_answers
+        self.local_context = local_context
+        self.catalog = catalog
+        self.catalog_phrasing = catalog_phrasing
+        self.catalog_fallback = catalog_fallback
+        self.token_budgets = {
+            kind: dict(budget, **(token_budgets or {}).get(kind, {})) for kind, budget in TOKEN_BUDGETS.items()
+        }
         
-        # Initialize Gemini client
-        try:
-            self.client = genai.Client(api_key=api_key)
-            logger.info("✓ Gemini client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini client: {e}")
-            raise
+        # Gemini client: a pre-built one is used as given; our own is created per process
+        # on first use, so an engine built in the gunicorn master never shares its
+        # connection pool with the forked workers
+        self._client = client
+        self._owns_client = client is None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+        self._http_client = None
+        self._async_http_client = None
+        self.ready = True
+        self.warmup = None
         
         # Model configuration
         self.model_name = 'gemini-2.5-flash'
         self.default_temperature = 0.2
         self.default_top_p = 0.8
+        self.system_instruction = self._build_system_instruction()
+        
+        # Optional explicit context cache for the static request prefix
+        self.context_cache = None
+        if context_cache_ttl:
+            self.context_cache = ContextCacheManager(
+                lambda: self.client,
+                self.store_id,
+                self.system_instruction,
+                ttl_seconds=context_cache_ttl,
+                refresh_margin_seconds=min(300, context_cache_ttl / 5)
+            )
+        
+        # Optional multi-turn sessions, with their stable prefix in per-session context caches
+        self.sessions = sessions
+        self.session_prefix_cache = None
+        if sessions is not None and session_prefix_cache_tokens:
+            self.session_prefix_cache = SessionPrefixCache(
+                lambda: self.client,
+                sessions,
+                self.store_id,
+                self.system_instruction,
+                min_new_tokens=session_prefix_cache_tokens
+            )
         
         logger.info(f"✓ Query engine initialized")
+        logger.info(f"  Gemini client: {'created per process on first use' if self._owns_client else type(client).__name__}")
         logger.info(f"  Model: {self.model_name}")
         logger.info(f"  Store ID: {self.store_id}")
+        logger.info(f"  Response cache: {'enabled' if self.cache else 'disabled'}")
+        logger.info(f"  Semantic cache: {'enabled' if self.semantic_cache else 'disabled'}")
+        logger.info(f"  Request coalescing: {'enabled' if self.single_flight else 'disabled'}")
+        logger.info(f"  Context cache: {'enabled' if self.context_cache else 'disabled'}")
+        logger.info(f"  Model router: {self.router.mode if self.router else 'disabled'}")
+        logger.info(f"  Request timeout: {f'{self.request_timeout:g}s' if self.request_timeout else 'none'}")
+        logger.info(f"  Hedged requests: {'enabled' if self.hedger else 'disabled'}")
+        logger.info(f"  Retries: {self.retry_policy.max_attempts if self.retry_policy else 1} attempts, "
+                    f"circuit breaker {'enabled' if self.breaker else 'disabled'}")
+        if self.local_index is not None:
+            logger.info(f"  Local index: enabled (spec answers {'on' if local_answers else 'off'}, "
+                        f"pre-selected context {'on' if local_context else 'off'})")
+        else:
+            logger.info("  Local index: disabled")
+        logger.info(f"  Product catalog: {f'{self.catalog.count()} products' if self.catalog else 'disabled'}")
+        logger.info("  Output budgets (answer/thinking tokens): " + ', '.join(
+            f"{kind} {budget['max_tokens']}/{budget['thinking_budget']}" for kind, budget in self.token_budgets.items()
+        ))
+    
+    @property
+    def client(self):
+        """Gemini client of the current process"""
+        if self._owns_client and self._client_pid != os.getpid():
+            with self._client_lock:
+                if self._client_pid != os.getpid():
+                    self._client = self._create_client()
+                    self._client_pid = os.getpid()
+        return self._client
+    
+    def _create_client(self) -> genai.Client:
+        """Create a Gemini client with keep-alive connection pools of its own"""
+        limits = httpx.Limits(max_keepalive_connections=20, keepalive_expiry=self.keepalive_seconds)
+        self._http_client = httpx.Client(limits=limits, follow_redirects=True)
+        self._async_http_client = httpx.AsyncClient(limits=limits, follow_redirects=True)
+        client = genai.Client(
+            api_key=self.api_key,
+            http_options=types.HttpOptions(
+                httpx_client=self._http_client,
+                httpx_async_client=self._async_http_client
+            )
+        )
+        logger.info(f"✓ Gemini client initialized (pid {os.getpid()})")
+        return client
+    
+    def start_warm_up(self, connections: int = 2, probe: bool = False) -> None:
+        """
+        Warm up the upstream connections in the background
+        
+        The engine reports ready=False until warm_up() has finished. Call this
+        in each worker process, after any fork.
+        """
+        self.ready = False
+        threading.Thread(
+            target=self.warm_up, args=(connections, probe), name='upstream-warmup', daemon=True
+        ).start()
+    
+    def warm_up(self, connections: int = 2, probe: bool = False, timeout: float = 10.0) -> Dict:
+        """
+        Open pooled keep-alive connections to the Gemini API before serving
+        
+        The connections are opened in parallel (TLS handshakes included) and
+        go back to the client's pool, so the first requests of a fresh worker
+        skip the connection setup. With probe=True the default model's
+        metadata is also fetched, a free call that checks the API key.
+        Failures are logged, never raised: the engine is marked ready either
+        way and later requests open their own connections.
+        
+        Args:
+            connections: Number of connections to open
+            probe: Also issue a models.get call
+            timeout: Seconds allowed for each warm-up request
+            
+        Returns:
+            Warm-up summary (also reported by /api/health)
+        """
+        self.ready = False
+        started = time.time()
+        summary = {'connections': 0, 'probe': None, 'error': None, 'skipped': not self._owns_client}
+        try:
+            client = self.client
+            if self._owns_client:
+                with ThreadPoolExecutor(max_workers=max(1, connections)) as pool:
+                    list(pool.map(
+                        lambda _: self._http_client.head(GEMINI_BASE_URL, timeout=timeout),
+                        range(connections)
+                    ))
+                summary['connections'] = connections
+                if probe:
+                    client.models.get(model=self.model_name, config=types.GetModelConfig(
+                        http_options=types.HttpOptions(timeout=int(timeout * 1000))
+                    ))
+                    summary['probe'] = 'ok'
+        except Exception as e:
+            logger.warning(f"Upstream warm-up failed: {e}")
+            summary['error'] = str(e)
+            if probe and summary['connections']:
+                summary['probe'] = 'failed'
+        return self._finish_warm_up(summary, started)
+    
+    def _finish_warm_up(self, summary: Dict, started: float) -> Dict:
+        """Record the warm-up summary and mark the engine ready"""
+        summary['seconds'] = round(time.time() - started, 3)
+        self.warmup = summary
+        self.ready = True
+        logger.info(f"✓ Upstream warm-up finished in {summary['seconds']:.2f}s ({summary['connections']} connections)")
+        return summary
     
     def _build_system_instruction(self) -> str:
         """Build comprehensive system instruction for the AI"""
@@ -90,7 +413,13 @@ class FlussoQueryEngine:
         temperature: Optional[float] = None,
         top_p: Optional[float] = None,
         max_tokens: Optional[int] = None,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        refresh: bool = False,
+        file_search: bool = True,
+        deadline: Optional[Deadline] = None,
+        session_id: Optional[str] = None,
+        thinking_budget: Optional[int] = None,
+        route: bool = True
     ) -> Dict:
         """
         Process a user query and return results
@@ -99,177 +428,1387 @@ class FlussoQueryEngine:
             user_query: The user's question
             temperature: Model temperature (0.0-1.0), default 0.3
             top_p: Top-p sampling parameter, default 0.9
-            max_tokens: Maximum tokens in response, default None (model default)
-            model: Model to use (gemini-2.5-flash or gemini-2.5-pro), default gemini-2.5-flash
+            max_tokens: Maximum answer tokens, default None (TOKEN_BUDGETS['query']);
+                metadata['truncated'] reports an answer cut off at the limit. Only
+                applied with a fixed thinking budget (see _resolve_params)
+            model: Model to use (gemini-2.5-flash or gemini-2.5-pro), default gemini-2.5-flash;
+                with a router configured, None (or any model in 'override' mode) is routed
+            refresh: Skip the cache lookup and overwrite any cached answer
+            file_search: Ground the answer with the File Search store (False for
+                synthesis over text already in the prompt)
+            deadline: Time budget for the whole request, passed down to the upstream
+                call (defaults to request_timeout from now)
+            session_id: Continue this conversation session: the question is sent
+                with the session's history and the answer is added to it (the
+                response caches are bypassed once there is history; a first
+                question is answered like any other); metadata['session'] describes it
+            thinking_budget: Thinking tokens the model may spend before answering
+                (0 turns thinking off, -1 lets the model decide), default None
+                (TOKEN_BUDGETS['query'])
+            route: Let the router pick the model (False for internal steps whose
+                prompt is not the client's question)
             
         Returns:
-            Dictionary with answer, sources, and metadata
+            Dictionary with answer, sources, and metadata; when the deadline runs
+            out, success is False and error_type is 'deadline_exceeded'
+        """
+        plan = self._plan_query(
+            user_query, temperature, top_p, max_tokens, model, file_search, deadline, session_id, thinking_budget, route
+        )
+        if plan.result is not None:
+            return plan.result
+        if plan.history:
+            return self._query_session(plan)
+        
+        result = self._query_model(plan.prompt, plan.params, refresh, plan.deadline)
+        escalation = self._escalation(plan, result)
+        if escalation is not None:
+            decision, params = escalation
+            escalated = self._query_model(plan.prompt, params, refresh, plan.deadline)
+            if escalated.get('success'):
+                result, plan.decision = escalated, decision
+        
+        return self._finish_query(plan, result)
+    
+    def _plan_query(
+        self,
+        user_query: str,
+        temperature: Optional[float],
+        top_p: Optional[float],
+        max_tokens: Optional[int],
+        model: Optional[str],
+        file_search: bool,
+        deadline: Optional[Deadline],
+        session_id: Optional[str],
+        thinking_budget: Optional[int],
+        route: bool,
+        streaming: bool = False
+    ) -> QueryPlan:
+        """
+        Decide how to answer a question before calling any model (shared by both engines)
+        
+        Reads the session and the local index, so the async engine runs it in a thread.
+        
+        Returns:
+            The plan; plan.result is set when a local spec answer needs no model call
         """
         if not user_query or not user_query.strip():
             raise ValueError("Query cannot be empty")
         
-        logger.info(f"Processing query: {user_query[:100]}...")
+        logger.info(f"Processing {'streaming ' if streaming else ''}query: {user_query[:100]}...")
+        note_query(user_query)
+        
+        plan = QueryPlan(user_query, session_id, self._request_deadline(deadline), {
+            'temperature': temperature,
+            'top_p': top_p,
+            'file_search': file_search,
+            'max_tokens': max_tokens,
+            'thinking_budget': thinking_budget
+        })
+        # A session's first question has no history to depend on, so it is answered like any other
+        plan.history = self._session_has_history(session_id)
+        spec, plan.passages = self._local_lookup(user_query, file_search and not plan.history)
+        if spec is not None:
+            plan.result = self._open_session(spec, session_id, user_query, self._resolve_params(model=model, **plan.options))
+            return plan
+        
+        plan.decision = self.router.route(user_query, model) if self.router and route else None
+        if plan.decision is not None:
+            model = plan.decision['model']
+            logger.info(f"Routed to {model} ({plan.decision['reason']})")
+        
+        plan.session_params = self._resolve_params(model=model, **plan.options)
+        plan.params = plan.session_params
+        if plan.passages:
+            plan.prompt = self._excerpts_prompt(user_query, plan.passages)
+            plan.params = dict(plan.session_params, file_search=False)
+        return plan
+    
+    def _escalation(self, plan: QueryPlan, result: Dict) -> Optional[Tuple[Dict, Dict]]:
+        """The router's decision to regenerate an ungrounded answer with the strong model, and its parameters"""
+        escalation = self.router.escalation(plan.decision, result, plan.params['file_search']) if plan.decision else None
+        if escalation is None or (plan.deadline and plan.deadline.expired()):
+            return None
+        logger.info(f"No grounding from {plan.decision['model']}, escalating to {escalation['model']}")
+        return escalation, self._resolve_params(model=escalation['model'], **plan.options)
+    
+    def _finish_query(self, plan: QueryPlan, result: Dict) -> Dict:
+        """Report an answer under the user's question and start its session's history with it"""
+        result = self._with_routing(self._with_passages(result, plan.user_query, plan.passages), plan.decision)
+        return self._open_session(result, plan.session_id, plan.user_query, plan.session_params)
+    
+    def _query_model(self, user_query: str, params: Dict, refresh: bool, deadline: Optional[Deadline]) -> Dict:
+        """Answer a query with fixed parameters from the caches, a shared call or Gemini"""
+        cached, cache_key = self._lookup_cache(user_query, params, refresh)
+        if cached is not None:
+            return cached
         
-        # Use provided parameters or defaults
-        temp = temperature if temperature is not None else self.default_temperature
-        top_p_val = top_p if top_p is not None else self.default_top_p
-        model_to_use = model if model is not None else self.model_name
+        if self.single_flight is None:
+            return self._generate(user_query, params, cache_key, deadline)
         
+        result, shared = self.single_flight.do(
+            cache_key or ResponseCache.make_key(user_query, **params),
+            lambda: self._generate(user_query, params, cache_key, deadline),
+            recheck=None if refresh else lambda: self._recheck_cache(user_query, cache_key),
+            deadline=deadline
+        )
+        return self._from_shared(result, user_query) if shared else result
+    
+    def _generate(
+        self,
+        user_query: str,
+        params: Dict,
+        cache_key: Optional[str],
+        deadline: Optional[Deadline] = None
+    ) -> Dict:
+        """Call Gemini for a query that missed the caches and store the result"""
         try:
-            # Build the prompt with system instruction embedded
-            full_prompt = f"""{self._build_system_instruction()}
-
-User Query: {user_query}"""
-            
             # Log the request start time for monitoring
-            import time
             start_time = time.time()
             
-            logger.info(f"Using model: {model_to_use}")
+            logger.info(f"Using model: {params['model']}")
+            if deadline is not None:
+                deadline.check('the upstream call')
             
             # Generate response using File Search (following official documentation pattern)
-            response = self.client.models.generate_content(
-                model=model_to_use,
-                contents=full_prompt,
-                config=types.GenerateContentConfig(
-                    tools=[types.Tool(
-                        file_search=types.FileSearch(
-                            file_search_store_names=[self.store_id]
-                        )
-                    )],
-                    temperature=temp,
-                    top_p=top_p_val,
-                )
+            contents = self._build_prompt(user_query)
+            response = self._call_upstream(
+                lambda: self.client.models.generate_content(
+                    model=params['model'],
+                    contents=contents,
+                    config=self._build_config(params, deadline)
+                ),
+                params['model'],
+                deadline
             )
+            return self._generated(user_query, params, cache_key, response, start_time)
             
-            # Log response time
-            elapsed_time = time.time() - start_time
-            logger.info(f"Gemini API response received in {elapsed_time:.2f}s")
-            
-            # Extract answer text
-            answer = response.text if response.text else "No response generated"
-            
-            # Extract sources from grounding metadata
-            sources = []
-            grounding_metadata = None
-            
-            if response.candidates and len(response.candidates) > 0:
-                candidate = response.candidates[0]
-                grounding_metadata = candidate.grounding_metadata
-                
-                if grounding_metadata and grounding_metadata.grounding_chunks:
-                    # Extract unique source titles
-                    seen_sources = set()
-                    for chunk in grounding_metadata.grounding_chunks:
-                        if hasattr(chunk, 'retrieved_context'):
-                            source_title = chunk.retrieved_context.title
-                            if source_title and source_title not in seen_sources:
-                                sources.append({
-                                    'title': source_title,
-                                    'uri': getattr(chunk.retrieved_context, 'uri', None)
-                                })
-                                seen_sources.add(source_title)
+        except Exception as e:
+            return self._generation_failed(user_query, cache_key, e, deadline)
+    
+    def _generated(
+        self,
+        user_query: str,
+        params: Dict,
+        cache_key: Optional[str],
+        response: types.GenerateContentResponse,
+        start_time: float
+    ) -> Dict:
+        """Build the result of a generated answer and store it in the caches"""
+        # Log response time
+        elapsed_time = time.time() - start_time
+        logger.info(f"Gemini API response received in {elapsed_time:.2f}s")
+        if self.router is not None:
+            self.router.observe(params['model'], elapsed_time)
+        
+        result = self._result_from_response(user_query, response, params)
+        self._store_result(user_query, params, cache_key, result)
+        return result
+    
+    def _generation_failed(
+        self,
+        user_query: str,
+        cache_key: Optional[str],
+        error: Exception,
+        deadline: Optional[Deadline]
+    ) -> Dict:
+        """Serve a stale cached answer for a failed call, or report the error"""
+        error = self._deadline_error(error, deadline)
+        stale = self._stale_result(user_query, cache_key, error)
+        return stale if stale is not None else self._error_result(user_query, error)
+    
+    def _query_session(self, plan: QueryPlan) -> Dict:
+        """Answer the next question of a session with its history (answers depend on it, so nothing is cached)"""
+        params, deadline = plan.params, plan.deadline
+        turn = self._session_turn(plan.session_id, plan.user_query, params)
+        try:
+            start_time = time.time()
+            if deadline is not None:
+                deadline.check('the upstream call')
+            response = self._call_upstream(
+                lambda: self.client.models.generate_content(
+                    model=params['model'],
+                    contents=turn.contents,
+                    config=self._build_config(params, deadline, turn.cached_content)
+                ),
+                params['model'],
+                deadline
+            )
+            return self._session_answered(plan, turn, response, start_time)
+        except Exception as e:
+            return self._error_result(plan.user_query, self._deadline_error(e, deadline))
+    
+    def _session_answered(
+        self,
+        plan: QueryPlan,
+        turn: SessionTurn,
+        response: types.GenerateContentResponse,
+        start_time: float
+    ) -> Dict:
+        """Build the result of a session question and add the turn to its session"""
+        logger.info(f"Gemini API response received in {time.time() - start_time:.2f}s")
+        result = self._result_from_response(plan.user_query, response, plan.params)
+        return self._with_routing(self._with_session(result, turn, plan.params), plan.decision)
+    
+    def _session_has_history(self, session_id: Optional[str]) -> bool:
+        """Whether a question must be answered with its session's history (False outside sessions)"""
+        if session_id is None:
+            return False
+        if self.sessions is None:
+            raise ValueError("Sessions are not enabled")
+        return self.sessions.has_history(session_id)
+    
+    def _open_session(self, result: Dict, session_id: Optional[str], user_query: str, params: Dict) -> Dict:
+        """Start a session's history with its first question, answered like a question outside a session"""
+        if session_id is None:
+            return result
+        return self._with_session(result, self.sessions.opening_turn(session_id, user_query), params)
+    
+    def _session_turn(self, session_id: str, user_query: str, params: Dict) -> SessionTurn:
+        """Prepare the contents for the next question of a session"""
+        if self.sessions is None:
+            raise ValueError("Sessions are not enabled")
+        note_model(params['model'])
+        turn = self.sessions.prepare(session_id, user_query, params['model'], params['file_search'])
+        logger.info(
+            f"Session {session_id[:24]}: turn {turn.history_turns + 1}, "
+            f"{turn.sent_tokens}/{turn.history_tokens} history tokens sent"
+            f"{' (prefix cached)' if turn.cached_content else ''}"
+        )
+        return turn
+    
+    def _with_session(self, result: Dict, turn: SessionTurn, params: Dict) -> Dict:
+        """Add an answered turn to its session and report the session in the result"""
+        if not result.get('success'):
+            return result
+        session, dropped_cache = self.sessions.record(turn, result['answer'])
+        if self.session_prefix_cache is not None:
+            self.session_prefix_cache.discard(dropped_cache)
+            self.session_prefix_cache.after_turn(turn.session_id, params['model'], params['file_search'])
+        # The result may be shared with coalesced requests, so it is copied rather than changed
+        return dict(result, metadata=dict(result.get('metadata') or {}, session=session))
+    
+    def start_session(self) -> str:
+        """
+        Start a conversation session
+        
+        Returns:
+            Session id to pass to query() / query_stream()
+        """
+        if self.sessions is None:
+            raise ValueError("Sessions are not enabled")
+        return self.sessions.create()
+    
+    def end_session(self, session_id: str) -> bool:
+        """
+        Delete a session and its prefix cache
+        
+        Returns:
+            Whether the session existed
+        """
+        if self.sessions is None:
+            raise ValueError("Sessions are not enabled")
+        existed, cache_name = self.sessions.delete(session_id)
+        if self.session_prefix_cache is not None:
+            self.session_prefix_cache.discard(cache_name)
+        return existed
+    
+    def _call_upstream(self, call: Callable, model: str, deadline: Optional[Deadline]):
+        """Run a generate_content call through admission, hedging, retries and the circuit breaker"""
+        def timed():
+            with upstream_call(model):
+                return call()
+        
+        def admitted():
+            # A hedge is one more upstream call, so it takes a slot of its own
+            with self._upstream_slot(deadline):
+                return timed()
+        
+        hedged = timed
+        if self.hedger is not None:
+            hedged = lambda: self.hedger.call(timed, deadline, key=model, hedge_fn=admitted)
+        
+        def attempt():
+            # Each attempt takes its own slot, so retry backoff does not hold one
+            with self._upstream_slot(deadline):
+                return hedged()
+        
+        if self.retry_policy is not None:
+            return self.retry_policy.call(attempt, deadline)
+        return attempt()
+    
+    def _upstream_slot(self, deadline: Optional[Deadline]):
+        """Admission slot for one upstream call (a no-op without admission control)"""
+        if self.admission is None:
+            return nullcontext()
+        return self.admission.slot(deadline)
+    
+    def _stale_result(self, user_query: str, cache_key: Optional[str], error: Exception) -> Optional[Dict]:
+        """Serve an expired cached answer when the upstream is failing, unreachable or overloaded"""
+        error_type = classify_error(error)
+        if cache_key is None or error_type not in TRANSIENT_ERRORS + ('circuit_open', 'deadline_exceeded', 'overloaded'):
+            return None
+        cached = self.cache.get(cache_key, allow_stale=True)
+        if cached is None:
+            return None
+        logger.warning(f"Serving stale cached answer (age {cached['_cache_age']}s) after {error_type}: {error}")
+        record_cache_lookup('response', 'stale')
+        result = self._from_cache(cached, user_query)
+        result['metadata'].update(stale=True, stale_reason=error_type)
+        return result
+    
+    def query_stream(
+        self,
+        user_query: str,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        model: Optional[str] = None,
+        refresh: bool = False,
+        file_search: bool = True,
+        deadline: Optional[Deadline] = None,
+        session_id: Optional[str] = None,
+        thinking_budget: Optional[int] = None,
+        route: bool = True
+    ) -> Iterator[Dict]:
+        """
+        Process a user query and stream the answer as it is generated
+        
+        Args:
+            Same as query()
             
-            logger.info(f"✓ Query processed successfully, {len(sources)} sources found")
+        Yields:
+            {'event': 'delta', 'text': ...} for each answer fragment, then a final
+            {'event': 'done', ...} carrying sources and metadata (same shape as
+            query() without 'answer'), or {'event': 'error', 'error': ...}
+        """
+        plan = self._plan_query(
+            user_query, temperature, top_p, max_tokens, model, file_search, deadline, session_id, thinking_budget, route,
+            streaming=True
+        )
+        if plan.result is not None:
+            yield from self._result_events(plan.result)
+            return
+        turn, cached, cache_key = self._stream_start(plan, refresh)
+        if cached is not None:
+            yield from self._result_events(cached)
+            return
+        
+        answer = AnswerStream(plan.params['model'], plan.deadline)
+        try:
+            contents, config = self._stream_request(plan, turn)
+            with self._upstream_slot(plan.deadline):
+                with upstream_call(plan.params['model']):
+                    stream = self.client.models.generate_content_stream(
+                        model=plan.params['model'],
+                        contents=contents,
+                        config=config
+                    )
+                    for chunk in stream:
+                        text = answer.add(chunk)
+                        if text:
+                            yield {'event': 'delta', 'text': text}
+            yield self._stream_done(plan, answer, turn, cache_key)
             
-            return {
-                'success': True,
-                'query': user_query,
-                'answer': answer,
-                'sources': sources,
-                'source_count': len(sources),
-                'metadata': {
-                    'model': model_to_use,
-                    'temperature': temp,
-                    'top_p': top_p_val,
-                    'has_grounding': grounding_metadata is not None
+        except Exception as e:
+            yield from self._stream_failed(plan, answer, cache_key, e)
+        except BaseException:
+            # The client closed the stream (GeneratorExit) or the task was cancelled
+            if self.breaker is not None:
+                self.breaker.record_abandoned()
+            raise
+    
+    def _stream_start(self, plan: QueryPlan, refresh: bool) -> Tuple[Optional[SessionTurn], Optional[Dict], Optional[str]]:
+        """
+        Prepare a streamed answer
+        
+        Returns:
+            Tuple of (session turn when asked with history, finished cached
+            result or None, exact cache key or None)
+        """
+        if plan.history:
+            return self._session_turn(plan.session_id, plan.user_query, plan.params), None, None
+        cached, cache_key = self._lookup_cache(plan.prompt, plan.params, refresh)
+        return None, self._finish_query(plan, cached) if cached is not None else None, cache_key
+    
+    def _stream_request(self, plan: QueryPlan, turn: Optional[SessionTurn]) -> Tuple[List[types.Content], types.GenerateContentConfig]:
+        """Check the deadline and circuit breaker before a streamed call, and build its contents and config"""
+        logger.info(f"Using model: {plan.params['model']} (streaming)")
+        if plan.deadline is not None:
+            plan.deadline.check('the upstream call')
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if turn is not None:
+            return turn.contents, self._build_config(plan.params, plan.deadline, turn.cached_content)
+        return self._build_prompt(plan.prompt), self._build_config(plan.params, plan.deadline)
+    
+    def _stream_done(
+        self,
+        plan: QueryPlan,
+        answer: AnswerStream,
+        turn: Optional[SessionTurn],
+        cache_key: Optional[str]
+    ) -> Dict:
+        """Finish a completed stream: store or record the answer and build the final event"""
+        logger.info(f"Gemini API stream completed in {time.time() - answer.started:.2f}s")
+        record_usage(answer.model, answer.usage)
+        if self.breaker is not None:
+            self.breaker.record_success()
+        
+        result = self._build_result(
+            plan.user_query,
+            "".join(answer.parts) or "No response generated",
+            answer.grounding_metadata,
+            plan.params,
+            answer.finish_reason
+        )
+        if turn is not None:
+            result = self._with_routing(self._with_session(result, turn, plan.params), plan.decision)
+        else:
+            self._store_result(plan.prompt, plan.params, cache_key, result)
+            result = self._finish_query(plan, result)
+        
+        done = self._done_event(result)
+        done['metadata']['time_to_first_token'] = (
+            round(answer.first_token_time, 3) if answer.first_token_time is not None else None
+        )
+        return done
+    
+    def _stream_failed(
+        self,
+        plan: QueryPlan,
+        answer: AnswerStream,
+        cache_key: Optional[str],
+        error: Exception
+    ) -> List[Dict]:
+        """Final events of a failed stream: a stale cached answer when nothing was sent yet, or the error"""
+        error = self._deadline_error(error, plan.deadline)
+        if self.breaker is not None and not isinstance(error, CircuitOpenError):
+            self.breaker.record_failure(error)
+        stale = None if answer.parts else self._stale_result(plan.user_query, cache_key, error)
+        if stale is not None:
+            return self._result_events(self._finish_query(plan, stale))
+        result = self._error_result(plan.user_query, error)
+        return [{'event': 'error', 'error': result['error'], 'error_type': result['error_type']}]
+    
+    def _result_events(self, result: Dict) -> List[Dict]:
+        """Stream events for a finished result: its whole answer as one delta, then the final event"""
+        events = [{'event': 'delta', 'text': result['answer']}] if result.get('answer') else []
+        return events + [self._done_event(result)]
+    
+    def _request_deadline(self, deadline: Optional[Deadline]) -> Optional[Deadline]:
+        """Use the caller's deadline, or start the default one"""
+        if deadline is None and self.request_timeout:
+            return Deadline(self.request_timeout)
+        return deadline
+    
+    def _deadline_error(self, error: Exception, deadline: Optional[Deadline]) -> Exception:
+        """Report transport timeouts under a deadline as DeadlineExceeded"""
+        if deadline is not None and isinstance(error, (TimeoutError, httpx.TimeoutException)):
+            return DeadlineExceeded(f"Deadline of {deadline.budget:g}s exceeded during upstream call")
+        return error
+    
+    def _resolve_params(
+        self,
+        temperature: Optional[float],
+        top_p: Optional[float],
+        model: Optional[str],
+        file_search: bool = True,
+        max_tokens: Optional[int] = None,
+        thinking_budget: Optional[int] = None
+    ) -> Dict:
+        """
+        Fill in default generation parameters
+        
+        A fixed thinking budget is raised to the model's minimum. With dynamic
+        thinking the answer-token limit is dropped: thinking would share it,
+        and a long thought could leave a cut-off or empty answer.
+        """
+        model = model if model is not None else self.model_name
+        default = self.token_budgets['query']
+        thinking_budget = thinking_budget if thinking_budget is not None else default['thinking_budget']
+        max_tokens = max_tokens if max_tokens is not None else default['max_tokens']
+        if thinking_budget is not None and thinking_budget >= 0:
+            thinking_budget = max(thinking_budget, MIN_THINKING_BUDGET.get(model, 0))
+        else:
+            max_tokens = None
+        return {
+            'model': model,
+            'temperature': temperature if temperature is not None else self.default_temperature,
+            'top_p': top_p if top_p is not None else self.default_top_p,
+            'file_search': file_search,
+            'max_tokens': max_tokens,
+            'thinking_budget': thinking_budget
+        }
+    
+    def _lookup_cache(
+        self,
+        user_query: str,
+        params: Dict,
+        refresh: bool
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Check the exact and near-duplicate caches
+        
+        Returns:
+            Tuple of (cached result or None, exact cache key or None)
+        """
+        note_model(params['model'])
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(user_query, **params)
+            if not refresh:
+                cached = self.cache.get(cache_key)
+                record_cache_lookup('response', 'miss' if cached is None else 'hit')
+                if cached is not None:
+                    logger.info(f"✓ Cache hit (age {cached['_cache_age']}s)")
+                    return self._from_cache(cached, user_query), cache_key
+        
+        if self.semantic_cache is not None and not refresh:
+            match = self.semantic_cache.lookup(user_query, params)
+            record_cache_lookup('semantic', 'miss' if match is None else 'hit')
+            if match is not None:
+                cached, similarity, matched_query = match
+                logger.info(f"✓ Semantic cache hit (similarity {similarity}): {matched_query[:100]}")
+                result = self._from_cache(cached, user_query)
+                result['metadata']['semantic_match'] = {
+                    'similarity': similarity,
+                    'matched_query': matched_query
                 }
+                return result, cache_key
+        
+        return None, cache_key
+    
+    def _store_result(self, user_query: str, params: Dict, cache_key: Optional[str], result: Dict) -> None:
+        """Save a fresh result in the configured caches"""
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(user_query, params, result)
+    
+    def _build_prompt(self, user_query: str) -> str:
+        """Build the request contents (the system instruction travels in the config)"""
+        return user_query
+    
+    def _build_config(
+        self,
+        params: Dict,
+        deadline: Optional[Deadline] = None,
+        cached_content: Optional[str] = None
+    ) -> types.GenerateContentConfig:
+        """
+        Build the File Search generation config
+        
+        When a context cache handle is ready (a session's prefix cache passed
+        in, or the shared one for the model), the system instruction and tools
+        are referenced through cached_content instead of being sent again. The
+        remaining deadline becomes the HTTP timeout of the call, and the
+        answer-token limit and thinking budget are applied either way.
+        """
+        http_options = types.HttpOptions(timeout=deadline.timeout_ms()) if deadline is not None else None
+        if cached_content is None and self.context_cache is not None:
+            cached_content = self.context_cache.get(params['model'], params['file_search'])
+        if cached_content:
+            return types.GenerateContentConfig(
+                cached_content=cached_content,
+                temperature=params['temperature'],
+                top_p=params['top_p'],
+                http_options=http_options,
+                **self._budget_config(params)
+            )
+        
+        tools = None
+        if params['file_search']:
+            tools = [types.Tool(
+                file_search=types.FileSearch(
+                    file_search_store_names=[self.store_id]
+                )
+            )]
+        return types.GenerateContentConfig(
+            system_instruction=self.system_instruction,
+            tools=tools,
+            temperature=params['temperature'],
+            top_p=params['top_p'],
+            http_options=http_options,
+            **self._budget_config(params)
+        )
+    
+    @staticmethod
+    def _budget_config(params: Dict) -> Dict:
+        """Output-token limit and thinking config arguments for GenerateContentConfig"""
+        config = {}
+        thinking_budget = params['thinking_budget']
+        if params['max_tokens'] is not None:
+            # Thinking tokens count against max_output_tokens, so a fixed thinking budget is added on top
+            config['max_output_tokens'] = params['max_tokens'] + max(thinking_budget or 0, 0)
+        if thinking_budget is not None:
+            config['thinking_config'] = types.ThinkingConfig(thinking_budget=thinking_budget)
+        return config
+    
+    def _extract_sources(self, grounding_metadata) -> List[Dict]:
+        """Extract unique source titles from grounding metadata"""
+        sources = []
+        if grounding_metadata and grounding_metadata.grounding_chunks:
+            seen_sources = set()
+            for chunk in grounding_metadata.grounding_chunks:
+                if hasattr(chunk, 'retrieved_context'):
+                    source_title = chunk.retrieved_context.title
+                    if source_title and source_title not in seen_sources:
+                        sources.append({
+                            'title': source_title,
+                            'uri': getattr(chunk.retrieved_context, 'uri', None)
+                        })
+                        seen_sources.add(source_title)
+        return sources
+    
+    def _result_from_response(self, user_query: str, response, params: Dict) -> Dict:
+        """Build the response dictionary from a complete generate_content response"""
+        record_usage(params['model'], response.usage_metadata)
+        
+        # Extract answer text
+        answer = response.text if response.text else "No response generated"
+        
+        grounding_metadata = None
+        finish_reason = None
+        if response.candidates and len(response.candidates) > 0:
+            grounding_metadata = response.candidates[0].grounding_metadata
+            finish_reason = response.candidates[0].finish_reason
+        
+        return self._build_result(user_query, answer, grounding_metadata, params, finish_reason)
+    
+    def _build_result(
+        self,
+        user_query: str,
+        answer: str,
+        grounding_metadata,
+        params: Dict,
+        finish_reason: Optional[types.FinishReason] = None
+    ) -> Dict:
+        """Assemble the response dictionary for a generated answer"""
+        sources = self._extract_sources(grounding_metadata)
+        truncated = finish_reason == types.FinishReason.MAX_TOKENS
+        
+        if truncated:
+            logger.warning(f"Answer truncated at {params['max_tokens']} tokens (thinking budget {params['thinking_budget']})")
+        logger.info(f"✓ Query processed successfully, {len(sources)} sources found")
+        
+        return {
+            'success': True,
+            'query': user_query,
+            'answer': answer,
+            'sources': sources,
+            'source_count': len(sources),
+            'metadata': {
+                'model': params['model'],
+                'temperature': params['temperature'],
+                'top_p': params['top_p'],
+                'max_tokens': params['max_tokens'],
+                'thinking_budget': params['thinking_budget'],
+                'finish_reason': getattr(finish_reason, 'value', finish_reason),
+                'truncated': truncated,
+                'has_grounding': grounding_metadata is not None,
+                'cached': False
             }
+        }
+    
+    def _error_result(self, user_query: str, error: Exception) -> Dict:
+        """Log an upstream failure and build the error response"""
+        error_type = classify_error(error)
+        record_error(error_type)
+        if error_type in ('deadline_exceeded', 'circuit_open', 'overloaded'):
+            logger.warning(f"Query failed fast ({error_type}): {error}")
+        else:
+            logger.error(f"Error processing query: {error}")
+            logger.error("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+        
+        result = {
+            'success': False,
+            'query': user_query,
+            'answer': None,
+            'error': str(error),
+            'error_type': error_type,
+            'sources': [],
+            'source_count': 0
+        }
+        if isinstance(error, (CircuitOpenError, AdmissionRejected)):
+            result['retry_after'] = round(error.retry_after, 1)
+        return result
+    
+    def _done_event(self, result: Dict) -> Dict:
+        """Build the final stream event from a result (everything but the answer)"""
+        done = {key: value for key, value in result.items() if key != 'answer'}
+        done['event'] = 'done'
+        done['metadata'] = dict(result.get('metadata') or {})
+        return done
+    
+    def _recheck_cache(self, user_query: str, cache_key: Optional[str]) -> Optional[Dict]:
+        """Re-read the shared cache after waiting on another worker's identical request"""
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        return self._from_cache(cached, user_query) if cached is not None else None
+    
+    def _from_shared(self, result: Dict, user_query: str) -> Dict:
+        """Copy a result produced for a coalesced identical request"""
+        note_cache('coalesced')
+        shared = copy.deepcopy(result)
+        shared['query'] = user_query
+        if 'metadata' in shared:
+            shared['metadata']['coalesced'] = True
+        return shared
+    
+    def _with_routing(self, result: Dict, decision: Optional[Dict]) -> Dict:
+        """Report the routing decision in a result's metadata"""
+        if decision is None or 'metadata' not in result:
+            return result
+        return dict(result, metadata=dict(result['metadata'], routing=decision))
+    
+    def _from_cache(self, cached: Dict, user_query: str) -> Dict:
+        """Turn a cached result into a response for the current request"""
+        cache_age = cached.pop('_cache_age', None)
+        cached['query'] = user_query
+        cached['metadata'] = dict(cached.get('metadata') or {}, cached=True, cache_age=cache_age)
+        return cached
+    
+    def lookup(self, query: str, k: int = 5) -> Dict:
+        """
+        Search the local index directly (no Gemini call)
+        
+        Args:
+            query: Free text or product code
+            k: Number of passages to return
             
-        except Exception as e:
-            logger.error(f"Error processing query: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-            
-            return {
-                'success': False,
-                'query': user_query,
-                'answer': None,
-                'error': str(e),
-                'sources': [],
-                'source_count': 0
+        Returns:
+            Dictionary with the spec answer (or None) and the top passages
+        """
+        if self.local_index is None:
+            raise ValueError("Local index is not enabled")
+        if not query or not query.strip():
+            raise ValueError("Query cannot be empty")
+        
+        note_query(query)
+        note_cache('local')
+        started = time.perf_counter()
+        spec = self.local_index.spec_lookup(query)
+        hits = self.local_index.search(query, k=k)
+        return {
+            'success': True,
+            'query': query,
+            'spec': spec,
+            'hits': hits,
+            'took_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+    
+    def _local_lookup(self, user_query: str, eligible: bool) -> Tuple[Optional[Dict], List[Dict]]:
+        """
+        Try the local index before a File Search call
+        
+        Returns:
+            Tuple of (spec answer result or None, passages to send instead of
+            running File Search, empty when File Search should run)
+        """
+        if self.local_index is None or not eligible:
+            return None, []
+        
+        started = time.perf_counter()
+        if self.local_answers:
+            spec = self.local_index.spec_lookup(user_query)
+            record_cache_lookup('local_index', 'miss' if spec is None else 'hit')
+            if spec is not None:
+                logger.info(f"✓ Local spec answer: {spec['label']} of {spec['code']} from {spec['path']}")
+                return self._spec_result(user_query, spec, time.perf_counter() - started), []
+        
+        passages = self.local_index.grounding(user_query) if self.local_context else []
+        if passages:
+            logger.info(f"✓ Local index selected {len(passages)} passages, skipping File Search")
+        return None, passages
+    
+    def _spec_result(self, user_query: str, spec: Dict, elapsed: float) -> Dict:
+        """Build the response for a spec answered from the local index (extractive, no model involved)"""
+        note_model('local-index')
+        sources = [{'title': os.path.basename(spec['path']), 'uri': f"local://{spec['path']}"}]
+        return {
+            'success': True,
+            'query': user_query,
+            'answer': f"{spec['label']} of **{spec['code']}**: {spec['value']}",
+            'sources': sources,
+            'source_count': len(sources),
+            'metadata': {
+                'model': 'local-index',
+                'has_grounding': True,
+                'cached': False,
+                'local_index': {
+                    'mode': 'spec',
+                    'attribute': spec['attribute'],
+                    'score': spec['score'],
+                    'took_ms': round(elapsed * 1000, 3)
+                }
             }
+        }
+    
+    def _excerpts_prompt(self, user_query: str, passages: List[Dict]) -> str:
+        """Build a prompt carrying the pre-selected passages (sent with File Search off)"""
+        sections = [f"### {passage['path']}\n{passage['text']}" for passage in passages]
+        return (
+            f"Answer the question using only the knowledge-base excerpts below. "
+            f"If they do not contain the answer, say so.\n\n"
+            f"Question: {user_query}\n\n" + "\n\n".join(sections)
+        )
     
-    def get_product_info(self, product_code: str) -> Dict:
+    def _with_passages(self, result: Dict, user_query: str, passages: List[Dict]) -> Dict:
+        """Report an answer generated from pre-selected passages under the user's query, with them as sources"""
+        if not passages:
+            return result
+        result['query'] = user_query
+        if not result.get('success'):
+            return result
+        sources = []
+        for path in dict.fromkeys(passage['path'] for passage in passages):
+            sources.append({'title': os.path.basename(path), 'uri': f"local://{path}"})
+        result['sources'] = sources
+        result['source_count'] = len(sources)
+        result['metadata'] = dict(
+            result['metadata'],
+            has_grounding=True,
+            local_index={'mode': 'context', 'passages': len(passages)}
+        )
+        return result
+    
+    def get_product_info(self, product_code: str, **query_kwargs) -> Dict:
         """
         Get comprehensive information about a specific product
         
         Args:
             product_code: Product code (e.g., "100.1000", "TVH.2691")
+            **query_kwargs: Extra arguments for query() (e.g. model, refresh)
             
         Returns:
             Query result dictionary
         """
         query = f"Provide comprehensive information about product {product_code}, including specifications, features, available finishes, and any installation requirements."
-        return self.query(query)
+        return self.query(query, **self._budget('product', query_kwargs))
     
-    def compare_products(self, product_codes: List[str]) -> Dict:
+    def compare_products(self, product_codes: List[str], mode: str = 'single', **query_kwargs) -> Dict:
         """
         Compare multiple products
         
         Args:
             product_codes: List of product codes to compare
+            mode: 'single' sends one comparison prompt; 'decomposed' fetches
+                per-product details concurrently (cached per SKU) and builds the
+                table from them. When every product is in the catalog, both
+                modes build the table from the catalog without a model call
+            **query_kwargs: Extra arguments for query() (e.g. model, refresh);
+                max_tokens and thinking_budget apply to the comparison answer,
+                while per-product lookups keep the 'details' budget
             
         Returns:
             Query result dictionary
         """
         if len(product_codes) < 2:
             raise ValueError("At least 2 products required for comparison")
+        if mode not in COMPARE_MODES:
+            raise ValueError(f"Compare mode must be one of: {', '.join(COMPARE_MODES)}")
+        note_query(self._comparison_prompt(product_codes))
+        
+        if mode == 'single' and not self._catalog_covers(product_codes):
+            return self.query(self._comparison_prompt(product_codes), **self._budget('compare', query_kwargs))
+        
+        # Per-product lookups and the synthesis share one deadline
+        query_kwargs['deadline'] = self._request_deadline(query_kwargs.get('deadline'))
+        details_kwargs = self._step_kwargs(
+            {key: value for key, value in query_kwargs.items() if key not in BUDGET_KEYS}
+        )
+        with ThreadPoolExecutor(max_workers=min(len(product_codes), 8)) as pool:
+            # Submit with a copy of this context so the lookups keep the request's priority lane
+            futures = [
+                pool.submit(contextvars.copy_context().run, self.get_product_details, code, **details_kwargs)
+                for code in product_codes
+            ]
+            details = [future.result() for future in futures]
+        
+        local = self._local_comparison(product_codes, details)
+        if local is not None:
+            return local
+        
+        synthesis = self.query(
+            self._synthesis_prompt(product_codes, details),
+            file_search=False,
+            **self._step_kwargs(self._budget('compare', query_kwargs))
+        )
+        return self._decomposed_result(product_codes, details, synthesis)
+    
+    def get_product_details(self, product_code: str, **query_kwargs) -> Dict:
+        """
+        Get structured specifications for one product
+        
+        A product in the catalog is answered from its record. Otherwise the
+        prompt depends only on the product code, so the answer is cached and
+        shared by every comparison that includes this product.
+        
+        Args:
+            product_code: Product code
+            **query_kwargs: Extra arguments for query() (e.g. model, refresh)
+            
+        Returns:
+            Query result dictionary with an extra 'details' field holding the
+            parsed specification object (None if the answer was not valid JSON)
+        """
+        product = self.catalog.get(product_code) if self.catalog is not None else None
+        if product is not None:
+            return self._catalog_details(product)
+        return self._attach_details(
+            self.query(self._details_prompt(product_code), **self._budget('details', query_kwargs))
+        )
+    
+    def _catalog_covers(self, product_codes: List[str]) -> bool:
+        """Whether the catalog has a record for every product"""
+        return self.catalog is not None and all(self.catalog.get(code) is not None for code in product_codes)
+    
+    def _catalog_details(self, product: Dict) -> Dict:
+        """Build a get_product_details result from a catalog record"""
+        note_cache('catalog')
+        sources = self._catalog_sources([product])
+        return {
+            'success': True,
+            'query': self._details_prompt(product['code']),
+            'answer': json.dumps(product['record']),
+            'details': product['record'],
+            'sources': sources,
+            'source_count': len(sources),
+            'metadata': {
+                'model': None,
+                'cached': False,
+                'has_grounding': bool(sources),
+                'catalog': product['extracted_by']
+            }
+        }
+    
+    @staticmethod
+    def _catalog_sources(products: List[Dict]) -> List[Dict]:
+        """Unique source documents of catalog products"""
+        paths = dict.fromkeys(path for product in products for path in product['sources'])
+        return [{'title': os.path.basename(path), 'uri': f"local://{path}"} for path in paths]
+    
+    def _comparison_prompt(self, product_codes: List[str]) -> str:
+        """Build the single-call comparison prompt"""
+        codes_str = ", ".join(product_codes)
+        return f"Create a detailed comparison of these products: {codes_str}. Include specifications, features, finishes, dimensions, and key differences. Present the information in a table format."
+    
+    def _details_prompt(self, product_code: str) -> str:
+        """Build the per-product structured details prompt"""
+        fields = ", ".join(f'"{field}"' for field in PRODUCT_DETAIL_FIELDS)
+        return (
+            f"Return the specifications of product {product_code} as a single JSON object with exactly these keys: "
+            f"{fields}. Use strings, or lists of strings for finishes and features. "
+            f"Use null for anything the knowledge base does not state. Respond with only the JSON object."
+        )
+    
+    def _attach_details(self, result: Dict) -> Dict:
+        """Parse the JSON object in a details answer"""
+        details = None
+        answer = result.get('answer') or ''
+        start, end = answer.find('{'), answer.rfind('}')
+        if result.get('success') and start != -1 and end > start:
+            try:
+                parsed = json.loads(answer[start:end + 1])
+                if isinstance(parsed, dict):
+                    details = parsed
+            except ValueError:
+                logger.warning("Product details answer was not valid JSON")
+        result['details'] = details
+        return result
+    
+    def _local_comparison(self, product_codes: List[str], details: List[Dict]) -> Optional[Dict]:
+        """
+        Build the comparison table without a model call
+        
+        Returns:
+            Result dictionary, or None when any product's details are missing a field
+        """
+        records = [result.get('details') for result in details]
+        if any(record is None or any(field not in record for field in PRODUCT_DETAIL_FIELDS) for record in records):
+            return None
+        
+        def cell(value):
+            if value is None or value == [] or value == '':
+                return 'Not listed'
+            if isinstance(value, list):
+                value = ', '.join(str(item) for item in value)
+            return str(value).replace('|', '\\|').replace('\n', ' ')
         
+        header = '| | ' + ' | '.join(f'**{code}**' for code in product_codes) + ' |'
+        divider = '|---|' + '---|' * len(product_codes)
+        rows = []
+        differences = []
+        for field in PRODUCT_DETAIL_FIELDS:
+            values = [cell(record[field]) for record in records]
+            label = field.replace('_', ' ').title()
+            rows.append(f'| **{label}** | ' + ' | '.join(values) + ' |')
+            if len(set(values)) > 1:
+                differences.append(label)
+        
+        answer = "\n".join([
+            f"## Comparison: {', '.join(product_codes)}",
+            "",
+            header,
+            divider,
+            *rows,
+            "",
+            f"**Key differences:** {', '.join(differences) if differences else 'None found in the listed specifications'}"
+        ])
+        synthesis = {
+            'success': True,
+            'answer': answer,
+            'metadata': {'model': None, 'cached': False}
+        }
+        return self._decomposed_result(product_codes, details, synthesis, local=True)
+    
+    def _synthesis_prompt(self, product_codes: List[str], details: List[Dict]) -> str:
+        """Build the synthesis prompt from per-product answers"""
+        sections = []
+        for code, result in zip(product_codes, details):
+            if result.get('details') is not None:
+                body = json.dumps(result['details'], indent=1)
+            else:
+                body = result.get('answer') or 'No information available.'
+            sections.append(f"### {code}\n{body}")
         codes_str = ", ".join(product_codes)
-        query = f"Create a detailed comparison of these products: {codes_str}. Include specifications, features, finishes, dimensions, and key differences. Present the information in a table format."
-        return self.query(query)
+        return (
+            f"Using only the product information below, create a detailed comparison of {codes_str}. "
+            f"Include specifications, features, finishes, dimensions, and key differences. "
+            f"Present the information in a table format.\n\n" + "\n\n".join(sections)
+        )
+    
+    def _decomposed_result(
+        self,
+        product_codes: List[str],
+        details: List[Dict],
+        synthesis: Dict,
+        local: bool = False
+    ) -> Dict:
+        """Combine per-product results and the synthesis step into one response"""
+        sources = []
+        seen_sources = set()
+        for result in details:
+            for source in result.get('sources') or []:
+                if source['title'] not in seen_sources:
+                    sources.append(source)
+                    seen_sources.add(source['title'])
+        
+        metadata = dict(synthesis.get('metadata') or {})
+        metadata.update({
+            'compare_mode': 'decomposed',
+            'synthesis': 'local' if local else 'model',
+            'has_grounding': any((r.get('metadata') or {}).get('has_grounding') for r in details),
+            'products': {
+                code: {
+                    'success': bool(result.get('success')),
+                    'cached': bool((result.get('metadata') or {}).get('cached')),
+                    'structured': result.get('details') is not None,
+                    'catalog': bool((result.get('metadata') or {}).get('catalog'))
+                }
+                for code, result in zip(product_codes, details)
+            }
+        })
+        
+        response = {
+            'success': bool(synthesis.get('success')),
+            'query': self._comparison_prompt(product_codes),
+            'answer': synthesis.get('answer'),
+            'sources': sources,
+            'source_count': len(sources),
+            'metadata': metadata
+        }
+        if not synthesis.get('success'):
+            response['error'] = synthesis.get('error')
+            response['error_type'] = synthesis.get('error_type')
+        return response
     
-    def search_by_features(self, category: str, features: List[str]) -> Dict:
+    def search_by_features(self, category: str, features: List[str], **query_kwargs) -> Dict:
         """
         Search for products by category and features
         
+        With a catalog, the matching products are found by an indexed query
+        and listed in a table (or phrased by the model without File Search when
+        catalog_phrasing is set); the model searches the knowledge base only
+        when there is no catalog or, with catalog_fallback, no match.
+        
         Args:
             category: Product category (e.g., "kitchen faucet", "shower system")
             features: List of desired features
+            **query_kwargs: Extra arguments for query() (e.g. model, refresh)
             
         Returns:
-            Query result dictionary
+            Query result dictionary; catalog answers report metadata['catalog']
         """
+        note_query(self._features_prompt(category, features))
+        local = self._catalog_search(category, features)
+        if local is None:
+            return self.query(self._features_prompt(category, features), **self._budget('search', query_kwargs))
+        if self.catalog_phrasing and local['metadata']['catalog']['matches']:
+            phrased = self.query(
+                self._phrasing_prompt(category, features, local),
+                file_search=False,
+                **self._step_kwargs(self._budget('search', query_kwargs))
+            )
+            return self._phrased_search(phrased, local)
+        return local
+    
+    def _features_prompt(self, category: str, features: List[str]) -> str:
+        """Build the File Search prompt for a feature search"""
         features_str = ", ".join(features)
-        query = f"Find all {category} products that have these features: {features_str}. List the products with their codes and brief descriptions."
-        return self.query(query)
+        return f"Find all {category} products that have these features: {features_str}. List the products with their codes and brief descriptions."
     
-    def get_installation_guide(self, product_code: str) -> Dict:
+    def _catalog_search(self, category: str, features: List[str]) -> Optional[Dict]:
+        """
+        Answer a feature search from the catalog
+        
+        Returns:
+            Result dictionary listing the matches, or None when the model should
+            search instead (no catalog, or no match with catalog_fallback)
+        """
+        if self.catalog is None:
+            return None
+        started = time.perf_counter()
+        products = self.catalog.search(category, features)['products']
+        elapsed = time.perf_counter() - started
+        if not products and self.catalog_fallback:
+            logger.info(f"No catalog match for {category} ({', '.join(features)}), asking the model")
+            return None
+        
+        note_model('catalog')
+        note_cache('catalog')
+        logger.info(f"✓ Catalog search: {len(products)} {category} products in {elapsed * 1000:.1f}ms")
+        shown = products[:CATALOG_MAX_ROWS]
+        features_str = ', '.join(features)
+        if products:
+            lines = [
+                f"## {category.title()} products with {features_str}" if features else f"## {category.title()} products",
+                "",
+                f"Found {len(products)} products in the catalog"
+                + (f" (showing the first {len(shown)})." if len(shown) < len(products) else "."),
+                "",
+                "| Code | Name | Finishes | Matching features |",
+                "|---|---|---|---|"
+            ]
+            for product in shown:
+                record = product['record']
+                matched = ', '.join(dict.fromkeys(product['matched'].values())) or '-'
+                cells = [f"**{product['code']}**", record.get('name') or '-', ', '.join(record['finishes']) or '-', matched]
+                lines.append('| ' + ' | '.join(cell.replace('|', '\\|') for cell in cells) + ' |')
+            answer = "\n".join(lines)
+        else:
+            answer = f"No {category} products with {features_str} were found in the product catalog."
+        
+        sources = self._catalog_sources(shown)
+        return {
+            'success': True,
+            'query': self._features_prompt(category, features),
+            'answer': answer,
+            'sources': sources,
+            'source_count': len(sources),
+            'products': [product['code'] for product in products],
+            'metadata': {
+                'model': None,
+                'cached': False,
+                'has_grounding': bool(products),
+                'catalog': {
+                    'matches': len(products),
+                    'shown': len(shown),
+                    'took_ms': round(elapsed * 1000, 3)
+                }
+            }
+        }
+    
+    def _phrasing_prompt(self, category: str, features: List[str], local: Dict) -> str:
+        """Build the prompt asking the model to phrase catalog matches"""
+        return (
+            f"Using only the product table below, answer this request: find {category} products with these "
+            f"features: {', '.join(features)}. Mention every product with its code.\n\n{local['answer']}"
+        )
+    
+    def _phrased_search(self, phrased: Dict, local: Dict) -> Dict:
+        """Report a phrased catalog answer with the catalog's sources (the table itself if phrasing failed)"""
+        if not phrased.get('success'):
+            return local
+        return dict(
+            phrased,
+            query=local['query'],
+            sources=local['sources'],
+            source_count=local['source_count'],
+            products=local['products'],
+            metadata=dict(phrased['metadata'], has_grounding=True, catalog=local['metadata']['catalog'])
+        )
+    
+    def get_installation_guide(self, product_code: str, **query_kwargs) -> Dict:
         """
         Get installation instructions for a product
         
         Args:
             product_code: Product code
+            **query_kwargs: Extra arguments for query() (e.g. model, refresh)
             
         Returns:
             Query result dictionary
         """
         query = f"Provide detailed installation instructions for product {product_code}, including required tools, steps, and any important warnings."
-        return self.query(query)
+        return self.query(query, **self._budget('installation', query_kwargs))
     
-    def get_parts_info(self, product_code: str) -> Dict:
+    def get_parts_info(self, product_code: str, **query_kwargs) -> Dict:
         """
         Get parts and assembly information for a product
         
         Args:
             product_code: Product code
+            **query_kwargs: Extra arguments for query() (e.g. model, refresh)
             
         Returns:
             Query result dictionary
         """
         query = f"Show the parts list and assembly diagram information for product {product_code}. List all parts with their numbers and descriptions."
-        return self.query(query)
+        return self.query(query, **self._budget('parts', query_kwargs))
+    
+    def _budget(self, kind: str, query_kwargs: Dict) -> Dict:
+        """query() arguments with the answer-token limit and thinking budget of a kind of request filled in"""
+        budget = self.token_budgets[kind]
+        return dict(query_kwargs, **{key: budget[key] for key in BUDGET_KEYS if query_kwargs.get(key) is None})
+    
+    def _step_kwargs(self, query_kwargs: Dict) -> Dict:
+        """
+        query() arguments for an internal step of a request (per-product details, synthesis, phrasing)
+        
+        These prompts name every product of the request, so the router would
+        classify them as comparisons and send them to the strong model. They are
+        not routed: the fast model answers them, unless the client chose a model
+        and the router leaves client choices alone.
+        """
+        step_kwargs = dict(query_kwargs, route=False)
+        if self.router is not None and self.router.mode != 'off' \
+                and (step_kwargs.get('model') is None or self.router.mode == 'override'):
+            step_kwargs['model'] = self.router.fast_model
+        return step_kwargs
+    
+    def query_many(
+        self,
+        items: List[Dict],
+        concurrency: int = 4,
+        deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        """
+        Run a batch of queries and helper lookups concurrently
+        
+        Args:
+            items: Batch items (see _batch_call for the accepted shapes)
+            concurrency: Maximum number of items processed at once
+            deadline: Optional deadline shared by every item in the batch
+            
+        Returns:
+            One result per item, in input order; failed items carry
+            success=False and an error message instead of raising
+        """
+        results = [None] * len(items)
+        for index, result in self.iter_query_many(items, concurrency, deadline):
+            results[index] = result
+        return results
+    
+    def iter_query_many(
+        self,
+        items: List[Dict],
+        concurrency: int = 4,
+        deadline: Optional[Deadline] = None
+    ) -> Iterator[Tuple[int, Dict]]:
+        """
+        Run a batch concurrently and yield results as each item finishes
+        
+        Args:
+            items: Batch items (see _batch_call for the accepted shapes)
+            concurrency: Maximum number of items processed at once
+            deadline: Optional deadline shared by every item in the batch
+            
+        Yields:
+            (index, result) tuples in completion order
+        """
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+        
+        logger.info(f"Processing batch of {len(items)} items (concurrency {concurrency})")
+        
+        pool = ThreadPoolExecutor(max_workers=min(concurrency, max(len(items), 1)))
+        try:
+            futures = {
+                pool.submit(contextvars.copy_context().run, self._run_batch_item, item, deadline): index
+                for index, item in enumerate(items)
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # When the generator is closed early (the client went away), items not started yet are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _run_batch_item(self, item: Dict, deadline: Optional[Deadline] = None) -> Dict:
+        """Run one batch item, turning any failure into a per-item error result"""
+        try:
+            return self._batch_call(item, deadline)()
+        except Exception as e:
+            logger.error(f"Batch item failed: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'item': item
+            }
+    
+    def _batch_call(self, item: Dict, deadline: Optional[Deadline] = None) -> Callable[[], Dict]:
+        """
+        Resolve a batch item to the engine call that serves it
+        
+        Accepted item shapes:
+            {"query": "...", "temperature": 0.2, "top_p": 0.8, "model": "..."}
+            {"type": "product" | "installation" | "parts", "product_code": "100.1000"}
+            {"type": "compare", "products": ["100.1000", "160.1000"], "mode": "decomposed"}
+            {"type": "search", "category": "kitchen faucet", "features": ["pull-down"]}
+        
+        Any item may also set max_tokens and thinking_budget.
+        
+        Raises:
+            ValueError: If the item is malformed
+        """
+        if not isinstance(item, dict):
+            raise ValueError("Batch item must be an object")
+        
+        item_type = item.get('type', 'query')
+        budget = {key: item.get(key) for key in BUDGET_KEYS}
+        if item_type == 'query':
+            return lambda: self.query(
+                user_query=item.get('query') or '',
+                temperature=item.get('temperature'),
+                top_p=item.get('top_p'),
+                model=item.get('model'),
+                deadline=deadline,
+                **budget
+            )
+        if item_type in ('product', 'installation', 'parts'):
+            product_code = (item.get('product_code') or '').strip()
+            if not product_code:
+                raise ValueError(f"'{item_type}' items require product_code")
+            method = {
+                'product': self.get_product_info,
+                'installation': self.get_installation_guide,
+                'parts': self.get_parts_info
+            }[item_type]
+            return lambda: method(product_code, deadline=deadline, **budget)
+        if item_type == 'compare':
+            return lambda: self.compare_products(
+                item.get('products') or [],
+                mode=item.get('mode', 'single'),
+                deadline=deadline,
+                **budget
+            )
+        if item_type == 'search':
+            if not item.get('category') or not item.get('features'):
+                raise ValueError("'search' items require category and features")
+            return lambda: self.search_by_features(item['category'], item['features'], deadline=deadline, **budget)
+        raise ValueError(f"Unknown batch item type: {item_type}")
 
 
 def main():
@@ -0,0 +1,413 @@
+"""
+Query log capture and offline workload analysis
+
+Each API request that asked something is appended as one compact JSON line
+(normalized query, route, model, latency, token counts and cache outcome) by
+a background thread, so requests only pay for putting a dict on a queue.
+Files rotate by size and only the newest are kept. The analyzer reads them
+back and reports what the traffic looks like, including the hit rate a
+response cache of a given size and TTL would get and the most requested
+product codes, written in the format warmup.py --codes-file reads.
+
+Usage:
+    python query_log.py                                   # analyze QUERY_LOG_DIR
+    python query_log.py /var/log/flusso --cache-size 1000 5000 --ttl 3600 86400
+    python query_log.py --codes-out hot_skus.txt --codes-top 200 && python warmup.py --codes-file hot_skus.txt
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import queue
+import atexit
+import logging
+import argparse
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from product_codes import extract_product_codes
+from response_cache import normalize_query
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Log file names sort by the time they were started: queries-20260101-120000123-<pid>.jsonl
+FILE_PREFIX = 'queries-'
+FILE_PATTERN = 'queries-*.jsonl*'
+
+# Frequency buckets of the distribution report (times a normalized query was asked)
+FREQUENCY_BUCKETS = ((1, 1), (2, 4), (5, 19), (20, 99), (100, None))
+
+
+class QueryLog:
+    """
+    Append-only, size-rotated JSONL log written by a background thread
+
+    Every process writes its own files, so gunicorn workers never interleave
+    lines or race on rotation, and the writer thread is started in each
+    process on first use (after the fork when the app is preloaded). When the
+    queue is full, records are dropped and counted rather than slowing down
+    requests.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_files: int = 20,
+        queue_size: int = 10000,
+        max_query_chars: int = 500
+    ):
+        """
+        Initialize the query log
+
+        Args:
+            directory: Directory holding the log files
+            max_bytes: Start a new file once the current one reaches this size
+            max_files: Log files kept in the directory (oldest are deleted;
+                keep it above the number of worker processes)
+            queue_size: Records waiting for the writer before new ones are dropped
+            max_query_chars: Longest normalized query kept in a record
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.queue_size = queue_size
+        self.max_query_chars = max_query_chars
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._handle = None
+        self._path = None
+        self._size = 0
+        self.written = 0
+        self.dropped = 0
+
+    def append(self, record: Dict) -> None:
+        """
+        Queue a record for writing (never blocks)
+
+        Args:
+            record: Request record; 'q' holds the raw query and is normalized by the writer
+        """
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        """Start this process's writer thread"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._handle = None
+            self._path = None
+            self._size = 0
+            self.written = 0
+            self.dropped = 0
+            self._thread = threading.Thread(target=self._run, name='query-log', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        """Write queued records in batches until close() sends None"""
+        while True:
+            records = [self._queue.get()]
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            self._write([record for record in records if record is not None])
+            if stop:
+                if self._handle is not None:
+                    self._handle.close()
+                    self._handle = None
+                return
+
+    def _write(self, records: List[Dict]) -> None:
+        """Append records to the current file, rotating it when full"""
+        if not records:
+            return
+        lines = b''.join(dumps(self._compact(record)) + b'\n' for record in records)
+        try:
+            if self._handle is None or (self._size and self._size + len(lines) > self.max_bytes):
+                self._rotate()
+            self._handle.write(lines)
+            self._handle.flush()
+            self._size += len(lines)
+            self.written += len(records)
+        except OSError as e:
+            logger.warning(f"Query log write failed: {e}")
+            self.dropped += len(records)
+
+    def _compact(self, record: Dict) -> Dict:
+        """Normalize and clip the query of a record"""
+        if record.get('q'):
+            record['q'] = normalize_query(record['q'])[:self.max_query_chars]
+        return record
+
+    def _rotate(self) -> None:
+        """Close the current file, open a new one and delete the oldest files over max_files"""
+        if self._handle is not None:
+            self._handle.close()
+        now = time.time()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        self._path = os.path.join(self.directory, f"{FILE_PREFIX}{stamp}-{os.getpid()}.jsonl")
+        self._handle = open(self._path, 'ab')
+        self._size = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, FILE_PATTERN)))[:-self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Write what is queued and stop this process's writer"""
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        """Return this process's writer counters"""
+        return {
+            'directory': self.directory,
+            'file': os.path.basename(self._path) if self._path else None,
+            'written': self.written,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize() if self._queue is not None else 0
+        }
+
+
+def log_files(paths: Iterable[str]) -> List[str]:
+    """Expand directories to their log files (in time order) and keep plain files as given"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, FILE_PATTERN))))
+        else:
+            files.append(path)
+    return files
+
+
+def read_records(paths: Iterable[str], since: Optional[float] = None) -> Iterator[Dict]:
+    """
+    Read query log records
+
+    Args:
+        paths: Log files (.jsonl, or .jsonl.gz once compressed) or directories of them
+        since: Skip records older than this Unix time
+
+    Yields:
+        Record dictionaries; unreadable lines are skipped
+    """
+    for path in log_files(paths):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and (since is None or record.get('ts', 0) >= since):
+                    yield record
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def project_hit_rate(requests: List[tuple], size: int, ttl_seconds: float) -> float:
+    """
+    Replay requests through a simulated response cache
+
+    The simulation follows ResponseCache: an answer is stored on a miss,
+    expires ttl_seconds after it was stored, and the least recently used
+    entry is evicted beyond size entries.
+
+    Args:
+        requests: (timestamp, key) tuples in time order
+        size: Cache entries
+        ttl_seconds: Entry lifetime
+
+    Returns:
+        Share of requests that would have been cache hits
+    """
+    cache = OrderedDict()
+    hits = 0
+    for ts, key in requests:
+        stored = cache.get(key)
+        if stored is not None and ts - stored < ttl_seconds:
+            hits += 1
+        else:
+            cache[key] = ts
+            if len(cache) > size:
+                cache.popitem(last=False)
+        cache.move_to_end(key)
+    return hits / len(requests) if requests else 0.0
+
+
+def analyze(
+    records: Iterable[Dict],
+    cache_sizes: Iterable[int] = (1000,),
+    ttls: Iterable[float] = (3600,),
+    top: int = 20
+) -> Dict:
+    """
+    Summarize a query log
+
+    Args:
+        records: Query log records
+        cache_sizes: Cache sizes to project hit rates for
+        ttls: Cache TTLs in seconds to project hit rates for
+        top: Length of the top query and product code lists
+
+    Returns:
+        Report dictionary (see the README's Query Log section); 'code_counts'
+        holds every product code with its request count, most requested first
+    """
+    total = 0
+    first = last = None
+    latencies = defaultdict(list)
+    outcomes = Counter()
+    models = Counter()
+    tokens = Counter()
+    query_counts = Counter()
+    code_counts = Counter()
+    cacheable = []
+    for record in records:
+        total += 1
+        ts = record.get('ts', 0)
+        first = ts if first is None else min(first, ts)
+        last = ts if last is None else max(last, ts)
+        route = record.get('route') or 'unknown'
+        if record.get('ms') is not None:
+            latencies[route].append(record['ms'])
+        outcomes[record.get('cache') or 'none'] += 1
+        models[record.get('model') or 'none'] += 1
+        tokens.update(record.get('tokens') or {})
+        query = record.get('q')
+        if not query:
+            continue
+        query_counts[query] += 1
+        code_counts.update(extract_product_codes(query))
+        # Answers the response cache could have served: successful ones produced by the model
+        if record.get('status', 200) < 400 and record.get('cache') not in ('local', 'catalog', 'none'):
+            cacheable.append((ts, f"{record.get('model')}|{query}"))
+
+    asked = sum(query_counts.values())
+    ranked = [count for _, count in query_counts.most_common()]
+    distribution = {}
+    for low, high in FREQUENCY_BUCKETS:
+        counts = [count for count in ranked if count >= low and (high is None or count <= high)]
+        label = f"{low}+" if high is None else (str(low) if low == high else f"{low}-{high}")
+        distribution[label] = {'queries': len(counts), 'requests': sum(counts)}
+
+    cacheable.sort(key=lambda item: item[0])
+    return {
+        'records': total,
+        'span_hours': round(((last or 0) - (first or 0)) / 3600, 2),
+        'queries': {
+            'total': asked,
+            'unique': len(query_counts),
+            'duplicate_rate': round(1 - len(query_counts) / asked, 4) if asked else 0.0,
+            'top_share': {
+                str(n): round(sum(ranked[:n]) / asked, 4) if asked else 0.0 for n in (10, 100, 1000)
+            },
+            'distribution': distribution,
+            'top': [{'q': query, 'count': count} for query, count in query_counts.most_common(top)]
+        },
+        'codes': {
+            'distinct': len(code_counts),
+            'top': [{'code': code, 'count': count} for code, count in code_counts.most_common(top)]
+        },
+        'latency_ms': {
+            route: {
+                'count': len(values),
+                'p50': percentile(values, 0.5),
+                'p90': percentile(values, 0.9),
+                'p99': percentile(values, 0.99),
+                'mean': round(sum(values) / len(values), 1)
+            }
+            for route, values in sorted(latencies.items())
+            for values in [sorted(values)]
+        },
+        'cache_outcomes': {outcome: round(count / total, 4) for outcome, count in outcomes.most_common()},
+        'models': dict(models.most_common()),
+        'tokens': dict(tokens),
+        'projected_hit_rate': [
+            {'cache_size': size, 'ttl_seconds': ttl, 'hit_rate': round(project_hit_rate(cacheable, size, ttl), 4)}
+            for size in cache_sizes
+            for ttl in ttls
+        ],
+        'code_counts': code_counts.most_common()
+    }
+
+
+def write_codes_file(path: str, code_counts: List[tuple], top: Optional[int] = None) -> int:
+    """
+    Write the most requested product codes for warmup.py --codes-file
+
+    Args:
+        path: Output file; one "CODE count" line per product
+        code_counts: (code, count) pairs, most requested first
+        top: Keep only the N most requested codes
+
+    Returns:
+        Number of codes written
+    """
+    selected = code_counts[:top] if top else code_counts
+    with open(path, 'w', encoding='utf-8') as handle:
+        handle.write('# Product codes by request count (query_log.py)\n')
+        for code, count in selected:
+            handle.write(f"{code} {count}\n")
+    return len(selected)
+
+
+def main():
+    """Analyze query logs from the command line"""
+    parser = argparse.ArgumentParser(description='Analyze the Flusso query log')
+    parser.add_argument('paths', nargs='*', help='Log files or directories (default QUERY_LOG_DIR)')
+    parser.add_argument('--since-hours', type=float, help='Only records from the last N hours')
+    parser.add_argument('--cache-size', type=int, nargs='+', default=[1000], help='Cache sizes to project')
+    parser.add_argument('--ttl', type=float, nargs='+', default=[3600], help='Cache TTLs in seconds to project')
+    parser.add_argument('--top', type=int, default=20, help='Top queries and product codes listed')
+    parser.add_argument('--codes-out', help='Write product codes by request count here (for warmup.py)')
+    parser.add_argument('--codes-top', type=int, default=200, help='Codes written to --codes-out')
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        from config import QUERY_LOG_DIR
+        paths = [QUERY_LOG_DIR]
+    if not log_files(paths):
+        print(f"Error: no query log files in {', '.join(paths)}")
+        sys.exit(1)
+
+    since = time.time() - args.since_hours * 3600 if args.since_hours else None
+    report = analyze(read_records(paths, since), args.cache_size, args.ttl, args.top)
+    code_counts = report.pop('code_counts')
+    if args.codes_out:
+        report['codes']['written'] = write_codes_file(args.codes_out, code_counts, args.codes_top)
+        report['codes']['file'] = args.codes_out
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Retries and circuit breaking around Gemini calls
+Transient upstream errors are retried with jittered exponential backoff inside the
+request deadline; repeated failures open a breaker that fails fast until a probe succeeds
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+from google.genai import errors
+
+from admission import AdmissionRejected
+from deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Error classes worth retrying and counting against the breaker
+TRANSIENT_ERRORS = ('rate_limited', 'unavailable', 'network')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the circuit breaker is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini API temporarily unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Classify an upstream failure
+
+    Args:
+        error: Exception raised by a Gemini call
+
+    Returns:
+        'deadline_exceeded', 'circuit_open', 'overloaded' (no admission slot),
+        'rate_limited' (429),
+        'unavailable' (5xx), 'network' (connection problems or timeouts without a
+        deadline), 'client_error' (other 4xx) or 'upstream_error'
+    """
+    if isinstance(error, DeadlineExceeded):
+        return 'deadline_exceeded'
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, AdmissionRejected):
+        return 'overloaded'
+    if isinstance(error, errors.APIError):
+        if error.code == 429:
+            return 'rate_limited'
+        if error.code in (500, 502, 503, 504):
+            return 'unavailable'
+        if 400 <= error.code < 500:
+            return 'client_error'
+        return 'upstream_error'
+    if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return 'network'
+    return 'upstream_error'
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker
+
+    The breaker opens after failure_threshold consecutive transient failures.
+    While open every call fails fast. After reset_timeout one probe call is let
+    through (half-open): success closes the breaker, failure opens it again.
+    A probe that is abandoned (cancelled, or its stream closed by the client)
+    counts as a failure, and one that reports nothing for reset_timeout
+    gives way to a new probe, so the breaker cannot stay half-open for good.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the breaker
+
+        Args:
+            failure_threshold: Consecutive transient failures that open the breaker
+            reset_timeout: Seconds to stay open before letting a probe through
+        """
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self) -> None:
+        """
+        Check whether a call may go upstream
+
+        Raises:
+            CircuitOpenError: While the breaker is open, or while a half-open probe is running
+        """
+        with self._lock:
+            if self.state == 'open':
+                waited = time.monotonic() - self._opened_at
+                if waited < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.reset_timeout - waited)
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open':
+                if self._probing and time.monotonic() - self._probe_started < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(1.0)
+                self._probing = True
+                self._probe_started = time.monotonic()
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call"""
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("✓ Gemini API recovered, circuit breaker closed")
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error: BaseException) -> None:
+        """Count a failed call; only transient upstream errors move the breaker"""
+        if classify_error(error) not in TRANSIENT_ERRORS:
+            with self._lock:
+                self._probing = False
+            return
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"Circuit breaker opened after {self._failures} failures: {error}")
+                    self.opened += 1
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def record_abandoned(self) -> None:
+        """
+        Count a call given up before it finished (a cancelled task, a stream closed by its client)
+
+        Outside a probe this says nothing about the upstream and is ignored;
+        an abandoned probe opens the breaker again like a failed one.
+        """
+        with self._lock:
+            if self.state != 'half_open' or not self._probing:
+                return
+            self._probing = False
+            logger.warning("Circuit breaker probe abandoned, breaker opened again")
+            self.state = 'open'
+            self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 when not open)"""
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def stats(self) -> Dict:
+        """Return breaker state and counters"""
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'retry_after': round(self.retry_after(), 1),
+            'opened': self.opened,
+            'rejected': self.rejected
+        }
+
+
+class RetryPolicy:
+    """
+    Retry transient upstream errors with exponential backoff and full jitter
+
+    Each attempt goes through the circuit breaker when one is given. A retry
+    is only made when its backoff fits inside the remaining deadline.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Initialize the policy
+
+        Args:
+            max_attempts: Attempts per call, including the first
+            base_delay: Backoff ceiling before the first retry, in seconds
+            max_delay: Largest backoff ceiling
+            breaker: Optional circuit breaker consulted before every attempt
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self._rng = random.Random()
+
+        self.retries = 0
+        self.gave_up = 0
+
+    def call(self, fn: Callable[[], Any], deadline: Optional[Deadline] = None) -> Any:
+        """
+        Run a blocking call with retries
+
+        Raises:
+            The last error when it is not transient, attempts run out or the deadline is too close
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = fn()
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure(e)
+                backoff = self._backoff(e, attempt, deadline)
+                if backoff is None:
+                    raise
+                time.sleep(backoff)
+                continue
+            except BaseException:
+                # Cancelled or interrupted: release a half-open probe slot
+                if self.breaker is not None:
+                    self.breaker.record_abandoned()
+                raise
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], deadline: Optional[Deadline] = None) -> Any:
+        """Await a call with retries (same rules as call())"""
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = await fn()
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure(e)
+                backoff = self._backoff(e, attempt, deadline)
+                if backoff is None:
+                    raise
+                await asyncio.sleep(backoff)
+                continue
+            except BaseException:
+                # Cancelled or interrupted: release a half-open probe slot
+                if self.breaker is not None:
+                    self.breaker.record_abandoned()
+                raise
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def _backoff(self, error: Exception, attempt: int, deadline: Optional[Deadline]) -> Optional[float]:
+        """Return the sleep before the next attempt, or None to give up"""
+        error_class = classify_error(error)
+        if error_class not in TRANSIENT_ERRORS:
+            return None
+        if attempt >= self.max_attempts:
+            self.gave_up += 1
+            return None
+        backoff = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if deadline is not None and deadline.remaining() <= backoff:
+            self.gave_up += 1
+            return None
+        self.retries += 1
+        logger.warning(f"Gemini call failed ({error_class}), retry {attempt} in {backoff:.2f}s: {error}")
+        return backoff
+
+    def stats(self) -> Dict:
+        """Return retry counters"""
+        return {
+            'max_attempts': self.max_attempts,
+            'retries': self.retries,
+            'gave_up': self.gave_up
+        }
@@ -0,0 +1,188 @@
+"""
+Shared response cache for the Flusso query engine
+SQLite-backed so every gunicorn worker on the host reads and fills the same cache
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text for cache keys (case, whitespace, trailing punctuation)"""
+    return " ".join(text.lower().split()).rstrip("?.! ")
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache for query results stored in a local SQLite database
+
+    WAL mode lets several processes read concurrently while one writes, so the
+    workers started by start_server.sh share hits without any extra service.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000, ttl_seconds: float = 3600):
+        """
+        Initialize the cache
+
+        Args:
+            path: SQLite database file (created if missing)
+            max_entries: Maximum number of cached responses before LRU eviction
+            ttl_seconds: Seconds a cached response stays fresh
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if ttl_seconds <= 0:
+            raise ValueError("ttl_seconds must be positive")
+
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        conn.commit()
+
+        logger.info(f"✓ Response cache ready: {path} (max {max_entries} entries, TTL {ttl_seconds}s)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return a connection for the current thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(user_query: str, **params) -> str:
+        """
+        Build a cache key from the normalized query and generation parameters
+
+        Args:
+            user_query: The user's question
+            **params: Model and sampling parameters that affect the answer
+
+        Returns:
+            Hex digest identifying the request
+        """
+        payload = json.dumps(
+            {'query': normalize_query(user_query), 'params': params},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Dict]:
+        """
+        Look up a fresh cached response
+
+        Args:
+            key: Cache key from make_key()
+            allow_stale: Also return an expired entry that has not been evicted yet
+                (used to answer while the upstream is failing)
+
+        Returns:
+            Cached value with a '_cache_age' field (seconds), or None on miss
+        """
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, created_at, expires_at FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None or (row[2] <= now and not allow_stale):
+                if not allow_stale:
+                    self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache read failed: {e}")
+            self.misses += 1
+            return None
+
+        if row[2] <= now:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        value = json.loads(row[0])
+        value['_cache_age'] = round(now - row[1], 3)
+        return value
+
+    def set(self, key: str, value: Dict) -> None:
+        """
+        Store a response and evict least-recently-used entries over the size limit
+
+        Args:
+            key: Cache key from make_key()
+            value: JSON-serializable response dictionary
+        """
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value), now, now + self.ttl_seconds, now)
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access ASC "
+                "LIMIT MAX(0, (SELECT COUNT(*) FROM responses) - ?))",
+                (self.max_entries,)
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def clear(self) -> None:
+        """Remove every cached response"""
+        conn = self._connection()
+        conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict:
+        """Return cache size and this process's hit/miss counters"""
+        try:
+            size = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        lookups = self.hits + self.misses
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'stale_hits': self.stale_hits
+        }
@@ -0,0 +1,80 @@
+"""
+JSON encoding, compression and lean mode for API responses
+Shared by the Flask and ASGI servers; uses orjson and brotli when they are installed
+"""
+import json
+import gzip
+from typing import Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # Standard-library encoder
+    orjson = None
+
+from static_assets import brotli, parse_accept_encoding
+
+JSON_ENCODER = 'orjson' if orjson is not None else 'json'
+
+# Dynamic bodies are compressed per response, so the levels trade a little size for speed
+# (see benchmarks/bench_json.py): on answer-sized bodies brotli 5 is ~6% smaller than gzip 6 for
+# ~0.1ms more, on large batches it is faster; higher levels cost far more than they save
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+# Metadata fields kept in lean mode (everything else in it is an echo of the request or diagnostics)
+LEAN_METADATA_FIELDS = ('model', 'cached', 'truncated')
+
+
+def dumps(obj) -> bytes:
+    """Serialize to compact UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # Types orjson does not know (and >64-bit ints): the standard encoder handles them with str()
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def compress(body: bytes, accept_encoding: Optional[str], min_bytes: int = 1024) -> Tuple[bytes, Optional[str]]:
+    """
+    Compress a response body with the best encoding the client accepts
+
+    Args:
+        body: Encoded response body
+        accept_encoding: Accept-Encoding request header
+        min_bytes: Smaller bodies are sent as they are
+
+    Returns:
+        (body, content coding), the coding being None when the body was left uncompressed
+    """
+    if len(body) < min_bytes or not accept_encoding:
+        return body, None
+    accepted = parse_accept_encoding(accept_encoding)
+    default = accepted.get('*', 0)
+    if brotli is not None and accepted.get('br', default) > 0:
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if accepted.get('gzip', default) > 0:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+    return body, None
+
+
+def wants_lean(prefer: Optional[str], flag=None) -> bool:
+    """
+    Whether the caller asked for lean responses
+
+    Args:
+        prefer: Prefer request header ("return=minimal" asks for lean responses)
+        flag: "lean" from the JSON body or query string (true/"true"/"1")
+    """
+    if flag is not None:
+        return flag is True or str(flag).lower() in ('true', '1')
+    return bool(prefer) and 'return=minimal' in prefer.replace(' ', '').lower()
+
+
+def lean_result(result: Dict) -> Dict:
+    """Drop the echoed query and all metadata but the model, cache and truncation flags from a result"""
+    lean = {key: value for key, value in result.items() if key not in ('query', 'metadata')}
+    metadata = result.get('metadata')
+    if metadata:
+        lean['metadata'] = {key: metadata[key] for key in LEAN_METADATA_FIELDS if key in metadata}
+    return lean
@@ -0,0 +1,248 @@
+"""
+Near-duplicate query cache for the Flusso query engine
+Matches paraphrased questions with MinHash signatures and LSH banding
+"""
+import re
+import copy
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from product_codes import PRODUCT_CODE_PATTERN, extract_product_codes
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_EMPTY_TOKEN = '<empty>'
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Words that carry no meaning for matching product questions
+STOPWORDS = frozenset("""
+a about all also an and any are as at available be can come comes could do does
+for from give have how i in info information is it its list me more my of on or
+please product products provide show tell than that the there these this to us
+what whats which with you your
+""".split())
+
+
+def stem(word: str) -> str:
+    """Very light plural stemming so 'finishes' and 'finish' share a token"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def query_tokens(text: str) -> FrozenSet[str]:
+    """
+    Reduce a query to its content words, excluding product codes
+
+    Args:
+        text: The user's question
+
+    Returns:
+        Set of stemmed content tokens (a sentinel token when nothing is left)
+    """
+    without_codes = PRODUCT_CODE_PATTERN.sub(' ', text).lower()
+    tokens = frozenset(
+        stem(word) for word in _WORD_PATTERN.findall(without_codes)
+        if word not in STOPWORDS
+    )
+    return tokens or frozenset([_EMPTY_TOKEN])
+
+
+class SemanticCache:
+    """
+    In-process near-duplicate cache keyed on query content words
+
+    Entries are bucketed by generation parameters and the exact set of product
+    codes in the query, so a paraphrase can never return another SKU's answer.
+    Within a bucket, LSH bands over MinHash signatures find candidates and the
+    exact Jaccard similarity of the token sets decides the match.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_entries: int = 10000,
+        ttl_seconds: float = 3600,
+        num_perm: int = 64,
+        bands: int = 16
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            threshold: Minimum Jaccard similarity (0.0-1.0) for a match
+            max_entries: Maximum cached answers before LRU eviction
+            ttl_seconds: Seconds an answer stays fresh
+            num_perm: MinHash signature length
+            bands: Number of LSH bands (must divide num_perm)
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be between 0.0 and 1.0")
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = random.Random(1)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._buckets: Dict[Tuple, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    def _signature(self, tokens: FrozenSet[str]) -> List[int]:
+        """Compute the MinHash signature of a token set"""
+        hashes = [
+            int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'little')
+            for token in tokens
+        ]
+        return [
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+            for a, b in self._perms
+        ]
+
+    def _bucket_keys(self, namespace: str, signature: List[int]) -> List[Tuple]:
+        """Split a signature into one bucket key per LSH band"""
+        rows = self.rows
+        return [
+            (namespace, band, hash(tuple(signature[band * rows:(band + 1) * rows])))
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def _namespace(user_query: str, params: Dict) -> str:
+        """Namespace entries by generation parameters and exact product codes"""
+        return json.dumps(
+            {'params': params, 'codes': extract_product_codes(user_query)},
+            sort_keys=True,
+            default=str
+        )
+
+    def lookup(self, user_query: str, params: Dict) -> Optional[Tuple[Dict, float, str]]:
+        """
+        Find a cached answer for a near-duplicate query
+
+        Args:
+            user_query: The user's question
+            params: Generation parameters the answer must have been produced with
+
+        Returns:
+            Tuple of (answer copy with '_cache_age', similarity, matched query), or None
+        """
+        started = time.perf_counter()
+        tokens = query_tokens(user_query)
+        bucket_keys = self._bucket_keys(self._namespace(user_query, params), self._signature(tokens))
+        now = time.time()
+
+        best = None
+        with self._lock:
+            seen = set()
+            for key in bucket_keys:
+                for entry_id in self._buckets.get(key, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    entry = self._entries[entry_id]
+                    if entry['expires_at'] <= now:
+                        continue
+                    similarity = len(tokens & entry['tokens']) / len(tokens | entry['tokens'])
+                    if similarity >= self.threshold and (best is None or similarity > best[1]):
+                        best = (entry_id, similarity)
+
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(best[0])
+                entry = self._entries[best[0]]
+                value = copy.deepcopy(entry['value'])
+                value['_cache_age'] = round(now - entry['created_at'], 3)
+                match = (value, round(best[1], 4), entry['query'])
+            self.lookup_seconds += time.perf_counter() - started
+
+        return None if best is None else match
+
+    def add(self, user_query: str, params: Dict, value: Dict) -> None:
+        """
+        Cache an answer for later near-duplicate lookups
+
+        Args:
+            user_query: The question that produced the answer
+            params: Generation parameters used
+            value: JSON-serializable response dictionary
+        """
+        tokens = query_tokens(user_query)
+        bucket_keys = self._bucket_keys(self._namespace(user_query, params), self._signature(tokens))
+        now = time.time()
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                'query': user_query,
+                'tokens': tokens,
+                'bucket_keys': bucket_keys,
+                'value': copy.deepcopy(value),
+                'created_at': now,
+                'expires_at': now + self.ttl_seconds
+            }
+            for key in bucket_keys:
+                self._buckets.setdefault(key, []).append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        """Drop the least recently used entry (caller holds the lock)"""
+        entry_id, entry = self._entries.popitem(last=False)
+        for key in entry['bucket_keys']:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def clear(self) -> None:
+        """Remove every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict:
+        """Return entry count, hit/miss counters and mean lookup cost"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'mean_lookup_ms': round(self.lookup_seconds / lookups * 1000, 4) if lookups else 0.0
+        }
@@ -0,0 +1,650 @@
+"""
+Server-side conversation sessions for multi-turn queries
+SQLite-backed so every gunicorn worker on the host continues the same conversations, with history kept within a token budget
+"""
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from product_codes import extract_product_codes
+
+logger = logging.getLogger(__name__)
+
+# Client-chosen session ids: letters, digits, '-' and '_'
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+# Smallest prefix Gemini accepts for an explicit context cache, per model (tokens)
+MIN_CACHE_TOKENS = {'gemini-2.5-flash': 1024, 'gemini-2.5-pro': 4096}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+
+# How much of the folded turns the summary keeps
+SUMMARY_QUESTIONS = 6
+SUMMARY_QUESTION_CHARS = 200
+SUMMARY_CODES = 24
+
+SUMMARY_ACK = "Understood. I will use this context for the follow-up questions."
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _content(role: str, text: str) -> types.Content:
+    """One conversation turn in request form"""
+    return types.Content(role=role, parts=[types.Part(text=text)])
+
+
+def _summary_text(summary: Dict) -> str:
+    """Render the folded-turns summary as the first message of the history"""
+    questions = '; '.join(f'"{question}"' for question in summary['questions'])
+    text = (
+        f"Summary of the earlier conversation ({summary['turns']} turns not shown). "
+        f"Most recent of those questions: {questions}."
+    )
+    if summary['codes']:
+        text += f" Products discussed: {', '.join(summary['codes'])}."
+    return text
+
+
+class SessionTurn:
+    """One question asked within a session, with the request contents prepared for it"""
+
+    def __init__(
+        self,
+        session_id: str,
+        question: str,
+        contents: List[types.Content],
+        cached_content: Optional[str],
+        history_turns: int,
+        history_tokens: int,
+        sent_tokens: int
+    ):
+        self.session_id = session_id
+        self.question = question
+        self.contents = contents
+        self.cached_content = cached_content
+        self.history_turns = history_turns
+        self.history_tokens = history_tokens
+        self.sent_tokens = sent_tokens
+
+
+class SessionStore:
+    """
+    Conversation histories stored in a local SQLite database
+
+    A session keeps its recent turns verbatim and folds older ones into a
+    short summary (their last questions and the product codes they mention)
+    whenever the history would exceed history_token_budget, so each session
+    costs a bounded amount of storage and prompt. Questions and answers are
+    clipped to max_answer_tokens before they are stored. Sessions idle for
+    longer than idle_ttl_seconds are deleted, and the least recently used ones
+    go when there are more than max_sessions. The row also records the explicit
+    prefix cache covering the first turns of the history (see
+    SessionPrefixCache); folding changes the prefix and drops it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        history_token_budget: int = 4000,
+        max_answer_tokens: int = 1500,
+        idle_ttl_seconds: float = 1800,
+        max_sessions: int = 10000
+    ):
+        """
+        Initialize the store
+
+        Args:
+            path: SQLite database file (created if missing)
+            history_token_budget: Most tokens of history (summary and turns) sent with a question
+            max_answer_tokens: Stored questions and answers are clipped to this many tokens
+            idle_ttl_seconds: Sessions unused for this long are evicted
+            max_sessions: Least recently used sessions are evicted above this count
+        """
+        if max_answer_tokens * 2 > history_token_budget:
+            raise ValueError("history_token_budget must hold at least two clipped answers")
+        if idle_ttl_seconds <= 0:
+            raise ValueError("idle_ttl_seconds must be positive")
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+
+        self.path = path
+        self.history_token_budget = history_token_budget
+        self.max_answer_tokens = max_answer_tokens
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+
+        self.turns_recorded = 0
+        self.turns_folded = 0
+        self.prefix_cache_turns = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                summary TEXT,
+                turns TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                cache_name TEXT,
+                cache_model TEXT,
+                cache_file_search INTEGER,
+                cache_turns INTEGER,
+                cache_expires_at REAL,
+                cache_pending_until REAL
+            )"""
+        )
+        self._connection().execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+
+        logger.info(
+            f"✓ Session store ready: {path} ({history_token_budget} history tokens, "
+            f"idle TTL {idle_ttl_seconds:g}s, max {max_sessions} sessions)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return a connection for the current thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _load(self, conn: sqlite3.Connection, session_id: str) -> Optional[Dict]:
+        """Read a live session row (None when missing or idle past the TTL)"""
+        row = conn.execute(
+            "SELECT summary, turns, tokens, created_at, last_access, cache_name, cache_model, "
+            "cache_file_search, cache_turns, cache_expires_at, cache_pending_until FROM sessions WHERE id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None or row[4] < time.time() - self.idle_ttl_seconds:
+            return None
+        return {
+            'summary': json.loads(row[0]) if row[0] else None,
+            'turns': json.loads(row[1]),
+            'tokens': row[2],
+            'created_at': row[3],
+            'last_access': row[4],
+            'cache_name': row[5],
+            'cache_model': row[6],
+            'cache_file_search': bool(row[7]),
+            'cache_turns': row[8] or 0,
+            'cache_expires_at': row[9] or 0.0,
+            'cache_pending_until': row[10] or 0.0
+        }
+
+    @staticmethod
+    def _history(session: Optional[Dict], start: int = 0) -> List[types.Content]:
+        """Request contents for the history from turn `start` (the summary leads when start is 0)"""
+        if session is None:
+            return []
+        contents = []
+        if start == 0 and session['summary']:
+            contents += [_content('user', _summary_text(session['summary'])), _content('model', SUMMARY_ACK)]
+        for question, answer, _ in session['turns'][start:]:
+            contents += [_content('user', question), _content('model', answer)]
+        return contents
+
+    def create(self) -> str:
+        """Start an empty session and return its id"""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO sessions (id, turns, tokens, created_at, last_access) VALUES (?, '[]', 0, ?, ?)",
+            (session_id, now, now)
+        )
+        return session_id
+
+    def has_history(self, session_id: str) -> bool:
+        """Whether a live session has earlier turns (or a summary of them) for the next question to depend on"""
+        try:
+            session = self._load(self._connection(), session_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Session read failed, answering without history: {e}")
+            return False
+        return session is not None and bool(session['turns'] or session['summary'])
+
+    def opening_turn(self, session_id: str, question: str) -> SessionTurn:
+        """The first question of a session, answered without history (see record())"""
+        return SessionTurn(
+            session_id=session_id,
+            question=question,
+            contents=[_content('user', question)],
+            cached_content=None,
+            history_turns=0,
+            history_tokens=0,
+            sent_tokens=0
+        )
+
+    def prepare(self, session_id: str, question: str, model: str, file_search: bool = True) -> SessionTurn:
+        """
+        Build the request contents for the next question of a session
+
+        When the session's prefix cache matches the model and tool setup, only
+        the turns after it are sent; otherwise the whole (budgeted) history is.
+
+        Args:
+            session_id: Session to continue (an unknown or expired id starts a new one)
+            question: The user's question
+            model: Model that will answer
+            file_search: Whether the call uses the File Search tool
+
+        Returns:
+            The prepared turn
+        """
+        try:
+            session = self._load(self._connection(), session_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Session read failed, answering without history: {e}")
+            session = None
+
+        start, cached_content = 0, None
+        if session is not None and session['cache_name'] and session['cache_model'] == model \
+                and session['cache_file_search'] == file_search and session['cache_expires_at'] > time.time() + 30:
+            start, cached_content = session['cache_turns'], session['cache_name']
+            self.prefix_cache_turns += 1
+
+        contents = self._history(session, start) + [_content('user', question)]
+        turns = session['turns'] if session else []
+        return SessionTurn(
+            session_id=session_id,
+            question=question,
+            contents=contents,
+            cached_content=cached_content,
+            history_turns=len(turns),
+            history_tokens=session['tokens'] if session else 0,
+            sent_tokens=sum(tokens for _, _, tokens in turns[start:])
+        )
+
+    def record(self, turn: SessionTurn, answer: str) -> Tuple[Dict, Optional[str]]:
+        """
+        Append an answered turn, folding old turns into the summary when over budget
+
+        Args:
+            turn: The turn from prepare()
+            answer: The model's answer
+
+        Returns:
+            (session metadata for the result, name of a prefix cache that was dropped or None)
+        """
+        question, answer = self._clip(turn.question), self._clip(answer)
+        now = time.time()
+        dropped_cache = None
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            session = self._load(conn, turn.session_id) or {
+                'summary': None, 'turns': [], 'tokens': 0, 'created_at': now, 'cache_name': None,
+                'cache_model': None, 'cache_file_search': False, 'cache_turns': 0,
+                'cache_expires_at': 0.0, 'cache_pending_until': 0.0
+            }
+            turns = session['turns'] + [[question, answer, estimate_tokens(question) + estimate_tokens(answer)]]
+            summary = session['summary']
+            folded = 0
+            while len(turns) > 1 and self._tokens(summary, turns) > self.history_token_budget:
+                summary = self._fold(summary, turns.pop(0))
+                folded += 1
+            if folded:
+                dropped_cache = session['cache_name']
+                session.update(cache_name=None, cache_model=None, cache_turns=0, cache_expires_at=0.0)
+
+            tokens = self._tokens(summary, turns)
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, summary, turns, tokens, created_at, last_access, cache_name, "
+                "cache_model, cache_file_search, cache_turns, cache_expires_at, cache_pending_until) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (turn.session_id, json.dumps(summary) if summary else None, json.dumps(turns), tokens,
+                 session['created_at'], now, session['cache_name'], session['cache_model'],
+                 int(session['cache_file_search']), session['cache_turns'], session['cache_expires_at'],
+                 session['cache_pending_until'])
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Session write failed: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            return {'id': turn.session_id, 'saved': False}, None
+
+        self.turns_recorded += 1
+        self.turns_folded += folded
+        return {
+            'id': turn.session_id,
+            'turns': (summary['turns'] if summary else 0) + len(turns),
+            'history_turns': turn.history_turns,
+            'history_tokens': turn.history_tokens,
+            'sent_history_tokens': turn.sent_tokens,
+            'prefix_cache': turn.cached_content is not None,
+            'summarized_turns': summary['turns'] if summary else 0
+        }, dropped_cache
+
+    def _clip(self, text: str) -> str:
+        """Clip a stored question or answer to max_answer_tokens"""
+        max_chars = self.max_answer_tokens * 4
+        return text if len(text) <= max_chars else text[:max_chars] + ' …'
+
+    @staticmethod
+    def _tokens(summary: Optional[Dict], turns: List) -> int:
+        """Tokens of history the next question would carry"""
+        summary_tokens = estimate_tokens(_summary_text(summary)) + estimate_tokens(SUMMARY_ACK) if summary else 0
+        return summary_tokens + sum(tokens for _, _, tokens in turns)
+
+    @staticmethod
+    def _fold(summary: Optional[Dict], turn: List) -> Dict:
+        """Fold one turn into the summary (its question and the product codes it mentions)"""
+        question, answer, _ = turn
+        summary = dict(summary or {'turns': 0, 'questions': [], 'codes': []})
+        summary['turns'] += 1
+        summary['questions'] = (summary['questions'] + [question[:SUMMARY_QUESTION_CHARS]])[-SUMMARY_QUESTIONS:]
+        codes = [code for code in summary['codes'] if code not in extract_product_codes(question + ' ' + answer)]
+        summary['codes'] = (codes + extract_product_codes(question + ' ' + answer))[-SUMMARY_CODES:]
+        return summary
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Delete idle sessions and the least recently used ones over max_sessions"""
+        conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.idle_ttl_seconds,))
+        conn.execute(
+            "DELETE FROM sessions WHERE id IN ("
+            "SELECT id FROM sessions ORDER BY last_access ASC "
+            "LIMIT MAX(0, (SELECT COUNT(*) FROM sessions) - ?))",
+            (self.max_sessions,)
+        )
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        Return a session's history
+
+        Returns:
+            Dictionary with the summary and turns, or None when there is no live session
+        """
+        session = self._load(self._connection(), session_id)
+        if session is None:
+            return None
+        return {
+            'id': session_id,
+            'summary': _summary_text(session['summary']) if session['summary'] else None,
+            'summarized_turns': session['summary']['turns'] if session['summary'] else 0,
+            'turns': [{'question': question, 'answer': answer} for question, answer, _ in session['turns']],
+            'history_tokens': session['tokens'],
+            'prefix_cache': session['cache_name'] is not None,
+            'idle_seconds': round(time.time() - session['last_access'], 1)
+        }
+
+    def delete(self, session_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        End a session
+
+        Returns:
+            (whether it existed, name of its prefix cache or None)
+        """
+        conn = self._connection()
+        row = conn.execute("SELECT cache_name FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        return row is not None, row[0] if row else None
+
+    def claim_prefix_cache(
+        self,
+        session_id: str,
+        model: str,
+        file_search: bool,
+        prefix_tokens: int,
+        min_new_tokens: int,
+        lease_seconds: float = 60
+    ) -> Optional[Tuple[List[types.Content], int, int]]:
+        """
+        Claim the creation of a new prefix cache covering a session's whole history
+
+        Only one worker wins the claim. A cache is due when the history not yet
+        covered by the current cache has reached min_new_tokens and the whole
+        prefix meets the model's minimum cacheable size.
+
+        Args:
+            session_id: Session whose history to cache
+            model: Model the cache is created for
+            file_search: Whether the cache includes the File Search tool
+            prefix_tokens: Tokens of the system instruction stored along with the history
+            min_new_tokens: Uncovered history needed before a cache is (re)created
+            lease_seconds: How long the claim blocks other workers
+
+        Returns:
+            (history contents, turns covered, summarized turns) to create the cache from, or None
+        """
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            session = self._load(conn, session_id)
+            if session is None or session['cache_pending_until'] > now:
+                conn.execute("COMMIT")
+                return None
+            current = session['cache_name'] and session['cache_model'] == model \
+                and session['cache_file_search'] == file_search and session['cache_expires_at'] > now + 60
+            covered = session['cache_turns'] if current else 0
+            uncovered = sum(tokens for _, _, tokens in session['turns'][covered:])
+            if not current and session['summary']:
+                uncovered += session['tokens'] - sum(tokens for _, _, tokens in session['turns'])
+            minimum = MIN_CACHE_TOKENS.get(model, DEFAULT_MIN_CACHE_TOKENS)
+            if uncovered < min_new_tokens or prefix_tokens + session['tokens'] < minimum:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE sessions SET cache_pending_until = ? WHERE id = ?", (now + lease_seconds, session_id))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Session prefix cache claim failed: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            return None
+        summarized = session['summary']['turns'] if session['summary'] else 0
+        return self._history(session), len(session['turns']), summarized
+
+    def set_prefix_cache(
+        self,
+        session_id: str,
+        name: Optional[str],
+        model: str,
+        file_search: bool,
+        turns: int,
+        summarized: int,
+        expires_at: float,
+        retry_seconds: float = 300
+    ) -> Optional[str]:
+        """
+        Store a newly created prefix cache, or back off after a failed creation (name None)
+
+        Args:
+            session_id: Session the cache was created for
+            name: Cached content name
+            model: Model of the cache
+            file_search: Whether the cache includes the File Search tool
+            turns: Turns the cache covers
+            summarized: Summarized turns when the history was read (the cache is
+                discarded if the history has been folded since)
+            expires_at: Expiry time of the cache
+            retry_seconds: Back-off before the next attempt when the creation failed
+
+        Returns:
+            Name of a cache that is no longer referenced and should be deleted (the replaced one,
+            or the new one when the session changed in the meantime), or None
+        """
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            session = self._load(conn, session_id)
+            current_summarized = session['summary']['turns'] if session and session['summary'] else 0
+            if session is None or current_summarized != summarized or len(session['turns']) < turns:
+                if session is not None:
+                    conn.execute("UPDATE sessions SET cache_pending_until = NULL WHERE id = ?", (session_id,))
+                conn.execute("COMMIT")
+                return name
+            if name is None:
+                conn.execute("UPDATE sessions SET cache_pending_until = ? WHERE id = ?", (now + retry_seconds, session_id))
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE sessions SET cache_name = ?, cache_model = ?, cache_file_search = ?, cache_turns = ?, "
+                "cache_expires_at = ?, cache_pending_until = NULL WHERE id = ?",
+                (name, model, int(file_search), turns, expires_at, session_id)
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Session prefix cache update failed: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            return name
+        return session['cache_name'] if session['cache_name'] != name else None
+
+    def stats(self) -> Dict:
+        """Return the live session count and this process's counters"""
+        try:
+            count = self._connection().execute(
+                "SELECT COUNT(*) FROM sessions WHERE last_access >= ?", (time.time() - self.idle_ttl_seconds,)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            count = None
+        return {
+            'sessions': count,
+            'max_sessions': self.max_sessions,
+            'idle_ttl_seconds': self.idle_ttl_seconds,
+            'history_token_budget': self.history_token_budget,
+            'turns_recorded': self.turns_recorded,
+            'turns_folded': self.turns_folded,
+            'prefix_cache_turns': self.prefix_cache_turns
+        }
+
+
+class SessionPrefixCache:
+    """
+    Explicit Gemini context caches holding a session's stable prefix
+
+    After a turn is recorded, a cache with the system instruction, the tools
+    and the session's history is created in a background thread once enough
+    uncovered history has accumulated. Later turns reference it through
+    cached_content and send only the turns after it plus the new question.
+    Caches live as long as an idle session (idle_ttl_seconds). Replaced or
+    orphaned ones are deleted after grace_seconds, so requests that were
+    already sent with them still find them.
+    """
+
+    def __init__(
+        self,
+        client_provider: Callable,
+        store: SessionStore,
+        store_id: str,
+        system_instruction: str,
+        min_new_tokens: int = 1024,
+        grace_seconds: float = 300
+    ):
+        """
+        Initialize the cache manager
+
+        Args:
+            client_provider: Returns the Gemini client (genai.Client) of the calling process
+            store: Session store recording which cache covers which turns
+            store_id: File Search store included in grounded caches
+            system_instruction: Instruction stored in every cache
+            min_new_tokens: Uncovered history needed before a cache is (re)created
+            grace_seconds: Delay before an unreferenced cache is deleted
+        """
+        self.client_provider = client_provider
+        self.store = store
+        self.store_id = store_id
+        self.system_instruction = system_instruction
+        self.min_new_tokens = min_new_tokens
+        self.grace_seconds = grace_seconds
+        self._instruction_tokens = estimate_tokens(system_instruction)
+
+        self.created = 0
+        self.failures = 0
+        self.deleted = 0
+
+    def after_turn(self, session_id: str, model: str, file_search: bool) -> None:
+        """Schedule a new prefix cache for a session if one is due"""
+        claim = self.store.claim_prefix_cache(
+            session_id, model, file_search, self._instruction_tokens, self.min_new_tokens
+        )
+        if claim is not None:
+            threading.Thread(
+                target=self._create, args=(session_id, model, file_search) + claim, daemon=True
+            ).start()
+
+    def _create(
+        self,
+        session_id: str,
+        model: str,
+        file_search: bool,
+        contents: List[types.Content],
+        turns: int,
+        summarized: int
+    ) -> None:
+        """Create the cache for a claimed session history"""
+        tools = None
+        if file_search:
+            tools = [types.Tool(file_search=types.FileSearch(file_search_store_names=[self.store_id]))]
+        name, expires_at = None, 0.0
+        try:
+            cached = self.client_provider().caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"flusso-session-{session_id[:24]}",
+                    system_instruction=self.system_instruction,
+                    tools=tools,
+                    contents=contents,
+                    ttl=f"{int(self.store.idle_ttl_seconds)}s"
+                )
+            )
+            name = cached.name
+            expires_at = cached.expire_time.timestamp() if cached.expire_time else time.time() + self.store.idle_ttl_seconds
+            self.created += 1
+            logger.info(f"✓ Session prefix cache ready for {session_id[:24]}: {turns} turns in {name}")
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Session prefix cache creation failed for {session_id[:24]}: {e}")
+        self.discard(self.store.set_prefix_cache(
+            session_id, name, model, file_search, turns, summarized, expires_at
+        ))
+
+    def discard(self, name: Optional[str]) -> None:
+        """Delete a cache that is no longer referenced, once the grace period is over"""
+        if name:
+            timer = threading.Timer(self.grace_seconds, self.delete, args=(name,))
+            timer.daemon = True
+            timer.start()
+
+    def delete(self, name: Optional[str]) -> None:
+        """Delete a cache that is no longer referenced (failures are left to its TTL)"""
+        if not name:
+            return
+        try:
+            self.client_provider().caches.delete(name=name)
+            self.deleted += 1
+        except Exception as e:
+            logger.info(f"Could not delete session prefix cache {name} (it expires on its own): {e}")
+
+    def stats(self) -> Dict:
+        """Return creation counters"""
+        return {
+            'created': self.created,
+            'failures': self.failures,
+            'deleted': self.deleted,
+            'min_new_tokens': self.min_new_tokens
+        }
@@ -0,0 +1,303 @@
+"""
+Request coalescing (single-flight) for identical in-flight queries
+Concurrent callers with the same key share one upstream call
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from deadline import Deadline
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-worker leases are unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight call that followers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _LeaderCancelled(Exception):
+    """Set on an async call whose leader was cancelled, so its followers retry instead of failing"""
+
+
+class _WorkerLease:
+    """
+    Advisory file lock that lets one worker on the host lead a key
+
+    Every key has its own lock file, so only identical requests ever wait
+    for each other. The holder removes the file before unlocking it, which
+    keeps the lock directory as small as the set of in-flight keys; a worker
+    that locked a file removed in the meantime retries on the current one.
+    """
+
+    def __init__(self, lock_dir: str, key: str):
+        self.path = os.path.join(lock_dir, f"flight-{key}.lock")
+        self._fd = None
+
+    def try_acquire(self) -> bool:
+        """Take the lease without blocking"""
+        while True:
+            fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(fd).st_ino:
+                self._fd = fd
+                return True
+            # The previous holder removed this file after it was opened
+            os.close(fd)
+
+    def release(self) -> None:
+        """Give the lease back"""
+        if self._fd is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution
+
+    Within a process, the first caller for a key (the leader) runs the call
+    and every concurrent caller with that key waits for its result. When a
+    lock directory is configured, leaders in different workers also take a
+    file lease. A worker that finds the lease taken waits for it (up to
+    lease_seconds, or less when the request's deadline is nearer), then
+    re-checks the shared cache before calling upstream.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, lease_seconds: float = 60.0):
+        """
+        Initialize the coalescer
+
+        Args:
+            lock_dir: Directory for cross-worker lease files (None = this process only)
+            lease_seconds: Longest time to wait for another worker's lease
+        """
+        if lock_dir and fcntl is None:
+            logger.warning("Cross-worker coalescing needs fcntl; using in-process coalescing only")
+            lock_dir = None
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+        self.lock_dir = lock_dir
+        self.lease_seconds = lease_seconds
+        self._calls: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.cross_worker_waits = 0
+        self.cross_worker_hits = 0
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        recheck: Optional[Callable[[], Any]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: Hex digest identifying the request (e.g. a response cache key)
+            fn: The upstream call
+            recheck: Returns a result produced by another worker, or None
+            deadline: Request deadline, which also bounds the wait for another worker's lease
+
+        Returns:
+            Tuple of (result, shared) where shared is True when this caller
+            did not run fn itself
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            if not call.event.wait(self._follow_timeout(deadline)):
+                # Out of time waiting for the leader: fn fails fast on the expired deadline
+                return fn(), False
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._lead(key, fn, recheck, deadline)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _lead(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        recheck: Optional[Callable[[], Any]],
+        deadline: Optional[Deadline]
+    ) -> Tuple[Any, bool]:
+        """Run the call as this process's leader, holding the worker lease if configured"""
+        if not self.lock_dir:
+            return fn(), False
+
+        lease = _WorkerLease(self.lock_dir, key)
+        waited = False
+        wait_until = self._lease_wait_until(deadline)
+        while not lease.try_acquire():
+            waited = True
+            if time.monotonic() >= wait_until:
+                logger.warning("Timed out waiting for another worker's lease; calling upstream")
+                return fn(), False
+            time.sleep(0.05)
+
+        try:
+            if waited:
+                self.cross_worker_waits += 1
+                if recheck is not None:
+                    result = recheck()
+                    if result is not None:
+                        self.cross_worker_hits += 1
+                        return result, True
+            return fn(), False
+        finally:
+            lease.release()
+
+    @staticmethod
+    def _follow_timeout(deadline: Optional[Deadline]) -> Optional[float]:
+        """Longest time a follower waits for its leader (None = no deadline)"""
+        return None if deadline is None else max(0.0, deadline.remaining())
+
+    def _lease_wait_until(self, deadline: Optional[Deadline]) -> float:
+        """Monotonic time to stop waiting for another worker's lease (fn then fails fast on an expired deadline)"""
+        wait = self.lease_seconds if deadline is None else min(self.lease_seconds, deadline.remaining())
+        return time.monotonic() + wait
+
+    def stats(self) -> Dict:
+        """Return coalescing counters for this process"""
+        return {
+            'cross_worker': bool(self.lock_dir),
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'cross_worker_waits': self.cross_worker_waits,
+            'cross_worker_hits': self.cross_worker_hits,
+            'upstream_calls_saved': self.coalesced + self.cross_worker_hits
+        }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for coroutines; callers share one awaited upstream call"""
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        recheck: Optional[Callable[[], Any]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Await fn once for all concurrent callers with the same key
+
+        A leader cancelled mid-call (its client went away) does not fail its
+        followers: they retry, and one of them leads the call instead.
+
+        Args:
+            Same as SingleFlight.do(), with fn returning an awaitable
+
+        Returns:
+            Tuple of (result, shared)
+        """
+        future = self._calls.get(key)
+        while future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self._follow_timeout(deadline)), True
+            except asyncio.TimeoutError:
+                return await fn(), False
+            except _LeaderCancelled:
+                self.coalesced -= 1
+                future = self._calls.get(key)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        try:
+            result, shared = await self._lead_async(key, fn, recheck, deadline)
+            future.set_result(result)
+            return result, shared
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when no follower awaited it
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+
+    async def _lead_async(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        recheck: Optional[Callable[[], Any]],
+        deadline: Optional[Deadline]
+    ) -> Tuple[Any, bool]:
+        """Await the call as this process's leader, polling the worker lease if configured"""
+        if not self.lock_dir:
+            return await fn(), False
+
+        lease = _WorkerLease(self.lock_dir, key)
+        waited = False
+        wait_until = self._lease_wait_until(deadline)
+        while not lease.try_acquire():
+            waited = True
+            if time.monotonic() >= wait_until:
+                logger.warning("Timed out waiting for another worker's lease; calling upstream")
+                return await fn(), False
+            await asyncio.sleep(0.05)
+
+        try:
+            if waited:
+                self.cross_worker_waits += 1
+                if recheck is not None:
+                    result = await asyncio.to_thread(recheck)
+                    if result is not None:
+                        self.cross_worker_hits += 1
+                        return result, True
+            return await fn(), False
+        finally:
+            lease.release()
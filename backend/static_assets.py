@@ -0,0 +1,215 @@
+"""
+In-memory static asset pipeline for the frontend
+Loads every file once at startup with its fingerprint, ETag and pre-compressed gzip/brotli copies
+"""
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # Brotli not installed: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Fingerprinted URLs never change content; everything else is revalidated with its ETag
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Encodings in order of preference (smallest first)
+ENCODINGS = ('br', 'gzip')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# Asset references in HTML (src="..." / href="...") that get their fingerprinted URL
+_REFERENCE = re.compile(r'''(src|href)=(["'])/?([^"'?#:]+)\2''')
+
+
+class Asset:
+    """One static file with its precomputed representations"""
+
+    def __init__(self, name: str, body: bytes, content_type: str, compress: bool):
+        digest = hashlib.sha256(body).hexdigest()
+        self.name = name
+        self.content_type = content_type
+        self.etag = digest[:20]
+        self.fingerprint = digest[:10]
+        self.bodies: Dict[str, bytes] = {'identity': body}
+        if compress:
+            candidates = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                candidates['br'] = brotli.compress(body, quality=11)
+            # Keep only encodings that actually make the file smaller
+            self.bodies.update({coding: data for coding, data in candidates.items() if len(data) < len(body)})
+
+    @property
+    def fingerprinted_name(self) -> str:
+        """Name with the content hash before the extension (app.js -> app.3f2a9c01de.js)"""
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.fingerprint}{ext}"
+
+    def etag_for(self, coding: str) -> str:
+        """Strong ETag of one representation"""
+        return f'"{self.etag}"' if coding == 'identity' else f'"{self.etag}-{coding}"'
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value"""
+    accepted = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+class StaticAssets:
+    """
+    Frontend files served from memory
+
+    Every file under the root is read once and kept with its gzip and brotli
+    copies, so a request is a dict lookup. Non-HTML files are also reachable
+    under a fingerprinted name (app.<hash>.js) that is served with an
+    immutable one-year Cache-Control, and references to them in the HTML are
+    rewritten to that name. HTML and plain names are sent with no-cache and
+    revalidated through If-None-Match, which costs a 304 and no body.
+    """
+
+    def __init__(self, root: Path, index: str = 'index.html', min_compress_bytes: int = 512):
+        """
+        Load the assets
+
+        Args:
+            root: Directory with the frontend files
+            index: File served for the site root
+            min_compress_bytes: Smaller files are only sent uncompressed
+        """
+        self.root = Path(root)
+        self.index = index
+        self._assets: Dict[str, Asset] = {}
+        self._immutable: Dict[str, Asset] = {}
+
+        files = {}
+        for path in sorted(self.root.rglob('*')):
+            if path.is_file():
+                files[path.relative_to(self.root).as_posix()] = path.read_bytes()
+
+        # Fingerprint the other assets first so the HTML can point at their fingerprinted names
+        for name, body in files.items():
+            if not name.endswith('.html'):
+                self._add(name, body, min_compress_bytes)
+        for name, body in files.items():
+            if name.endswith('.html'):
+                self._add(name, self._rewrite_references(body), min_compress_bytes)
+
+        encoded = sum(len(asset.bodies) - 1 for asset in self._assets.values())
+        logger.info(
+            f"✓ Static assets loaded: {len(self._assets)} files from {self.root} "
+            f"({encoded} pre-compressed copies{'' if brotli else ', brotli unavailable'})"
+        )
+
+    def _add(self, name: str, body: bytes, min_compress_bytes: int) -> None:
+        """Register one file under its plain and fingerprinted names"""
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        compress = len(body) >= min_compress_bytes and content_type.startswith(COMPRESSIBLE_TYPES)
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+        asset = Asset(name, body, content_type, compress)
+        self._assets[name] = asset
+        if not name.endswith('.html'):
+            self._immutable[asset.fingerprinted_name] = asset
+
+    def _rewrite_references(self, html: bytes) -> bytes:
+        """Point src/href references to loaded assets at their fingerprinted names"""
+        def replace(match):
+            asset = self._assets.get(match.group(3))
+            if asset is None:
+                return match.group(0)
+            return f'{match.group(1)}={match.group(2)}/{asset.fingerprinted_name}{match.group(2)}'
+        return _REFERENCE.sub(replace, html.decode('utf-8')).encode('utf-8')
+
+    def url_for(self, name: str) -> str:
+        """Fingerprinted URL of an asset (the plain name for HTML and unknown files)"""
+        asset = self._assets.get(name)
+        if asset is None or name.endswith('.html'):
+            return f'/{name}'
+        return f'/{asset.fingerprinted_name}'
+
+    def respond(
+        self,
+        path: str,
+        accept_encoding: Optional[str] = None,
+        if_none_match: Optional[str] = None
+    ) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """
+        Build the response for a static request
+
+        Args:
+            path: Request path relative to the site root ('' for the index)
+            accept_encoding: Accept-Encoding request header
+            if_none_match: If-None-Match request header
+
+        Returns:
+            (status, headers, body), or None when there is no such asset
+        """
+        name = path.lstrip('/') or self.index
+        asset = self._immutable.get(name)
+        cache_control = IMMUTABLE
+        if asset is None:
+            asset = self._assets.get(name)
+            cache_control = REVALIDATE
+        if asset is None:
+            return None
+
+        coding = self._choose_encoding(asset, accept_encoding)
+        etag = asset.etag_for(coding)
+        headers = {
+            'Cache-Control': cache_control,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding'
+        }
+
+        if if_none_match:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in tags or any(asset.etag_for(candidate) in tags for candidate in asset.bodies):
+                return 304, headers, b''
+
+        headers['Content-Type'] = asset.content_type
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+        return 200, headers, asset.bodies[coding]
+
+    @staticmethod
+    def _choose_encoding(asset: Asset, accept_encoding: Optional[str]) -> str:
+        """Pick the smallest pre-compressed copy the client accepts"""
+        accepted = parse_accept_encoding(accept_encoding)
+        for coding in ENCODINGS:
+            if coding in asset.bodies and accepted.get(coding, accepted.get('*', 0)) > 0:
+                return coding
+        return 'identity'
+
+    def stats(self) -> Dict:
+        """Return asset counts and sizes"""
+        return {
+            'files': len(self._assets),
+            'bytes': sum(len(asset.bodies['identity']) for asset in self._assets.values()),
+            'compressed_bytes': {
+                coding: sum(len(asset.bodies[coding]) for asset in self._assets.values() if coding in asset.bodies)
+                for coding in ENCODINGS
+            }
+        }
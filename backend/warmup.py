@@ -0,0 +1,301 @@
+"""
+Catalog warm-up for the Flusso response cache
+
+Fills the shared response cache with the deterministic helper lookups
+(product info, installation guide, parts info) for a list of product codes, so
+hot SKUs are answered from cache right after a deploy or knowledge-base update.
+
+Usage:
+    python warmup.py --codes-file hot_skus.txt
+    python warmup.py --from-logs server.log --top 200 --concurrency 4 --rate 2
+    python warmup.py --codes-file hot_skus.txt --refresh --every 21600
+    python query_log.py --codes-out hot_skus.txt && python warmup.py --codes-file hot_skus.txt
+"""
+import re
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional
+
+from admission import priority_lane
+from product_codes import extract_product_codes
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Helper lookups whose prompts depend only on the product code
+LOOKUPS = {
+    'product': 'get_product_info',
+    'installation': 'get_installation_guide',
+    'parts': 'get_parts_info',
+}
+
+_LOGGED_QUERY = re.compile(r'Processing (?:streaming )?query: (.*)')
+_RATE_LIMITED = ('429', 'RESOURCE_EXHAUSTED', 'rate limit', 'quota')
+
+
+def load_codes_file(path: str) -> List[str]:
+    """
+    Read product codes from a text file
+
+    One code per line; blank lines and '#' comments are ignored. Extra columns
+    (e.g. counts written by the query log analyzer) are ignored too.
+
+    Args:
+        path: Path to the codes file
+
+    Returns:
+        Product codes in file order, without duplicates
+    """
+    codes = []
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                codes.append(line.split()[0].strip(',').upper())
+    return list(dict.fromkeys(codes))
+
+
+def mine_codes_from_logs(paths: Iterable[str], top: Optional[int] = None) -> List[str]:
+    """
+    Find the most requested product codes in server logs
+
+    Args:
+        paths: Log files containing the engine's "Processing query: ..." lines
+        top: Keep only the N most frequent codes
+
+    Returns:
+        Product codes ordered by request count, most frequent first
+    """
+    counts = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as handle:
+            for line in handle:
+                match = _LOGGED_QUERY.search(line)
+                if match:
+                    counts.update(extract_product_codes(match.group(1)))
+    return [code for code, _ in counts.most_common(top)]
+
+
+class CacheWarmer:
+    """
+    Run helper lookups for many product codes to fill the response cache
+
+    Work is spread over a bounded thread pool and paced by a token bucket.
+    When upstream responses look rate limited, the rate is halved (down to
+    min_rate) so a warm-up never competes with user traffic for quota.
+    """
+
+    def __init__(
+        self,
+        engine,
+        lookups: Iterable[str] = tuple(LOOKUPS),
+        concurrency: int = 4,
+        rate_per_second: float = 2.0,
+        min_rate: float = 0.1,
+        progress_callback: Optional[Callable[[Dict], None]] = None
+    ):
+        """
+        Initialize the warmer
+
+        Args:
+            engine: FlussoQueryEngine whose cache should be filled
+            lookups: Which helper lookups to run per code (product, installation, parts)
+            concurrency: Maximum lookups in flight
+            rate_per_second: Maximum lookups started per second
+            min_rate: Floor for the rate after backing off
+            progress_callback: Called with status() after each lookup
+        """
+        unknown = set(lookups) - set(LOOKUPS)
+        if unknown:
+            raise ValueError(f"Unknown lookups: {', '.join(sorted(unknown))}")
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+
+        self.engine = engine
+        self.lookups = list(lookups)
+        self.concurrency = concurrency
+        self.min_rate = min_rate
+        self.bucket = TokenBucket(rate_per_second)
+        self.progress_callback = progress_callback
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reset(0)
+        self.runs = 0
+        self.last_run: Optional[Dict] = None
+
+    def _reset(self, total: int) -> None:
+        """Reset progress counters for a new run"""
+        self.total = total
+        self.completed = 0
+        self.succeeded = 0
+        self.already_cached = 0
+        self.failed = 0
+        self.started_at = time.time()
+
+    def run(self, codes: List[str], refresh: bool = False) -> Dict:
+        """
+        Warm the cache for a list of product codes
+
+        Args:
+            codes: Product codes to warm
+            refresh: Regenerate answers even if they are cached (for scheduled refreshes)
+
+        Returns:
+            Final status dictionary
+        """
+        tasks = [(code, lookup) for code in codes for lookup in self.lookups]
+        self._reset(len(tasks))
+        logger.info(f"Warming {len(tasks)} lookups for {len(codes)} codes "
+                    f"(concurrency {self.concurrency}, {self.bucket.rate}/s, refresh={refresh})")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [pool.submit(self._warm_one, code, lookup, refresh) for code, lookup in tasks]
+            for future in as_completed(futures):
+                future.result()
+
+        self.runs += 1
+        self.last_run = self.status()
+        logger.info(f"✓ Warm-up finished: {self.last_run}")
+        return self.last_run
+
+    def _warm_one(self, code: str, lookup: str, refresh: bool) -> None:
+        """Run one helper lookup, pacing it with the token bucket"""
+        if self._stop.is_set():
+            return
+        self.bucket.acquire()
+        try:
+            with priority_lane('batch'):
+                result = getattr(self.engine, LOOKUPS[lookup])(code, refresh=refresh)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        with self._lock:
+            self.completed += 1
+            if not result.get('success'):
+                self.failed += 1
+                error = str(result.get('error', ''))
+                logger.warning(f"Warm-up {lookup} {code} failed: {error[:200]}")
+                if result.get('error_type') == 'rate_limited' or any(marker in error for marker in _RATE_LIMITED):
+                    self._back_off()
+            elif (result.get('metadata') or {}).get('cached'):
+                self.already_cached += 1
+            else:
+                self.succeeded += 1
+            status = self.status()
+
+        if self.completed % 25 == 0 or self.completed == self.total:
+            logger.info(f"Warm-up progress: {self.completed}/{self.total} "
+                        f"({status['percent']}%), {self.failed} failed")
+        if self.progress_callback:
+            self.progress_callback(status)
+
+    def _back_off(self) -> None:
+        """Halve the rate after an upstream rate-limit error (caller holds the lock)"""
+        new_rate = max(self.min_rate, self.bucket.rate / 2)
+        if new_rate < self.bucket.rate:
+            logger.warning(f"Upstream rate limited; slowing warm-up to {new_rate:.2f}/s")
+            self.bucket.set_rate(new_rate)
+
+    def start_schedule(
+        self,
+        codes_provider: Callable[[], List[str]],
+        interval_seconds: float,
+        refresh_first: bool = False
+    ) -> None:
+        """
+        Refresh the cache in a background thread at a fixed interval
+
+        Args:
+            codes_provider: Returns the codes to warm (re-read every run, e.g. from a file)
+            interval_seconds: Seconds between the start of consecutive runs
+            refresh_first: Regenerate cached answers on the first run too (later runs always do)
+        """
+        if self._thread and self._thread.is_alive():
+            raise RuntimeError("Warm-up schedule already running")
+        self._stop.clear()
+
+        def loop():
+            refresh = refresh_first
+            while not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    self.run(codes_provider(), refresh=refresh)
+                except Exception as e:
+                    logger.error(f"Scheduled warm-up failed: {e}", exc_info=True)
+                refresh = True
+                self._stop.wait(max(0.0, interval_seconds - (time.monotonic() - started)))
+
+        self._thread = threading.Thread(target=loop, name='cache-warmer', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the scheduled refresh after the lookups already in flight"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def status(self) -> Dict:
+        """Return progress for the current (or last) run"""
+        elapsed = time.time() - self.started_at
+        return {
+            'total': self.total,
+            'completed': self.completed,
+            'percent': round(100 * self.completed / self.total, 1) if self.total else 100.0,
+            'generated': self.succeeded,
+            'already_cached': self.already_cached,
+            'failed': self.failed,
+            'rate_per_second': round(self.bucket.rate, 3),
+            'elapsed_seconds': round(elapsed, 1),
+            'runs': self.runs
+        }
+
+
+def main():
+    """Warm the shared response cache from the command line"""
+    parser = argparse.ArgumentParser(description='Warm the Flusso response cache for hot product codes')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--codes-file', help='File with one product code per line')
+    source.add_argument('--from-logs', nargs='+', metavar='LOG', help='Server logs to mine for requested codes')
+    parser.add_argument('--top', type=int, default=200, help='Codes to keep when mining logs')
+    parser.add_argument('--lookups', nargs='+', choices=list(LOOKUPS), default=list(LOOKUPS))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0, help='Lookups started per second')
+    parser.add_argument('--refresh', action='store_true', help='Regenerate answers that are already cached')
+    parser.add_argument('--every', type=float, help='Repeat every N seconds (scheduled refresh)')
+    args = parser.parse_args()
+
+    from config import CACHE_ENABLED, create_query_engine
+
+    if not CACHE_ENABLED:
+        print("Error: CACHE_ENABLED is False; there is no cache to warm")
+        sys.exit(1)
+
+    def codes_provider():
+        if args.codes_file:
+            return load_codes_file(args.codes_file)
+        return mine_codes_from_logs(args.from_logs, top=args.top)
+
+    engine = create_query_engine()
+    warmer = CacheWarmer(engine, lookups=args.lookups, concurrency=args.concurrency, rate_per_second=args.rate)
+
+    if args.every:
+        warmer.start_schedule(codes_provider, args.every, refresh_first=args.refresh)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            warmer.stop()
+    else:
+        status = warmer.run(codes_provider(), refresh=args.refresh)
+        sys.exit(1 if status['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
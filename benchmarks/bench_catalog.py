@@ -0,0 +1,109 @@
+"""
+Measure the product catalog on a synthetic set of spec sheets
+
+A directory of markdown spec sheets (category, finishes, mounting and a few
+feature bullets per product) is generated and extracted into a fresh catalog.
+Then feature searches of three breadths are timed: a whole category, a
+category with one finish, and a category with a finish and two features.
+
+Usage:
+    python benchmarks/bench_catalog.py --products 5000 --searches 2000
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.WARNING)
+
+from product_catalog import ProductCatalog  # noqa: E402
+
+CATEGORIES = ['Kitchen Faucet', 'Lavatory Faucet', 'Bar Faucet', 'Shower System', 'Tub Filler', 'Hand Shower']
+FINISHES = ['Chrome', 'Brushed Nickel', 'Matte Black', 'Satin Brass', 'Polished Nickel', 'Gunmetal']
+FEATURES = [
+    'Pull-down sprayer', 'Magnetic docking', 'Ceramic disc cartridge', 'Touchless sensor', 'Pressure balance valve',
+    'Thermostatic valve', 'Swivel spout', 'Single handle', 'Dual handle', 'Water-saving aerator', 'Diverter',
+    'Hand shower included', 'Soap dispenser', 'Filtered water tap', 'Pot filler arm', 'Lead-free brass'
+]
+
+
+def generate(root: str, count: int, rng: random.Random) -> None:
+    """Write one spec sheet per product into root"""
+    for index in range(count):
+        code = f"{100 + index // 100}.{1000 + index % 100}"
+        with open(os.path.join(root, f"Spec Sheet {code}.md"), 'w', encoding='utf-8') as handle:
+            handle.write(
+                f"# {code} {rng.choice(['Serie 100', 'Serie 160', 'Modern'])} {rng.choice(CATEGORIES)}\n\n"
+                f"## Specifications\n"
+                f"- Finishes: {', '.join(rng.sample(FINISHES, rng.randint(1, 4)))}\n"
+                f"- Mounting: {rng.choice(['Deck mount', 'Wall mount'])}\n"
+                f"- Flow rate: {rng.choice([1.2, 1.5, 1.8, 2.2])} GPM\n\n"
+                f"## Features\n" + ''.join(f"- {feature}\n" for feature in rng.sample(FEATURES, rng.randint(2, 6)))
+            )
+
+
+def percentile(values: list, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the product catalog')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--searches', type=int, default=1000, help='Searches per breadth')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='flusso-catalog-')
+    root = os.path.join(workdir, 'docs')
+    os.makedirs(root)
+    try:
+        generate(root, args.products, rng)
+        catalog = ProductCatalog(os.path.join(workdir, 'catalog.sqlite3'))
+        started = time.perf_counter()
+        build = catalog.update(root)
+        build_seconds = time.perf_counter() - started
+
+        breadths = {
+            'category': lambda: (rng.choice(CATEGORIES), []),
+            'category_finish': lambda: (rng.choice(CATEGORIES), [rng.choice(FINISHES)]),
+            'category_finish_features': lambda: (
+                rng.choice(CATEGORIES), [rng.choice(FINISHES)] + rng.sample(FEATURES, 2)
+            ),
+        }
+        report = {
+            'products': args.products,
+            'build_seconds': round(build_seconds, 3),
+            'build': build,
+            'database_bytes': sum(
+                os.path.getsize(catalog.path + suffix) for suffix in ('', '-wal') if os.path.exists(catalog.path + suffix)
+            ),
+            'searches': {}
+        }
+        for name, make in breadths.items():
+            timings, matches = [], 0
+            for _ in range(args.searches):
+                category, features = make()
+                started = time.perf_counter()
+                matches += len(catalog.search(category, features)['products'])
+                timings.append(time.perf_counter() - started)
+            report['searches'][name] = {
+                'mean_matches': round(matches / args.searches, 1),
+                'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+                'p99_ms': round(percentile(timings, 0.99) * 1000, 3)
+            }
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
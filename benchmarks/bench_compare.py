@@ -0,0 +1,101 @@
+"""
+Benchmark single-prompt vs decomposed compare_products on a local fake upstream
+
+The fake upstream's latency grows with the number of product codes in the
+prompt (longer comparison answers). A stream of comparisons drawn from a small
+set of popular SKUs is run through each mode with a fresh response cache.
+
+Usage:
+    python benchmarks/bench_compare.py --comparisons 30 --base-latency 1.0 --per-code-latency 0.6
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.INFO)
+
+from fake_gemini import FakeGeminiClient, fixed_latency  # noqa: E402
+from product_codes import extract_product_codes  # noqa: E402
+from query_engine import FlussoQueryEngine, PRODUCT_DETAIL_FIELDS  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+
+POPULAR = ['100.1000', '160.1000', '240.4420', 'TVH.2691', '180.1000', '120.2000']
+
+
+def responder(model: str, prompt: str):
+    """Answer detail prompts with JSON; everything else gets the default filler"""
+    if 'single JSON object' in prompt:
+        code = extract_product_codes(prompt.split('Return the specifications of product', 1)[1])[0]
+        return json.dumps({field: f"{field} of {code}" for field in PRODUCT_DETAIL_FIELDS})
+    return None
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def workload(count: int, seed: int):
+    """Generate comparisons of 2-4 popular SKUs"""
+    rng = random.Random(seed)
+    return [rng.sample(POPULAR, rng.choice([2, 2, 3, 4])) for _ in range(count)]
+
+
+def run(mode: str, comparisons, base_latency: float, per_code_latency: float) -> dict:
+    """Run a comparison workload in one mode"""
+    fake = FakeGeminiClient(
+        latency=fixed_latency(base_latency),
+        per_code_latency=per_code_latency,
+        responder=responder
+    )
+    cache = ResponseCache(os.path.join(tempfile.mkdtemp(), 'bench.sqlite3'), max_entries=10000)
+    engine = FlussoQueryEngine('fake-key', 'fileSearchStores/fake', cache=cache, client=fake)
+
+    timings = []
+    local_tables = 0
+    for codes in comparisons:
+        started = time.perf_counter()
+        result = engine.compare_products(codes, mode=mode)
+        timings.append(time.perf_counter() - started)
+        assert result['success'], result
+        local_tables += result['metadata'].get('synthesis') == 'local'
+
+    return {
+        'mode': mode,
+        'comparisons': len(comparisons),
+        'upstream_calls': fake.calls,
+        'local_tables': local_tables,
+        'total_seconds': round(sum(timings), 2),
+        'mean_seconds': round(statistics.mean(timings), 3),
+        'p50_seconds': round(percentile(timings, 50), 3),
+        'p95_seconds': round(percentile(timings, 95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compare_products modes')
+    parser.add_argument('--comparisons', type=int, default=30)
+    parser.add_argument('--base-latency', type=float, default=1.0)
+    parser.add_argument('--per-code-latency', type=float, default=0.6)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    comparisons = workload(args.comparisons, args.seed)
+    report = [
+        run(mode, comparisons, args.base_latency, args.per_code_latency)
+        for mode in ('single', 'decomposed')
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
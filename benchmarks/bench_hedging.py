@@ -0,0 +1,78 @@
+"""
+Measure tail latency with and without hedged requests on a local fake upstream
+
+The fake upstream samples latencies from a long-tailed lognormal
+distribution. Each run sends the same sequence of sequential queries (no
+caching) and reports latency percentiles after a warm-up period, plus how
+many extra upstream calls hedging cost.
+
+Usage:
+    python benchmarks/bench_hedging.py --requests 400 --median 0.05 --sigma 1.0
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.WARNING)
+
+from fake_gemini import FakeGeminiClient, lognormal_latency  # noqa: E402
+from hedging import Hedger  # noqa: E402
+from query_engine import FlussoQueryEngine  # noqa: E402
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(hedger, args) -> dict:
+    """Send the workload through an engine with the given hedger"""
+    fake = FakeGeminiClient(latency=lognormal_latency(args.median, args.sigma), seed=args.seed)
+    engine = FlussoQueryEngine('fake-key', 'fileSearchStores/fake', client=fake, hedger=hedger)
+
+    timings = []
+    for i in range(args.requests):
+        started = time.perf_counter()
+        result = engine.query(f"benchmark query {i}")
+        timings.append(time.perf_counter() - started)
+        assert result['success'], result
+    measured = timings[args.warmup:]
+
+    report = {
+        'hedging': hedger is not None,
+        'requests': len(measured),
+        'upstream_calls': fake.calls,
+        'mean_seconds': round(statistics.mean(measured), 3),
+        'p50_seconds': round(percentile(measured, 50), 3),
+        'p95_seconds': round(percentile(measured, 95), 3),
+        'p99_seconds': round(percentile(measured, 99), 3),
+    }
+    if hedger is not None:
+        report['hedger'] = hedger.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hedged upstream requests')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--warmup', type=int, default=50, help='Requests excluded while latency samples build up')
+    parser.add_argument('--median', type=float, default=0.05, help='Median upstream latency in seconds')
+    parser.add_argument('--sigma', type=float, default=1.0, help='Lognormal spread (larger = longer tail)')
+    parser.add_argument('--percentile', type=float, default=90)
+    parser.add_argument('--max-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    hedger = Hedger(percentile=args.percentile, min_samples=20, max_hedge_ratio=args.max_ratio)
+    print(json.dumps([run(None, args), run(hedger, args)], indent=2))
+
+
+if __name__ == '__main__':
+    main()
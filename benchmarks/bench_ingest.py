@@ -0,0 +1,137 @@
+"""
+Measure ingestion throughput on a synthetic document set against the fake File Search store
+
+A directory of random documents (lognormal sizes) is generated once. For each
+concurrency level it is ingested from scratch into a fresh fake store, whose
+uploads take a lognormal latency and whose operations finish indexing a fixed
+time later. Then the incremental paths are timed: a re-run over the unchanged
+tree (stat only), the same with --rehash, and a run after a share of the files
+was edited and a few were deleted.
+
+Usage:
+    python benchmarks/bench_ingest.py --files 2000 --concurrency 1 4 16
+    python benchmarks/bench_ingest.py --files 500 --upload-latency 0.3 --index-seconds 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.WARNING)
+
+from fake_gemini import FakeGeminiClient  # noqa: E402
+from ingest import MANIFEST_NAME, Ingester, Manifest  # noqa: E402
+
+STORE = 'fileSearchStores/bench'
+
+
+def generate(root: str, count: int, median_kb: float, rng: random.Random) -> int:
+    """Write count documents of lognormal size into root, spread over subdirectories; return total bytes"""
+    total = 0
+    for index in range(count):
+        directory = os.path.join(root, f"series-{index % 20:02d}")
+        os.makedirs(directory, exist_ok=True)
+        size = max(256, int(rng.lognormvariate(0, 0.8) * median_kb * 1024))
+        with open(os.path.join(directory, f"spec-{index:05d}.pdf"), 'wb') as handle:
+            handle.write(rng.randbytes(size))
+        total += size
+    return total
+
+
+def ingest(root: str, manifest_path: str, client, args, **run_args) -> dict:
+    """One ingestion run with a fresh Ingester"""
+    ingester = Ingester(
+        client,
+        STORE,
+        Manifest(manifest_path),
+        concurrency=run_args.pop('concurrency', max(args.concurrency)),
+        poll_interval=args.poll_interval
+    )
+    started = time.perf_counter()
+    status = ingester.run(root, **run_args)
+    status['wall_seconds'] = round(time.perf_counter() - started, 3)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark File Search ingestion')
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--median-kb', type=float, default=64)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--upload-latency', type=float, default=0.05, help='Median seconds per upload')
+    parser.add_argument('--index-seconds', type=float, default=1.0, help='Seconds from upload to indexed')
+    parser.add_argument('--poll-interval', type=float, default=0.25)
+    parser.add_argument('--edit-share', type=float, default=0.02, help='Share of files edited before the incremental run')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='flusso-ingest-')
+    root = os.path.join(workdir, 'docs')
+    try:
+        total_bytes = generate(root, args.files, args.median_kb, rng)
+
+        def new_client():
+            return FakeGeminiClient(
+                upload_latency=lambda r: r.lognormvariate(0, 0.5) * args.upload_latency,
+                index_seconds=args.index_seconds,
+                seed=args.seed
+            )
+
+        report = {
+            'files': args.files,
+            'megabytes': round(total_bytes / 1e6, 1),
+            'upload_latency': args.upload_latency,
+            'index_seconds': args.index_seconds,
+            'full': {}
+        }
+        for concurrency in args.concurrency:
+            manifest_path = os.path.join(workdir, f"manifest-{concurrency}.sqlite3")
+            status = ingest(root, manifest_path, new_client(), args, concurrency=concurrency)
+            report['full'][concurrency] = {
+                'seconds': status['wall_seconds'],
+                'files_per_second': round(args.files / status['wall_seconds'], 1),
+                'mb_per_second': round(total_bytes / 1e6 / status['wall_seconds'], 2),
+                'failed': status['failed']
+            }
+
+        # Incremental runs reuse the last store and manifest
+        client = new_client()
+        manifest_path = os.path.join(root, MANIFEST_NAME)
+        ingest(root, manifest_path, client, args)
+        unchanged = ingest(root, manifest_path, client, args)
+        rehash = ingest(root, manifest_path, client, args, rehash=True)
+
+        paths = sorted(os.path.join(directory, name) for directory, _, names in os.walk(root)
+                       for name in names if name.endswith('.pdf'))
+        edited = rng.sample(paths, max(1, int(len(paths) * args.edit_share)))
+        for path in edited[:-2]:
+            with open(path, 'ab') as handle:
+                handle.write(b'revision')
+        for path in edited[-2:]:
+            os.remove(path)
+        incremental = ingest(root, manifest_path, client, args)
+
+        report['unchanged_rerun_seconds'] = unchanged['wall_seconds']
+        report['rehash_rerun_seconds'] = rehash['wall_seconds']
+        report['incremental'] = {
+            'seconds': incremental['wall_seconds'],
+            'plan': incremental['plan'],
+            'uploaded': incremental['uploaded'],
+            'deleted': incremental['deleted']
+        }
+        report['fake_store'] = client.stats()
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Microbenchmark JSON serialization and compression of representative API payloads
+
+Payloads are shaped like real results: a single answer with a markdown
+comparison table and sources, a decomposed comparison with per-product
+details, and a /api/batch response. For each one the standard-library
+encoder (configured like Flask's jsonify) is compared with the encoder in
+responses.py, and every compression setting with the bytes it saves and the
+time it costs. Lean-mode sizes are reported too.
+
+Usage:
+    python benchmarks/bench_json.py --batch-items 50 --repeats 200
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from query_engine import PRODUCT_DETAIL_FIELDS  # noqa: E402
+from responses import JSON_ENCODER, dumps, lean_result  # noqa: E402
+from static_assets import brotli  # noqa: E402
+
+CODES = ['100.1000', '160.1000', '240.4420', 'TVH.2691', '180.1000', '120.2000']
+VOCABULARY = (
+    'valve thermostatic pressure balance trim cartridge finish chrome brushed nickel matte black '
+    'flow rate gpm spout reach height mounting deck wall rough-in installation ceramic disc '
+    'handle lever diverter shower tub filler faucet lavatory kitchen pull-down sprayer aerator '
+    'compliant certified warranty collection dimensions inches connection npt supply lines'
+).split()
+
+
+def markdown_answer(rng: random.Random, codes, paragraphs: int) -> str:
+    """A markdown answer with prose, bullet lists and a comparison table"""
+    parts = []
+    for _ in range(paragraphs):
+        parts.append(' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(40, 90))) + '.')
+        parts.append('\n'.join(f"- **{rng.choice(codes)}**: {' '.join(rng.sample(VOCABULARY, 8))}" for _ in range(4)))
+    header = '| Feature | ' + ' | '.join(f'**{code}**' for code in codes) + ' |'
+    rows = [f"| {field} | " + ' | '.join(' '.join(rng.sample(VOCABULARY, 3)) for _ in codes) + ' |'
+            for field in PRODUCT_DETAIL_FIELDS]
+    parts.append('\n'.join([header, '|' + ' --- |' * (len(codes) + 1)] + rows))
+    return '\n\n'.join(parts)
+
+
+def query_result(rng: random.Random, paragraphs: int = 6) -> dict:
+    """A /api/query result"""
+    codes = rng.sample(CODES, 3)
+    sources = [{'title': f"Spec Sheet {code}.pdf", 'uri': f"fileSearchStores/flusso/documents/{code}"} for code in codes]
+    sources.append({'title': 'Flusso Catalog 2025.pdf', 'uri': 'fileSearchStores/flusso/documents/catalog'})
+    return {
+        'success': True,
+        'query': f"Compare {', '.join(codes)} for a master bathroom remodel",
+        'answer': markdown_answer(rng, codes, paragraphs),
+        'sources': sources,
+        'source_count': len(sources),
+        'metadata': {
+            'model': 'gemini-2.5-flash', 'temperature': 0.2, 'top_p': 0.8, 'has_grounding': True,
+            'cached': False, 'routing': {'model': 'gemini-2.5-flash', 'reason': 'category:comparison'}
+        }
+    }
+
+
+def compare_result(rng: random.Random) -> dict:
+    """A decomposed /api/compare result with per-product details"""
+    result = query_result(rng, paragraphs=3)
+    result['metadata']['products'] = {
+        code: {
+            'details': {field: ' '.join(rng.sample(VOCABULARY, 4)) for field in PRODUCT_DETAIL_FIELDS},
+            'cached': rng.random() < 0.5
+        }
+        for code in rng.sample(CODES, 4)
+    }
+    return result
+
+
+def timed(fn, repeats: int) -> float:
+    """Mean microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+def measure(payload, repeats: int) -> dict:
+    """Serialization and compression costs for one payload"""
+    flask_style = lambda: json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()  # noqa: E731
+    body = dumps(payload)
+    report = {
+        'bytes': len(body),
+        'lean_bytes': len(dumps(lean_payload(payload))),
+        'serialize_us': {
+            'json (jsonify settings)': round(timed(flask_style, repeats), 1),
+            JSON_ENCODER: round(timed(lambda: dumps(payload), repeats), 1)
+        },
+        'compression': {}
+    }
+    settings = [(f'gzip-{level}', lambda level=level: gzip.compress(body, compresslevel=level, mtime=0))
+                for level in (1, 6, 9)]
+    if brotli is not None:
+        settings += [(f'br-{quality}', lambda quality=quality: brotli.compress(body, quality=quality))
+                     for quality in (1, 5, 6, 11)]
+    for name, fn in settings:
+        compressed = fn()
+        runs = max(1, repeats // 10) if name == 'br-11' else repeats
+        report['compression'][name] = {
+            'bytes': len(compressed),
+            'ratio': round(len(compressed) / len(body), 3),
+            'us': round(timed(fn, runs), 1)
+        }
+    return report
+
+
+def lean_payload(payload):
+    """The lean-mode version of a payload"""
+    if 'results' in payload:
+        return dict(payload, results=[lean_result(result) for result in payload['results']])
+    return lean_result(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON encoding and compression')
+    parser.add_argument('--batch-items', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    payloads = {
+        'query': query_result(rng),
+        'compare_decomposed': compare_result(rng),
+        'batch': {
+            'success': True,
+            'count': args.batch_items,
+            'results': [query_result(rng, paragraphs=2) for _ in range(args.batch_items)]
+        }
+    }
+    report = {
+        'encoder': JSON_ENCODER,
+        'brotli': brotli is not None,
+        'payloads': {name: measure(payload, args.repeats) for name, payload in payloads.items()}
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
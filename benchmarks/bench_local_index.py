@@ -0,0 +1,137 @@
+"""
+Measure the local BM25 index on a synthetic set of spec sheets
+
+A directory of markdown spec sheets (one per product code, with a spec list
+and a description of filler words) is generated and indexed from scratch.
+Then a mix of spec lookups ("flow rate of 100.1000") and free-text searches
+is timed, followed by an incremental update after a share of the sheets was
+edited, and a reopen of the index (what a restarted worker pays).
+
+Usage:
+    python benchmarks/bench_local_index.py --documents 2000 --queries 5000
+    python benchmarks/bench_local_index.py --documents 500 --filler-words 2000
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.WARNING)
+
+from local_index import LocalIndex  # noqa: E402
+
+WORDS = (
+    'faucet lavatory kitchen shower valve trim cartridge ceramic disc spout handle lever '
+    'deck wall mount brass finish chrome nickel matte black gold pressure balance thermostatic '
+    'diverter sprayer pull down escutcheon aerator hose drain assembly installation warranty'
+).split()
+FINISHES = ['Chrome', 'Brushed Nickel', 'Matte Black', 'Satin Brass', 'Polished Nickel']
+ATTRIBUTES = ['flow rate', 'spout reach', 'finishes', 'mounting', 'warranty']
+
+
+def generate(root: str, count: int, filler_words: int, rng: random.Random) -> list:
+    """Write one spec sheet per product code into root; return the codes"""
+    codes = []
+    for index in range(count):
+        code = f"{100 + index // 100}.{1000 + index % 100}"
+        codes.append(code)
+        filler = ' '.join(rng.choice(WORDS) for _ in range(filler_words))
+        with open(os.path.join(root, f"Spec Sheet {code}.md"), 'w', encoding='utf-8') as handle:
+            handle.write(
+                f"# {code} {rng.choice(WORDS).title()} Faucet\n\n"
+                f"## Specifications\n"
+                f"- Flow rate: {rng.choice([1.2, 1.5, 1.8, 2.2])} GPM\n"
+                f"- Spout reach: {rng.randint(4, 10)} in\n"
+                f"- Finishes: {', '.join(rng.sample(FINISHES, 3))}\n"
+                f"- Mounting: {rng.choice(['Deck mount', 'Wall mount'])}\n"
+                f"- Warranty: Limited lifetime\n\n"
+                f"## Description\n{filler}\n"
+            )
+    return codes
+
+
+def percentile(values: list, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the local BM25 index')
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--filler-words', type=int, default=400, help='Description words per spec sheet')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--edit-share', type=float, default=0.02, help='Share of sheets edited before the update')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='flusso-index-')
+    root = os.path.join(workdir, 'docs')
+    directory = os.path.join(workdir, 'index')
+    os.makedirs(root)
+    try:
+        codes = generate(root, args.documents, args.filler_words, rng)
+        index = LocalIndex(directory)
+
+        started = time.perf_counter()
+        build = index.update(root)
+        build_seconds = time.perf_counter() - started
+
+        timings = {'spec': [], 'search': []}
+        answered = 0
+        for _ in range(args.queries):
+            code = rng.choice(codes)
+            if rng.random() < 0.5:
+                started = time.perf_counter()
+                answered += index.spec_lookup(f"What is the {rng.choice(ATTRIBUTES)} of {code}?") is not None
+                timings['spec'].append(time.perf_counter() - started)
+            else:
+                query = f"{' '.join(rng.sample(WORDS, 3))} {code if rng.random() < 0.5 else ''}"
+                started = time.perf_counter()
+                index.search(query, k=5)
+                timings['search'].append(time.perf_counter() - started)
+
+        stats = index.stats()
+        edited = rng.sample(sorted(os.listdir(root)), max(1, int(args.documents * args.edit_share)))
+        for name in edited:
+            with open(os.path.join(root, name), 'a', encoding='utf-8') as handle:
+                handle.write('\nRevised installation notes.\n')
+        started = time.perf_counter()
+        update = index.update(root)
+        update_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        reopened = LocalIndex(directory)
+        reopened.search('flow rate', k=1)
+        reopen_seconds = time.perf_counter() - started
+
+        report = {
+            'documents': args.documents,
+            'build_seconds': round(build_seconds, 3),
+            'build': build,
+            'index': stats,
+            'spec_answer_rate': round(answered / max(1, len(timings['spec'])), 3),
+            'latency_ms': {
+                kind: {
+                    'p50': round(percentile(values, 0.5) * 1000, 3),
+                    'p99': round(percentile(values, 0.99) * 1000, 3)
+                }
+                for kind, values in timings.items() if values
+            },
+            'incremental': {'edited': len(edited), 'seconds': round(update_seconds, 3), 'update': update},
+            'reopen_seconds': round(reopen_seconds, 4)
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Measure how answer-token limits and thinking budgets change latency on a local fake upstream
+
+The fake upstream charges a fixed time per call (prompt processing and File
+Search) plus a time per generated token, thinking included. Left to the
+model, it thinks for a sampled number of tokens and writes a long-tailed
+answer. Each setting runs the same number of queries, concurrently, once
+without and once with streaming: latency, time to first token, answer size
+and the share of answers cut off at the limit are reported per setting.
+
+Usage:
+    python benchmarks/bench_output_budget.py --calls 40 --token-ms 4 --thinking-tokens 800
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.WARNING)
+
+from fake_gemini import FakeGeminiClient, estimate_tokens, fixed_latency, lognormal_words  # noqa: E402
+from query_engine import TOKEN_BUDGETS, FlussoQueryEngine  # noqa: E402
+
+# (name, max_tokens, thinking_budget); None leaves it to the model
+SETTINGS = [
+    ('model default', None, None),
+    ('query default', TOKEN_BUDGETS['query']['max_tokens'], TOKEN_BUDGETS['query']['thinking_budget']),
+    ('compare', TOKEN_BUDGETS['compare']['max_tokens'], TOKEN_BUDGETS['compare']['thinking_budget']),
+    ('product', TOKEN_BUDGETS['product']['max_tokens'], TOKEN_BUDGETS['product']['thinking_budget']),
+    ('details', TOKEN_BUDGETS['details']['max_tokens'], TOKEN_BUDGETS['details']['thinking_budget']),
+    ('short, no thinking', 256, 0),
+]
+
+
+def percentile(values: list, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def run(engine: FlussoQueryEngine, calls: int, max_tokens, thinking_budget) -> dict:
+    """Run one setting without and with streaming"""
+    def answer(index: int):
+        started = time.perf_counter()
+        result = engine.query(
+            f"Tell me about product 100.{1000 + index}", max_tokens=max_tokens, thinking_budget=thinking_budget
+        )
+        return time.perf_counter() - started, result
+
+    def stream(index: int):
+        started = time.perf_counter()
+        first_token = None
+        for event in engine.query_stream(
+            f"Describe product 160.{1000 + index}", max_tokens=max_tokens, thinking_budget=thinking_budget
+        ):
+            if event['event'] == 'delta' and first_token is None:
+                first_token = time.perf_counter() - started
+        return first_token
+
+    with ThreadPoolExecutor(max_workers=calls) as pool:
+        answered = list(pool.map(answer, range(calls)))
+        first_tokens = [value for value in pool.map(stream, range(calls)) if value is not None]
+
+    latencies = [elapsed for elapsed, _ in answered]
+    results = [result for _, result in answered if result.get('success')]
+    return {
+        'max_tokens': max_tokens,
+        'thinking_budget': thinking_budget,
+        'p50_seconds': round(percentile(latencies, 0.5), 3),
+        'p95_seconds': round(percentile(latencies, 0.95), 3),
+        'ttft_p50_seconds': round(percentile(first_tokens, 0.5), 3) if first_tokens else None,
+        'mean_answer_tokens': round(sum(estimate_tokens(r['answer']) for r in results) / max(1, len(results))),
+        'truncated_share': round(sum(r['metadata']['truncated'] for r in results) / max(1, len(results)), 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark answer-token limits and thinking budgets')
+    parser.add_argument('--calls', type=int, default=30, help='Queries per setting (run concurrently)')
+    parser.add_argument('--base-latency', type=float, default=0.4, help='Seconds per call before generation')
+    parser.add_argument('--token-ms', type=float, default=2.0, help='Milliseconds per generated token')
+    parser.add_argument('--answer-words', type=int, default=450, help='Median answer length left to the model')
+    parser.add_argument('--thinking-tokens', type=int, default=600, help='Median thinking tokens left to the model')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    fake = FakeGeminiClient(
+        latency=fixed_latency(args.base_latency),
+        answer_words=lognormal_words(args.answer_words, 0.4),
+        thinking_tokens=lognormal_words(args.thinking_tokens, 0.5),
+        token_seconds=args.token_ms / 1000,
+        seed=args.seed
+    )
+    # No caches, and no default budget so that None really leaves the length to the model
+    engine = FlussoQueryEngine(
+        'bench-key',
+        'fileSearchStores/bench',
+        client=fake,
+        token_budgets={'query': {'max_tokens': None, 'thinking_budget': None}}
+    )
+
+    report = {
+        'calls': args.calls,
+        'base_latency': args.base_latency,
+        'token_ms': args.token_ms,
+        'settings': {name: run(engine, args.calls, max_tokens, thinking) for name, max_tokens, thinking in SETTINGS}
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Compare prompt token usage of the three ways the system instruction can be sent
+
+    legacy              instruction pasted into the contents of every request
+    system_instruction  instruction in GenerateContentConfig.system_instruction
+    context_cache       instruction and File Search tool in an explicit context cache
+
+Without --live only count_tokens is used (no generation cost). With --live each
+query is generated once per mode and usage_metadata is reported, including
+cached_content_token_count. Requires GEMINI_API_KEY and STORE_ID; --estimate
+works offline with a 4-characters-per-token approximation.
+
+Usage:
+    python benchmarks/bench_prompt_tokens.py
+    python benchmarks/bench_prompt_tokens.py --live --model gemini-2.5-flash
+    python benchmarks/bench_prompt_tokens.py --estimate
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.INFO)
+
+from google.genai import types  # noqa: E402
+from query_engine import FlussoQueryEngine  # noqa: E402
+
+QUERIES = [
+    "What products does Flusso offer?",
+    "Tell me about product 100.1000",
+    "What finishes are available for kitchen faucets?",
+    "How do I install the TVH.2691 trim?",
+    "Compare 160.1000 and 240.4420",
+]
+
+
+def legacy_contents(engine: FlussoQueryEngine, user_query: str) -> str:
+    """The prompt the engine used to send, with the instruction embedded"""
+    return f"""{engine.system_instruction}
+
+User Query: {user_query}"""
+
+
+def count_mode(engine: FlussoQueryEngine, model: str, estimate: bool) -> dict:
+    """Count input tokens per request with count_tokens (or a character estimate)"""
+    def count(text: str) -> int:
+        if estimate:
+            return max(1, len(text) // 4)
+        return engine.client.models.count_tokens(model=model, contents=text).total_tokens
+
+    instruction_tokens = count(engine.system_instruction)
+    rows = []
+    for user_query in QUERIES:
+        query_tokens = count(user_query)
+        rows.append({
+            'query': user_query,
+            'legacy_tokens': count(legacy_contents(engine, user_query)),
+            'user_query_tokens': query_tokens,
+        })
+
+    legacy_mean = statistics.mean(row['legacy_tokens'] for row in rows)
+    query_mean = statistics.mean(row['user_query_tokens'] for row in rows)
+    return {
+        'method': 'estimate' if estimate else 'count_tokens',
+        'instruction_tokens': instruction_tokens,
+        'mean_legacy_prompt_tokens': round(legacy_mean, 1),
+        'mean_system_instruction_prompt_tokens': round(query_mean + instruction_tokens, 1),
+        'mean_uncached_tokens_with_context_cache': round(query_mean, 1),
+        'queries': rows,
+    }
+
+
+def live_mode(engine: FlussoQueryEngine, cached_engine: FlussoQueryEngine, model: str, wait: float) -> list:
+    """Generate every query once per mode and report usage_metadata"""
+    deadline = time.monotonic() + wait
+    while cached_engine.context_cache.get(model) is None and time.monotonic() < deadline:
+        time.sleep(1)
+
+    params = engine._resolve_params(None, None, model)
+    legacy_config = engine._build_config(params).model_copy(update={'system_instruction': None})
+    modes = {
+        'legacy': (engine, lambda q: legacy_contents(engine, q), legacy_config),
+        'system_instruction': (engine, lambda q: q, engine._build_config(params)),
+        'context_cache': (cached_engine, lambda q: q, cached_engine._build_config(params)),
+    }
+
+    report = []
+    for mode, (mode_engine, contents, config) in modes.items():
+        if mode == 'context_cache' and not config.cached_content:
+            report.append({'mode': mode, 'skipped': 'context cache not available', **cached_engine.context_cache.stats()})
+            continue
+        prompt_tokens, cached_tokens, latencies = [], [], []
+        for user_query in QUERIES:
+            started = time.perf_counter()
+            response = mode_engine.client.models.generate_content(
+                model=model, contents=contents(user_query), config=config
+            )
+            latencies.append(time.perf_counter() - started)
+            usage = response.usage_metadata or types.GenerateContentResponseUsageMetadata()
+            prompt_tokens.append(usage.prompt_token_count or 0)
+            cached_tokens.append(usage.cached_content_token_count or 0)
+        report.append({
+            'mode': mode,
+            'mean_prompt_tokens': round(statistics.mean(prompt_tokens), 1),
+            'mean_cached_tokens': round(statistics.mean(cached_tokens), 1),
+            'mean_billed_uncached_tokens': round(statistics.mean(p - c for p, c in zip(prompt_tokens, cached_tokens)), 1),
+            'mean_latency_seconds': round(statistics.mean(latencies), 3),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare prompt token usage of system instruction strategies')
+    parser.add_argument('--model', default='gemini-2.5-flash')
+    parser.add_argument('--live', action='store_true', help='Generate answers and report usage_metadata')
+    parser.add_argument('--estimate', action='store_true', help='Estimate tokens offline (4 characters per token)')
+    parser.add_argument('--cache-wait', type=float, default=30, help='Seconds to wait for the context cache')
+    args = parser.parse_args()
+
+    api_key = os.getenv('GEMINI_API_KEY')
+    store_id = os.getenv('STORE_ID', 'fileSearchStores/flusso-complete-knowledge-b-n8g5l5u765nh')
+    if not api_key and not args.estimate:
+        print("Error: GEMINI_API_KEY environment variable not set (use --estimate to run offline)")
+        sys.exit(1)
+
+    engine = FlussoQueryEngine(api_key=api_key or 'offline', store_id=store_id)
+    report = {'count': count_mode(engine, args.model, args.estimate)}
+    if args.live:
+        cached_engine = FlussoQueryEngine(api_key=api_key, store_id=store_id, context_cache_ttl=600)
+        report['live'] = live_mode(engine, cached_engine, args.model, args.cache_wait)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
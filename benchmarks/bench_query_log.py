@@ -0,0 +1,123 @@
+"""
+Measure the query log's cost on the request path and the analyzer on a synthetic workload
+
+Records are appended from several threads, as request threads would, while
+the writer drains the queue to disk: the time per append() call, the records
+written and dropped, and the bytes per record are reported. The log is then
+analyzed, with queries drawn from a Zipf distribution over a fixed set of
+questions about a fixed set of products, so the duplicate rate and projected
+cache hit rates have a known shape.
+
+Usage:
+    python benchmarks/bench_query_log.py --records 200000 --threads 8 --queries 20000 --zipf 1.1
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.WARNING)
+
+from query_log import QueryLog, analyze, read_records  # noqa: E402
+
+TEMPLATES = [
+    'What finishes does {code} come in?',
+    'Installation instructions for {code}',
+    'Flow rate of {code}',
+    'Replacement cartridge for {code}',
+    'Tell me about {code}'
+]
+
+
+def zipf_sampler(count: int, exponent: float, rng: random.Random):
+    """Return a function drawing ranks 0..count-1 with Zipf weights"""
+    weights = [1 / (rank + 1) ** exponent for rank in range(count)]
+    return lambda k: rng.choices(range(count), weights=weights, k=k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the query log')
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=8, help='Threads appending concurrently')
+    parser.add_argument('--queries', type=int, default=10000, help='Distinct questions in the workload')
+    parser.add_argument('--zipf', type=float, default=1.0, help='Zipf exponent of question popularity')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    questions = [
+        TEMPLATES[index % len(TEMPLATES)].format(code=f"{100 + index // 500}.{1000 + index // 5 % 100}")
+        for index in range(args.queries)
+    ]
+    ranks = zipf_sampler(args.queries, args.zipf, rng)(args.records)
+    started_at = time.time()
+    records = [
+        {
+            'ts': round(started_at + index * 0.05, 3),
+            'route': '/api/query',
+            'status': 200,
+            'q': questions[rank],
+            'model': 'gemini-2.5-flash',
+            'ms': round(rng.lognormvariate(7.6, 0.4), 1),
+            'cache': 'miss',
+            'calls': 1,
+            'tokens': {'prompt': 12, 'response': 420}
+        }
+        for index, rank in enumerate(ranks)
+    ]
+
+    workdir = tempfile.mkdtemp(prefix='flusso-query-log-')
+    try:
+        log = QueryLog(workdir, max_bytes=4 * 1024 * 1024, max_files=1000)
+        per_thread = len(records) // args.threads
+        timings = []
+
+        def append(part: int):
+            started = time.perf_counter()
+            for record in records[part * per_thread:(part + 1) * per_thread]:
+                log.append(record)
+            timings.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=append, args=(part,)) for part in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        log.close(timeout=60)
+        drain_seconds = time.perf_counter() - started
+        stats = log.stats()
+        log_bytes = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+
+        started = time.perf_counter()
+        report = analyze(read_records([workdir]), cache_sizes=(1000, 5000), ttls=(3600, 86400), top=5)
+        analyze_seconds = time.perf_counter() - started
+        report.pop('code_counts')
+
+        print(json.dumps({
+            'records': per_thread * args.threads,
+            'threads': args.threads,
+            'append_us': round(sum(timings) / (per_thread * args.threads) * 1e6, 2),
+            'written': stats['written'],
+            'dropped': stats['dropped'],
+            'writer_records_per_second': round(stats['written'] / drain_seconds),
+            'bytes_per_record': round(log_bytes / max(1, stats['written']), 1),
+            'analyze_seconds': round(analyze_seconds, 2),
+            'duplicate_rate': report['queries']['duplicate_rate'],
+            'top_share': report['queries']['top_share'],
+            'projected_hit_rate': report['projected_hit_rate']
+        }, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
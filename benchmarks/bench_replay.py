@@ -0,0 +1,157 @@
+"""
+Replay a recorded cassette through the query engine to profile the server side on its own
+
+Without --cassette, a synthetic capture is recorded first from the local fake
+upstream (unique catalogue questions, a share of them streamed). The cassette
+is then opened in replay mode and every recording is sent through
+FlussoQueryEngine with the caches off and no simulated latency, so the
+throughput and per-request times measure only our own code (prompt and config
+building, response parsing, grounding extraction, result shaping).
+
+Usage:
+    python benchmarks/bench_replay.py --records 5000 --threads 8
+    python benchmarks/bench_replay.py --cassette /tmp/flusso.cassette --latency-scale 0.01
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import logging  # noqa: E402
+logging.disable(logging.INFO)
+
+from cassette import Cassette, CassetteClient  # noqa: E402
+from fake_gemini import FakeGeminiClient, lognormal_words  # noqa: E402
+from query_engine import FlussoQueryEngine  # noqa: E402
+
+CODES = ['100.1000', '160.1000', '240.4420', 'TVH.2691', '180.1000', '120.2000', '100.2420', '160.2310']
+QUESTIONS = [
+    'What finishes is {code} available in?',
+    'What are the specifications of {code}?',
+    'Is {code} compatible with a pressure balance valve?',
+    'What is the flow rate of {code}?',
+    'Which rough-in valve does {code} need?'
+]
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def record(path: str, count: int, stream_share: float, seed: int) -> None:
+    """Record a synthetic capture of unique questions from the fake upstream"""
+    rng = random.Random(seed)
+    fake = FakeGeminiClient(
+        latency=lambda r: r.lognormvariate(0.4, 0.5) / 1000,
+        answer_words=lognormal_words(250, 0.4),
+        code_sources=True,
+        first_token_fraction=0.2,
+        seed=seed
+    )
+    cassette = Cassette(path, 'record')
+    engine = FlussoQueryEngine(
+        api_key='fake-key',
+        store_id='fileSearchStores/fake',
+        client=CassetteClient(cassette, inner=fake)
+    )
+    for index in range(count):
+        question = rng.choice(QUESTIONS).format(code=rng.choice(CODES)) + f" (ticket {index})"
+        model = rng.choice(['gemini-2.5-flash', 'gemini-2.5-flash', 'gemini-2.5-pro'])
+        if rng.random() < stream_share:
+            for _ in engine.query_stream(question, model=model):
+                pass
+        else:
+            engine.query(question, model=model)
+    cassette.close()
+
+
+def replay_one(engine: FlussoQueryEngine, entry: dict) -> tuple:
+    """Send one recording through the engine; returns (seconds, answered)"""
+    request = entry['request']
+    kwargs = {
+        'model': request['model'],
+        'temperature': request['config'].get('temperature'),
+        'top_p': request['config'].get('top_p'),
+        'file_search': request['config'].get('file_search', False)
+    }
+    started = time.perf_counter()
+    if request['stream']:
+        events = list(engine.query_stream(request['contents'], **kwargs))
+        answered = events[-1].get('event') == 'done'
+    else:
+        answered = engine.query(request['contents'], **kwargs).get('success', False)
+    return time.perf_counter() - started, answered
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a cassette through the query engine')
+    parser.add_argument('--cassette', help='Existing cassette (default: record a synthetic one)')
+    parser.add_argument('--records', type=int, default=5000, help='Size of the synthetic capture')
+    parser.add_argument('--stream-share', type=float, default=0.2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency-scale', type=float, help='Simulate recorded latency at this scale')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    path = args.cassette
+    record_seconds = None
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.cassette')
+        started = time.perf_counter()
+        record(path, args.records, args.stream_share, args.seed)
+        record_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cassette = Cassette(path, 'replay')
+    load_seconds = time.perf_counter() - started
+    entries = list(cassette.entries())
+
+    engine = FlussoQueryEngine(
+        api_key='fake-key',
+        store_id='fileSearchStores/fake',
+        client=CassetteClient(
+            cassette,
+            simulate_latency=args.latency_scale is not None,
+            latency_scale=args.latency_scale or 1.0
+        )
+    )
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        outcomes = list(pool.map(lambda entry: replay_one(engine, entry), entries))
+    replay_seconds = time.perf_counter() - started
+
+    times = [seconds * 1000 for seconds, _ in outcomes]
+    size = os.path.getsize(path)
+    report = {
+        'cassette': path,
+        'records': cassette.records,
+        'unique_requests': cassette.stats()['requests'],
+        'file_mb': round(size / 1e6, 2),
+        'bytes_per_record': round(size / max(cassette.records, 1)),
+        'record_seconds': round(record_seconds, 2) if record_seconds is not None else None,
+        'index_load_ms': round(load_seconds * 1000, 1),
+        'replay_seconds': round(replay_seconds, 2),
+        'replay_per_second': round(len(entries) / replay_seconds, 1),
+        'answered': sum(1 for _, answered in outcomes if answered),
+        'misses': cassette.misses,
+        'request_ms': {
+            'p50': round(percentile(times, 50), 2),
+            'p90': round(percentile(times, 90), 2),
+            'p99': round(percentile(times, 99), 2)
+        },
+        'threads': args.threads,
+        'latency_scale': args.latency_scale
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
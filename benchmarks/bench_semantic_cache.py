@@ -0,0 +1,96 @@
+"""
+Benchmark near-duplicate cache lookups at a large number of cached entries
+
+Usage:
+    python benchmarks/bench_semantic_cache.py --entries 100000 --lookups 5000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from semantic_cache import SemanticCache  # noqa: E402
+
+TEMPLATES = [
+    "what finishes does {code} come in",
+    "tell me about {code}",
+    "installation instructions for {code}",
+    "show the parts list for {code}",
+    "what is the flow rate of {code}",
+    "what are the dimensions of {code}",
+    "does {code} include a drain assembly",
+    "which cartridge does {code} use",
+]
+
+PARAPHRASES = [
+    "{code} available finishes?",
+    "Tell me about product {code}",
+    "{code} installation instructions",
+    "parts list for {code} please",
+]
+
+PARAMS = {'model': 'gemini-2.5-flash', 'temperature': 0.2, 'top_p': 0.8}
+
+
+def product_code(index: int) -> str:
+    """Generate a synthetic product code"""
+    return f"{100 + index // 10000}.{index % 10000:04d}"
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--threshold', type=float, default=0.8)
+    args = parser.parse_args()
+
+    cache = SemanticCache(threshold=args.threshold, max_entries=args.entries)
+    answer = {'success': True, 'answer': 'x' * 200, 'sources': [], 'metadata': {}}
+
+    started = time.perf_counter()
+    for i in range(args.entries):
+        template = TEMPLATES[i % len(TEMPLATES)]
+        cache.add(template.format(code=product_code(i // len(TEMPLATES))), PARAMS, answer)
+    fill_seconds = time.perf_counter() - started
+
+    rng = random.Random(7)
+    populated_codes = args.entries // len(TEMPLATES)
+    timings = {'hit': [], 'miss': []}
+    for i in range(args.lookups):
+        if i % 2:
+            query = rng.choice(PARAPHRASES).format(code=product_code(rng.randrange(populated_codes)))
+        else:
+            query = rng.choice(TEMPLATES).format(code=f"999.{rng.randrange(10000):04d}")
+        t0 = time.perf_counter()
+        match = cache.lookup(query, PARAMS)
+        timings['hit' if match else 'miss'].append((time.perf_counter() - t0) * 1000)
+
+    report = {
+        'entries': len(cache._entries),
+        'fill_seconds': round(fill_seconds, 2),
+        'stats': cache.stats(),
+    }
+    for outcome, samples in timings.items():
+        if samples:
+            report[f'{outcome}_lookup_ms'] = {
+                'count': len(samples),
+                'mean': round(statistics.mean(samples), 4),
+                'p50': round(percentile(samples, 50), 4),
+                'p99': round(percentile(samples, 99), 4),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark cold start: module import time and gunicorn boot time with and without preload_app
+
+Each import is timed in a fresh interpreter. Each boot starts gunicorn on the
+local fake upstream and polls /api/health from several connections until
+every worker has answered ready; the CPU time of the master and the workers
+up to that point is read from /proc (Linux). Without preload every worker
+imports the app (google.genai included) itself; with it the master imports
+once and forks, which matters most on small instances where the workers'
+imports compete for one CPU.
+
+Usage:
+    python benchmarks/bench_startup.py --workers 2 --repeats 3
+    python benchmarks/bench_startup.py --server asgi
+"""
+import os
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+ENV = dict(
+    os.environ,
+    UPSTREAM_MODE='fake',
+    CACHE_ENABLED='False',
+    SEMANTIC_CACHE_ENABLED='False',
+    CLIENT_RATE_LIMIT_ENABLED='False'
+)
+
+
+def import_seconds(module: str) -> float:
+    """Time importing a module in a fresh interpreter"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.check_output(['python', '-c', code], cwd=BACKEND, env=ENV, stderr=subprocess.DEVNULL, text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def cpu_seconds(pid: int) -> float:
+    """User + system CPU time of a process (0 where /proc is unavailable)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def free_port() -> int:
+    """Pick an unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def boot(server: str, workers: int, preload: bool) -> dict:
+    """Start gunicorn and time it until every worker reports ready"""
+    port = free_port()
+    env = dict(
+        ENV,
+        PRELOAD_APP=str(preload),
+        PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(prefix='flusso_startup_metrics_')
+    )
+    command = ['gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--log-level', 'warning']
+    command += ['-k', 'uvicorn.workers.UvicornWorker', 'asgi_app:app'] if server == 'asgi' else ['app:app']
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/api/health'
+    ready = {}
+
+    def poll(_):
+        # A new (cheap, plain) connection per request, so that every worker gets to accept some
+        # without the poller taking CPU away from the workers it is timing
+        while len(ready) < workers and time.perf_counter() - started < 60:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    ready.setdefault(json.load(response)['pid'], time.perf_counter() - started)
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.02)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers * 2) as pool:
+            list(pool.map(poll, range(workers * 2)))
+        if len(ready) < workers:
+            raise SystemExit(f"Only {len(ready)} of {workers} workers became ready within 60s")
+        cpu = cpu_seconds(process.pid) + sum(cpu_seconds(pid) for pid in ready)
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        'first_ready_seconds': round(min(ready.values()), 3),
+        'all_ready_seconds': round(max(ready.values()), 3),
+        'cpu_seconds': round(cpu, 3)
+    }
+
+
+def median_of(runs: list) -> dict:
+    """Median of each field over repeated runs"""
+    return {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import and boot time')
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    app_module = 'asgi_app' if args.server == 'asgi' else 'app'
+    report = {
+        'server': args.server,
+        'workers': args.workers,
+        'cpus': os.cpu_count(),
+        'import_seconds': {
+            module: round(statistics.median(import_seconds(module) for _ in range(args.repeats)), 3)
+            for module in ('google.genai', app_module)
+        },
+        'boot': {
+            'per_worker_import': median_of([boot(args.server, args.workers, False) for _ in range(args.repeats)]),
+            'preload_app': median_of([boot(args.server, args.workers, True) for _ in range(args.repeats)])
+        }
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Replay a query log through the model router and compare latency before and after
+
+Queries are read from server logs ("Processing query: ..." followed by
+"Using model: ..." lines) or from JSON lines with "query" and optional
+"model" fields. "Before" uses the model each request actually asked for
+(gemini-2.5-flash when none was logged); "after" uses the router's choice,
+including escalations of ungrounded flash answers. Upstream latency is
+sampled from per-model lognormal distributions, so no API calls are made.
+
+Usage:
+    python benchmarks/eval_router.py server.log
+    python benchmarks/eval_router.py queries.jsonl --mode auto --strong-share 0.1
+"""
+import os
+import re
+import sys
+import json
+import random
+import argparse
+import statistics
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from fake_gemini import lognormal_latency  # noqa: E402
+from model_router import ROUTER_MODES, ModelRouter  # noqa: E402
+
+FAST, STRONG = 'gemini-2.5-flash', 'gemini-2.5-pro'
+
+_LOGGED_QUERY = re.compile(r'Processing (?:streaming )?query: (.*)')
+_LOGGED_MODEL = re.compile(r'Using model: (\S+)')
+
+
+def load_log(paths):
+    """
+    Read (query, requested model) pairs from server logs or JSON lines
+
+    Returns:
+        List of (query, model or None) tuples in log order
+    """
+    entries = []
+    for path in paths:
+        pending = None
+        with open(path, encoding='utf-8', errors='replace') as handle:
+            for line in handle:
+                line = line.strip()
+                if line.startswith('{'):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('query'):
+                        entries.append((record['query'], record.get('model')))
+                    continue
+                query_match = _LOGGED_QUERY.search(line)
+                if query_match:
+                    text = query_match.group(1)
+                    pending = [text[:-3] if text.endswith('...') else text, None]
+                    entries.append(pending)
+                    continue
+                model_match = _LOGGED_MODEL.search(line)
+                if model_match and pending is not None and pending[1] is None:
+                    pending[1] = model_match.group(1)
+                    pending = None
+    return [tuple(entry) for entry in entries]
+
+
+def summarize(latencies, models):
+    """Latency percentiles and model mix for one replay"""
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 2)
+
+    return {
+        'mean_seconds': round(statistics.mean(ordered), 2),
+        'p50_seconds': pct(50),
+        'p90_seconds': pct(90),
+        'p99_seconds': pct(99),
+        'models': dict(Counter(models)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a query log through the model router')
+    parser.add_argument('logs', nargs='+', help='Server logs or JSON lines with "query" and "model"')
+    parser.add_argument('--mode', choices=[m for m in ROUTER_MODES if m != 'off'], default='override')
+    parser.add_argument('--strong-share', type=float, default=0.25)
+    parser.add_argument('--latency-budget', type=float, default=20.0)
+    parser.add_argument('--no-escalation', action='store_true')
+    parser.add_argument('--flash-median', type=float, default=3.0, help='Median flash latency in seconds')
+    parser.add_argument('--pro-median', type=float, default=10.0, help='Median pro latency in seconds')
+    parser.add_argument('--sigma', type=float, default=0.5, help='Lognormal spread of latencies')
+    parser.add_argument('--ungrounded-rate', type=float, default=0.05,
+                        help='Share of flash answers without grounding (triggers escalation)')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    entries = load_log(args.logs)
+    if not entries:
+        print("Error: no queries found in the log")
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    samplers = {FAST: lognormal_latency(args.flash_median, args.sigma),
+                STRONG: lognormal_latency(args.pro_median, args.sigma)}
+    router = ModelRouter(
+        fast_model=FAST,
+        strong_model=STRONG,
+        mode=args.mode,
+        strong_share_budget=args.strong_share,
+        latency_budget_seconds=args.latency_budget,
+        escalate_ungrounded=not args.no_escalation,
+        expected_latency={FAST: args.flash_median, STRONG: args.pro_median}
+    )
+
+    before_latency, before_models = [], []
+    after_latency, after_models = [], []
+    for user_query, requested in entries:
+        requested_model = requested if requested in samplers else None
+        before_model = requested_model or FAST
+        before_latency.append(samplers[before_model](rng))
+        before_models.append(before_model)
+
+        decision = router.route(user_query, requested_model)
+        model = decision['model'] if decision else before_model
+        latency = samplers[model](rng)
+        router.observe(model, latency)
+        grounded = model != FAST or rng.random() >= args.ungrounded_rate
+        escalation = router.escalation(decision, {'success': True, 'source_count': int(grounded)})
+        if escalation is not None:
+            extra = samplers[STRONG](rng)
+            router.observe(STRONG, extra)
+            latency += extra
+            model = STRONG
+        after_latency.append(latency)
+        after_models.append(model)
+
+    print(json.dumps({
+        'queries': len(entries),
+        'before': summarize(before_latency, before_models),
+        'after': summarize(after_latency, after_models),
+        'router': router.stats(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Load test: sync workers vs the ASGI app on a local fake Gemini upstream
+
+The sync baseline pushes requests through FlussoQueryEngine with one thread per
+gunicorn sync worker (2 in production). The async run drives asgi_app through
+httpx's in-process ASGI transport, so the numbers reflect the serving path
+rather than socket overhead.
+
+Usage:
+    python benchmarks/load_async.py --requests 400 --latency 0.5 --concurrency 1 8 64 256
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+os.environ.setdefault('GEMINI_API_KEY', 'fake-key')
+os.environ.setdefault('STORE_ID', 'fileSearchStores/fake')
+os.environ['CACHE_ENABLED'] = 'False'
+os.environ['SEMANTIC_CACHE_ENABLED'] = 'False'
+
+import logging  # noqa: E402
+logging.disable(logging.INFO)
+
+import httpx  # noqa: E402
+from asgi_app import create_app  # noqa: E402
+from async_query_engine import AsyncFlussoQueryEngine  # noqa: E402
+from fake_gemini import FakeGeminiClient, fixed_latency  # noqa: E402
+from query_engine import FlussoQueryEngine  # noqa: E402
+
+
+def run_sync(requests: int, workers: int, latency: float) -> dict:
+    """Serve requests with a fixed number of blocking workers"""
+    fake = FakeGeminiClient(latency=fixed_latency(latency))
+    engine = FlussoQueryEngine('fake-key', 'fileSearchStores/fake', client=fake)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda i: engine.query(f"sync question {i}"), range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': f'sync x{workers}',
+        'requests': requests,
+        'errors': sum(not r['success'] for r in results),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 2),
+        'peak_upstream_in_flight': fake.peak_in_flight,
+    }
+
+
+async def run_async(requests: int, concurrency: int, latency: float) -> dict:
+    """Serve requests through the ASGI app with a given number of concurrent clients"""
+    fake = FakeGeminiClient(latency=fixed_latency(latency))
+    engine = AsyncFlussoQueryEngine('fake-key', 'fileSearchStores/fake', client=fake)
+    app = create_app(engine)
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://asgi') as client:
+        async def one(i: int):
+            async with semaphore:
+                response = await client.post('/api/query', json={'query': f"async question {i}"})
+                statuses.append(response.status_code == 200 and response.json()['success'])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'mode': f'asgi c{concurrency}',
+        'requests': requests,
+        'errors': statuses.count(False),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 2),
+        'peak_upstream_in_flight': fake.peak_in_flight,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sync and ASGI serving on a fake upstream')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.5, help='Fake upstream latency in seconds')
+    parser.add_argument('--sync-workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 64, 256])
+    args = parser.parse_args()
+
+    sync_requests = min(args.requests, 40)
+    report = [run_sync(sync_requests, args.sync_workers, args.latency)]
+    for concurrency in args.concurrency:
+        requests = args.requests if concurrency > 1 else min(args.requests, 20)
+        report.append(asyncio.run(run_async(requests, concurrency, args.latency)))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
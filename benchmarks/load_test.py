@@ -0,0 +1,304 @@
+"""
+Load test the real server stack against the local fake Gemini upstream
+
+Starts gunicorn (Flask app, or the ASGI app with --server asgi) with
+UPSTREAM_MODE=fake on a free port, or targets an already running server with
+--url. Concurrent clients then send a weighted mix of requests across the API
+endpoints. The report is JSON: throughput, p50/p95/p99 latency, error rate and
+status counts, overall and per endpoint, plus time to first byte for
+streaming. It also records the git commit, so runs can be compared between
+commits with --baseline.
+
+Usage:
+    python benchmarks/load_test.py --requests 500 --concurrency 16 --output before.json
+    python benchmarks/load_test.py --requests 500 --concurrency 16 --baseline before.json
+    python benchmarks/load_test.py --duration 60 --mix query=5,compare=1 --fake-error-rate 0.05
+    python benchmarks/load_test.py --url http://localhost:5000 --requests 200
+"""
+import os
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+CODES = ['100.1000', '160.1000', '240.4420', 'TVH.2691', '180.1000', '120.2000', '200.1500', 'TVS.1300']
+TOPICS = ['thermostatic shower valves', 'matte black faucets', 'wall-mount tub fillers', 'pressure balance trims']
+DEFAULT_MIX = 'query=40,stream=10,product=15,compare=10,search=10,installation=8,parts=7'
+
+
+def build_request(endpoint: str, rng: random.Random):
+    """Return (method, path, json body) for one request to an endpoint"""
+    code = rng.choice(CODES)
+    if endpoint == 'query':
+        return 'POST', '/api/query', {'query': f"What finishes are available for {code}? (#{rng.randrange(10 ** 6)})"}
+    if endpoint == 'stream':
+        return 'POST', '/api/query/stream', {'query': f"Describe {rng.choice(TOPICS)} (#{rng.randrange(10 ** 6)})"}
+    if endpoint == 'product':
+        return 'GET', f'/api/product/{code}', None
+    if endpoint == 'installation':
+        return 'GET', f'/api/installation/{code}', None
+    if endpoint == 'parts':
+        return 'GET', f'/api/parts/{code}', None
+    if endpoint == 'compare':
+        return 'POST', '/api/compare', {'products': rng.sample(CODES, rng.choice([2, 2, 3]))}
+    if endpoint == 'search':
+        return 'POST', '/api/search', {
+            'category': rng.choice(['shower valves', 'faucets', 'tub fillers']),
+            'features': rng.sample(['thermostatic', 'matte black', 'wall mount', 'ADA compliant'], 2)
+        }
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def parse_mix(text: str) -> dict:
+    """Parse 'query=40,compare=10' into endpoint weights"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        build_request(name.strip(), random.Random())
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def send(client: httpx.Client, endpoint: str, rng: random.Random) -> dict:
+    """Send one request and time it; a body with success=false counts as an error"""
+    method, path, body = build_request(endpoint, rng)
+    started = time.perf_counter()
+    ttfb = None
+    try:
+        with client.stream(method, path, json=body) as response:
+            chunks = []
+            for chunk in response.iter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                chunks.append(chunk)
+            status = response.status_code
+        payload = b''.join(chunks)
+        if endpoint == 'stream':
+            ok = status == 200 and b'event: error' not in payload
+        else:
+            ok = status == 200 and json.loads(payload).get('success', False)
+    except (httpx.HTTPError, ValueError) as e:
+        status, ok = type(e).__name__, False
+    return {
+        'endpoint': endpoint,
+        'status': status,
+        'ok': ok,
+        'seconds': time.perf_counter() - started,
+        'ttfb': ttfb
+    }
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(records: list, seconds: float) -> dict:
+    """Throughput, latency percentiles and error rate for a set of requests"""
+    latencies = [r['seconds'] for r in records]
+    summary = {
+        'requests': len(records),
+        'throughput_rps': round(len(records) / seconds, 2) if seconds else 0.0,
+        'error_rate': round(sum(not r['ok'] for r in records) / len(records), 4),
+        'mean_seconds': round(statistics.mean(latencies), 4),
+        'p50_seconds': round(percentile(latencies, 50), 4),
+        'p95_seconds': round(percentile(latencies, 95), 4),
+        'p99_seconds': round(percentile(latencies, 99), 4),
+        'status': dict(Counter(str(r['status']) for r in records))
+    }
+    ttfbs = [r['ttfb'] for r in records if r['endpoint'] == 'stream' and r['ttfb'] is not None]
+    if ttfbs:
+        summary['ttfb_p50_seconds'] = round(percentile(ttfbs, 50), 4)
+        summary['ttfb_p95_seconds'] = round(percentile(ttfbs, 95), 4)
+    return summary
+
+
+def run_load(base_url: str, args) -> dict:
+    """Drive the server with concurrent clients and summarize the measured requests"""
+    mix = parse_mix(args.mix)
+    endpoints, weights = list(mix), list(mix.values())
+    lock = threading.Lock()
+    sent = 0
+    records = []
+    stop_at = None
+
+    def claim() -> bool:
+        nonlocal sent
+        with lock:
+            if stop_at is not None and time.perf_counter() >= stop_at:
+                return False
+            if args.duration is None and sent >= args.warmup + args.requests:
+                return False
+            sent += 1
+            return True
+
+    def client_loop(worker: int):
+        rng = random.Random(args.seed * 1000 + worker)
+        with httpx.Client(base_url=base_url, timeout=args.timeout) as client:
+            while claim():
+                record = send(client, rng.choices(endpoints, weights)[0], rng)
+                with lock:
+                    records.append(record)
+
+    started = time.perf_counter()
+    if args.duration is not None:
+        stop_at = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(client_loop, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    measured = records[args.warmup:]
+    if not measured:
+        raise SystemExit("No requests were measured; increase --requests or --duration")
+    # Throughput over the measured share of the run
+    seconds = elapsed * len(measured) / len(records)
+    by_endpoint = {}
+    for endpoint in endpoints:
+        subset = [r for r in measured if r['endpoint'] == endpoint]
+        if subset:
+            by_endpoint[endpoint] = summarize(subset, seconds)
+    return {'overall': summarize(measured, seconds), 'endpoints': by_endpoint}
+
+
+def free_port() -> int:
+    """Pick an unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    """Start gunicorn on the fake upstream and wait until /api/health answers"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        UPSTREAM_MODE='fake',
+        FAKE_LATENCY_MEDIAN=str(args.fake_latency),
+        FAKE_LATENCY_SIGMA=str(args.fake_sigma),
+        FAKE_ERROR_RATE=str(args.fake_error_rate),
+        FAKE_ANSWER_WORDS=str(args.fake_answer_words),
+        CLIENT_RATE_LIMIT_ENABLED='False',
+        PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(prefix='flusso_load_metrics_')
+    )
+    if not args.cache:
+        env.update(CACHE_ENABLED='False', SEMANTIC_CACHE_ENABLED='False')
+    command = ['gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(args.workers), '--timeout', '300', '--log-level', 'warning']
+    if args.server == 'asgi':
+        command += ['-k', 'uvicorn.workers.UvicornWorker', 'asgi_app:app']
+    else:
+        command += ['app:app']
+    process = subprocess.Popen(command, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {process.returncode}")
+        try:
+            if httpx.get(f'{base_url}/api/health', timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("Server did not become healthy within 60s")
+
+
+def git_commit() -> str:
+    """Current commit of the working tree (None outside a git checkout)"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Percentage change from a baseline report for throughput and latency percentiles"""
+    def delta(new, old):
+        return round((new - old) / old * 100, 1) if old else None
+
+    keys = ('throughput_rps', 'p50_seconds', 'p95_seconds', 'p99_seconds', 'error_rate')
+    changes = {'baseline_commit': baseline.get('commit')}
+    pairs = [('overall', report['overall'], baseline.get('overall', {}))]
+    pairs += [(name, stats, baseline.get('endpoints', {}).get(name, {})) for name, stats in report['endpoints'].items()]
+    for name, current, old in pairs:
+        changes[name] = {f'{key}_change_percent': delta(current[key], old.get(key)) for key in keys if key in old}
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API on the fake Gemini upstream')
+    parser.add_argument('--url', help='Target a running server instead of starting one')
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=500, help='Measured requests (ignored with --duration)')
+    parser.add_argument('--duration', type=float, help='Run for this many seconds instead of a request count')
+    parser.add_argument('--warmup', type=int, default=20, help='Requests sent before measuring')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Endpoint weights, e.g. query=40,compare=10')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--cache', action='store_true', help='Keep the response caches enabled')
+    parser.add_argument('--fake-latency', type=float, default=1.5, help='Median fake upstream latency (s)')
+    parser.add_argument('--fake-sigma', type=float, default=0.5, help='Lognormal spread (0 = fixed latency)')
+    parser.add_argument('--fake-error-rate', type=float, default=0.0)
+    parser.add_argument('--fake-answer-words', type=int, default=250)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Report changes against an earlier JSON report')
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        process, base_url = start_server(args)
+    try:
+        results = run_load(base_url, args)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'target': args.url or f'gunicorn {args.server} x{args.workers} (fake upstream)',
+        'settings': {
+            'concurrency': args.concurrency,
+            'mix': parse_mix(args.mix),
+            'cache': args.cache,
+            'fake_latency': None if args.url else args.fake_latency,
+            'fake_sigma': None if args.url else args.fake_sigma,
+            'fake_error_rate': None if args.url else args.fake_error_rate,
+            'fake_answer_words': None if args.url else args.fake_answer_words
+        },
+        **results
+    }
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['comparison'] = compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
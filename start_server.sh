@@ -1,4 +1,12 @@
 #!/bin/bash
 # Render startup script
+# SERVER_MODE=asgi serves the async API (asgi_app.py) on uvicorn workers
+# gunicorn.conf.py sets up multi-process Prometheus metrics for /metrics
+# Render's router appends the client address to X-Forwarded-For; without trusting it every
+# client shares the router's address and the per-client rate limit applies to the whole site
+export TRUST_PROXY_HEADERS="${TRUST_PROXY_HEADERS:-True}"
 cd backend
-exec gunicorn app:app --bind 0.0.0.0:$PORT --timeout 300 --workers 2 --log-level info
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec gunicorn -c gunicorn.conf.py asgi_app:app -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT --timeout 300 --workers 2 --log-level info
+fi
+exec gunicorn -c gunicorn.conf.py app:app --bind 0.0.0.0:$PORT --timeout 300 --workers 2 --log-level info
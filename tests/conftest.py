@@ -0,0 +1,45 @@
+"""
+Shared fixtures for the backend tests
+Every test runs against the bundled fake Gemini client (fake_gemini.py); nothing calls the real API
+"""
+import os
+import sys
+import tempfile
+
+# The backend modules import each other as top-level modules, as they do under gunicorn
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+# Importing config (and asgi_app, which builds its app on import) must not reach the
+# real API or shared files in the system temp directory
+_STATE_DIR = tempfile.mkdtemp(prefix='flusso-tests-')
+os.environ.update({
+    'UPSTREAM_MODE': 'fake',
+    'FAKE_LATENCY_MEDIAN': '0.01',
+    'UPSTREAM_WARMUP_ENABLED': 'False',
+    'QUERY_LOG_ENABLED': 'False',
+    'LOCAL_INDEX_ENABLED': 'False',
+    'CATALOG_ENABLED': 'False',
+    'CACHE_PATH': os.path.join(_STATE_DIR, 'cache.sqlite3'),
+    'SESSION_PATH': os.path.join(_STATE_DIR, 'sessions.sqlite3'),
+    'SINGLE_FLIGHT_LOCK_DIR': os.path.join(_STATE_DIR, 'single_flight')
+})
+
+import pytest  # noqa: E402
+
+from fake_gemini import FakeGeminiClient, fixed_latency  # noqa: E402
+from query_engine import FlussoQueryEngine  # noqa: E402
+
+
+@pytest.fixture
+def fake_client():
+    """Fake upstream answering every call in 10 ms"""
+    return FakeGeminiClient(latency=fixed_latency(0.01), answer_words=20)
+
+
+@pytest.fixture
+def make_engine(fake_client):
+    """Build a query engine on the fake client; keyword arguments go to the engine"""
+    def make(engine_class=FlussoQueryEngine, **kwargs):
+        kwargs.setdefault('client', fake_client)
+        return engine_class(api_key='test-key', store_id='fileSearchStores/test', **kwargs)
+    return make
@@ -0,0 +1,79 @@
+"""
+Tests for admission control and the per-client rate limit, down to the HTTP responses
+"""
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+import asgi_app
+from admission import AdmissionController, AdmissionRejected, ClientRateLimiter
+from async_query_engine import AsyncFlussoQueryEngine
+from deadline import Deadline
+from fake_gemini import FakeGeminiClient, fixed_latency
+
+
+def test_full_queue_rejects_at_once():
+    admission = AdmissionController(max_concurrent=1, max_queue=0)
+    with admission.slot():
+        with pytest.raises(AdmissionRejected) as rejected:
+            with admission.slot():
+                pass
+    assert rejected.value.reason == 'queue full'
+    assert admission.stats()['rejected']['queue_full'] == 1
+    assert admission.stats()['in_flight'] == 0
+
+
+def test_queue_wait_stops_at_deadline():
+    admission = AdmissionController(max_concurrent=1, max_queue=4, max_queue_seconds=10)
+    with admission.slot():
+        with pytest.raises(AdmissionRejected) as rejected:
+            with admission.slot(Deadline(0.05)):
+                pass
+    assert rejected.value.reason == 'queue timeout'
+    assert admission.stats()['queue_depth'] == {lane: 0 for lane in admission.stats()['queue_depth']}
+
+
+def test_rate_limiter_limits_each_client_separately():
+    limiter = ClientRateLimiter(rate=0.01, burst=2)
+    assert [limiter.check('a') for _ in range(2)] == [0.0, 0.0]
+    assert limiter.check('a') > 0
+    assert limiter.check('b') == 0.0
+    assert limiter.stats()['limited'] == 1
+
+
+def test_overloaded_engine_answers_429(make_engine):
+    engine = make_engine(
+        AsyncFlussoQueryEngine,
+        client=FakeGeminiClient(latency=fixed_latency(0.2)),
+        admission=AdmissionController(max_concurrent=1, max_queue=0, retry_after_seconds=3)
+    )
+
+    async def two_at_once():
+        return await asyncio.gather(
+            engine.query('Tell me about 100.1000'),
+            engine.query('Tell me about 160.1000')
+        )
+
+    results = asyncio.run(two_at_once())
+    rejected = [result for result in results if not result['success']]
+    assert len(rejected) == 1
+    assert rejected[0]['error_type'] == 'overloaded'
+
+    response = asgi_app._result_response(rejected[0])
+    assert response.status_code == 429
+    assert response.headers['retry-after'] == '3'
+
+
+def test_rate_limited_client_gets_429(make_engine):
+    app = asgi_app.create_app(make_engine(AsyncFlussoQueryEngine), ClientRateLimiter(rate=0.01, burst=2))
+    with TestClient(app) as client:
+        statuses = [client.post('/api/query', json={'query': 'Tell me about 100.1000'}).status_code for _ in range(3)]
+        limited = client.post('/api/query', json={'query': 'Tell me about 100.1000'})
+        health = client.get('/api/health')
+
+    assert statuses == [200, 200, 429]
+    assert limited.json()['error_type'] == 'too_many_requests'
+    assert int(limited.headers['retry-after']) > 0
+    # Health checks are never limited
+    assert health.status_code == 200
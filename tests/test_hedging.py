@@ -0,0 +1,72 @@
+"""
+Tests for hedged upstream requests
+"""
+import time
+import threading
+
+import metrics
+from admission import AdmissionController
+from fake_gemini import FakeGeminiClient
+from hedging import Hedger
+
+
+def _warm_hedger(delay: float = 0.02) -> Hedger:
+    """A hedger that hedges after `delay` seconds and can always afford a hedge"""
+    hedger = Hedger(min_samples=3, max_hedge_ratio=1.0)
+    for _ in range(5):
+        hedger.observe('model', delay)
+    return hedger
+
+
+def test_hedge_answers_first_when_primary_is_slow():
+    hedger = _warm_hedger()
+    attempts = []
+
+    def upstream():
+        attempts.append(1)
+        time.sleep(0.5 if len(attempts) == 1 else 0.01)
+        return len(attempts)
+
+    started = time.monotonic()
+    assert hedger.call(upstream, key='model') == 2
+    assert time.monotonic() - started < 0.3
+    assert hedger.stats()['hedge_wins'] == 1
+
+
+def test_attempts_run_in_the_callers_context():
+    hedger = _warm_hedger()
+    timer = metrics.start_request()
+    seen = []
+
+    def upstream():
+        seen.append(metrics._current_request.get())
+        time.sleep(0.2 if len(seen) == 1 else 0.01)
+
+    hedger.call(upstream, key='model')
+    assert seen == [timer, timer]
+
+
+def test_hedge_takes_its_own_admission_slot(make_engine):
+    slow_then_fast = iter([0.4, 0.01, 0.01, 0.01])
+    admission = AdmissionController(max_concurrent=4)
+    engine = make_engine(
+        client=FakeGeminiClient(latency=lambda rng: next(slow_then_fast, 0.01)),
+        hedger=_warm_hedger(),
+        admission=admission
+    )
+    engine.hedger._samples = {engine.model_name: engine.hedger._samples['model']}
+    peak = []
+
+    def watch():
+        for _ in range(30):
+            peak.append(admission.stats()['in_flight'])
+            time.sleep(0.01)
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    result = engine.query('Tell me about 100.1000', refresh=True)
+    watcher.join()
+
+    assert result['success']
+    assert engine.hedger.stats()['hedges_sent'] == 1
+    assert max(peak) == 2
@@ -0,0 +1,57 @@
+"""
+Tests for model routing and its budgets
+"""
+import time
+
+from model_router import ModelRouter, classify_query
+
+COMPARISON = 'Compare 100.1000 and 160.1000'
+
+
+def test_classify_query():
+    assert classify_query(COMPARISON) == 'comparison'
+    assert classify_query('Flow rate of 100.1000') == 'lookup'
+    assert classify_query('What warranty does Flusso offer?') == 'open'
+
+
+def test_auto_mode_keeps_requested_model():
+    router = ModelRouter(mode='auto')
+    assert router.route(COMPARISON, 'gemini-2.5-flash') is None
+    assert router.route(COMPARISON)['model'] == router.strong_model
+
+
+def test_share_budget_downgrades_to_fast_model():
+    router = ModelRouter(mode='override', strong_share_budget=0.5)
+    models = [router.route(COMPARISON)['model'] for _ in range(4)]
+    assert models.count(router.strong_model) == 2
+    assert router.stats()['budget_downgrades'] == 2
+
+
+def test_latency_budget_recovers_through_probes():
+    router = ModelRouter(mode='override', strong_share_budget=1.0, latency_probe_seconds=0.05)
+    for _ in range(30):
+        router.observe(router.strong_model, 40.0)
+
+    decision = router.route(COMPARISON)
+    assert decision['model'] == router.fast_model
+    assert decision['reason'] == 'latency budget exceeded'
+
+    for _ in range(50):
+        time.sleep(0.06)
+        if router.route(COMPARISON)['model'] == router.strong_model:
+            router.observe(router.strong_model, 5.0)
+        if router.stats()['latency_estimates'][router.strong_model] < router.latency_budget_seconds:
+            break
+
+    assert router.route(COMPARISON)['model'] == router.strong_model
+    assert router.stats()['latency_probes'] > 0
+
+
+def test_one_probe_per_interval():
+    router = ModelRouter(mode='override', strong_share_budget=1.0, latency_probe_seconds=60)
+    for _ in range(30):
+        router.observe(router.strong_model, 40.0)
+    router._strong_checked_at = time.monotonic() - 61
+
+    models = [router.route(COMPARISON)['model'] for _ in range(5)]
+    assert models == [router.strong_model] + [router.fast_model] * 4
@@ -0,0 +1,103 @@
+"""
+Tests for the sync and async query engines on the fake upstream
+"""
+import asyncio
+
+import pytest
+
+from async_query_engine import AsyncFlussoQueryEngine
+from fake_gemini import FakeGeminiClient, fixed_latency
+from response_cache import ResponseCache
+from sessions import SessionStore
+from single_flight import AsyncSingleFlight, SingleFlight
+
+QUESTION = 'What finishes does 100.1000 come in?'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / 'cache.sqlite3'))
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    return SessionStore(str(tmp_path / 'sessions.sqlite3'))
+
+
+def _stream_answer(events):
+    """Join the deltas of a stream and return (answer, final event)"""
+    events = list(events)
+    return ''.join(event['text'] for event in events if event['event'] == 'delta'), events[-1]
+
+
+def test_repeated_question_is_served_from_cache(make_engine, fake_client, cache):
+    engine = make_engine(cache=cache)
+    first = engine.query(QUESTION)
+    second = engine.query(QUESTION)
+
+    assert first['success'] and second['success']
+    assert second['answer'] == first['answer']
+    assert second['metadata']['cached']
+    assert fake_client.calls == 1
+
+
+def test_stream_matches_query_and_fills_cache(make_engine, fake_client, cache):
+    engine = make_engine(cache=cache)
+    answer, done = _stream_answer(engine.query_stream(QUESTION))
+    assert done['event'] == 'done'
+    assert done['metadata']['time_to_first_token'] is not None
+
+    cached = engine.query(QUESTION)
+    assert cached['answer'] == answer
+    assert fake_client.calls == 1
+
+
+def test_async_engine_shares_query_and_stream_behaviour(make_engine, fake_client, cache):
+    engine = make_engine(AsyncFlussoQueryEngine, cache=cache, single_flight=AsyncSingleFlight())
+
+    async def scenario():
+        results = await asyncio.gather(*(engine.query(QUESTION) for _ in range(3)))
+        events = [event async for event in engine.query_stream(QUESTION)]
+        return results, events
+
+    results, events = asyncio.run(scenario())
+    answer, done = _stream_answer(events)
+    assert all(result['answer'] == results[0]['answer'] for result in results)
+    assert answer == results[0]['answer']
+    assert done['metadata']['cached']
+    assert fake_client.calls == 1
+
+
+def test_first_session_question_uses_cache_and_follow_up_uses_history(make_engine, fake_client, cache, sessions):
+    engine = make_engine(cache=cache, sessions=sessions)
+    engine.query(QUESTION)
+
+    session_id = engine.start_session()
+    first = engine.query(QUESTION, session_id=session_id)
+    assert first['metadata']['cached']
+    assert first['metadata']['session']['turns'] == 1
+
+    follow_up = engine.query('And the flow rate?', session_id=session_id)
+    assert follow_up['metadata']['session']['history_turns'] == 1
+    assert fake_client.calls == 2
+
+
+def test_upstream_errors_become_error_results(make_engine):
+    engine = make_engine(client=FakeGeminiClient(latency=fixed_latency(0.01), error_rate=1.0, error_codes=(503,)))
+    result = engine.query(QUESTION)
+    assert not result['success']
+
+    _, final = _stream_answer(engine.query_stream(QUESTION))
+    assert final['event'] == 'error'
+
+
+def test_closed_batch_stream_skips_unstarted_items(make_engine):
+    client = FakeGeminiClient(latency=fixed_latency(0.05))
+    engine = make_engine(client=client, single_flight=SingleFlight())
+    items = [{'type': 'query', 'query': f'Tell me about 100.{1000 + index}'} for index in range(20)]
+
+    batch = engine.iter_query_many(items, concurrency=2)
+    next(batch)
+    batch.close()
+
+    assert client.calls <= 4
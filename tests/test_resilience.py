@@ -0,0 +1,111 @@
+"""
+Tests for the circuit breaker and retry policy
+"""
+import time
+import asyncio
+
+import pytest
+
+from fake_gemini import FakeGeminiClient, _api_error, fixed_latency
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def _open_breaker(reset_timeout: float = 0.05) -> CircuitBreaker:
+    """A breaker opened by one transient failure, already past its reset timeout"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure(_api_error(503))
+    assert breaker.state == 'open'
+    time.sleep(reset_timeout * 1.5)
+    return breaker
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure(_api_error(503))
+    assert breaker.state == 'closed'
+    breaker.record_failure(_api_error(429))
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_client_errors_do_not_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure(_api_error(404))
+    assert breaker.state == 'closed'
+
+
+def test_cancelled_probe_reopens_breaker_and_allows_next_probe():
+    breaker = _open_breaker()
+    policy = RetryPolicy(max_attempts=1, breaker=breaker)
+
+    async def scenario():
+        probe = asyncio.ensure_future(policy.acall(lambda: asyncio.sleep(5)))
+        await asyncio.sleep(0.01)
+        assert breaker.state == 'half_open'
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert breaker.state == 'open'
+        await asyncio.sleep(0.08)
+
+        async def succeed():
+            return 'ok'
+        return await policy.acall(succeed)
+
+    assert asyncio.run(scenario()) == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_interrupted_sync_probe_reopens_breaker():
+    breaker = _open_breaker()
+    policy = RetryPolicy(max_attempts=1, breaker=breaker)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        policy.call(interrupted)
+    assert breaker.state == 'open'
+    assert not breaker._probing
+
+
+def test_silent_probe_expires_after_reset_timeout():
+    breaker = _open_breaker()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.08)
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+
+
+def test_closed_stream_releases_probe(make_engine):
+    breaker = _open_breaker()
+    client = FakeGeminiClient(latency=fixed_latency(0.01), answer_words=40, token_seconds=0.001)
+    engine = make_engine(client=client, retry_policy=RetryPolicy(max_attempts=1, breaker=breaker))
+
+    stream = engine.query_stream('Tell me about 100.1000')
+    for event in stream:
+        if event['event'] == 'delta':
+            break
+    assert breaker.state == 'half_open'
+    stream.close()
+
+    assert breaker.state == 'open'
+    assert not breaker._probing
+
+
+def test_retry_policy_retries_transient_errors():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _api_error(503)
+        return 'ok'
+
+    assert policy.call(flaky) == 'ok'
+    assert len(attempts) == 3
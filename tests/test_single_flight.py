@@ -0,0 +1,124 @@
+"""
+Tests for request coalescing within and across workers
+"""
+import os
+import time
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+from deadline import Deadline
+from single_flight import AsyncSingleFlight, SingleFlight, _WorkerLease
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='cross-worker leases need fcntl')
+
+
+def _key(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _run_concurrently(*calls) -> None:
+    threads = [threading.Thread(target=call) for call in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    calls, results = [], []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'answer'
+
+    _run_concurrently(*(lambda: results.append(flight.do(_key('q'), slow)) for _ in range(4)))
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+
+
+def test_different_keys_do_not_wait_for_each_other(tmp_path):
+    flight = SingleFlight(lock_dir=str(tmp_path))
+    elapsed = {}
+
+    def timed(name):
+        started = time.monotonic()
+        flight.do(_key(name), lambda: time.sleep(0.3))
+        elapsed[name] = time.monotonic() - started
+
+    _run_concurrently(*(lambda name=name: timed(name) for name in ('a', 'b', 'c', 'd')))
+    assert max(elapsed.values()) < 0.5
+    # Lease files are removed once their call is done
+    assert os.listdir(tmp_path) == []
+
+
+def test_second_worker_reads_result_after_lease(tmp_path):
+    first, second = SingleFlight(lock_dir=str(tmp_path)), SingleFlight(lock_dir=str(tmp_path))
+    calls, results = [], {}
+
+    def lead(name, flight):
+        results[name] = flight.do(
+            _key('q'),
+            lambda: calls.append(name) or time.sleep(0.2) or name,
+            recheck=lambda: 'from shared cache'
+        )
+
+    leader = threading.Thread(target=lead, args=('first', first))
+    leader.start()
+    time.sleep(0.05)
+    lead('second', second)
+    leader.join()
+
+    assert calls == ['first']
+    assert results['second'] == ('from shared cache', True)
+    assert second.stats()['cross_worker_hits'] == 1
+
+
+def test_lease_wait_stops_at_deadline(tmp_path):
+    held = _WorkerLease(str(tmp_path), _key('q'))
+    assert held.try_acquire()
+    try:
+        flight = SingleFlight(lock_dir=str(tmp_path), lease_seconds=60)
+        started = time.monotonic()
+        assert flight.do(_key('q'), lambda: 'own', deadline=Deadline(0.2)) == ('own', False)
+        assert time.monotonic() - started < 1.0
+    finally:
+        held.release()
+
+
+def test_follower_wait_stops_at_deadline():
+    flight = SingleFlight()
+    leader = threading.Thread(target=lambda: flight.do(_key('q'), lambda: time.sleep(1.0)))
+    leader.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    assert flight.do(_key('q'), lambda: 'own', deadline=Deadline(0.2)) == ('own', False)
+    assert time.monotonic() - started < 0.6
+    leader.join()
+
+
+def test_followers_take_over_from_cancelled_async_leader():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do(_key('q'), upstream))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.ensure_future(flight.do(_key('q'), upstream)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert [result for result, _ in results] == [2, 2, 2]
+    assert sorted(shared for _, shared in results) == [False, True, True]